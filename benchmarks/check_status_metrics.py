@@ -0,0 +1,92 @@
+"""
+Офлайн-проверка метрик StatusCache на поддельном ServiceManager (см. fakes.py):
+запуски по команде планировщика не считаются перезапусками, неожиданное
+падение и подъем службы - считаются, а collect_metrics отдает их в /metrics.
+
+    python benchmarks/check_status_metrics.py
+
+Код выхода 1, если хоть одна проверка не прошла.
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import FakeServiceManager  # noqa: E402
+from utils import status_cache as status_cache_module  # noqa: E402
+from utils.config_manager import ConfigManager  # noqa: E402
+from utils.metrics import MetricsRegistry  # noqa: E402
+from utils.operation_scheduler import OperationScheduler  # noqa: E402
+from utils.status_cache import StatusCache  # noqa: E402
+
+
+class Checker:
+    def __init__(self):
+        self.failures = []
+
+    def expect(self, label, actual, expected):
+        ok = actual == expected
+        print(f"    {'OK  ' if ok else 'FAIL'} {label}: {actual!r}" + ("" if ok else f" (ожидалось {expected!r})"))
+        if not ok:
+            self.failures.append(label)
+
+
+def metric(samples, name):
+    for sample_name, _, _, _, value in samples:
+        if sample_name == name:
+            return value
+    return None
+
+
+def main():
+    tmp_dir = tempfile.mkdtemp(prefix="zapret-check-")
+    # Окно "запуск ожидаем" после операции сокращено, чтобы не ждать его в проверке
+    status_cache_module.EXPECTED_START_GRACE = 0.0
+    checker = Checker()
+    manager = FakeServiceManager(winsw_path=os.path.join(tmp_dir, "bin", "winws.exe"))
+    cache = StatusCache(manager, ConfigManager(os.path.join(tmp_dir, "bin")))
+    scheduler = OperationScheduler(manager, cache)
+    scheduler.start()
+    service = manager.services[manager.service_name]
+    try:
+        print("Служба уже запущена при старте программы")
+        cache.refresh()
+        checker.expect("restarts", cache.snapshot()["restarts"], 0)
+
+        print("Остановка, запуск и перезапуск через планировщик")
+        for action in ("stop", "start", "restart"):
+            scheduler.run(action, timeout=5)
+            cache.refresh()
+        checker.expect("restarts", cache.snapshot()["restarts"], 0)
+
+        print("Служба упала и поднялась сама (восстановление SCM)")
+        service.state = "STOPPED"
+        cache.refresh()
+        service.state = "RUNNING"
+        cache.refresh()
+        checker.expect("restarts", cache.snapshot()["restarts"], 1)
+
+        print("collect_metrics по последнему снимку")
+        samples = cache.collect_metrics()
+        checker.expect("zapret_restarts_total", metric(samples, "zapret_restarts_total"), 1)
+        checker.expect("zapret_service_up", metric(samples, "zapret_service_up"), True)
+        checker.expect("zapret_manual_process_up", metric(samples, "zapret_manual_process_up"), False)
+        registry = MetricsRegistry()
+        registry.add_collector(cache.collect_metrics)
+        checker.expect("/metrics", "zapret_restarts_total 1" in registry.render().splitlines(), True)
+    finally:
+        scheduler.stop()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    if checker.failures:
+        print(f"\nНе прошли: {', '.join(checker.failures)}")
+        return 1
+    print("\nВсе проверки прошли.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
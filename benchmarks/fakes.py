@@ -0,0 +1,281 @@
+"""
+Поддельные бэкенды для запуска бенчмарков на Linux: вместо `sc`, `tasklist`
+и `taskkill` возвращаются заранее заготовленные ответы Windows, вместо
+winws и реальной сети при автоподборе профиля - FakeEvaluator, вместо сотен
+машин с Zapret GUI для агрегатора парка - FakeFleet.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+
+from utils.process_manager import ServiceManager
+from utils.profile_tuner import Evaluation, Evaluator
+
+SC_QUERY = """
+SERVICE_NAME: {name}
+        TYPE               : 10  WIN32_OWN_PROCESS
+        STATE              : {code}  {state}
+                                (STOPPABLE, NOT_PAUSABLE, ACCEPTS_SHUTDOWN)
+        WIN32_EXIT_CODE    : 0  (0x0)
+        SERVICE_EXIT_CODE  : 0  (0x0)
+        CHECKPOINT         : 0x0
+        WAIT_HINT          : 0x0
+"""
+
+SC_QC = """
+[SC] QueryServiceConfig SUCCESS
+
+SERVICE_NAME: {name}
+        TYPE               : 10  WIN32_OWN_PROCESS
+        START_TYPE         : {start_code}   {start_type}_START
+        ERROR_CONTROL      : 1   NORMAL
+        BINARY_PATH_NAME   : {bin_path}
+        DISPLAY_NAME       : {name}
+"""
+
+SC_NOT_FOUND = """[SC] EnumQueryServicesStatus:OpenService FAILED 1060:
+
+The specified service does not exist as an installed service.
+"""
+
+TASKLIST = """
+Image Name                     PID Session Name        Session#    Mem Usage
+========================= ======== ================ =========== ============
+cmd.exe                       {pid} Console                    1      4,312 K
+"""
+
+STATE_CODES = {"STOPPED": 1, "START_PENDING": 2, "STOP_PENDING": 3, "RUNNING": 4}
+START_CODES = {"AUTO": 2, "DEMAND": 3, "DISABLED": 4}
+DEFAULT_BIN_PATH = '"C:\\zapret\\bin\\winws.exe" --wf-tcp=80,443'
+
+_ARG_RE = re.compile(r'(\w+)= (?:"((?:\\"|[^"])*)"|(\S+))')
+
+
+class FakeService:
+    """Состояние поддельной службы. Переходы *_PENDING завершаются через transition секунд."""
+    def __init__(self, state="STOPPED", bin_path=DEFAULT_BIN_PATH, start_type="AUTO"):
+        self.state = state
+        self.bin_path = bin_path
+        self.start_type = start_type
+        self.target = None
+        self.settle_at = 0.0
+
+    def begin(self, pending, target, transition):
+        self.state, self.target = pending, target
+        self.settle_at = time.monotonic() + transition
+
+    def current(self):
+        if self.target and time.monotonic() >= self.settle_at:
+            self.state, self.target = self.target, None
+        return self.state
+
+
+class FakeServiceManager(ServiceManager):
+    """
+    ServiceManager, у которого подменен только запуск команд: разбор ответов
+    остается настоящим. Службы zapret/WinDivert ведут себя как в SCM: есть
+    состояния START_PENDING/STOP_PENDING, коды ошибок 1056/1060/1062/1073.
+    latency - искусственная задержка каждой команды (сек), transition -
+    длительность перехода состояния службы.
+    """
+    def __init__(self, latency=0.0, admin=True, transition=0.0, services=None, **kwargs):
+        kwargs.setdefault("state_path", None)   # Установленный профиль не пишется в data/ рабочего каталога
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.admin = admin
+        self.transition = transition
+        self.commands = []
+        self._lock = threading.Lock()
+        if services is None:
+            services = {self.service_name: FakeService("RUNNING"), "WinDivert": FakeService("RUNNING", "", "DEMAND")}
+        self.services = services
+
+    def is_admin(self):
+        return self.admin
+
+    def _run_command(self, command, as_admin=False):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.commands.append(command)
+            return self._respond(command)
+
+    def _respond(self, command):
+        label = self._command_label(command)
+        if label == "tasklist":
+            return TASKLIST.format(pid=self.manual_process_pid), ""
+        if not label.startswith("sc "):
+            return "SUCCESS", ""
+        if label == "sc query" and '"' not in command:
+            return self._enumerate(), ""
+        name = command.split('"')[1]
+        service = self.services.get(name)
+        if label == "sc create":
+            if service:
+                return "[SC] CreateService FAILED 1073:\n\nThe specified service already exists.", ""
+            args = self._args(command)
+            self.services[name] = FakeService("STOPPED", args.get("binPath", ""),
+                                              args.get("start", "demand").upper())
+            return "[SC] CreateService SUCCESS", ""
+        if service is None:
+            return SC_NOT_FOUND, ""
+        state = service.current()
+        if label == "sc query":
+            return SC_QUERY.format(name=name, code=STATE_CODES[state], state=state), ""
+        if label == "sc qc":
+            return SC_QC.format(name=name, start_code=START_CODES[service.start_type],
+                                start_type=service.start_type, bin_path=service.bin_path), ""
+        if label == "sc start":
+            if state != "STOPPED":
+                return "[SC] StartService FAILED 1056:\n\nAn instance of the service is already running.", ""
+            service.begin("START_PENDING", "RUNNING", self.transition)
+            return SC_QUERY.format(name=name, code=2, state="START_PENDING"), ""
+        if label == "sc stop":
+            if state == "STOPPED":
+                return "[SC] ControlService FAILED 1062:\n\nThe service has not been started.", ""
+            service.begin("STOP_PENDING", "STOPPED", self.transition)
+            return SC_QUERY.format(name=name, code=3, state="STOP_PENDING"), ""
+        if label == "sc delete":
+            del self.services[name]
+            return "[SC] DeleteService SUCCESS", ""
+        if label == "sc config":
+            args = self._args(command)
+            service.bin_path = args.get("binPath", service.bin_path)
+            service.start_type = args.get("start", service.start_type.lower()).upper()
+            return "[SC] ChangeServiceConfig SUCCESS", ""
+        return "[SC] ChangeServiceConfig2 SUCCESS", ""
+
+    def _enumerate(self):
+        """`sc query` без имени: все активные службы."""
+        blocks = []
+        for name, service in self.services.items():
+            state = service.current()
+            if state != "STOPPED":
+                blocks.append(f"SERVICE_NAME: {name}\nDISPLAY_NAME: {name}\n" + SC_QUERY.split("\n", 2)[2]
+                              .format(code=STATE_CODES[state], state=state))
+        return "\n".join(blocks)
+
+    @staticmethod
+    def _args(command):
+        """Аргументы вида 'binPath= "..."' и 'start= auto' из команды sc."""
+        return {key: (quoted.replace('\\"', '"') if quoted else plain)
+                for key, quoted, plain in _ARG_RE.findall(command)}
+
+
+class FakeEvaluator(Evaluator):
+    """
+    Заглушка проверки кандидатов для ProfileTuner. Каждой строке аргументов
+    соответствует постоянная "настоящая" доля успеха, а каждая проверка -
+    случайный исход с этой вероятностью. Раунд занимает latency секунд.
+    """
+    name = "fake"
+
+    def __init__(self, latency=0.0, parallelism=4, hosts=("a", "b", "c", "d"), seed=0):
+        self.latency = latency
+        self.parallelism = parallelism
+        self.hosts = hosts
+        self.seed = seed
+        self.rounds = 0
+        self._lock = threading.Lock()
+
+    def quality(self, args):
+        digest = hashlib.sha256(f"{self.seed}|{args}".encode("utf-8")).digest()
+        return int.from_bytes(digest[:4], "big") / 0xFFFFFFFF
+
+    def evaluate(self, args, rounds):
+        quality = self.quality(args)
+        with self._lock:
+            self.rounds += rounds
+            rng = random.Random(f"{args}|{self.rounds}")
+        time.sleep(self.latency * rounds)
+        successes = sum(rng.random() < quality for _ in range(rounds * len(self.hosts)))
+        return Evaluation(rounds, rounds * len(self.hosts), successes, successes * 0.05)
+
+
+class FakeFleet:
+    """
+    count поддельных узлов API (GET /status, /lists, /profiles, POST /profile,
+    /lists/push) на портах 127.0.0.1 в одном потоке asyncio. latency - задержка
+    каждого ответа (сек). connections - сколько соединений приняли узлы.
+    """
+    def __init__(self, count, latency=0.0):
+        self.count = count
+        self.latency = latency
+        self.ports = []
+        self.connections = 0
+        self.requests = 0
+        self._profiles = {}
+        self._loop = asyncio.new_event_loop()
+        self._servers = []
+        self._thread = None
+
+    def start(self):
+        ready = threading.Event()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+
+        async def open_servers():
+            for index in range(self.count):
+                server = await asyncio.start_server(
+                    lambda reader, writer, index=index: self._serve(index, reader, writer), "127.0.0.1", 0)
+                self._servers.append(server)
+                self.ports.append(server.sockets[0].getsockname()[1])
+            ready.set()
+
+        asyncio.run_coroutine_threadsafe(open_servers(), self._loop)
+        ready.wait()
+        return self
+
+    def stop(self):
+        async def close_servers():
+            for server in self._servers:
+                server.close()
+
+        asyncio.run_coroutine_threadsafe(close_servers(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    async def _serve(self, index, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                length = 0
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b""):
+                        break
+                    if line.lower().startswith(b"content-length:"):
+                        length = int(line.split(b":")[1])
+                payload = json.loads(await reader.readexactly(length)) if length else {}
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                self.requests += 1
+                body = json.dumps(self._respond(index, method, path, payload)).encode("utf-8")
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                             + f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def _respond(self, index, method, path, payload):
+        if path == "/status":
+            return {"ok": True, "status": {"service_status": "RUNNING", "manual_running": False,
+                                           "profile": self._profiles.get(index, "general.bat"),
+                                           "ipset_enabled": True, "uptime": 100.0}}
+        if path == "/lists":
+            return {"ok": True, "lists": {"list-general.txt": {"sha256": "a" * 64, "size": 100, "mtime": 0}}}
+        if path == "/profiles":
+            return {"ok": True, "profiles": ["general.bat", "general (ALT).bat"]}
+        if method == "POST" and path == "/profile":
+            self._profiles[index] = payload.get("profile")
+        return {"ok": True, "message": "ok"}
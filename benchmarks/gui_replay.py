@@ -0,0 +1,221 @@
+"""
+Нагрузка пути обновления GUI записанной трассой бэкендов (см. utils/backend_trace.py).
+
+Трасса проигрывается в StatusCache, снимки идут в ServiceTab и StatsTab
+(offscreen Qt), а RepaintProbe для каждой смены состояния замеряет время от
+смены до перерисовки вкладки и считает смены, которые склейка пропустила
+(на экране сразу оказалось более позднее состояние).
+
+    python benchmarks/gui_replay.py --record trace.jsonl --changes 2000   # синтетическая трасса
+    python benchmarks/gui_replay.py trace.jsonl --rate 2000 --batch-ms 0 8 16 33
+
+Трассу с Windows записывает само приложение: "backend_trace": {"enabled": true, "path": ...}.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PySide6.QtCore import QEvent, QEventLoop, QObject, QTimer  # noqa: E402
+from PySide6.QtWidgets import QApplication, QHBoxLayout, QWidget  # noqa: E402
+
+from fakes import FakeServiceManager  # noqa: E402
+from utils.backend_trace import (ReplayConfigManager, ReplayServiceManager, TraceRecorder,  # noqa: E402
+                                 TraceReplayer, load_trace)
+from utils.config_manager import ConfigManager  # noqa: E402
+from utils.operation_scheduler import OperationScheduler  # noqa: E402
+from utils.status_cache import StatusCache  # noqa: E402
+from widgets.render_batcher import RENDER_BATCH_MS  # noqa: E402
+from widgets.service_tab import ServiceTab  # noqa: E402
+from widgets.stats_tab import StatsTab  # noqa: E402
+
+# Сколько ждать последних перерисовок после конца трассы, сек
+DRAIN_TIMEOUT = 2.0
+
+
+def record_fake_trace(path, changes, seed=0):
+    """
+    Записывает трассу поддельной службы: между опросами StatusCache она
+    запускается и останавливается, иногда меняются тип запуска и ручной запуск.
+    """
+    rng = random.Random(seed)
+    work_dir = tempfile.mkdtemp(prefix="zapret-trace-")
+    service_manager = FakeServiceManager()
+    config_manager = ConfigManager(os.path.join(work_dir, "bin"))
+    recorder = TraceRecorder(path).attach(service_manager, config_manager)
+    status_cache = StatusCache(service_manager, config_manager)
+    service = service_manager.services[service_manager.service_name]
+    try:
+        for index in range(changes):
+            service.state = "STOPPED" if service.state == "RUNNING" else "RUNNING"
+            if rng.random() < 0.1:
+                service.start_type = "DEMAND" if service.start_type == "AUTO" else "AUTO"
+            status_cache.refresh()
+    finally:
+        recorder.close()
+    return path
+
+
+class RepaintProbe(QObject):
+    """
+    Связывает перерисовки вкладки со сменами состояния трассы. Снимок узнается
+    по updated_at: слушатель StatusCache (он должен быть подписан раньше вкладок)
+    запоминает номер смены снимка и ее время, обертка render вкладки - какая
+    смена отрисована последней, а фильтр событий Paint - когда она попала на экран.
+
+    Задержка считается для каждой смены, в том числе пропущенной склейкой:
+    от смены до первой перерисовки, показавшей ее или более позднее состояние.
+    """
+    def __init__(self, widget, batcher, seqs, change_times):
+        super().__init__(widget)
+        self.seqs = seqs
+        self.change_times = change_times
+        self.rendered_seq = -1
+        self.painted_seq = -1
+        self.rendered = 0
+        self.painted = 0
+        self.latencies = []
+        render = batcher.render
+
+        def probed_render(snapshot):
+            render(snapshot)
+            seq = self.seqs.get(snapshot.get("updated_at"))
+            if seq is not None:
+                self.rendered_seq = seq
+                self.rendered += 1
+
+        batcher.render = probed_render
+        for child in [widget] + widget.findChildren(QWidget):
+            child.installEventFilter(self)
+
+    def eventFilter(self, watched, event):
+        if event.type() == QEvent.Type.Paint and self.rendered_seq > self.painted_seq:
+            now = time.perf_counter()
+            self.latencies.extend(now - self.change_times[seq]
+                                  for seq in range(self.painted_seq + 1, self.rendered_seq + 1))
+            self.painted_seq = self.rendered_seq
+            self.painted += 1
+        return False
+
+    def results(self, changes):
+        latencies = sorted(self.latencies)
+        return {
+            "changes": changes,
+            "rendered": self.rendered,
+            "painted": self.painted,
+            "dropped": changes - self.painted,
+            "final_painted": self.painted_seq == changes - 1,
+            "latency_p50": statistics.median(latencies) if latencies else None,
+            "latency_p95": latencies[int(len(latencies) * 0.95) - 1] if latencies else None,
+            "latency_max": latencies[-1] if latencies else None,
+        }
+
+
+def replay_gui(events, speed=None, rate=None, loops=1, batch_ms=RENDER_BATCH_MS):
+    """Проигрывает события в ServiceTab и StatsTab. Возвращает {"pipeline": ..., "service": ..., "stats": ...}."""
+    app = QApplication.instance() or QApplication([])
+    service_manager = ReplayServiceManager()
+    config_manager = ReplayConfigManager(os.path.join(tempfile.mkdtemp(prefix="zapret-replay-"), "bin"))
+    status_cache = StatusCache(service_manager, config_manager)
+    replayer = TraceReplayer(events, service_manager, config_manager, status_cache, speed=speed, rate=rate,
+                             loops=loops)
+    seqs = {}
+    change_times = []
+
+    def remember(snapshot):
+        seq, changed_at = replayer.current
+        if seq is not None:
+            seqs[snapshot["updated_at"]] = seq
+            change_times.append(changed_at)
+
+    status_cache.add_listener(remember)
+    status_cache.refresh()
+
+    scheduler = OperationScheduler(service_manager, status_cache)
+    scheduler.start()
+    window = QWidget()
+    layout = QHBoxLayout(window)
+    service_tab = ServiceTab(service_manager, status_cache, scheduler)
+    service_tab.timers.remove("status")     # Снимки дает только трасса
+    stats_tab = StatsTab(status_cache, scheduler)
+    layout.addWidget(service_tab)
+    layout.addWidget(stats_tab)
+    probes = {}
+    for name, tab in (("service", service_tab), ("stats", stats_tab)):
+        tab.render_batcher.batch_ms = batch_ms
+        probes[name] = RepaintProbe(tab, tab.render_batcher, seqs, change_times)
+    window.show()
+    app.processEvents()
+
+    loop = QEventLoop()
+    watchdog = QTimer()
+    watchdog.timeout.connect(lambda: None if replayer.is_running() else loop.quit())
+    watchdog.start(10)
+    replayer.start()
+    loop.exec()
+    watchdog.stop()
+    # Последние снимки еще в очереди сигналов или ждут таймера склейки
+    changes = replayer.stats["changes"]
+    deadline = time.perf_counter() + DRAIN_TIMEOUT
+    while time.perf_counter() < deadline and not all(
+            probe.painted_seq == changes - 1 for probe in probes.values()):
+        app.processEvents(QEventLoop.ProcessEventsFlag.AllEvents, 10)
+
+    results = {"pipeline": replayer.stats}
+    results.update({name: probe.results(changes) for name, probe in probes.items()})
+    scheduler.stop()
+    window.close()
+    window.deleteLater()
+    app.processEvents()
+    return results
+
+
+def format_seconds(value):
+    return f"{value * 1000:.2f} мс" if value is not None else "-"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузка пути обновления GUI записанной трассой")
+    parser.add_argument("trace", nargs="?", help="Трасса (JSON Lines); без нее записывается синтетическая")
+    parser.add_argument("--record", help="Записать синтетическую трассу в этот файл и выйти")
+    parser.add_argument("--changes", type=int, default=2000, help="Смен состояния в синтетической трассе")
+    parser.add_argument("--speed", type=float, help="Ускорение относительно записи (по умолчанию без пауз)")
+    parser.add_argument("--rate", type=float, help="Фиксированное число смен в секунду")
+    parser.add_argument("--loops", type=int, default=1, help="Сколько раз проиграть трассу")
+    parser.add_argument("--batch-ms", type=int, nargs="+", default=[RENDER_BATCH_MS],
+                        help="Интервалы склейки перерисовок для сравнения, мс")
+    args = parser.parse_args()
+
+    if args.record:
+        record_fake_trace(args.record, args.changes)
+        print(f"Трасса записана: {args.record}")
+        return 0
+    path = args.trace
+    if not path:
+        path = os.path.join(tempfile.mkdtemp(prefix="zapret-trace-"), "trace.jsonl")
+        record_fake_trace(path, args.changes)
+    events = load_trace(path)
+
+    print(f"{'склейка':>8} {'смен/с':>8} {'вкладка':>8} {'отрисовано':>10} {'на экране':>9} {'пропущено':>9} "
+          f"{'p50':>10} {'p95':>10} {'max':>10}")
+    for batch_ms in args.batch_ms:
+        results = replay_gui(events, speed=args.speed, rate=args.rate, loops=args.loops, batch_ms=batch_ms)
+        for name in ("service", "stats"):
+            tab = results[name]
+            print(f"{batch_ms:>6}мс {results['pipeline']['rate']:>8.0f} {name:>8} {tab['rendered']:>10} "
+                  f"{tab['painted']:>9} {tab['dropped']:>9} {format_seconds(tab['latency_p50']):>10} "
+                  f"{format_seconds(tab['latency_p95']):>10} {format_seconds(tab['latency_max']):>10}"
+                  + ("" if tab["final_painted"] else "  последнее состояние не отрисовано!"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
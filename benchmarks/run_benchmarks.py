@@ -0,0 +1,606 @@
+"""
+Бенчмарки горячих путей Zapret GUI. Запускаются на Linux с поддельными
+бэкендами служб и команд (см. fakes.py).
+
+    python benchmarks/run_benchmarks.py                  # прогон и сравнение с базой
+    python benchmarks/run_benchmarks.py --save-baseline  # записать новую базу
+    python benchmarks/run_benchmarks.py --quick -k ipset # без 1M записей, только ipset
+
+Каждый бенчмарк возвращает метрики "меньше - лучше" (секунды, число команд).
+Метрика считается регрессией, если она хуже базы больше чем на --threshold
+(доля, по умолчанию 0.25). Код выхода 1 при регрессии, упавшем бенчмарке
+или метрике базы, которую прогон не вернул.
+"""
+import argparse
+import functools
+import glob
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(ROOT_DIR, "src")
+sys.path.insert(0, SRC_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import FakeEvaluator, FakeFleet, FakeServiceManager  # noqa: E402
+from utils.bundle_updater import (MANIFEST_NAME, SIGNATURE_SUFFIX, BundleUpdater, build_manifest,  # noqa: E402
+                                  generate_key, sign_manifest)
+from utils.config_manager import ConfigManager  # noqa: E402
+from utils.fleet import FleetAggregator, FleetNode  # noqa: E402
+from utils.hostlist_stats import hostlist_match, read_hostlist  # noqa: E402
+from utils.ipset import IPSet  # noqa: E402
+from utils.ipset_cache import cache_path_for, ensure_cache, open_ipset  # noqa: E402
+from utils.ipset_pipeline import ingest  # noqa: E402
+from utils.profile_parser import parse_profile  # noqa: E402
+from utils.profile_tuner import ProfileTuner, generate_candidates  # noqa: E402
+from utils.reachability import DAY, ReachabilityHistory  # noqa: E402
+from utils.settings_manager import SettingsManager  # noqa: E402
+from utils.status_cache import StatusCache  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+DEFAULT_THRESHOLD = 0.25
+# Метрики короче этого времени слишком шумные для сравнения в процентах
+MIN_COMPARABLE_SECONDS = 0.0005
+
+IPSET_SIZES = (("6k", 6000), ("100k", 100000), ("1m", 1000000))
+LOOKUPS = 100000
+HOSTLIST_QUERIES = 100000
+REPLAY_CHANGES = 2000
+REPLAY_RATE = 2000       # Смен состояния в секунду: на порядки чаще реального опроса
+
+
+def measure(func, repeat=5, setup=None):
+    """Медиана времени выполнения func() за repeat прогонов (setup() не учитывается)."""
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def generate_ipset(path, count, seed=1):
+    """Синтетический ipset: случайные IPv4 /24-/32 и немного IPv6, как в реальных списках."""
+    rng = random.Random(seed)
+    with open(path, 'w', encoding='utf-8', newline='\n') as f:
+        for i in range(count):
+            if i % 50 == 0:
+                f.write(f"2001:db8:{rng.randrange(65536):x}:{rng.randrange(65536):x}::/64\n")
+            else:
+                address = socket.inet_ntoa(rng.getrandbits(32).to_bytes(4, "big"))
+                f.write(f"{address}/{rng.choice((24, 28, 32))}\n")
+
+
+def ipset_sizes(quick=False):
+    return IPSET_SIZES[:2] if quick else IPSET_SIZES
+
+
+class BenchmarkContext:
+    """Временный рабочий каталог и общие данные для бенчмарков."""
+    def __init__(self, quick=False):
+        self.quick = quick
+        self.tmp_dir = tempfile.mkdtemp(prefix="zapret-bench-")
+        self.ipset_files = {}
+
+    def ipset_file(self, label, count):
+        if label not in self.ipset_files:
+            path = os.path.join(self.tmp_dir, f"ipset-{label}.txt")
+            generate_ipset(path, count)
+            self.ipset_files[label] = path
+        return self.ipset_files[label]
+
+    def ipset_sizes(self):
+        return ipset_sizes(self.quick)
+
+    def close(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+def bench_bat_parsing(ctx):
+    paths = sorted(glob.glob(os.path.join(ROOT_DIR, "general*.bat")))
+    manager = FakeServiceManager(winsw_path=os.path.join(ctx.tmp_dir, "bin", "winws.exe"))
+
+    def parse_all():
+        for path in paths:
+            parse_profile(path, {"GameFilter": "1024-65535"})
+
+    def install_args():
+        for path in paths:
+            manager._parse_bat_file(path)
+
+    return {
+        "parse_profiles": measure(parse_all, repeat=20),
+        "install_args": measure(install_args, repeat=20),
+    }
+
+
+def bench_ipset(ctx):
+    results = {}
+    rng = random.Random(2)
+    queries = [rng.getrandbits(32) for _ in range(LOOKUPS)]
+    for label, count in ctx.ipset_sizes():
+        path = ctx.ipset_file(label, count)
+        repeat = 3 if count >= 1000000 else 5
+        results[f"load_{label}"] = measure(lambda: IPSet.load(path), repeat=repeat)
+
+        out_path = os.path.join(ctx.tmp_dir, f"aggregated-{label}.txt")
+
+        def aggregate():
+            with open(path, 'rb') as f:
+                ingest(iter(lambda: f.read(65536), b""), out_path)
+
+        results[f"aggregate_{label}"] = measure(aggregate, repeat=repeat)
+
+        def drop_cache():
+            if os.path.exists(cache_path_for(path)):
+                os.remove(cache_path_for(path))
+
+        results[f"cache_build_{label}"] = measure(lambda: ensure_cache(path), repeat=repeat, setup=drop_cache)
+        results[f"cache_open_{label}"] = measure(lambda: open_ipset(path)[0].close(), repeat=20)
+
+        ipset = IPSet.load(path)
+
+        def lookup():
+            for value in queries:
+                value in ipset
+
+        results[f"lookup_{label}_x{LOOKUPS // 1000}k"] = measure(lookup, repeat=repeat)
+    return results
+
+
+def bench_hostlist(ctx):
+    entries = set(read_hostlist(os.path.join(ROOT_DIR, "lists", "list-general.txt")))
+    rng = random.Random(3)
+    known = sorted(entries)
+    hosts = []
+    for i in range(HOSTLIST_QUERIES):
+        if i % 3 == 0:
+            hosts.append("cdn-%d.%s" % (i, rng.choice(known)))
+        else:
+            hosts.append("www.site-%d.example%d.com" % (i, i % 97))
+
+    def match_all():
+        for host in hosts:
+            hostlist_match(host, entries)
+
+    return {f"match_x{HOSTLIST_QUERIES // 1000}k": measure(match_all)}
+
+
+def bench_settings(ctx):
+    path = os.path.join(ctx.tmp_dir, "config.json")
+    manager = SettingsManager(path)
+    manager.settings.update({"filter": {"settings": {"selected_profile": "general.bat"}},
+                             "control_api": {"enabled": False, "port": 8765}})
+    saves = 200
+
+    def save_many():
+        for i in range(saves):
+            manager.set_setting("counter", i)
+
+    return {f"save_x{saves}": measure(save_many)}
+
+
+def bench_status_polling(ctx):
+    manager = FakeServiceManager(winsw_path=os.path.join(ctx.tmp_dir, "bin", "winws.exe"))
+    manager.manual_process_pid = 4242
+    config = ConfigManager(os.path.join(ctx.tmp_dir, "bin"))
+    settings = SettingsManager(os.path.join(ctx.tmp_dir, "status-config.json"))
+    cache = StatusCache(manager, config, settings)
+    ticks = 50
+
+    def poll():
+        for _ in range(ticks):
+            cache.refresh()
+
+    seconds = measure(poll) / ticks
+    manager.commands.clear()
+    cache.refresh()
+    return {"tick_seconds": seconds, "commands_per_tick": float(len(manager.commands))}
+
+
+def bench_service_pipeline(ctx):
+    """Смена профиля и удаление служб: sc отвечает за 10 мс, переход состояния занимает 50 мс."""
+    paths = sorted(glob.glob(os.path.join(ROOT_DIR, "general*.bat")))[:2]
+    manager = FakeServiceManager(latency=0.01, transition=0.05,
+                                 winsw_path=os.path.join(ctx.tmp_dir, "bin", "winws.exe"))
+    switches = iter(paths * 100)
+
+    def switch_profile():
+        success, message = manager.install_service(next(switches))
+        if not success:
+            raise RuntimeError(message)
+
+    def reinstall():
+        manager.install_service(paths[0])
+
+    manager.commands.clear()
+    switch_seconds = measure(switch_profile)
+    commands = len(manager.commands) / 5
+    return {
+        "switch_profile": switch_seconds,
+        "commands_per_switch": float(commands),
+        "uninstall": measure(manager.uninstall_service, setup=reinstall),
+    }
+
+
+def bench_profile_tuner(ctx):
+    """Автоподбор по всему пространству параметров: раунд проверки занимает 1 мс, 4 проверки параллельно."""
+    profile = parse_profile(os.path.join(ROOT_DIR, "general (ALT).bat"), {"GameFilter": "1024-65535"})
+    candidates = generate_candidates()
+    evaluator = FakeEvaluator(latency=0.001)
+
+    def tune():
+        ProfileTuner(profile, evaluator, candidates).run()
+
+    seconds = measure(tune, repeat=3)
+    evaluator.rounds = 0
+    tune()
+    return {"tune": seconds, "rounds_per_tune": float(evaluator.rounds)}
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def bench_bundle_update(ctx):
+    """Обновление файлов с локального HTTP-сервера: в релизе изменился только winws.exe."""
+    release_dir = os.path.join(ctx.tmp_dir, "release")
+    local_dir = os.path.join(ctx.tmp_dir, "installed")
+    for path in (release_dir, local_dir):
+        shutil.copytree(os.path.join(ROOT_DIR, "bin"), os.path.join(path, "bin"), dirs_exist_ok=True)
+        for bat in glob.glob(os.path.join(ROOT_DIR, "general*.bat")):
+            shutil.copy(bat, path)
+    with open(os.path.join(release_dir, "bin", "winws.exe"), "ab") as f:
+        f.write(b"\0" * 16)
+    private_key, public_key = generate_key()
+    data = json.dumps(build_manifest(release_dir, version="bench")).encode("utf-8")
+    with open(os.path.join(release_dir, MANIFEST_NAME), "wb") as f:
+        f.write(data)
+    with open(os.path.join(release_dir, MANIFEST_NAME + SIGNATURE_SUFFIX), "w", encoding="ascii") as f:
+        f.write(sign_manifest(data, private_key))
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(_QuietHandler, directory=release_dir))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    manifest_url = f"http://127.0.0.1:{server.server_port}/{MANIFEST_NAME}"
+    manager = FakeServiceManager(latency=0.01, transition=0.05)
+    installed_exe = os.path.join(local_dir, "bin", "winws.exe")
+    original_exe = open(installed_exe, "rb").read()
+    downloaded = []
+    windows = []
+
+    def reset():
+        with open(installed_exe, "wb") as f:
+            f.write(original_exe)
+
+    def update():
+        updater = BundleUpdater(manifest_url, root_dir=local_dir, public_key=public_key)
+        success, message, plan = updater.check()
+        if not success:
+            raise RuntimeError(message)
+        downloaded.append(plan.download_size)
+        updater.download(plan)
+        started = time.perf_counter()
+        success, message = updater.apply(manager)
+        windows.append(time.perf_counter() - started)
+        if not success:
+            raise RuntimeError(message)
+
+    try:
+        update_seconds = measure(update, setup=reset)
+        check_seconds = measure(lambda: BundleUpdater(manifest_url, root_dir=local_dir, public_key=public_key).check())
+    finally:
+        server.shutdown()
+        server.server_close()
+    return {
+        "update": update_seconds,
+        "check_unchanged": check_seconds,
+        "service_window": statistics.median(windows),
+        "bytes_per_update": float(statistics.median(downloaded)),
+    }
+
+
+def bench_reachability_history(ctx):
+    """История проверок: 500 доменов x 3 профиля за 40 дней (200k строк, в --quick 50k)."""
+    rows = 50000 if ctx.quick else 200000
+    domains = [f"d{i}.example" for i in range(499)] + ["youtube.com"]
+    profiles = [None, "general.bat", "general (ALT).bat"]
+    rnd = random.Random(1)
+    now = time.time()
+    batches = rows // len(domains)
+    history = ReachabilityHistory(os.path.join(ctx.tmp_dir, "reachability.sqlite3"))
+    try:
+        for batch in range(batches):
+            results = [{"domain": domain, "ok": rnd.random() > 0.2, "tls_ms": rnd.uniform(20, 300)}
+                       for domain in domains]
+            history.record(results, profiles[batch % 3], "net", ts=now - 40 * DAY + batch * 40 * DAY / batches)
+        return {
+            "p95_per_profile_7d": measure(lambda: history.tls_percentiles("youtube.com", 7, now=now)),
+            "stale_domains": measure(lambda: history.stale_domains(domains, "general.bat", "net", DAY, now=now)),
+            "compact": measure(lambda: history.compact(now=now), repeat=1),
+        }
+    finally:
+        history.close()
+
+
+def bench_fleet(ctx):
+    """Агрегатор парка: 300 узлов (в --quick 50), каждый отвечает за 20 мс."""
+    count = 50 if ctx.quick else 300
+    fleet = FakeFleet(count, latency=0.02).start()
+    aggregator = FleetAggregator([FleetNode(f"node{i}", "127.0.0.1", port) for i, port in enumerate(fleet.ports)],
+                                 poll_interval=3600)
+    names = list(aggregator.nodes)
+    threads_before = threading.active_count()
+    aggregator.start()
+    try:
+        while aggregator.cycles == 0:
+            time.sleep(0.01)
+        threads = threading.active_count() - threads_before
+
+        def cycle():
+            aggregator.refresh().result()
+
+        def push():
+            aggregator.push_profile(names, "general (ALT).bat").result()
+
+        return {
+            "poll_cycle": measure(cycle),
+            "push_profile_all": measure(push, repeat=3),
+            "connections": float(fleet.connections),
+            "threads": float(threads),
+        }
+    finally:
+        aggregator.stop()
+        fleet.stop()
+
+
+def _child_error(result, default):
+    """Причина падения дочернего процесса: строка фатальной ошибки интерпретатора или последняя строка stderr."""
+    lines = result.stderr.strip().splitlines()
+    reason = next((line for line in lines if line.startswith("Fatal Python error")), lines[-1] if lines else default)
+    return f"{reason} (код {result.returncode})"
+
+
+_GUI_CHILD = r"""
+import os, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {src!r})
+sys.path.insert(0, {bench!r})
+from PySide6.QtWidgets import QApplication
+import main
+from fakes import FakeServiceManager
+main.ServiceManager = FakeServiceManager
+app = QApplication([])
+window = main.MainWindow(app)
+app.processEvents()
+print(time.perf_counter() - started)
+window.close()
+"""
+
+
+def bench_gui_startup(ctx):
+    """Время от запуска интерпретатора до построенного главного окна (offscreen Qt)."""
+    work_dir = os.path.join(ctx.tmp_dir, "gui")
+    os.makedirs(work_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(ROOT_DIR, "general*.bat")):
+        shutil.copy(path, work_dir)
+    if not os.path.exists(os.path.join(work_dir, "lists")):
+        shutil.copytree(os.path.join(ROOT_DIR, "lists"), os.path.join(work_dir, "lists"))
+    code = _GUI_CHILD.format(src=SRC_DIR, bench=os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, QT_QPA_PLATFORM="offscreen")
+    timings = []
+    for _ in range(3):
+        result = subprocess.run([sys.executable, "-c", code], cwd=work_dir, env=env,
+                                capture_output=True, text=True, timeout=120)
+        if result.returncode != 0:
+            raise RuntimeError(_child_error(result, "GUI не запустился"))
+        timings.append(float(result.stdout.strip().splitlines()[-1]))
+    return {"main_window": statistics.median(timings)}
+
+
+_REPLAY_CHILD = r"""
+import json, sys
+sys.path.insert(0, {bench!r})
+import gui_replay
+events = gui_replay.load_trace(gui_replay.record_fake_trace({trace!r}, {changes}))
+print(json.dumps(gui_replay.replay_gui(events, rate={rate})))
+"""
+
+
+def bench_gui_replay(ctx):
+    """Синтетическая трасса с фиксированной частотой смен в ServiceTab и StatsTab (offscreen Qt)."""
+    changes = 500 if ctx.quick else REPLAY_CHANGES
+    code = _REPLAY_CHILD.format(bench=os.path.dirname(os.path.abspath(__file__)),
+                                trace=os.path.join(ctx.tmp_dir, "backend-trace.jsonl"),
+                                changes=changes, rate=REPLAY_RATE)
+    env = dict(os.environ, QT_QPA_PLATFORM="offscreen")
+    result = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, timeout=300)
+    if result.returncode != 0:
+        raise RuntimeError(_child_error(result, "Проигрывание не удалось"))
+    results = json.loads(result.stdout.strip().splitlines()[-1])
+    metrics = {}
+    for tab in ("service", "stats"):
+        if not results[tab]["final_painted"]:
+            raise RuntimeError(f"{tab}: последнее состояние трассы не отрисовано")
+        metrics[f"latency_p95_{tab}"] = results[tab]["latency_p95"]
+        metrics[f"latency_max_{tab}"] = results[tab]["latency_max"]
+        metrics[f"repaints_{tab}"] = results[tab]["painted"]
+    return metrics
+
+
+BENCHMARKS = {
+    "bat": bench_bat_parsing,
+    "ipset": bench_ipset,
+    "hostlist": bench_hostlist,
+    "settings": bench_settings,
+    "status": bench_status_polling,
+    "service": bench_service_pipeline,
+    "tuner": bench_profile_tuner,
+    "update": bench_bundle_update,
+    "history": bench_reachability_history,
+    "fleet": bench_fleet,
+    "gui": bench_gui_startup,
+    "replay": bench_gui_replay,
+}
+
+
+def run(selected, quick=False):
+    """Прогон выбранных групп. Возвращает (результаты, {группа: ошибка}) для групп, которые упали."""
+    ctx = BenchmarkContext(quick)
+    results = {}
+    failures = {}
+    try:
+        for group, func in BENCHMARKS.items():
+            if selected and not any(key in group for key in selected):
+                continue
+            print(f"[{group}]", flush=True)
+            try:
+                metrics = func(ctx)
+            except Exception as e:
+                print(f"    ОШИБКА: {e}")
+                failures[group] = str(e) or type(e).__name__
+                continue
+            for name, value in metrics.items():
+                results[f"{group}.{name}"] = value
+                print(f"    {name:<28} {format_value(name, value)}")
+    finally:
+        ctx.close()
+    return results, failures
+
+
+def missing_metrics(results, baseline, selected, quick=False):
+    """
+    Метрики базы, которых нет в прогоне: бенчмарк перестал их возвращать.
+    Не выбранные через -k группы и пропущенные в --quick размеры ipset не считаются.
+    """
+    measured = {label for label, _ in ipset_sizes(quick)}
+    skipped_sizes = [label for label, _ in IPSET_SIZES if label not in measured]
+    missing = []
+    for name in sorted(baseline):
+        group, metric = name.split(".", 1)
+        if name in results or group not in BENCHMARKS:
+            continue
+        if selected and not any(key in group for key in selected):
+            continue
+        if group == "ipset" and any(f"_{label}" in metric for label in skipped_sizes):
+            continue
+        missing.append(name)
+    return missing
+
+
+def _is_count(name):
+    """Метрики-счетчики (число команд, раундов проверки, байт, соединений, потоков, перерисовок), остальные - секунды."""
+    return name.rsplit(".", 1)[-1].startswith(("commands", "rounds", "bytes", "connections", "threads",
+                                               "repaints"))
+
+
+def format_value(name, value):
+    if _is_count(name):
+        return f"{value:.0f}"
+    if value < 0.001:
+        return f"{value * 1e6:.1f} мкс"
+    if value < 1:
+        return f"{value * 1e3:.2f} мс"
+    return f"{value:.2f} с"
+
+
+def compare(results, baseline, threshold):
+    """Список регрессий: (метрика, база, текущее, относительное изменение)."""
+    regressions = []
+    for name, value in results.items():
+        base = baseline.get(name)
+        if base is None or base <= 0:
+            continue
+        if not _is_count(name) and max(base, value) < MIN_COMPARABLE_SECONDS:
+            continue
+        change = (value - base) / base
+        if change > threshold:
+            regressions.append((name, base, value, change))
+    return regressions
+
+
+def load_baseline(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f).get("results", {})
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def save_baseline(path, results):
+    existing = load_baseline(path)
+    existing.update(results)  # Частичный прогон (-k) обновляет только свои метрики
+    data = {
+        "machine": {"python": platform.python_version(), "platform": platform.platform(),
+                    "processor": platform.processor()},
+        "saved_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "results": existing,
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=4, sort_keys=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки Zapret GUI")
+    parser.add_argument("-k", dest="select", action="append", default=[],
+                        help="Запускать только группы, содержащие подстроку (bat, ipset, hostlist, ...)")
+    parser.add_argument("--quick", action="store_true", help="Пропустить ipset на 1M записей")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Файл базовых результатов")
+    parser.add_argument("--save-baseline", action="store_true", help="Сохранить результаты как базу")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Допустимое ухудшение относительно базы (доля)")
+    parser.add_argument("--json", help="Записать результаты прогона в файл")
+    args = parser.parse_args()
+
+    results, failures = run(args.select, args.quick)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+    if failures:
+        print("\nУпавшие бенчмарки:")
+        for group, error in failures.items():
+            print(f"    {group}: {error}")
+
+    if args.save_baseline:
+        if failures:
+            print("\nБаза не сохранена: есть упавшие бенчмарки.")
+            return 1
+        save_baseline(args.baseline, results)
+        print(f"\nБаза сохранена: {args.baseline}")
+        return 0
+
+    baseline = load_baseline(args.baseline)
+    if not baseline:
+        print("\nБаза не найдена, сравнение пропущено (запустите с --save-baseline).")
+        return 1 if failures else 0
+    missing = [name for name in missing_metrics(results, baseline, args.select, args.quick)
+               if name.split(".", 1)[0] not in failures]
+    if missing:
+        print("\nМетрики базы, которых нет в прогоне:")
+        for name in missing:
+            print(f"    {name}")
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"\nРегрессии (порог {args.threshold:.0%}):")
+        for name, base, value, change in regressions:
+            print(f"    {name}: {format_value(name, base)} -> {format_value(name, value)} (+{change:.0%})")
+    elif not failures and not missing:
+        print(f"\nРегрессий нет (порог {args.threshold:.0%}).")
+    return 1 if failures or missing or regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
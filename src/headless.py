@@ -0,0 +1,74 @@
+"""
+Headless-режим: опрашивает состояние службы и обслуживает локальный JSON API без GUI.
+Запуск: python src/headless.py [--host 127.0.0.1] [--port 8765] [--interval 3]
+"""
+import argparse
+import time
+
+from utils.settings_manager import SettingsManager
+from utils.config_manager import ConfigManager
+from utils.process_manager import ServiceManager
+from utils.status_cache import StatusCache
+from utils.control_server import ControlServer, DEFAULT_HOST, DEFAULT_PORT, api_token
+from utils.operation_scheduler import OperationScheduler
+from utils.network_profiles import NetworkProfileManager
+from utils.backend_trace import recorder_from_settings
+
+
+def main():
+    settings_manager = SettingsManager()
+    api_settings = settings_manager.get_setting("control_api", {})
+
+    parser = argparse.ArgumentParser(description="Zapret GUI headless core")
+    parser.add_argument("--host", default=api_settings.get("host", DEFAULT_HOST))
+    parser.add_argument("--port", type=int, default=api_settings.get("port", DEFAULT_PORT))
+    parser.add_argument("--token", help="Токен API (по умолчанию - из config.json, создается при первом запуске).")
+    parser.add_argument("--metrics", action="store_true", default=api_settings.get("metrics", False),
+                        help="Включить эндпоинт /metrics.")
+    parser.add_argument("--interval", type=float, default=3.0, help="Интервал опроса службы, сек.")
+    args = parser.parse_args()
+
+    service_manager = ServiceManager()
+    service_manager.supervisor_settings = settings_manager.get_setting("supervisor", {})
+    config_manager = ConfigManager()
+    recorder = recorder_from_settings(settings_manager, service_manager, config_manager)
+    status_cache = StatusCache(service_manager, config_manager, settings_manager)
+    status_cache.refresh()
+    scheduler = OperationScheduler(service_manager, status_cache)
+    scheduler.start()
+
+    server = ControlServer(status_cache, config_manager, service_manager, settings_manager,
+                           host=args.host, port=args.port, token=args.token or api_token(settings_manager),
+                           metrics_enabled=args.metrics, scheduler=scheduler)
+    success, message = server.start()
+    print(message)
+    if not success:
+        return 1
+
+    network_manager = None
+    network_settings = settings_manager.get_setting("network_profiles", {})
+    if network_settings.get("enabled", False):
+        network_manager = NetworkProfileManager(service_manager, scheduler, settings_manager, settings=network_settings,
+                                                on_change=lambda state: status_cache.update(network=state))
+        network_manager.start()
+
+    try:
+        while True:
+            time.sleep(args.interval)
+            if not scheduler.is_busy():  # Во время операции снимок обновит сам планировщик
+                status_cache.refresh()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if network_manager:
+            network_manager.stop()
+        server.stop()
+        scheduler.stop()
+        service_manager.shutdown()
+        if recorder:
+            recorder.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
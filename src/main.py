@@ -1,11 +1,21 @@
 import sys
 from PySide6.QtWidgets import (QApplication, QMainWindow, QWidget, 
-                               QHBoxLayout, QVBoxLayout, QStackedWidget, QMessageBox)
-from PySide6.QtGui import QIcon
-from PySide6.QtCore import QCoreApplication, Qt
+                               QHBoxLayout, QVBoxLayout, QStackedWidget, QMessageBox,
+                               QSystemTrayIcon, QMenu)
+from PySide6.QtGui import QIcon, QAction
+from PySide6.QtCore import QCoreApplication, Qt, QEvent, Signal
 
 from utils.settings_manager import SettingsManager
+from utils.config_manager import ConfigManager
 from utils.process_manager import ServiceManager
+from utils.status_cache import StatusCache
+from utils.snapshot_store import DEFAULT_KEEP_AUTO, SnapshotStore
+from utils.operation_scheduler import OperationScheduler
+from utils.control_server import ControlServer, DEFAULT_HOST, DEFAULT_PORT, api_token
+from utils.timer_scheduler import TimerScheduler
+from utils.network_profiles import NetworkProfileManager
+from utils.reachability import ReachabilityHistory
+from utils.backend_trace import recorder_from_settings
 
 # Import widgets
 from widgets.header import Header
@@ -18,17 +28,53 @@ from widgets.game_filter_tab import GameFilterTab
 from widgets.stats_tab import StatsTab
 from widgets.diagnostics_tab import DiagnosticsTab
 from widgets.domain_checker_tab import DomainCheckerTab
+from widgets.fleet_tab import FleetTab
 from widgets.backup_tab import BackupTab
 from widgets.about_tab import AboutTab
 
+ICON_PATH = "src/resources/icon.ico"
+
+TRAY_STATUS_TEXT = {
+    "RUNNING": "служба запущена",
+    "STOPPED": "служба остановлена",
+    "NOT_FOUND": "служба не установлена",
+}
+
 class MainWindow(QMainWindow):
+    # Обновления снимка приходят из разных потоков; значок в трее обновляется в GUI-потоке
+    tray_status_changed = Signal(object)
+
     def __init__(self, app):
         super().__init__()
         self.settings_manager = SettingsManager()
         self.app = app
+        general = self.settings_manager.get_setting("general", {})
+        self.minimize_to_tray = general.get("minimize_to_tray", False)
+        self.start_minimized = general.get("start_minimized", False)
+        self.quitting = False
+        # Периодические задачи всех вкладок; пока окно скрыто, ui-задачи стоят, фоновые редки
+        self.timers = TimerScheduler(self)
+
+        # Общие для всех вкладок менеджеры и снимок состояния
+        self.service_manager = ServiceManager()
+        self.service_manager.supervisor_settings = self.settings_manager.get_setting("supervisor", {})
+        self.config_manager = ConfigManager()
+        # Запись ответов менеджеров для воспроизведения вне Windows ("backend_trace")
+        self.backend_recorder = recorder_from_settings(self.settings_manager, self.service_manager,
+                                                       self.config_manager)
+        self.status_cache = StatusCache(self.service_manager, self.config_manager, self.settings_manager)
+        # Все изменения службы (GUI и API) идут через одну очередь
+        self.scheduler = OperationScheduler(self.service_manager, self.status_cache)
+        self.scheduler.start()
+        self.snapshot_store = SnapshotStore(
+            keep_auto=self.settings_manager.get_setting("backup", {}).get("keep_auto", DEFAULT_KEEP_AUTO))
+        self.control_server = None
+        self.network_manager = None
+        self.reachability_history = ReachabilityHistory()
+        self.fleet_tab = None
 
         self.setWindowTitle("Zapret GUI")
-        self.setWindowIcon(QIcon("src/resources/icon.ico")) # Assuming icon exists
+        self.setWindowIcon(QIcon(ICON_PATH))
         self.resize(1280, 800)
         self.setStyleSheet("background-color: #f0f2f5;")
 
@@ -66,21 +112,156 @@ class MainWindow(QMainWindow):
         # Connect navigation
         self.nav_bar.page_changed.connect(self.pages.setCurrentIndex)
 
+        self.tray = None
+        self.setup_tray()
+        self.start_control_server()
+        self.start_network_manager()
+
+    def start_network_manager(self):
+        """Автоприменение профиля при смене сети, если включено ("network_profiles")."""
+        network_settings = self.settings_manager.get_setting("network_profiles", {})
+        if not network_settings.get("enabled", False):
+            return
+        self.network_manager = NetworkProfileManager(
+            self.service_manager, self.scheduler, self.settings_manager, settings=network_settings,
+            on_change=lambda state: self.status_cache.update(network=state))
+        self.network_manager.start()
+
+    def setup_tray(self):
+        """Значок в трее нужен, если окно может прятаться в трей."""
+        if not (self.minimize_to_tray or self.start_minimized) or not QSystemTrayIcon.isSystemTrayAvailable():
+            return
+        self.tray = QSystemTrayIcon(QIcon(ICON_PATH), self)
+        self.tray.setToolTip("Zapret GUI")
+        menu = QMenu(self)
+        self.tray_status_action = QAction("Состояние: ...", menu)
+        self.tray_status_action.setEnabled(False)
+        menu.addAction(self.tray_status_action)
+        menu.addSeparator()
+        show_action = QAction("Открыть", menu)
+        show_action.triggered.connect(self.show_from_tray)
+        menu.addAction(show_action)
+        restart_action = QAction("Перезапустить службу", menu)
+        restart_action.triggered.connect(lambda: self.scheduler.submit("restart"))
+        menu.addAction(restart_action)
+        quit_action = QAction("Выход", menu)
+        quit_action.triggered.connect(self.quit_from_tray)
+        menu.addAction(quit_action)
+        self.tray.setContextMenu(menu)
+        self.tray.activated.connect(self.on_tray_activated)
+        self.tray_status_changed.connect(self.render_tray_status)
+        self.status_cache.add_listener(self.tray_status_changed.emit)
+        self.tray.show()
+        if self.minimize_to_tray:
+            # Закрытое в трей окно не должно завершать приложение; настоящий выход - в closeEvent
+            self.app.setQuitOnLastWindowClosed(False)
+
+    def render_tray_status(self, snapshot):
+        if snapshot.get("manual_running"):
+            text = "ручной запуск активен"
+        else:
+            text = TRAY_STATUS_TEXT.get(snapshot.get("service_status"), "состояние неизвестно")
+        self.tray_status_action.setText(f"Состояние: {text}")
+        self.tray.setToolTip(f"Zapret GUI: {text}")
+
+    def on_tray_activated(self, reason):
+        if reason in (QSystemTrayIcon.ActivationReason.Trigger, QSystemTrayIcon.ActivationReason.DoubleClick):
+            self.show_from_tray()
+
+    def show_from_tray(self):
+        self.showNormal()
+        self.activateWindow()
+        self.raise_()
+
+    def quit_from_tray(self):
+        self.quitting = True
+        self.close()
+        self.app.quit()
+
+    def update_visibility(self):
+        self.timers.set_visible(self.isVisible() and not self.isMinimized())
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.update_visibility()
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.update_visibility()
+
+    def changeEvent(self, event):
+        super().changeEvent(event)
+        if event.type() == QEvent.Type.WindowStateChange:
+            if self.isMinimized() and self.tray:
+                self.hide()  # Свернутое окно уходит в трей
+            self.update_visibility()
+
+    def start_control_server(self):
+        """Запускает локальный JSON API, если он включен в настройках ("control_api")."""
+        api_settings = self.settings_manager.get_setting("control_api", {})
+        if not api_settings.get("enabled", False):
+            return
+        self.control_server = ControlServer(
+            self.status_cache, self.config_manager, self.service_manager, self.settings_manager,
+            host=api_settings.get("host", DEFAULT_HOST),
+            port=api_settings.get("port", DEFAULT_PORT),
+            token=api_token(self.settings_manager),
+            metrics_enabled=api_settings.get("metrics", False),
+            snapshot_store=self.snapshot_store,
+            scheduler=self.scheduler,
+        )
+        success, message = self.control_server.start()
+        print(message)
+        if not success:
+            self.control_server = None
+
+    def closeEvent(self, event):
+        if self.tray and self.minimize_to_tray and not self.quitting:
+            event.ignore()
+            self.hide()
+            return
+        if self.control_server:
+            self.control_server.stop()
+        if self.network_manager:
+            self.network_manager.stop()
+        if self.fleet_tab:
+            self.fleet_tab.stop()
+        self.game_filter_tab.stop()
+        self.scheduler.stop()
+        self.service_manager.shutdown()
+        self.reachability_history.close()
+        if self.backend_recorder:
+            self.backend_recorder.close()
+        if self.tray:
+            self.tray.hide()
+        super().closeEvent(event)
+        # Значок в трее и отключенный quitOnLastWindowClosed не дают циклу событий завершиться сам
+        self.app.quit()
+
     def add_pages(self):
         # Tuples of (icon_path, name, widget_instance)
         # Using placeholders for icons
+        self.game_filter_tab = GameFilterTab(self.config_manager, self.settings_manager)
         page_data = [
-            ("src/resources/service.svg", "Служба", ServiceTab()),
-            ("src/resources/filter.svg", "Фильтр", FilterTab()),
-            ("src/resources/lists.svg", "Списки", ListsTab()),
-            ("src/resources/game.svg", "Игровой фильтр", GameFilterTab()),
-            ("src/resources/stats.svg", "Статистика", StatsTab()),
-            ("src/resources/diagnostics.svg", "Диагностика", DiagnosticsTab()),
-            ("src/resources/domain.svg", "Проверка доменов", DomainCheckerTab()),
+            ("src/resources/service.svg", "Служба", ServiceTab(self.service_manager, self.status_cache, self.scheduler, self.timers)),
+            ("src/resources/filter.svg", "Фильтр", FilterTab(self.config_manager, service_manager=self.service_manager)),
+            ("src/resources/lists.svg", "Списки", ListsTab(self.snapshot_store, self.settings_manager,
+                                                           self.config_manager, self.status_cache, self.scheduler)),
+            ("src/resources/game.svg", "Игровой фильтр", self.game_filter_tab),
+            ("src/resources/stats.svg", "Статистика", StatsTab(self.status_cache, self.scheduler)),
+            ("src/resources/diagnostics.svg", "Диагностика", DiagnosticsTab(self.service_manager, self.settings_manager,
+                                                                            self.reachability_history, self.status_cache)),
+            ("src/resources/domain.svg", "Проверка доменов", DomainCheckerTab(self.reachability_history, self.settings_manager,
+                                                                              self.status_cache, self.timers)),
             ("src/resources/settings.svg", "Настройки", SettingsTab(app=self.app)),
-            ("src/resources/backup.svg", "Бэкапы", BackupTab()),
-            ("src/resources/about.svg", "О программе", AboutTab())
+            ("src/resources/backup.svg", "Бэкапы", BackupTab(self.snapshot_store)),
+            ("src/resources/about.svg", "О программе", AboutTab(self.settings_manager, self.scheduler))
         ]
+        fleet_settings = self.settings_manager.get_setting("fleet", {})
+        if fleet_settings.get("enabled", False):
+            # Режим агрегатора: сводка по другим машинам с Zapret GUI
+            self.fleet_tab = FleetTab(fleet_settings)
+            page_data.insert(1, ("src/resources/service.svg", "Парк", self.fleet_tab))
         
         for i, (icon, name, widget) in enumerate(page_data):
             self.pages.addWidget(widget)
@@ -115,7 +296,12 @@ def main():
     app.setStyleSheet(load_stylesheet())
 
     window = MainWindow(app)
-    window.show()
+    if not window.start_minimized:
+        window.show()
+    elif window.tray:
+        window.update_visibility()  # Сразу в трей: окно не создается на экране
+    else:
+        window.showMinimized()
     sys.exit(app.exec())
 
 if __name__ == "__main__":
@@ -0,0 +1,318 @@
+"""
+Запись и воспроизведение ответов ServiceManager и ConfigManager.
+
+TraceRecorder оборачивает вызовы менеджеров и пишет их результаты с
+таймингами в трассу (JSON Lines). Записанную на Windows трассу можно
+проиграть где угодно: ReplayServiceManager и ReplayConfigManager отвечают
+записанными результатами вместо `sc` и файлов-флагов, а TraceReplayer подает
+смены состояния в StatusCache с исходными интервалами, с ускорением или с
+фиксированной частотой (тысячи смен в секунду) - так нагружается путь
+обновления GUI без Windows.
+
+Формат трассы: первая строка - заголовок {"trace": "zapret-backend", "version": 1, ...},
+далее по строке на вызов: {"t": сек. от начала, "target": "service"|"config",
+"call": имя метода, "args": [...], "result": ..., "duration": сек., "pid": manual_process_pid}.
+"""
+import json
+import threading
+import time
+
+from utils.config_manager import ConfigManager
+from utils.process_manager import ServiceManager
+
+TRACE_FORMAT = "zapret-backend"
+TRACE_VERSION = 1
+
+SERVICE = "service"
+CONFIG = "config"
+
+# Вызовы, которые записываются, и ответ воспроизведения, пока в трассе не встретился записанный
+SERVICE_CALLS = {
+    "get_service_status": "NOT_FOUND",
+    "get_service_start_type": None,
+    "is_manual_process_running": False,
+    "is_admin": True,
+    "install_service": (True, "replay"),
+    "uninstall_service": (True, "replay"),
+    "start_service": (True, "replay"),
+    "stop_service": (True, "replay"),
+    "restart_service": (True, "replay"),
+    "set_service_start_type": (True, "replay"),
+    "start_manual_process": (True, "replay"),
+    "stop_manual_process": (True, "replay"),
+    "reload_lists": (True, "replay"),
+}
+CONFIG_CALLS = {
+    "is_game_filter_enabled": False,
+    "is_ipset_enabled": False,
+    "get_game_filter_ports": "0",
+    "enable_game_filter": (True, "replay"),
+    "disable_game_filter": (True, "replay"),
+    "set_game_filter_ports": (True, "replay"),
+    "enable_ipset": (True, "replay"),
+    "disable_ipset": (True, "replay"),
+}
+# Опросы состояния: только их смена - событие для GUI
+STATE_CALLS = {
+    SERVICE: ("get_service_status", "get_service_start_type", "is_manual_process_running", "is_admin"),
+    CONFIG: ("is_game_filter_enabled", "is_ipset_enabled", "get_game_filter_ports"),
+}
+_MISSING = object()
+
+
+class TraceRecorder:
+    """
+    Пишет трассу вызовов. attach() подменяет методы экземпляров менеджеров
+    обертками, detach() возвращает исходные. Запись из нескольких потоков
+    (планировщик, опрос, API) сериализуется блокировкой.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.events = 0
+        self._lock = threading.Lock()
+        self._file = open(path, 'w', encoding='utf-8')
+        self._started = time.perf_counter()
+        self._attached = []
+        self._write({"trace": TRACE_FORMAT, "version": TRACE_VERSION, "started_at": time.time()})
+
+    def attach(self, service_manager=None, config_manager=None):
+        for target, manager, calls in ((SERVICE, service_manager, SERVICE_CALLS),
+                                       (CONFIG, config_manager, CONFIG_CALLS)):
+            if manager is None:
+                continue
+            for name in calls:
+                setattr(manager, name, self._wrap(target, manager, name, getattr(manager, name)))
+                self._attached.append((manager, name))
+        return self
+
+    def detach(self):
+        for manager, name in self._attached:
+            manager.__dict__.pop(name, None)
+        self._attached = []
+
+    def close(self):
+        self.detach()
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+    def _wrap(self, target, manager, name, method):
+        def recorded(*args):
+            started = time.perf_counter()
+            result = method(*args)
+            event = {"t": round(started - self._started, 6), "target": target, "call": name,
+                     "args": list(args), "result": result,
+                     "duration": round(time.perf_counter() - started, 6)}
+            if target == SERVICE:
+                event["pid"] = manager.manual_process_pid
+            self._write(event)
+            return result
+        return recorded
+
+    def _write(self, record):
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.write(line + "\n")
+            self._file.flush()  # Трасса нужна и после аварийного завершения
+            if "call" in record:
+                self.events += 1
+
+
+def recorder_from_settings(settings_manager, service_manager, config_manager):
+    """Запускает запись, если она включена ("backend_trace": {"enabled": true, "path": ...})."""
+    settings = settings_manager.get_setting("backend_trace", {})
+    if not settings.get("enabled", False):
+        return None
+    try:
+        recorder = TraceRecorder(settings.get("path", "backend-trace.jsonl"))
+    except OSError as e:
+        print(f"Не удалось начать запись трассы: {e}")
+        return None
+    return recorder.attach(service_manager, config_manager)
+
+
+def load_trace(path):
+    """События трассы по порядку. Результаты-списки превращаются обратно в кортежи (success, message)."""
+    events = []
+    with open(path, 'r', encoding='utf-8') as f:
+        header = json.loads(f.readline() or "{}")
+        if header.get("trace") != TRACE_FORMAT or header.get("version") != TRACE_VERSION:
+            raise ValueError(f"{path}: не трасса {TRACE_FORMAT} версии {TRACE_VERSION}")
+        for line in f:
+            if not line.strip():
+                continue
+            event = json.loads(line)
+            if isinstance(event.get("result"), list):
+                event["result"] = tuple(event["result"])
+            events.append(event)
+    return events
+
+
+def state_changes(events):
+    """
+    Смены состояния: [(t, {(target, call): result, ("service", "pid"): pid})].
+    Подряд идущие опросы одного цикла (без повтора вызова) склеиваются в одну смену,
+    как их и увидел бы StatusCache.refresh().
+    """
+    changes = []
+    state = {}
+    group_t, group_calls, group = None, set(), {}
+    for event in events:
+        target, call = event["target"], event["call"]
+        if call not in STATE_CALLS.get(target, ()):
+            continue
+        if (target, call) in group_calls:
+            if group:
+                changes.append((group_t, group))
+            group_t, group_calls, group = None, set(), {}
+        group_calls.add((target, call))
+        updates = {(target, call): event["result"]}
+        if target == SERVICE:
+            updates[(SERVICE, "pid")] = event.get("pid")
+        for key, value in updates.items():
+            if state.get(key, _MISSING) != value:
+                state[key] = value
+                group[key] = value
+                if group_t is None:
+                    group_t = event["t"]
+    if group:
+        changes.append((group_t, group))
+    return changes
+
+
+class _Replayed:
+    """Общая часть Replay-менеджеров: ответы берутся из self.results."""
+    DEFAULTS = {}
+
+    def replay(self, changes):
+        self.results.update(changes)
+
+    def _result(self, name):
+        return self.results.get(name, self.DEFAULTS[name])
+
+
+def _replayed_call(name):
+    def call(self, *args):
+        return self._result(name)
+    call.__name__ = name
+    return call
+
+
+class ReplayServiceManager(_Replayed, ServiceManager):
+    """ServiceManager, который отвечает последними проигранными результатами вместо `sc` и tasklist."""
+    DEFAULTS = SERVICE_CALLS
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("state_path", None)
+        super().__init__(**kwargs)
+        self.results = {}
+
+    def replay(self, changes):
+        self.manual_process_pid = changes.pop("pid", self.manual_process_pid)
+        super().replay(changes)
+
+
+class ReplayConfigManager(_Replayed, ConfigManager):
+    """ConfigManager, который отвечает последними проигранными результатами вместо файлов-флагов."""
+    DEFAULTS = CONFIG_CALLS
+
+    def __init__(self, base_path="bin", lists_dir=None):
+        super().__init__(base_path, lists_dir)
+        self.results = {}
+
+
+for _name in SERVICE_CALLS:
+    setattr(ReplayServiceManager, _name, _replayed_call(_name))
+for _name in CONFIG_CALLS:
+    setattr(ReplayConfigManager, _name, _replayed_call(_name))
+
+
+class TraceReplayer:
+    """
+    Подает смены состояния трассы в Replay-менеджеры и после каждой вызывает
+    status_cache.refresh(), как это сделал бы опрос. speed - ускорение
+    относительно записи (None - без пауз), rate - фиксированное число смен
+    в секунду вместо записанных интервалов. loops - сколько раз проиграть трассу.
+
+    current - (номер смены, perf_counter момента смены) во время refresh():
+    по нему слушатели StatusCache связывают снимок со сменой.
+    """
+    def __init__(self, events, service_manager, config_manager, status_cache, speed=1.0, rate=None, loops=1):
+        self.changes = state_changes(events)
+        self.service_manager = service_manager
+        self.config_manager = config_manager
+        self.status_cache = status_cache
+        self.speed = speed
+        self.rate = rate
+        self.loops = loops
+        self.current = (None, None)
+        self.stats = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def schedule(self):
+        """[(сек. от начала проигрывания, изменения)] для всех петель."""
+        if not self.changes:
+            return []
+        first = self.changes[0][0]
+        span = self.changes[-1][0] - first
+        period = len(self.changes) / self.rate if self.rate else span / self.speed if self.speed else 0.0
+        schedule = []
+        for loop in range(self.loops):
+            for index, (t, changes) in enumerate(self.changes):
+                if self.rate:
+                    offset = (loop * len(self.changes) + index) / self.rate
+                elif self.speed:
+                    offset = loop * period + (t - first) / self.speed
+                else:
+                    offset = 0.0
+                schedule.append((offset, changes))
+        return schedule
+
+    def run(self):
+        """Проигрывает трассу в текущем потоке. Возвращает статистику."""
+        refresh_times = []
+        late = 0
+        schedule = self.schedule()
+        started = time.perf_counter()
+        for seq, (offset, changes) in enumerate(schedule):
+            if self._stop.is_set():
+                break
+            delay = started + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -0.001:
+                late += 1   # Опрос не успевает за заданной частотой
+            service = {call: value for (target, call), value in changes.items() if target == SERVICE}
+            config = {call: value for (target, call), value in changes.items() if target == CONFIG}
+            self.service_manager.replay(service)
+            self.config_manager.replay(config)
+            self.current = (seq, time.perf_counter())
+            self.status_cache.refresh()
+            refresh_times.append(time.perf_counter() - self.current[1])
+        elapsed = time.perf_counter() - started
+        refresh_times.sort()
+        self.stats = {
+            "changes": len(refresh_times),
+            "elapsed": elapsed,
+            "rate": len(refresh_times) / elapsed if elapsed else 0.0,
+            "late": late,
+            "refresh_avg": sum(refresh_times) / len(refresh_times) if refresh_times else 0.0,
+            "refresh_max": refresh_times[-1] if refresh_times else 0.0,
+        }
+        return self.stats
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="trace-replay", daemon=True)
+        self._thread.start()
+        return self
+
+    def is_running(self):
+        return bool(self._thread and self._thread.is_alive())
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
@@ -0,0 +1,465 @@
+"""
+Обновление файлов zapret (bin/ и профили) по манифесту хэшей.
+
+Манифест - JSON, который публикуется рядом с файлами релиза:
+    {"version": "1.6.3", "files": {"bin/winws.exe": {"sha256": "...", "size": 185856}, ...}}
+Файл скачивается по адресу манифеста + относительный путь или по полю "url" записи;
+поле "url" должно указывать на тот же сервер (схема, хост, порт), что и манифест.
+
+Манифест подписывается Ed25519: рядом лежит manifest.json.sig (base64 подписи
+точных байтов манифеста), а открытый ключ закреплен в настройках
+("updater" -> "public_key"). Без ключа, без подписи или с неверной подписью
+обновление не выполняется. Адреса - только https; http допускается лишь для
+loopback (локальная проверка). Для подписи нужен пакет cryptography.
+
+Скачиваются только файлы, хэш которых отличается от локального. Локальные хэши
+кэшируются по (размер, mtime), как в SnapshotStore, поэтому неизменные файлы не
+перечитываются. Скачанное складывается в .update/staging/ (на том же томе, что
+и программа) и проверяется по хэшу. Подмена выполняется одной операцией
+планировщика: служба останавливается, файлы подменяются через os.replace с
+откатом при ошибке, служба запускается снова.
+
+Проверка на локальном сервере (из каталога src):
+    python -m utils.bundle_updater --generate-key ../release.key    # печатает открытый ключ
+    python -m utils.bundle_updater <папка релиза> --version 1.6.3 --key ../release.key
+    python -m http.server 8000 --directory <папка релиза>
+и в config.json: "updater": {"manifest_url": "http://127.0.0.1:8000/manifest.json", "public_key": "..."}
+"""
+import base64
+import binascii
+import glob
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import quote, urljoin, urlsplit
+
+import requests
+
+try:
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey, Ed25519PublicKey
+except ImportError:
+    Ed25519PrivateKey = Ed25519PublicKey = None
+
+from utils.metrics import DOWNLOAD_BYTES, DOWNLOAD_DURATION, DOWNLOAD_FAILURES
+from utils.service_pipeline import DRIVER_SERVICES, NOT_FOUND, RUNNING, STOPPED, ServicePipeline
+
+# Файлы, которые приходят с релизом zapret. Флаги bin/*.enabled и списки - данные пользователя
+DEFAULT_PATTERNS = ("bin/*.exe", "bin/*.dll", "bin/*.sys", "bin/*.bin", "general*.bat", "service.bat")
+MANIFEST_NAME = "manifest.json"
+SIGNATURE_SUFFIX = ".sig"
+# Хосты, для которых допускается http: локальная проверка обновления
+LOOPBACK_HOSTS = ("127.0.0.1", "::1", "localhost")
+UPDATE_DIRNAME = ".update"
+DEFAULT_PARALLELISM = 4
+DEFAULT_TIMEOUT = 30
+CHUNK_SIZE = 256 * 1024
+
+
+def file_sha256(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def check_rel_path(rel_path):
+    """Путь из манифеста должен оставаться внутри каталога программы."""
+    normalized = os.path.normpath(rel_path.replace("/", os.sep))
+    if os.path.isabs(normalized) or normalized.startswith("..") or ":" in normalized:
+        raise ValueError(f"Недопустимый путь в манифесте: {rel_path}")
+    return normalized.replace(os.sep, "/")
+
+
+def check_url(url):
+    """Адрес обновления: https, http - только для loopback."""
+    parts = urlsplit(url)
+    if parts.hostname and (parts.scheme == "https" or (parts.scheme == "http" and parts.hostname in LOOPBACK_HOSTS)):
+        return url
+    raise ValueError(f"Адрес обновления должен начинаться с https:// (http - только для 127.0.0.1): {url}")
+
+
+def url_origin(url):
+    parts = urlsplit(url)
+    return parts.scheme, parts.hostname, parts.port or {"http": 80, "https": 443}.get(parts.scheme)
+
+
+def _require_cryptography():
+    if Ed25519PublicKey is None:
+        raise ValueError("Для проверки подписи манифеста нужен пакет cryptography (pip install cryptography).")
+
+
+def generate_key():
+    """Новый ключ подписи. Возвращает (закрытый, открытый) в base64."""
+    _require_cryptography()
+    private_key = Ed25519PrivateKey.generate()
+    return (base64.b64encode(private_key.private_bytes_raw()).decode("ascii"),
+            base64.b64encode(private_key.public_key().public_bytes_raw()).decode("ascii"))
+
+
+def sign_manifest(data, private_key):
+    """Подпись (base64) байтов манифеста закрытым ключом в base64."""
+    _require_cryptography()
+    key = Ed25519PrivateKey.from_private_bytes(_decode_key(private_key, "закрытый ключ"))
+    return base64.b64encode(key.sign(data)).decode("ascii")
+
+
+def verify_manifest(data, signature, public_key):
+    """Проверяет подпись манифеста закрепленным ключом; ValueError, если она не подходит."""
+    _require_cryptography()
+    key = Ed25519PublicKey.from_public_bytes(_decode_key(public_key, "открытый ключ"))
+    try:
+        key.verify(base64.b64decode(signature.strip(), validate=True), data)
+    except (InvalidSignature, binascii.Error, ValueError):
+        raise ValueError("Подпись манифеста не совпадает с закрепленным ключом.")
+
+
+def _decode_key(value, label):
+    try:
+        key = base64.b64decode(value.strip(), validate=True)
+    except (AttributeError, binascii.Error):
+        key = b""
+    if len(key) != 32:
+        raise ValueError(f"Некорректный {label}: ожидается base64 32 байт.")
+    return key
+
+
+def build_manifest(root_dir=".", patterns=DEFAULT_PATTERNS, version=None):
+    """Манифест для файлов релиза в root_dir."""
+    root_dir = os.path.abspath(root_dir)
+    files = {}
+    for pattern in patterns:
+        for path in sorted(glob.glob(os.path.join(root_dir, pattern))):
+            if os.path.isfile(path):
+                rel_path = os.path.relpath(path, root_dir).replace(os.sep, "/")
+                files[rel_path] = {"sha256": file_sha256(path), "size": os.path.getsize(path)}
+    return {"version": version, "files": files}
+
+
+class FileHashIndex:
+    """Кэш sha256 файлов: {путь: [размер, mtime_ns, sha256]}. Хэш пересчитывается, только если файл изменился."""
+    def __init__(self, root_dir, path):
+        self.root_dir = root_dir
+        self.path = path
+        self._index = {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                self._index = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def digest(self, rel_path):
+        """sha256 файла или None, если его нет."""
+        full_path = os.path.join(self.root_dir, *rel_path.split("/"))
+        try:
+            stat = os.stat(full_path)
+        except OSError:
+            return None
+        cached = self._index.get(rel_path)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+        digest = file_sha256(full_path)
+        self._index[rel_path] = [stat.st_size, stat.st_mtime_ns, digest]
+        return digest
+
+    def remember(self, rel_path, digest):
+        stat = os.stat(os.path.join(self.root_dir, *rel_path.split("/")))
+        self._index[rel_path] = [stat.st_size, stat.st_mtime_ns, digest]
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._index, f, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+
+
+class UpdatePlan:
+    """Что нужно скачать: [(путь, запись манифеста)] и сколько файлов уже совпадает."""
+    def __init__(self, manifest, changed, unchanged):
+        self.manifest = manifest
+        self.changed = changed
+        self.unchanged = unchanged
+
+    @property
+    def version(self):
+        return self.manifest.get("version")
+
+    @property
+    def download_size(self):
+        return sum(entry.get("size", 0) for _, entry in self.changed)
+
+    @property
+    def total_size(self):
+        return sum(entry.get("size", 0) for entry in self.manifest["files"].values())
+
+    def is_empty(self):
+        return not self.changed
+
+    def summary(self):
+        version = f" {self.version}" if self.version else ""
+        if self.is_empty():
+            return f"Файлы zapret{version} актуальны ({self.unchanged} файлов)."
+        names = ", ".join(rel_path for rel_path, _ in self.changed)
+        return (f"Обновление{version}: изменено {len(self.changed)} из {len(self.changed) + self.unchanged} файлов, "
+                f"скачать {self.download_size / 1024:.0f} КБ из {self.total_size / 1024:.0f} КБ ({names}).")
+
+
+class BundleUpdater:
+    """
+    Обновляет файлы программы в root_dir по манифесту manifest_url, подписанному
+    ключом public_key (base64 открытого ключа Ed25519).
+    check() -> plan, download(plan) - в фоне; apply(service_manager) - через
+    OperationScheduler (действие "apply_update"), пока служба остановлена.
+    """
+    def __init__(self, manifest_url, root_dir=".", parallelism=DEFAULT_PARALLELISM, timeout=DEFAULT_TIMEOUT,
+                 session=None, public_key=None):
+        self.manifest_url = manifest_url
+        self.public_key = public_key
+        self.root_dir = os.path.abspath(root_dir)
+        self.parallelism = parallelism
+        self.timeout = timeout
+        self.session = session
+        self.update_dir = os.path.join(self.root_dir, UPDATE_DIRNAME)
+        self.staging_dir = os.path.join(self.update_dir, "staging")
+        self.index = FileHashIndex(self.root_dir, os.path.join(self.update_dir, "hashes.json"))
+        self.staged = None   # UpdatePlan, файлы которого скачаны и проверены
+
+    # --- Проверка ---
+    def fetch_manifest(self):
+        check_url(self.manifest_url)
+        if not self.public_key:
+            raise ValueError('Не задан ключ подписи манифеста: "updater" -> "public_key" в config.json.')
+        _require_cryptography()
+        http = self.session or requests
+        response = http.get(self.manifest_url, timeout=self.timeout)
+        response.raise_for_status()
+        data = response.content
+        signature = http.get(self.manifest_url + SIGNATURE_SUFFIX, timeout=self.timeout)
+        if signature.status_code == 404:
+            raise ValueError("Манифест не подписан: нет файла подписи.")
+        signature.raise_for_status()
+        verify_manifest(data, signature.text, self.public_key)
+
+        manifest = json.loads(data)
+        if not isinstance(manifest, dict) or not isinstance(manifest.get("files"), dict):
+            raise ValueError("Манифест не содержит списка файлов.")
+        files = {}
+        for rel_path, entry in manifest["files"].items():
+            if not isinstance(entry, dict) or len(str(entry.get("sha256", ""))) != 64:
+                raise ValueError(f"Некорректная запись манифеста: {rel_path}")
+            rel_path = check_rel_path(rel_path)
+            self.file_url(rel_path, entry)   # Адрес файла - только на сервере манифеста
+            files[rel_path] = entry
+        manifest["files"] = files
+        return manifest
+
+    def plan(self, manifest):
+        changed = []
+        for rel_path, entry in sorted(manifest["files"].items()):
+            if self.index.digest(rel_path) != entry["sha256"].lower():
+                changed.append((rel_path, entry))
+        self.index.save()
+        return UpdatePlan(manifest, changed, len(manifest["files"]) - len(changed))
+
+    def check(self):
+        """Возвращает (success, message, plan)."""
+        try:
+            plan = self.plan(self.fetch_manifest())
+        except requests.exceptions.RequestException as e:
+            return False, f"Не удалось получить манифест: {e}", None
+        except (OSError, ValueError) as e:
+            return False, f"Ошибка манифеста: {e}", None
+        return True, plan.summary(), plan
+
+    # --- Скачивание ---
+    def file_url(self, rel_path, entry):
+        url = entry.get("url") or urljoin(self.manifest_url, quote(rel_path))
+        if not isinstance(url, str) or url_origin(url) != url_origin(self.manifest_url):
+            raise ValueError(f"Файл {rel_path} указан не на сервере манифеста: {url}")
+        return url
+
+    def staged_path(self, rel_path):
+        return os.path.join(self.staging_dir, *rel_path.split("/"))
+
+    def fetch_file(self, rel_path, entry, session):
+        """Скачивает файл в staging и проверяет хэш. Возвращает скачанные байты (0, если уже был скачан)."""
+        expected = entry["sha256"].lower()
+        staged_path = self.staged_path(rel_path)
+        if os.path.exists(staged_path) and file_sha256(staged_path) == expected:
+            return 0  # Остался от прерванного обновления
+        os.makedirs(os.path.dirname(staged_path), exist_ok=True)
+        started = time.perf_counter()
+        hasher = hashlib.sha256()
+        size = 0
+        part_path = staged_path + ".part"
+        try:
+            with session.get(self.file_url(rel_path, entry), stream=True, timeout=self.timeout) as response:
+                response.raise_for_status()
+                with open(part_path, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        hasher.update(chunk)
+                        size += len(chunk)
+                        f.write(chunk)
+            if hasher.hexdigest() != expected:
+                raise ValueError("хэш не совпадает с манифестом")
+            os.replace(part_path, staged_path)
+        except Exception:
+            DOWNLOAD_FAILURES.inc(file=os.path.basename(rel_path))
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+        DOWNLOAD_DURATION.observe(time.perf_counter() - started, file=os.path.basename(rel_path))
+        DOWNLOAD_BYTES.inc(size, file=os.path.basename(rel_path))
+        return size
+
+    def download(self, plan, progress_callback=None):
+        """
+        Параллельно скачивает измененные файлы в staging. progress_callback(done, total)
+        вызывается по завершении каждого файла. Возвращает (success, message).
+        """
+        self.staged = None
+        if plan.is_empty():
+            return True, plan.summary()
+        started = time.perf_counter()
+        downloaded = 0
+        errors = []
+        with requests.Session() as own_session, \
+                ThreadPoolExecutor(max_workers=max(1, min(self.parallelism, len(plan.changed)))) as pool:
+            session = self.session or own_session
+            futures = {pool.submit(self.fetch_file, rel_path, entry, session): rel_path
+                       for rel_path, entry in plan.changed}
+            for done, future in enumerate(as_completed(futures), 1):
+                try:
+                    downloaded += future.result()
+                except (requests.exceptions.RequestException, OSError, ValueError) as e:
+                    errors.append(f"{futures[future]}: {e}")
+                if progress_callback:
+                    progress_callback(done, len(futures))
+        if errors:
+            return False, "Не удалось скачать обновление:\n" + "\n".join(errors)
+        self.staged = plan
+        return True, (f"Скачано {downloaded / 1024:.0f} КБ, файлов: {len(plan.changed)}, "
+                      f"за {time.perf_counter() - started:.1f} с.")
+
+    # --- Применение ---
+    def apply(self, service_manager):
+        """
+        Подменяет файлы скачанным обновлением. Служба и ручной запуск на это время
+        останавливаются и затем запускаются снова. Если подмена прервется, уже
+        замененные файлы возвращаются обратно. Возвращает (success, message).
+        """
+        plan = self.staged
+        if plan is None:
+            return False, "Обновление не скачано."
+        for rel_path, entry in plan.changed:
+            staged_path = self.staged_path(rel_path)
+            if not os.path.exists(staged_path) or file_sha256(staged_path) != entry["sha256"].lower():
+                self.staged = None
+                return False, f"Скачанный файл {rel_path} поврежден, скачайте обновление заново."
+
+        started = time.perf_counter()
+        manual_bat = service_manager.manual_bat_path if service_manager.is_manual_process_running() else None
+        if manual_bat:
+            service_manager.stop_manual_process()
+        pipeline = ServicePipeline(service_manager)
+        stopped_ok, stop_message, stopped = pipeline.stop_services([service_manager.service_name, *DRIVER_SERVICES])
+        if not stopped_ok:
+            self._resume(service_manager, stopped, manual_bat)
+            return False, f"Не удалось остановить службы для обновления: {stop_message}"
+
+        success, message = self._swap(plan)
+        resume_message = self._resume(service_manager, stopped, manual_bat)
+        window = time.perf_counter() - started
+        if success:
+            self.staged = None
+            self.index.save()
+            message = f"{message} Служба была остановлена {window:.1f} с."
+        return success, message + resume_message
+
+    def _swap(self, plan):
+        committed = []  # (целевой путь, резервная копия или None)
+        try:
+            for rel_path, _ in plan.changed:
+                full_path = os.path.join(self.root_dir, *rel_path.split("/"))
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                backup = None
+                if os.path.exists(full_path):
+                    backup = full_path + ".update-bak"
+                    os.replace(full_path, backup)
+                committed.append((full_path, backup))
+                os.replace(self.staged_path(rel_path), full_path)
+        except OSError as e:
+            for full_path, backup in reversed(committed):
+                try:
+                    if backup:
+                        os.replace(backup, full_path)
+                    elif os.path.exists(full_path):
+                        os.remove(full_path)
+                except OSError:
+                    pass
+            return False, f"Обновление отменено, файлы возвращены: {e}"
+        for _, backup in committed:
+            if backup:
+                try:
+                    os.remove(backup)
+                except OSError:
+                    pass
+        for rel_path, entry in plan.changed:
+            self.index.remember(rel_path, entry["sha256"].lower())
+        version = f" до {plan.version}" if plan.version else ""
+        return True, f"Файлы zapret обновлены{version}: заменено {len(plan.changed)}."
+
+    @staticmethod
+    def _resume(service_manager, stopped, manual_bat):
+        # Драйверы WinDivert winws.exe запустит сам
+        messages = []
+        if service_manager.service_name in stopped:
+            success, message = service_manager.start_service()
+            if not success:
+                messages.append(message)
+            else:
+                ServicePipeline(service_manager).wait_for(service_manager.service_name, (RUNNING, STOPPED, NOT_FOUND))
+        if manual_bat:
+            success, message = service_manager.start_manual_process(manual_bat)
+            if not success:
+                messages.append(message)
+        return "".join(f"\n{message}" for message in messages)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Создает подписанный manifest.json для файлов релиза zapret.")
+    parser.add_argument("root", nargs="?", help="Папка релиза")
+    parser.add_argument("--version")
+    parser.add_argument("--key", help="Файл закрытого ключа (base64), которым подписывается манифест")
+    parser.add_argument("--generate-key", metavar="PATH", help="Создать ключ подписи и вывести открытый ключ")
+    args = parser.parse_args()
+    if args.generate_key:
+        if os.path.exists(args.generate_key):
+            parser.error(f"{args.generate_key} уже существует")
+        private_key, public_key = generate_key()
+        with open(args.generate_key, 'w', encoding='utf-8') as f:
+            f.write(private_key + "\n")
+        print(f"Закрытый ключ: {args.generate_key}\n"
+              f'Открытый ключ для config.json ("updater" -> "public_key"): {public_key}')
+        return
+    if not args.root or not args.key:
+        parser.error("нужны папка релиза и --key")
+    with open(args.key, 'r', encoding='utf-8') as f:
+        private_key = f.read()
+    manifest = build_manifest(args.root, version=args.version)
+    data = json.dumps(manifest, indent=1, ensure_ascii=False).encode("utf-8")
+    path = os.path.join(args.root, MANIFEST_NAME)
+    with open(path, 'wb') as f:
+        f.write(data)
+    with open(path + SIGNATURE_SUFFIX, 'w', encoding='ascii') as f:
+        f.write(sign_manifest(data, private_key) + "\n")
+    print(f"{path}: {len(manifest['files'])} файлов, подпись {path + SIGNATURE_SUFFIX}")
+
+
+if __name__ == "__main__":
+    main()
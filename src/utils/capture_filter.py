@@ -0,0 +1,97 @@
+"""
+Минимальный фильтр перехвата WinDivert (--wf-tcp/--wf-udp) для профиля winws.
+
+Каждый пакет, попавший под --wf-*, копируется из ядра в winws. Если ни одна
+секция профиля не может на него сработать, это чистые накладные расходы.
+Здесь считается точное объединение портов, на которые действуют секции,
+и сравнивается с тем, что профиль перехватывает.
+"""
+from utils.port_ranges import PortRangeSet
+
+PROTOCOLS = ("tcp", "udp")
+
+# Порт 0 в --filter-* означает "ничего" (так service.bat выключает %GameFilter%)
+_REAL_PORTS = PortRangeSet([(1, 65535)])
+
+
+def captured_ports(profile):
+    """Порты, которые WinDivert передает winws по --wf-tcp/--wf-udp профиля."""
+    captured = {}
+    for protocol in PROTOCOLS:
+        spec = profile.get_global(f"--wf-{protocol}")
+        captured[protocol] = PortRangeSet.parse(spec) & _REAL_PORTS if spec else PortRangeSet()
+    return captured
+
+
+def used_ports(profile):
+    """Объединение портов, на которые может сработать хотя бы одна секция профиля."""
+    used = {protocol: PortRangeSet() for protocol in PROTOCOLS}
+    for section in profile.sections:
+        for protocol in PROTOCOLS:
+            used[protocol] = used[protocol] | (section.ports(protocol) & _REAL_PORTS)
+    return used
+
+
+class CaptureReport:
+    """Сравнение перехватываемых и используемых портов профиля."""
+    def __init__(self, profile):
+        self.profile = profile
+        self.captured = captured_ports(profile)
+        self.used = used_ports(profile)
+        # Перехватывается, но ни одна секция не сработает - лишние копирования пакетов
+        self.unused = {p: self.captured[p] - self.used[p] for p in PROTOCOLS}
+        # Секция ждет эти порты, но WinDivert их не перехватывает - секция на них не сработает
+        self.uncaptured = {p: self.used[p] - self.captured[p] for p in PROTOCOLS}
+        # Самый узкий перехват, не меняющий поведение профиля
+        self.tight = {p: self.captured[p] & self.used[p] for p in PROTOCOLS}
+
+    def is_tight(self):
+        return not any(self.unused.values())
+
+    def has_raw_filter(self):
+        """С --wf-raw фильтр WinDivert задан вручную, и --wf-tcp/--wf-udp не используются."""
+        return self.profile.get_global("--wf-raw") is not None
+
+    def tight_options(self):
+        """
+        Глобальные опции профиля с --wf-tcp/--wf-udp, суженными до используемых портов
+        (и без пустого порта 0). Если перехват пришлось бы убрать совсем, опции остаются как есть.
+        """
+        options = list(self.profile.global_options)
+        if self.has_raw_filter() or not any(self.tight.values()):
+            return options
+        result = []
+        for option, value in options:
+            protocol = option[len("--wf-"):]
+            if option in ("--wf-tcp", "--wf-udp"):
+                if self.tight[protocol]:
+                    result.append((option, str(self.tight[protocol])))
+                continue
+            result.append((option, value))
+        return result
+
+
+def analyze_capture(profile):
+    return CaptureReport(profile)
+
+
+def format_capture_report(report):
+    """Текстовый отчет о перехвате для вкладки фильтров."""
+    lines = ["Перехват WinDivert:"]
+    if report.has_raw_filter():
+        lines.append("  Используется --wf-raw, порты не анализируются.")
+        return "\n".join(lines)
+    for protocol in PROTOCOLS:
+        name = protocol.upper()
+        lines.append(f"  {name}: перехват {report.captured[protocol] or '-'}, "
+                     f"используется {report.used[protocol] or '-'}")
+        if report.unused[protocol]:
+            lines.append(f"    Перехватывается без пользы: {report.unused[protocol]}")
+        if report.uncaptured[protocol]:
+            lines.append(f"    Нужны секциям, но не перехватываются: {report.uncaptured[protocol]}")
+    if report.is_tight():
+        lines.append("  Перехват минимален.")
+    else:
+        tight = " ".join(f"{o}={v}" for o, v in report.tight_options() if o in ("--wf-tcp", "--wf-udp"))
+        lines.append(f"  Минимальный перехват: {tight}")
+    return "\n".join(lines)
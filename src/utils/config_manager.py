@@ -1,17 +1,26 @@
 import os
 
+from utils.ipset_switch import IpsetSwitch
+from utils.port_ranges import PortRangeSet
+
+# Диапазон %GameFilter% из service.bat (load_game_filter)
+DEFAULT_GAME_FILTER_PORTS = "1024-65535"
+
 class ConfigManager:
     """
-    Управляет конфигурациями, основанными на файлах-флагах,
-    аналогично 'game_filter.enabled' и 'ipset.enabled' в .bat скриптах.
+    Управляет конфигурациями, основанными на файлах-флагах, аналогично
+    'game_filter.enabled' в .bat скриптах. Режим ipset хранится не флагом, а
+    самим lists/ipset-all.txt (см. IpsetSwitch), как в service.bat.
     """
-    def __init__(self, base_path="bin"):
+    def __init__(self, base_path="bin", lists_dir=None):
         self.base_path = os.path.abspath(base_path)
         if not os.path.exists(self.base_path):
             os.makedirs(self.base_path)
             
         self.game_filter_flag = os.path.join(self.base_path, "game_filter.enabled")
+        # Прежний флаг ipset: .bat скрипты его не читали, при переключении он удаляется
         self.ipset_flag = os.path.join(self.base_path, "ipset.enabled")
+        self.ipset = IpsetSwitch(lists_dir or os.path.join(os.path.dirname(self.base_path), "lists"))
 
     # --- Game Filter ---
     def is_game_filter_enabled(self):
@@ -36,25 +45,57 @@ class ConfigManager:
         except Exception as e:
             return False, f"Не удалось выключить игровой фильтр: {e}"
 
+    def get_game_filter_ports(self):
+        """
+        Значение %GameFilter% для профилей, как в service.bat (load_game_filter).
+        Если во флаг-файле записан набор портов, используется он, иначе весь диапазон.
+        """
+        if not self.is_game_filter_enabled():
+            return "0"
+        try:
+            with open(self.game_filter_flag, 'r', encoding='utf-8') as f:
+                spec = f.read().strip()
+            if spec and PortRangeSet.parse(spec):
+                return str(PortRangeSet.parse(spec))
+        except (OSError, ValueError):
+            pass
+        return DEFAULT_GAME_FILTER_PORTS
+
+    def set_game_filter_ports(self, ports):
+        """
+        Включает игровой фильтр с узким набором портов ('27015-27030,3478').
+        service.bat проверяет только наличие флаг-файла, поэтому порты хранятся в нем же;
+        пустое значение возвращает весь диапазон.
+        """
+        try:
+            spec = str(PortRangeSet.parse(ports)) if ports else ""
+        except ValueError as e:
+            return False, str(e)
+        try:
+            with open(self.game_filter_flag, 'w', encoding='utf-8') as f:
+                f.write(spec)
+            return True, f"Игровой фильтр включен для портов: {spec or DEFAULT_GAME_FILTER_PORTS}."
+        except Exception as e:
+            return False, f"Не удалось сохранить порты игрового фильтра: {e}"
+
     # --- IPSet ---
     def is_ipset_enabled(self):
-        """Проверяет, включен ли ipset."""
-        return os.path.exists(self.ipset_flag)
+        """Проверяет, включен ли ipset: активен ли полный список, а не заглушка."""
+        return self.ipset.is_enabled()
 
     def enable_ipset(self):
-        """Включает ipset, создавая файл-флаг."""
-        try:
-            with open(self.ipset_flag, 'w') as f:
-                pass
-            return True, "IPset включен."
-        except Exception as e:
-            return False, f"Не удалось включить ipset: {e}"
+        """Включает ipset, подставляя полный список вместо заглушки."""
+        return self._switch_ipset(True)
 
     def disable_ipset(self):
-        """Выключает ipset, удаляя файл-флаг."""
-        try:
-            if self.is_ipset_enabled():
+        """Выключает ipset, подставляя заглушку; полный список остается в ipset-all.txt.backup."""
+        return self._switch_ipset(False)
+
+    def _switch_ipset(self, enabled):
+        success, message = self.ipset.set_enabled(enabled)
+        if success and os.path.exists(self.ipset_flag):
+            try:
                 os.remove(self.ipset_flag)
-            return True, "IPset выключен."
-        except Exception as e:
-            return False, f"Не удалось выключить ipset: {e}" 
\ No newline at end of file
+            except OSError:
+                pass
+        return success, message
@@ -0,0 +1,229 @@
+"""
+Поиск программ, конфликтующих с zapret (перенос :service_diagnostics из service.bat).
+
+service.bat запускает отдельный `tasklist` или `sc query | findstr` на каждую
+проверку. Здесь один раз снимается состояние системы (процессы, активные службы,
+DNS-серверы), и все правила проверяются по этому снимку в памяти. Правила
+описаны в conflict_rules.json; дополнительные правила можно подключить своим
+файлом того же формата (настройка "diagnostics" -> "rules_file").
+
+Условия правила (срабатывает, если выполнено любое):
+    processes - имя процесса (точное совпадение без учета регистра)
+    services  - подстрока имени или отображаемого имени активной службы
+    dns       - префикс адреса DNS-сервера
+    paths     - существующий путь (переменные окружения %NAME% раскрываются)
+"""
+import json
+import os
+import re
+import shutil
+import time
+
+import psutil
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "conflict_rules.json")
+
+SEVERITIES = ("error", "warning", "info")
+DISCORD_PROCESS = "Discord.exe"
+
+_SERVICE_LINE_RE = re.compile(r'^\s*(SERVICE_NAME|DISPLAY_NAME)\s*:\s*(.+?)\s*$', re.MULTILINE)
+_ENV_RE = re.compile(r'%([^%]+)%')
+
+
+class SystemSnapshot:
+    """Процессы, активные службы и DNS-серверы, снятые за один проход."""
+    def __init__(self, processes=(), services=(), dns_servers=(), taken_at=None):
+        self.processes = {name.lower() for name in processes}
+        self.services = [(name, display) for name, display in services]   # (имя, отображаемое имя)
+        self.dns_servers = list(dns_servers)
+        self.taken_at = taken_at if taken_at is not None else time.time()
+
+    def has_process(self, name):
+        return name.lower() in self.processes
+
+    def services_matching(self, pattern):
+        pattern = pattern.lower()
+        return [name for name, display in self.services
+                if pattern in name.lower() or pattern in display.lower()]
+
+
+def snapshot_processes():
+    """Имена всех процессов одним проходом psutil (без запуска tasklist)."""
+    names = set()
+    for process in psutil.process_iter(['name']):
+        if process.info['name']:
+            names.add(process.info['name'])
+    return names
+
+
+def parse_service_list(output):
+    """[(имя, отображаемое имя)] из вывода `sc query` без аргументов."""
+    services = []
+    for key, value in _SERVICE_LINE_RE.findall(output or ""):
+        if key == "SERVICE_NAME":
+            services.append([value, ""])
+        elif services:
+            services[-1][1] = value
+    return [tuple(item) for item in services]
+
+
+def snapshot_services(service_manager):
+    """Активные службы одним вызовом `sc query` (как в service.bat)."""
+    stdout, _ = service_manager._run_command("sc query")
+    return parse_service_list(stdout)
+
+
+def snapshot_dns_servers():
+    """
+    DNS-серверы всех интерфейсов из реестра (то, что показывает
+    `wmic nicconfig get DNSServerSearchOrder`). Вне Windows - пустой список.
+    """
+    try:
+        import winreg
+    except ImportError:
+        return []
+    servers = []
+    root = r"SYSTEM\CurrentControlSet\Services\Tcpip\Parameters\Interfaces"
+    try:
+        with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, root) as interfaces:
+            index = 0
+            while True:
+                try:
+                    name = winreg.EnumKey(interfaces, index)
+                except OSError:
+                    break
+                index += 1
+                with winreg.OpenKey(interfaces, name) as key:
+                    for value_name in ("NameServer", "DhcpNameServer"):
+                        try:
+                            value, _ = winreg.QueryValueEx(key, value_name)
+                        except OSError:
+                            continue
+                        # Статические адреса разделены запятыми, полученные по DHCP - пробелами
+                        for server in re.split(r'[,\s]+', value or ""):
+                            if server and server not in servers:
+                                servers.append(server)
+    except OSError:
+        pass
+    return servers
+
+
+def take_snapshot(service_manager):
+    return SystemSnapshot(snapshot_processes(), snapshot_services(service_manager), snapshot_dns_servers())
+
+
+def expand_path(path):
+    """Раскрывает %NAME% из окружения; неизвестные переменные оставляют путь несуществующим."""
+    def replace(match):
+        return os.environ.get(match.group(1), match.group(0))
+    return os.path.normpath(_ENV_RE.sub(replace, path))
+
+
+class ConflictRule:
+    def __init__(self, data):
+        if not isinstance(data, dict) or not data.get("id"):
+            raise ValueError(f"Правило без id: {data}")
+        self.id = data["id"]
+        self.title = data.get("title", self.id)
+        self.severity = data.get("severity", "warning")
+        if self.severity not in SEVERITIES:
+            raise ValueError(f"Правило {self.id}: неизвестная важность '{self.severity}'")
+        self.processes = list(data.get("processes", []))
+        self.services = list(data.get("services", []))
+        self.dns = list(data.get("dns", []))
+        self.paths = list(data.get("paths", []))
+        if not (self.processes or self.services or self.dns or self.paths):
+            raise ValueError(f"Правило {self.id}: не задано ни одного условия")
+        self.message = data.get("message", f"Обнаружено: {self.title}")
+        self.hint = data.get("hint", "")
+        self.link = data.get("link", "")
+
+    def evaluate(self, snapshot):
+        """Список найденного (имена процессов, служб, адреса, пути); пустой, если правило не сработало."""
+        evidence = [name for name in self.processes if snapshot.has_process(name)]
+        for pattern in self.services:
+            evidence.extend(name for name in snapshot.services_matching(pattern) if name not in evidence)
+        evidence.extend(server for server in snapshot.dns_servers
+                        if any(server.startswith(prefix) for prefix in self.dns))
+        for path in self.paths:
+            expanded = expand_path(path)
+            if os.path.exists(expanded):
+                evidence.append(expanded)
+        return evidence
+
+
+class Finding:
+    def __init__(self, rule, evidence):
+        self.rule = rule
+        self.evidence = evidence
+
+    @property
+    def passed(self):
+        return not self.evidence
+
+
+def load_rules(path=DEFAULT_RULES_PATH):
+    """Загружает правила из JSON-файла ({"rules": [...]}). Ошибка формата - ValueError."""
+    with open(path, 'r', encoding='utf-8') as f:
+        try:
+            data = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"{path}: {e}")
+    return [ConflictRule(item) for item in data.get("rules", [])]
+
+
+class ConflictScanner:
+    """Набор правил; scan() проверяет их все по одному снимку системы."""
+    def __init__(self, rules=None):
+        self.rules = rules if rules is not None else load_rules()
+
+    @classmethod
+    def from_settings(cls, settings_manager=None):
+        """
+        Встроенные правила плюс правила из файла "diagnostics" -> "rules_file".
+        Правило из пользовательского файла заменяет встроенное с тем же id.
+        """
+        rules = {rule.id: rule for rule in load_rules()}
+        extra = (settings_manager.get_setting("diagnostics", {}) if settings_manager else {}).get("rules_file")
+        if extra:
+            for rule in load_rules(extra):
+                rules[rule.id] = rule
+        return cls(list(rules.values()))
+
+    def scan(self, snapshot):
+        return [Finding(rule, rule.evaluate(snapshot)) for rule in self.rules]
+
+
+def clear_discord_cache():
+    """
+    Закрывает Discord и удаляет его кэш (Cache, Code Cache, GPUCache), как
+    service.bat. Возвращает (success, message).
+    """
+    messages = []
+    success = True
+    killed = []
+    for process in psutil.process_iter(['name']):
+        if (process.info['name'] or "").lower() == DISCORD_PROCESS.lower():
+            try:
+                process.kill()
+                killed.append(process)
+            except psutil.Error as e:
+                success = False
+                messages.append(f"Не удалось закрыть Discord: {e}")
+    if killed:
+        psutil.wait_procs(killed, timeout=5)  # Файлы кэша заняты, пока процесс не завершился
+        messages.append("Discord закрыт.")
+    discord_dir = expand_path("%APPDATA%/discord")
+    for name in ("Cache", "Code Cache", "GPUCache"):
+        path = os.path.join(discord_dir, name)
+        if not os.path.exists(path):
+            continue
+        try:
+            shutil.rmtree(path)
+            messages.append(f"Удалено: {path}")
+        except OSError as e:
+            success = False
+            messages.append(f"Не удалось удалить {path}: {e}")
+    if not messages:
+        messages.append("Кэш Discord не найден.")
+    return success, "\n".join(messages)
@@ -0,0 +1,388 @@
+import glob
+import hashlib
+import hmac
+import ipaddress
+import json
+import os
+import secrets
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, urlsplit
+
+from utils.bundle_updater import file_sha256
+from utils.ipset_cache import ensure_cache
+from utils.list_files import LISTS_LOCK, atomic_output
+from utils.list_updater import get_ipset_sources, lookup_address, update_ipset_from_sources
+from utils.metrics import REGISTRY, ListEntriesCollector
+from utils.operation_scheduler import ACTIONS
+
+# Сколько секунд запрос API может ждать своей очереди к службе
+OPERATION_DEADLINE = 120
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+LOOPBACK_NAMES = ("localhost",)
+
+# Предел тела запроса: самый большой из них - POST /lists/push со списком целиком
+MAX_BODY_SIZE = 32 * 1024 * 1024
+
+# Через сколько секунд тишины закрывается соединение keep-alive
+IDLE_TIMEOUT = 60
+
+
+def is_loopback(host):
+    """host - loopback-адрес или localhost (имя из заголовка Host или адрес привязки)."""
+    if not host:
+        return False
+    if host.lower() in LOOPBACK_NAMES:
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def api_token(settings_manager):
+    """
+    Токен API из настроек ("control_api" -> "token"). Если его нет, создается
+    случайный и сохраняется в config.json, чтобы им могли пользоваться клиенты.
+    """
+    api_settings = dict(settings_manager.get_setting("control_api", {}))
+    if not api_settings.get("token"):
+        api_settings["token"] = secrets.token_urlsafe(32)
+        settings_manager.set_setting("control_api", api_settings)
+    return api_settings["token"]
+
+
+class ControlServer:
+    """
+    Локальный JSON API для мониторинга и автоматизации.
+    Чтения обслуживаются из StatusCache, изменения флагов сериализуются одной
+    блокировкой, а операции со службой идут через общий OperationScheduler (если передан).
+    Соединения HTTP/1.1 keep-alive: агрегатор парка опрашивает узел по одному соединению.
+
+    Каждый запрос несет токен (X-Auth-Token или Authorization: Bearer); без
+    переданного токена создается случайный, а на не-loopback адресе сервер без
+    явного токена не запускается. POST принимается только с Content-Type
+    application/json, а при привязке к loopback заголовок Host тоже должен быть
+    loopback: так страница в браузере не может ни отправить "простой" запрос,
+    ни обойти проверку через DNS rebinding.
+
+    GET  /status            - снимок состояния службы и процесса
+    GET  /profiles          - доступные .bat профили
+    POST /game_filter       - {"enabled": true|false}
+    POST /ipset             - {"enabled": true|false} - переключить и перезапустить работающий winws
+    POST /lists/refresh     - пересобрать ipset-all.txt из всех источников
+    POST /ipset/lookup      - {"ip": "1.2.3.4"} - есть ли адрес в полном ipset и из каких источников
+    GET  /lists             - версии списков: sha256, размер и время изменения
+    POST /lists/push        - {"name": "list-general.txt", "content": "...", "sha256": "..."} - заменить список
+    POST /profile           - {"profile": "general (ALT).bat"}
+    GET  /operations        - очередь операций со службой и их задержки
+    GET  /metrics           - метрики в формате Prometheus (если metrics_enabled)
+    """
+    def __init__(self, status_cache, config_manager, service_manager, settings_manager=None,
+                 host=DEFAULT_HOST, port=DEFAULT_PORT, token=None,
+                 profiles_dir=".", lists_dir="lists",
+                 metrics_enabled=False, registry=REGISTRY, snapshot_store=None, scheduler=None):
+        self.status_cache = status_cache
+        self.config_manager = config_manager
+        self.service_manager = service_manager
+        self.settings_manager = settings_manager
+        self.host = host
+        self.port = port
+        self.token_generated = not token
+        self.token = token or secrets.token_urlsafe(32)
+        self.profiles_dir = os.path.abspath(profiles_dir)
+        self.lists_dir = os.path.abspath(lists_dir)
+        self.registry = registry
+        self.snapshot_store = snapshot_store
+        self.scheduler = scheduler
+
+        self._mutation_lock = threading.Lock()
+        self._list_hashes = {}      # имя -> (размер, mtime_ns, sha256)
+        self._httpd = None
+        self._thread = None
+        self._routes = {
+            ("GET", "/status"): self.get_status,
+            ("GET", "/profiles"): self.get_profiles,
+            ("POST", "/game_filter"): self.set_game_filter,
+            ("POST", "/ipset"): self.set_ipset,
+            ("POST", "/lists/refresh"): self.refresh_lists,
+            ("POST", "/ipset/lookup"): self.lookup_ipset,
+            ("GET", "/lists"): self.get_lists,
+            ("POST", "/lists/push"): self.push_list,
+            ("POST", "/profile"): self.switch_profile,
+            ("GET", "/operations"): self.get_operations,
+        }
+        if metrics_enabled:
+            self._routes[("GET", "/metrics")] = self.get_metrics
+            self._collectors = [status_cache.collect_metrics, ListEntriesCollector(self.lists_dir)]
+        else:
+            self._collectors = []
+
+    # --- Жизненный цикл ---
+    def start(self):
+        """Запускает HTTP-сервер в фоновом потоке. Возвращает (success, message)."""
+        if self._httpd:
+            return True, "API уже запущен."
+        if self.token_generated and not is_loopback(self.host):
+            return False, (f"API на {self.host} доступен из сети: задайте токен "
+                           '("control_api" -> "token" в config.json или --token).')
+        try:
+            self._httpd = ThreadingHTTPServer((self.host, self.port), self._make_handler())
+        except OSError as e:
+            self._httpd = None
+            return False, f"Не удалось запустить API на {self.host}:{self.port}: {e}"
+        self._httpd.daemon_threads = True
+        for collector in self._collectors:
+            self.registry.add_collector(collector)
+        self.port = self._httpd.server_address[1]
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return True, f"API запущен на http://{self.host}:{self.port}"
+
+    def stop(self):
+        """Останавливает HTTP-сервер."""
+        if not self._httpd:
+            return
+        for collector in self._collectors:
+            self.registry.remove_collector(collector)
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._thread.join(timeout=5)
+        self._httpd = None
+        self._thread = None
+
+    # --- Маршрутизация ---
+    def handle(self, method, path, payload=None):
+        """
+        Обрабатывает запрос без сокетов (удобно для автоматизации и проверок).
+        Возвращает (http_status, dict).
+        """
+        handler = self._routes.get((method, path.rstrip("/") or "/"))
+        if handler is None:
+            return 404, {"ok": False, "error": f"Unknown endpoint: {method} {path}"}
+        try:
+            return handler(payload or {})
+        except ValueError as e:
+            return 400, {"ok": False, "error": str(e)}
+        except Exception as e:
+            return 500, {"ok": False, "error": str(e)}
+
+    # --- Обработчики ---
+    def get_status(self, payload):
+        snapshot = self.status_cache.snapshot()
+        if not snapshot:
+            return 503, {"ok": False, "error": "Состояние еще не опрошено."}
+        return 200, {"ok": True, "status": snapshot}
+
+    def get_metrics(self, payload):
+        """Текст метрик. Возвращается строкой, а не dict: обработчик отдаст его как text/plain."""
+        return 200, self.registry.render()
+
+    def get_profiles(self, payload):
+        return 200, {"ok": True, "profiles": self.list_profiles()}
+
+    def set_game_filter(self, payload):
+        enabled = self._require_bool(payload, "enabled")
+        with self._mutation_lock:
+            if enabled:
+                success, message = self.config_manager.enable_game_filter()
+            else:
+                success, message = self.config_manager.disable_game_filter()
+            self.status_cache.update(game_filter_enabled=self.config_manager.is_game_filter_enabled())
+        return self._result(success, message)
+
+    def set_ipset(self, payload):
+        enabled = self._require_bool(payload, "enabled")
+        with self._mutation_lock:
+            if enabled:
+                success, message = self.config_manager.enable_ipset()
+            else:
+                success, message = self.config_manager.disable_ipset()
+            self.status_cache.update(ipset_enabled=self.config_manager.is_ipset_enabled())
+            if success:
+                # winws читает ipset только при запуске
+                reloaded, reload_message = self._service_operation("reload_lists")
+                success, message = reloaded, f"{message} {reload_message}"
+        return self._result(success, message)
+
+    def refresh_lists(self, payload):
+        with self._mutation_lock:
+            if self.snapshot_store:
+                self.snapshot_store.create_snapshot("Перед обновлением ipset (API)", auto=True)
+            success, message, _ = update_ipset_from_sources(get_ipset_sources(self.settings_manager),
+                                                            self.config_manager.ipset.write_path)
+        return self._result(success, message)
+
+    def lookup_ipset(self, payload):
+        ip = payload.get("ip")
+        if not isinstance(ip, str):
+            raise ValueError("Поле 'ip' должно быть строкой.")
+        # Полный список, даже если ipset выключен и активна заглушка
+        with LISTS_LOCK:
+            path = self.config_manager.ipset.write_path()
+        if not os.path.exists(path):
+            return 404, {"ok": False, "error": "Полный список ipset еще не скачан."}
+        result = lookup_address(ip, path)
+        return 200, {"ok": True, "ip": ip, "ipset_enabled": self.config_manager.is_ipset_enabled(), **result}
+
+    def get_lists(self, payload):
+        lists = {}
+        for path in sorted(glob.glob(os.path.join(self.lists_dir, "*.txt"))):
+            name = os.path.basename(path)
+            stat = os.stat(path)
+            cached = self._list_hashes.get(name)
+            if not cached or cached[:2] != (stat.st_size, stat.st_mtime_ns):
+                cached = (stat.st_size, stat.st_mtime_ns, file_sha256(path))
+                self._list_hashes[name] = cached
+            lists[name] = {"sha256": cached[2], "size": stat.st_size, "mtime": stat.st_mtime}
+        return 200, {"ok": True, "lists": lists}
+
+    def push_list(self, payload):
+        name = payload.get("name")
+        content = payload.get("content")
+        if not isinstance(name, str) or os.path.basename(name) != name or not name.endswith(".txt"):
+            raise ValueError("Поле 'name' должно быть именем файла .txt в папке списков.")
+        if not isinstance(content, str):
+            raise ValueError("Поле 'content' должно быть строкой.")
+        data = content.encode("utf-8")
+        if payload.get("sha256") and hashlib.sha256(data).hexdigest() != payload["sha256"]:
+            raise ValueError("sha256 не совпадает с содержимым.")
+        with self._mutation_lock:
+            if self.snapshot_store:
+                self.snapshot_store.create_snapshot(f"Перед заменой {name} (API)", auto=True)
+            with LISTS_LOCK:
+                # Выключенный ipset - заглушка в ipset-all.txt, полный список тогда пишется в .backup
+                path = (self.config_manager.ipset.write_path() if name == "ipset-all.txt"
+                        else os.path.join(self.lists_dir, name))
+                with atomic_output(path) as f:
+                    f.write(data)
+            if name == "ipset-all.txt":
+                ensure_cache(path)
+        return self._result(True, f"Список {name} обновлен ({len(data)} байт).")
+
+    def switch_profile(self, payload):
+        profile = payload.get("profile")
+        if profile not in self.list_profiles():
+            return 400, {"ok": False, "error": f"Неизвестный профиль: {profile}"}
+        with self._mutation_lock:
+            success, message = self._service_operation("install", os.path.join(self.profiles_dir, profile))
+            if success and self.settings_manager:
+                filter_config = self.settings_manager.get_setting("filter", {})
+                filter_config.setdefault("settings", {})["selected_profile"] = profile
+                self.settings_manager.set_setting("filter", filter_config)
+            self.status_cache.refresh()
+        return self._result(success, message)
+
+    def get_operations(self, payload):
+        if not self.scheduler:
+            return 200, {"ok": True, "operations": None}
+        return 200, {"ok": True, "operations": self.scheduler.stats()}
+
+    def list_profiles(self):
+        """Возвращает имена профилей general*.bat."""
+        return sorted(os.path.basename(p) for p in glob.glob(os.path.join(self.profiles_dir, "general*.bat")))
+
+    # --- Вспомогательные ---
+    def _service_operation(self, action, data=None):
+        if self.scheduler:
+            return self.scheduler.run(action, data, deadline=OPERATION_DEADLINE)
+        return ACTIONS[action](self.service_manager, data)
+
+    def _require_bool(self, payload, key):
+        value = payload.get(key)
+        if not isinstance(value, bool):
+            raise ValueError(f"Поле '{key}' должно быть true или false.")
+        return value
+
+    def _result(self, success, message):
+        return (200 if success else 500), {"ok": success, "message": message}
+
+    def authorized(self, headers):
+        """Проверка токена из X-Auth-Token или Authorization: Bearer без утечки по времени."""
+        supplied = headers.get("X-Auth-Token")
+        if supplied is None:
+            scheme, _, value = (headers.get("Authorization") or "").partition(" ")
+            supplied = value.strip() if scheme.lower() == "bearer" else ""
+        return hmac.compare_digest(supplied.encode("utf-8"), self.token.encode("utf-8"))
+
+    def host_allowed(self, host_header):
+        """При привязке к loopback принимаются только запросы на loopback-имя (защита от DNS rebinding)."""
+        if not is_loopback(self.host):
+            return True
+        try:
+            return is_loopback(urlsplit("//" + (host_header or "")).hostname)
+        except ValueError:
+            return False
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"   # keep-alive; каждый ответ несет Content-Length
+            timeout = IDLE_TIMEOUT          # простаивающее соединение не держит поток вечно
+
+            def do_GET(self):
+                self._dispatch("GET")
+
+            def do_POST(self):
+                self._dispatch("POST")
+
+            def _dispatch(self, method):
+                # Непрочитанное тело при keep-alive попало бы в следующий запрос,
+                # поэтому после отказа без чтения тела соединение закрывается
+                if not server.host_allowed(self.headers.get("Host")):
+                    self.close_connection = True
+                    self._send(403, {"ok": False, "error": "Host must be a loopback address"})
+                    return
+                if not server.authorized(self.headers):
+                    self.close_connection = True
+                    self._send(401, {"ok": False, "error": "Unauthorized"})
+                    return
+                content_type = (self.headers.get("Content-Type") or "").split(";")[0].strip().lower()
+                if method == "POST" and content_type != "application/json":
+                    self.close_connection = True
+                    self._send(415, {"ok": False, "error": "Content-Type must be application/json"})
+                    return
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    self.close_connection = True
+                    self._send(400, {"ok": False, "error": "Invalid Content-Length"})
+                    return
+                if length > MAX_BODY_SIZE:
+                    self.close_connection = True
+                    self._send(413, {"ok": False, "error": f"Body exceeds {MAX_BODY_SIZE} bytes"})
+                    return
+                body = self.rfile.read(length) if length else b""
+                try:
+                    payload = json.loads(body) if body else {}
+                except ValueError:
+                    self._send(400, {"ok": False, "error": "Invalid JSON body"})
+                    return
+                if not isinstance(payload, dict):
+                    self._send(400, {"ok": False, "error": "JSON body must be an object"})
+                    return
+                status, body = server.handle(method, urlparse(self.path).path, payload)
+                self._send(status, body)
+
+            def _send(self, status, body):
+                if isinstance(body, str):
+                    data = body.encode("utf-8")
+                    content_type = "text/plain; version=0.0.4; charset=utf-8"
+                else:
+                    data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                    content_type = "application/json; charset=utf-8"
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass  # Не засоряем консоль запросами мониторинга
+
+        return Handler
@@ -0,0 +1,14 @@
+"""
+Каталог состояния, которое программа создает сама: история проверок,
+кэш автоподбора, профили сетей, статистика срабатываний hostlist.
+
+Оно хранится в data/, а не в lists/. lists/ целиком входит в снимки бэкапа,
+и восстановление снимка не должно удалять или подменять открытую базу.
+"""
+import os
+
+DATA_DIR = "data"
+
+
+def data_path(name):
+    return os.path.join(DATA_DIR, name)
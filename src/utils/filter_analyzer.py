@@ -0,0 +1,382 @@
+"""
+Анализ цепочки профилей winws (секций между --new).
+
+winws проверяет секции по порядку и применяет первую, условиям которой
+соответствует пакет. Поэтому порядок влияет и на поведение (перекрывающиеся
+секции с разными действиями), и на стоимость: каждая пропущенная секция - это
+лишние проверки портов, протокола, ipset и hostlist для каждого пакета.
+"""
+from utils.capture_filter import PROTOCOLS, _REAL_PORTS, captured_ports
+from utils.profile_parser import ProfileSection, format_options
+
+# Условная стоимость проверки одного условия секции (в единицах "сравнение портов")
+CHECK_COSTS = {
+    "ports": 1,
+    "l3": 1,
+    "l7": 1,
+    "ipset": 2,      # бинарный поиск по диапазонам
+    "hostlist": 3,   # поиск домена и всех его родительских доменов
+}
+
+# Оценка вероятности, что пакет класса подходит под условие (список содержимого не читаем)
+MATCH_PROBABILITY = {
+    "l3": 0.9,
+    "l7": 0.5,
+    "ipset": 0.3,
+    "hostlist": 0.3,
+}
+
+# Типичные классы пакетов: (название, протокол, порт, доля трафика)
+PACKET_CLASSES = (
+    ("HTTPS (TCP 443)", "tcp", 443, 0.55),
+    ("QUIC (UDP 443)", "udp", 443, 0.25),
+    ("HTTP (TCP 80)", "tcp", 80, 0.05),
+    ("Discord/STUN (UDP 50000-50100)", "udp", 50000, 0.05),
+    ("Игры (UDP 1024-65535)", "udp", 27015, 0.10),
+)
+
+class SectionInfo:
+    """Условия срабатывания секции, приведенные к множествам для сравнения."""
+    def __init__(self, section, captured=None):
+        self.section = section
+        self.index = section.index
+        self.ports = {}
+        for protocol in PROTOCOLS:
+            ports = section.ports(protocol) & _REAL_PORTS
+            if captured is not None:
+                ports = ports & captured[protocol]
+            self.ports[protocol] = ports
+        self.l3 = _value_set(section, "--filter-l3")
+        self.l7 = section.l7()
+        self.hostlists = section.hostlists()
+        self.ipsets = section.ipsets()
+        self.hostlist_excludes = frozenset(section.get_all("--hostlist-exclude"))
+        self.ipset_excludes = frozenset(section.get_all("--ipset-exclude"))
+        self.actions = tuple(section.action_options())
+
+    def is_empty(self):
+        return not any(self.ports.values())
+
+    def checks(self):
+        """Список проверок, которые winws выполняет для секции."""
+        checks = ["ports"]
+        if self.l3 is not None:
+            checks.append("l3")
+        if self.l7 is not None:
+            checks.append("l7")
+        if self.ipsets or self.ipset_excludes:
+            checks.append("ipset")
+        if self.hostlists or self.hostlist_excludes:
+            checks.append("hostlist")
+        return checks
+
+    def cost(self):
+        return sum(CHECK_COSTS[check] for check in self.checks())
+
+    def match_probability(self):
+        """Оценка вероятности срабатывания для пакета, прошедшего фильтр портов."""
+        probability = 1.0
+        for check in self.checks()[1:]:
+            probability *= MATCH_PROBABILITY[check]
+        return probability
+
+    def accepts(self, protocol, port):
+        return port in self.ports[protocol]
+
+
+def _value_set(section, option):
+    values = section.get_all(option)
+    if not values:
+        return None
+    return frozenset(p.strip().lower() for v in values for p in v.split(",") if p.strip())
+
+
+def _covers(outer, inner):
+    """Условие-множество outer (None - любое значение) пропускает все, что пропускает inner."""
+    if outer is None:
+        return True
+    return inner is not None and inner <= outer
+
+
+def _compatible(a, b):
+    """Условия-множества a и b могут пропустить один и тот же пакет."""
+    return a is None or b is None or bool(a & b)
+
+
+def _list_covers(outer, inner):
+    """Списки outer (OR файлов; пусто - любой адрес) содержат все, что inner."""
+    if not outer:
+        return True
+    return bool(inner) and inner <= outer
+
+
+def shadows(earlier, later):
+    """Секция earlier перехватывает все пакеты, которые могли бы попасть в later."""
+    return (all(later.ports[p] <= earlier.ports[p] for p in PROTOCOLS)
+            and _covers(earlier.l3, later.l3)
+            and _covers(earlier.l7, later.l7)
+            and _list_covers(earlier.hostlists, later.hostlists)
+            and _list_covers(earlier.ipsets, later.ipsets)
+            and earlier.hostlist_excludes <= later.hostlist_excludes
+            and earlier.ipset_excludes <= later.ipset_excludes)
+
+
+def overlaps(a, b):
+    """
+    Секции могут сработать на один и тот же пакет. Содержимое списков не
+    сравнивается: разные hostlist/ipset считаются потенциально пересекающимися.
+    """
+    return (any(a.ports[p] & b.ports[p] for p in PROTOCOLS)
+            and _compatible(a.l3, b.l3)
+            and _compatible(a.l7, b.l7))
+
+
+def order_matters(a, b):
+    """Перестановка a и b может изменить поведение: они пересекаются и действуют по-разному."""
+    return overlaps(a, b) and a.actions != b.actions
+
+
+class AnalysisReport:
+    """Результат анализа профиля."""
+    def __init__(self, profile):
+        self.profile = profile
+        self.unreachable = []   # [(секция, причина)]
+        self.shadowed = []      # [(секция, перекрывающая секция)]
+        self.overlaps = []      # [(секция, секция)] - порядок важен
+        self.merges = []        # [(секция, секция, описание)]
+        self.class_costs = []   # [(класс, стоимость текущая, стоимость предложенная)]
+        self.suggested_sections = []
+        self.current_cost = 0.0
+        self.suggested_cost = 0.0
+
+    def has_changes(self):
+        """Предложенная цепочка отличается от текущей."""
+        return [s.index for s in self.suggested_sections] != [s.index for s in self.profile.sections] \
+            or bool(self.merges)
+
+
+def analyze_profile(profile, captured=None):
+    """
+    Анализирует цепочку секций профиля.
+    captured - порты, перехватываемые драйвером ({'tcp': PortRangeSet, 'udp': ...});
+    по умолчанию берутся из --wf-tcp/--wf-udp профиля.
+    """
+    if captured is None:
+        captured = captured_ports(profile)
+    infos = [SectionInfo(section, captured) for section in profile.sections]
+    report = AnalysisReport(profile)
+
+    reachable = []
+    idle = []  # Недостижимы при текущих переменных (например, %GameFilter%=0), но в профиле нужны
+    for info in infos:
+        if info.is_empty():
+            report.unreachable.append((info.section, "порты секции не перехватываются (--wf-*) или равны 0"))
+            idle.append(info)
+            continue
+        shadow = next((earlier for earlier in reachable if shadows(earlier, info)), None)
+        if shadow is not None:
+            report.shadowed.append((info.section, shadow.section))
+            report.unreachable.append((info.section, f"все ее пакеты забирает секция #{shadow.index}"))
+            continue
+        reachable.append(info)
+
+    for i, a in enumerate(reachable):
+        for b in reachable[i + 1:]:
+            if order_matters(a, b):
+                report.overlaps.append((a.section, b.section))
+
+    merged = _merge_sections(reachable, report)
+    ordered = _reorder(merged)
+    if _weighted_cost(ordered, captured) >= _weighted_cost(merged, captured):
+        ordered = merged
+    # Неактивные секции уходят в конец: для остальных пакетов они стоят одну проверку портов
+    ordered = ordered + idle
+    report.suggested_sections = [info.section for info in ordered]
+
+    for name, protocol, port, weight in PACKET_CLASSES:
+        if port not in captured[protocol]:
+            continue  # Такие пакеты WinDivert до winws не доводит
+        current = _expected_cost(infos, protocol, port)
+        suggested = _expected_cost(ordered, protocol, port)
+        report.class_costs.append((name, current, suggested))
+    report.current_cost = _weighted_cost(infos, captured)
+    report.suggested_cost = _weighted_cost(ordered, captured)
+    return report
+
+
+def _expected_cost(infos, protocol, port):
+    """Ожидаемая стоимость прохода пакета класса по цепочке до первого срабатывания."""
+    cost = 0.0
+    reach = 1.0  # вероятность, что пакет дошел до текущей секции
+    for info in infos:
+        if not info.accepts(protocol, port):
+            cost += reach * CHECK_COSTS["ports"]
+            continue
+        cost += reach * info.cost()
+        reach *= 1.0 - info.match_probability()
+        if reach <= 0.0:
+            break
+    return cost
+
+
+def _weighted_cost(infos, captured):
+    return sum(weight * _expected_cost(infos, protocol, port)
+               for _, protocol, port, weight in PACKET_CLASSES if port in captured[protocol])
+
+
+def _merge_key(info, ignore):
+    """Ключ для поиска секций, отличающихся только условием ignore ('ports' или 'lists')."""
+    key = [info.actions, info.l3, info.l7, info.hostlist_excludes, info.ipset_excludes]
+    if ignore != "ports":
+        key.append(tuple(info.ports[p] for p in PROTOCOLS))
+    if ignore != "lists":
+        key.extend((info.hostlists, info.ipsets))
+    return tuple(key)
+
+
+def _merge_sections(infos, report):
+    """
+    Объединяет секции с одинаковыми действиями:
+    - отличающиеся только портами (порты объединяются);
+    - отличающиеся только файлами одного вида списков (несколько --hostlist/--ipset в секции
+      проверяются через ИЛИ). hostlist и ipset в одной секции работают как И, поэтому их не смешиваем.
+    Поздняя секция переносится к ранней, только если между ними нет секций, с которыми важен порядок.
+    """
+    result = list(infos)
+    changed = True
+    while changed:
+        changed = False
+        for i, a in enumerate(result):
+            for j in range(i + 1, len(result)):
+                b = result[j]
+                kind = _merge_kind(a, b)
+                if kind is None or any(order_matters(c, b) for c in result[i + 1:j]):
+                    continue
+                merged = SectionInfo(_merged_section(a.section, b.section, kind))
+                merged.ports = {p: a.ports[p] | b.ports[p] for p in PROTOCOLS}
+                description = "объединить порты" if kind == "ports" else "объединить списки"
+                report.merges.append((a.section, b.section, description))
+                result[i] = merged
+                del result[j]
+                changed = True
+                break
+            if changed:
+                break
+    return result
+
+
+def _merge_kind(a, b):
+    if _merge_key(a, "ports") == _merge_key(b, "ports"):
+        return "ports"
+    if _merge_key(a, "lists") == _merge_key(b, "lists"):
+        same_hostlists = a.hostlists == b.hostlists
+        same_ipsets = a.ipsets == b.ipsets
+        # Можно объединять только один вид списков и только если он есть в обеих секциях
+        if same_ipsets and a.hostlists and b.hostlists and not a.ipsets:
+            return "lists"
+        if same_hostlists and a.ipsets and b.ipsets and not a.hostlists:
+            return "lists"
+    return None
+
+
+def _merged_section(a, b, kind):
+    """Новая секция на месте a: условия a и b объединены, действия общие."""
+    conditions = []
+    if kind == "ports":
+        # Порты берутся после подстановки переменных; секция без --filter-* - это все порты
+        ports = {p: (a.ports(p) | b.ports(p)) & _REAL_PORTS for p in PROTOCOLS}
+        if any(ports[p] != _REAL_PORTS for p in PROTOCOLS):
+            for protocol in PROTOCOLS:
+                if ports[protocol]:
+                    conditions.append((f"--filter-{protocol}", str(ports[protocol])))
+        conditions.extend(item for item in a.match_options() if item[0] not in ("--filter-tcp", "--filter-udp"))
+    else:
+        conditions = a.match_options()
+        conditions.extend(item for item in b.match_options() if item not in conditions)
+    return ProfileSection(a.index, conditions + a.action_options(), a.variables)
+
+
+def _reorder(infos):
+    """
+    Предлагаемый порядок: раньше секции с меньшим отношением стоимости проверки
+    к доле срабатываний (правило Смита), обе величины взвешены по классам трафика.
+    Пары, для которых важен порядок, не переставляются.
+    """
+    def ratio(info):
+        cost = hits = 0.0
+        for _, protocol, port, weight in PACKET_CLASSES:
+            if info.accepts(protocol, port):
+                cost += weight * info.cost()
+                hits += weight * info.match_probability()
+            else:
+                cost += weight * CHECK_COSTS["ports"]
+        return cost / hits if hits else float("inf")
+
+    remaining = list(infos)
+    ordered = []
+    while remaining:
+        available = [info for i, info in enumerate(remaining)
+                     if not any(order_matters(prev, info) for prev in remaining[:i])]
+        best = min(available, key=lambda info: (ratio(info), remaining.index(info)))
+        ordered.append(best)
+        remaining.remove(best)
+    return ordered
+
+
+def describe_section(section):
+    """Короткое описание условий секции для отчета."""
+    parts = []
+    for option, value in section.match_options():
+        name = option[2:]
+        parts.append(f"{name}={value}" if value is not None else name)
+    return ", ".join(parts) if parts else "все пакеты"
+
+
+def format_report(report):
+    """Текстовый отчет по результатам анализа."""
+    lines = [f"Профиль: {report.profile.name}", f"Секций: {len(report.profile.sections)}", ""]
+
+    if report.unreachable:
+        lines.append("Недостижимые секции:")
+        for section, reason in report.unreachable:
+            lines.append(f"  #{section.index} ({describe_section(section)}): {reason}")
+        lines.append("")
+
+    if report.overlaps:
+        lines.append("Пересекающиеся секции с разными действиями (порядок важен):")
+        for a, b in report.overlaps:
+            lines.append(f"  #{a.index} ({describe_section(a)}) раньше #{b.index} ({describe_section(b)})")
+        lines.append("")
+
+    if report.merges:
+        lines.append("Можно объединить:")
+        for a, b, description in report.merges:
+            lines.append(f"  #{a.index} и #{b.index}: {description}")
+        lines.append("")
+
+    lines.append("Оценка стоимости проверки пакета (условные единицы):")
+    for name, current, suggested in report.class_costs:
+        lines.append(f"  {name}: {current:.1f} -> {suggested:.1f}")
+    lines.append(f"  Взвешенно по трафику: {report.current_cost:.2f} -> {report.suggested_cost:.2f}")
+    lines.append("")
+
+    if report.has_changes():
+        order = ", ".join(f"#{s.index}" for s in report.suggested_sections)
+        lines.append(f"Предлагаемый порядок секций: {order}")
+        lines.append("")
+        lines.append("Предлагаемая цепочка:")
+        lines.append(format_chain(report.profile, report.suggested_sections))
+    else:
+        lines.append("Текущий порядок секций оптимален.")
+    return "\n".join(lines)
+
+
+def format_chain(profile, sections):
+    """Цепочка секций в виде строк .bat (с переносами '^')."""
+    lines = []
+    if profile.global_options:
+        lines.append(format_options(profile.global_options) + " ^")
+    for i, section in enumerate(sections):
+        suffix = " --new ^" if i < len(sections) - 1 else ""
+        lines.append(section.to_args() + suffix)
+    return "\n".join(lines)
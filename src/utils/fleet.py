@@ -0,0 +1,342 @@
+"""
+Агрегатор парка: сводное состояние многих экземпляров Zapret GUI по их
+локальному API (ControlServer) и рассылка профиля или списка выбранным узлам.
+
+Все узлы обслуживает один поток с циклом asyncio: к каждому узлу держится одно
+постоянное HTTP/1.1-соединение, опросы идут одновременно (не больше
+poll_parallelism в полете), рассылка - не больше push_parallelism узлов сразу.
+"""
+import asyncio
+import hashlib
+import json
+import threading
+import time
+
+DEFAULT_PORT = 8765
+DEFAULT_POLL_INTERVAL = 5.0
+DEFAULT_TIMEOUT = 5.0
+# Рассылка ждет выполнения на узле: смена профиля идет через очередь операций узла
+# (срок OPERATION_DEADLINE = 120 с в control_server), замена списка - снимок и пересборка кэша
+DEFAULT_PUSH_TIMEOUT = 130.0
+DEFAULT_POLL_PARALLELISM = 64
+DEFAULT_PUSH_PARALLELISM = 8
+# Опрос /profiles - раз в столько циклов: профили меняются редко
+PROFILES_EVERY = 12
+# Запросы, которые можно повторить после обрыва соединения
+IDEMPOTENT_METHODS = ("GET",)
+
+OK = "ok"
+DEGRADED = "degraded"
+OFFLINE = "offline"
+
+
+class NodeError(Exception):
+    pass
+
+
+class NodeConnection:
+    """
+    Постоянное соединение с API одного узла. Запросы к узлу идут по очереди.
+    Соединение, которое узел уже закрыл, заменяется новым до отправки запроса.
+    Если оно оборвалось во время запроса, повторяются только идемпотентные (GET):
+    POST мог успеть выполниться на узле.
+    """
+    def __init__(self, host, port=DEFAULT_PORT, token=None, timeout=DEFAULT_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.token = token
+        self.timeout = timeout
+        self.connects = 0
+        self.requests = 0
+        self._reader = None
+        self._writer = None
+        self._lock = asyncio.Lock()
+
+    async def request(self, method, path, payload=None, timeout=None):
+        """
+        Возвращает (http_status, тело JSON). Сетевые ошибки - NodeError.
+        timeout - ожидание ответа на этот запрос (по умолчанию self.timeout).
+        """
+        timeout = timeout or self.timeout
+        async with self._lock:
+            for attempt in range(2):
+                if self._reader is not None and self._reader.at_eof():
+                    self.close()
+                reused = self._writer is not None
+                try:
+                    if not reused:
+                        await asyncio.wait_for(self._connect(), self.timeout)
+                    return await asyncio.wait_for(self._roundtrip(method, path, payload), timeout)
+                except asyncio.TimeoutError:
+                    self.close()
+                    raise NodeError("нет ответа")
+                except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+                    self.close()
+                    if not reused or attempt or method not in IDEMPOTENT_METHODS:
+                        raise NodeError(str(e) or type(e).__name__)
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        self.connects += 1
+
+    async def _roundtrip(self, method, path, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8") if payload is not None else b""
+        headers = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}",
+                   f"Content-Length: {len(body)}"]
+        if method == "POST":
+            headers.append("Content-Type: application/json")
+        if self.token:
+            headers.append(f"X-Auth-Token: {self.token}")
+        self._writer.write(("\r\n".join(headers) + "\r\n\r\n").encode("latin-1") + body)
+        await self._writer.drain()
+
+        status_line = await self._reader.readline()
+        if not status_line:
+            raise ConnectionResetError("соединение закрыто узлом")
+        status = int(status_line.split()[1])
+        length = 0
+        close = False
+        while True:
+            line = await self._reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            name = name.strip().lower()
+            if name == "content-length":
+                length = int(value)
+            elif name == "connection" and value.strip().lower() == "close":
+                close = True
+        data = await self._reader.readexactly(length)
+        self.requests += 1
+        if close:
+            self.close()
+        return status, json.loads(data) if data else {}
+
+    def close(self):
+        if self._writer:
+            self._writer.close()
+        self._reader = self._writer = None
+
+
+class FleetNode:
+    """Узел парка и последнее известное о нем."""
+    def __init__(self, name, host, port=DEFAULT_PORT, token=None, timeout=DEFAULT_TIMEOUT):
+        self.name = name
+        self.address = f"{host}:{port}"
+        self.connection = NodeConnection(host, port, token, timeout)
+        self.online = False
+        self.status = {}
+        self.lists = {}
+        self.profiles = []
+        self.latency = None
+        self.error = None
+        self.last_seen = None
+        self.polls = 0
+
+    @classmethod
+    def from_config(cls, config, timeout=DEFAULT_TIMEOUT):
+        """Узел из настроек: "host:port" или {"name", "host", "port", "token"}."""
+        if isinstance(config, str):
+            host, _, port = config.rpartition(":") if ":" in config else (config, "", "")
+            config = {"host": host, "port": int(port) if port else DEFAULT_PORT}
+        host = config["host"]
+        port = config.get("port", DEFAULT_PORT)
+        return cls(config.get("name") or f"{host}:{port}", host, port, config.get("token"), timeout)
+
+    @property
+    def health(self):
+        if not self.online:
+            return OFFLINE
+        supervisor = self.status.get("supervisor") or {}
+        running = self.status.get("service_status") == "RUNNING" or self.status.get("manual_running")
+        if not running or supervisor.get("state") == "crash_loop":
+            return DEGRADED
+        return OK
+
+    def summary(self):
+        return {
+            "name": self.name,
+            "address": self.address,
+            "health": self.health,
+            "service_status": self.status.get("service_status"),
+            "manual_running": bool(self.status.get("manual_running")),
+            "profile": self.status.get("profile"),
+            "ipset_enabled": self.status.get("ipset_enabled"),
+            "game_filter_enabled": self.status.get("game_filter_enabled"),
+            "uptime": self.status.get("uptime"),
+            "lists": {name: entry["sha256"] for name, entry in self.lists.items()},
+            "profiles": list(self.profiles),
+            "latency": self.latency,
+            "error": self.error,
+            "last_seen": self.last_seen,
+            "connects": self.connection.connects,
+            "requests": self.connection.requests,
+        }
+
+
+class FleetAggregator:
+    """
+    Сводное состояние узлов. start() запускает цикл опроса в отдельном потоке,
+    view() отдает снимок для GUI, push_*() возвращают concurrent.futures.Future
+    с {имя узла: (success, message)}. on_change(view) вызывается из потока цикла
+    после каждого опроса и рассылки.
+    """
+    def __init__(self, nodes, poll_interval=DEFAULT_POLL_INTERVAL, poll_parallelism=DEFAULT_POLL_PARALLELISM,
+                 push_parallelism=DEFAULT_PUSH_PARALLELISM, push_timeout=DEFAULT_PUSH_TIMEOUT, on_change=None):
+        self.nodes = {node.name: node for node in nodes}
+        self.poll_interval = poll_interval
+        self.poll_parallelism = poll_parallelism
+        self.push_parallelism = push_parallelism
+        self.push_timeout = push_timeout
+        self.on_change = on_change
+        self.cycles = 0
+        self.last_cycle = None
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._stop = None
+
+    @classmethod
+    def from_settings(cls, settings, on_change=None):
+        """Из настроек "fleet": {"nodes": [...], "poll_interval", "timeout", "push_parallelism", "push_timeout"}."""
+        timeout = settings.get("timeout", DEFAULT_TIMEOUT)
+        nodes = [FleetNode.from_config(config, timeout) for config in settings.get("nodes", [])]
+        return cls(nodes, poll_interval=settings.get("poll_interval", DEFAULT_POLL_INTERVAL),
+                   poll_parallelism=settings.get("poll_parallelism", DEFAULT_POLL_PARALLELISM),
+                   push_parallelism=settings.get("push_parallelism", DEFAULT_PUSH_PARALLELISM),
+                   push_timeout=settings.get("push_timeout", DEFAULT_PUSH_TIMEOUT), on_change=on_change)
+
+    # --- Жизненный цикл ---
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_until_complete, args=(self._run(),),
+                                        name="fleet-aggregator", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        if not self._thread:
+            return
+        self._loop.call_soon_threadsafe(lambda: self._stop and self._stop.set())
+        self._thread.join(timeout)
+        self._thread = None
+        self._loop.close()
+
+    async def _run(self):
+        self._stop = asyncio.Event()
+        try:
+            while not self._stop.is_set():
+                await self.poll_all()
+                try:
+                    await asyncio.wait_for(self._stop.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            for node in self.nodes.values():
+                node.connection.close()
+
+    # --- Опрос ---
+    async def poll_all(self, names=None):
+        started = time.perf_counter()
+        semaphore = asyncio.Semaphore(self.poll_parallelism)
+        nodes = [self.nodes[name] for name in names] if names else list(self.nodes.values())
+
+        async def bounded(node):
+            async with semaphore:
+                await self.poll_node(node)
+
+        await asyncio.gather(*(bounded(node) for node in nodes))
+        if names is None:
+            self.cycles += 1
+            self.last_cycle = time.perf_counter() - started
+        self._publish()
+
+    async def poll_node(self, node):
+        started = time.perf_counter()
+        try:
+            status, body = await node.connection.request("GET", "/status")
+            if status != 200:
+                raise NodeError(body.get("error") or f"HTTP {status}")
+            _, lists = await node.connection.request("GET", "/lists")
+            if node.polls % PROFILES_EVERY == 0:
+                _, profiles = await node.connection.request("GET", "/profiles")
+                profiles = profiles.get("profiles", [])
+            else:
+                profiles = node.profiles
+        except NodeError as e:
+            with self._lock:
+                node.online = False
+                node.error = str(e)
+            return
+        with self._lock:
+            node.online = True
+            node.error = None
+            node.status = body.get("status", {})
+            node.lists = lists.get("lists", {})
+            node.profiles = profiles
+            node.latency = time.perf_counter() - started
+            node.last_seen = time.time()
+            node.polls += 1
+
+    # --- Сводка ---
+    def view(self):
+        with self._lock:
+            return [node.summary() for node in self.nodes.values()]
+
+    def list_versions(self):
+        """{список: {sha256: [узлы]}} по узлам в сети. Больше одного sha256 - версии разошлись."""
+        versions = {}
+        with self._lock:
+            for node in self.nodes.values():
+                if not node.online:
+                    continue
+                for name, entry in node.lists.items():
+                    versions.setdefault(name, {}).setdefault(entry["sha256"], []).append(node.name)
+        return versions
+
+    def _publish(self):
+        if self.on_change:
+            try:
+                self.on_change(self.view())
+            except Exception as e:
+                print(f"Fleet listener failed: {e}")
+
+    def refresh(self):
+        """Внеочередной опрос всех узлов. Возвращает concurrent.futures.Future."""
+        return self._submit(self.poll_all())
+
+    # --- Рассылка ---
+    def push_profile(self, names, profile):
+        return self._submit(self.push(names, "/profile", {"profile": profile}))
+
+    def push_list(self, names, list_name, content):
+        payload = {"name": list_name, "content": content,
+                   "sha256": hashlib.sha256(content.encode("utf-8")).hexdigest()}
+        return self._submit(self.push(names, "/lists/push", payload))
+
+    def _submit(self, coroutine):
+        if not self._thread:
+            raise RuntimeError("Агрегатор не запущен.")
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    async def push(self, names, path, payload):
+        """
+        POST path на узлы names, не больше push_parallelism одновременно, ответ ждется до
+        push_timeout. Затем узлы опрашиваются заново.
+        """
+        semaphore = asyncio.Semaphore(self.push_parallelism)
+
+        async def bounded(node):
+            async with semaphore:
+                try:
+                    status, body = await node.connection.request("POST", path, payload, self.push_timeout)
+                except NodeError as e:
+                    return node.name, (False, str(e))
+                return node.name, (status == 200 and body.get("ok", False),
+                                   body.get("message") or body.get("error") or f"HTTP {status}")
+
+        nodes = [self.nodes[name] for name in names if name in self.nodes]
+        results = dict(await asyncio.gather(*(bounded(node) for node in nodes)))
+        await self.poll_all([node.name for node in nodes])
+        return results
@@ -0,0 +1,226 @@
+"""
+Подбор узкого набора портов для игрового фильтра по живым UDP-сокетам игр.
+
+Вместо %GameFilter%=1024-65535 (тысячи перехватываемых портов) за игровую
+сессию собираются порты UDP-трафика выбранных процессов и склеиваются в
+компактный набор диапазонов.
+
+Удаленный порт UDP psutil на Windows не знает (GetExtendedUdpTable содержит
+только локальные адреса), а игровые сокеты обычно и не привязаны к серверу.
+Поэтому удаленные порты снимаются с потоков процесса через WinDivert (слой
+FLOW, только прослушивание), а если он недоступен - в набор идут локальные
+порты UDP-сокетов игры.
+"""
+import ctypes
+import os
+import sys
+import threading
+import time
+
+import psutil
+
+from utils.port_ranges import PortRangeSet
+
+# Порты, которые и так перехватываются профилями (QUIC) - в игровой набор их не добавляем
+EXCLUDED_PORTS = PortRangeSet.parse("0,53,443")
+DEFAULT_GAP = 8   # Соседние порты серверов одной игры часто идут подряд с небольшими разрывами
+
+WINDIVERT_DLL = os.path.join("bin", "WinDivert.dll")
+_LAYER_FLOW = 2
+_FLAG_SNIFF = 0x0001
+_FLAG_RECV_ONLY = 0x0004
+_EVENT_FLOW_ESTABLISHED = 1
+_SHUTDOWN_BOTH = 3
+_PRIORITY = -1000      # Ниже winws: прослушивание не должно мешать обходу
+
+
+def list_udp_processes():
+    """Имена процессов, у которых сейчас есть UDP-сокеты: {имя: число сокетов}."""
+    names = _process_names()
+    counts = {}
+    for conn in _udp_connections():
+        name = names.get(conn.pid)
+        if name:
+            counts[name] = counts.get(name, 0) + 1
+    return counts
+
+
+def _udp_connections():
+    try:
+        return psutil.net_connections(kind='udp')
+    except (psutil.AccessDenied, OSError):
+        return []
+
+
+def _process_names():
+    names = {}
+    for process in psutil.process_iter(['pid', 'name']):
+        if process.info['name']:
+            names[process.info['pid']] = process.info['name']
+    return names
+
+
+class _FlowData(ctypes.Structure):
+    _fields_ = [("EndpointId", ctypes.c_uint64), ("ParentEndpointId", ctypes.c_uint64),
+                ("ProcessId", ctypes.c_uint32), ("LocalAddr", ctypes.c_uint32 * 4),
+                ("RemoteAddr", ctypes.c_uint32 * 4), ("LocalPort", ctypes.c_uint16),
+                ("RemotePort", ctypes.c_uint16), ("Protocol", ctypes.c_uint8)]
+
+
+class _AddressData(ctypes.Union):
+    _fields_ = [("Flow", _FlowData), ("Reserved", ctypes.c_uint8 * 64)]
+
+
+class _Address(ctypes.Structure):
+    """WINDIVERT_ADDRESS (WinDivert 2.x): битовые поля Layer/Event/... - в Flags."""
+    _fields_ = [("Timestamp", ctypes.c_int64), ("Flags", ctypes.c_uint32), ("Reserved2", ctypes.c_uint32),
+                ("Data", _AddressData)]
+
+
+class UdpFlowSniffer:
+    """
+    Слушает установку UDP-потоков через WinDivert (слой FLOW, SNIFF | RECV_ONLY:
+    пакеты не перехватываются) и запоминает удаленные порты по PID.
+    Требует Windows, прав администратора и WinDivert.dll из комплекта zapret.
+    """
+    def __init__(self, dll_path=WINDIVERT_DLL):
+        self.dll_path = dll_path
+        self.flows = {}       # PID -> {удаленный порт: сколько потоков}
+        self._lock = threading.Lock()
+        self._dll = None
+        self._handle = None
+        self._thread = None
+
+    def start(self):
+        """Открывает WinDivert и запускает поток чтения. Возвращает (success, message)."""
+        if sys.platform != "win32":
+            return False, "Прослушивание потоков доступно только в Windows."
+        try:
+            dll = ctypes.WinDLL(os.path.abspath(self.dll_path), use_last_error=True)
+            dll.WinDivertOpen.restype = ctypes.c_void_p
+            dll.WinDivertOpen.argtypes = [ctypes.c_char_p, ctypes.c_int, ctypes.c_int16, ctypes.c_uint64]
+            dll.WinDivertRecv.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_uint,
+                                          ctypes.POINTER(ctypes.c_uint), ctypes.POINTER(_Address)]
+            dll.WinDivertShutdown.argtypes = [ctypes.c_void_p, ctypes.c_int]
+            dll.WinDivertClose.argtypes = [ctypes.c_void_p]
+        except (OSError, AttributeError) as e:
+            return False, f"WinDivert недоступен: {e}"
+        handle = dll.WinDivertOpen(b"udp", _LAYER_FLOW, _PRIORITY, _FLAG_SNIFF | _FLAG_RECV_ONLY)
+        if handle in (None, ctypes.c_void_p(-1).value):
+            return False, f"Не удалось открыть WinDivert (код {ctypes.get_last_error()})."
+        self._dll, self._handle = dll, handle
+        self._thread = threading.Thread(target=self._run, name="udp-flow-sniffer", daemon=True)
+        self._thread.start()
+        return True, "Прослушивание UDP-потоков запущено."
+
+    def stop(self):
+        if self._handle is None:
+            return
+        self._dll.WinDivertShutdown(self._handle, _SHUTDOWN_BOTH)   # Разблокирует WinDivertRecv
+        if self._thread:
+            self._thread.join(2)
+        self._dll.WinDivertClose(self._handle)
+        self._handle = None
+
+    def ports_for(self, pids):
+        """Удаленные порты потоков этих процессов: {порт: сколько потоков}."""
+        ports = {}
+        with self._lock:
+            for pid in pids:
+                for port, count in self.flows.get(pid, {}).items():
+                    ports[port] = ports.get(port, 0) + count
+        return ports
+
+    def _run(self):
+        address = _Address()
+        received = ctypes.c_uint()
+        while self._dll.WinDivertRecv(self._handle, None, 0, ctypes.byref(received), ctypes.byref(address)):
+            if (address.Flags >> 8) & 0xFF != _EVENT_FLOW_ESTABLISHED:
+                continue
+            flow = address.Data.Flow
+            with self._lock:
+                ports = self.flows.setdefault(flow.ProcessId, {})
+                ports[flow.RemotePort] = ports.get(flow.RemotePort, 0) + 1
+
+
+class GamePortDetector:
+    """
+    Накопитель наблюдений за UDP-трафиком выбранных процессов (имена без учета регистра).
+    sample() делает один снимок; порты копятся между вызовами в течение сессии.
+    Удаленные порты берутся из sniffer (UdpFlowSniffer) и из сокетов, для которых
+    ОС сообщает удаленный адрес; без них итоговый набор - локальные порты игры.
+    """
+    def __init__(self, process_names, sniffer=None):
+        self.process_names = {name.lower() for name in process_names}
+        self.sniffer = sniffer
+        self.remote_ports = {}    # порт -> сколько раз встречался
+        self.local_ports = set()
+        self.unconnected = 0      # сокеты без удаленного адреса (порт сервера по ним неизвестен)
+        self.samples = 0
+        self.started = time.time()
+        self._pids = {}       # PID -> имя для выбранных процессов
+        self._ignored = set() # PID остальных процессов
+
+    def sample(self):
+        """Один снимок сокетов. Возвращает число найденных сокетов выбранных процессов."""
+        self._refresh_pids()
+        found = 0
+        socket_ports = {}
+        for conn in _udp_connections():
+            if conn.pid not in self._pids:
+                continue
+            found += 1
+            if conn.laddr:
+                self.local_ports.add(conn.laddr.port)
+            if conn.raddr:
+                socket_ports[conn.raddr.port] = socket_ports.get(conn.raddr.port, 0) + 1
+            else:
+                self.unconnected += 1
+        if self.sniffer:
+            # Счетчики сниффера накопительные: берем максимум, а не сумму по снимкам
+            for port, count in self.sniffer.ports_for(self._pids).items():
+                socket_ports[port] = max(socket_ports.get(port, 0), count)
+        for port, count in socket_ports.items():
+            self.remote_ports[port] = self.remote_ports.get(port, 0) + count
+        self.samples += 1
+        return found
+
+    def _refresh_pids(self):
+        # Имена процессов кэшируются по PID, перечисление повторяется только для новых PID
+        alive = set(psutil.pids())
+        for pid in list(self._pids):
+            if pid not in alive:
+                del self._pids[pid]
+        self._ignored &= alive
+        for pid in alive - set(self._pids) - self._ignored:
+            try:
+                name = psutil.Process(pid).name()
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+            if name.lower() in self.process_names:
+                self._pids[pid] = name
+            else:
+                self._ignored.add(pid)
+
+    def source(self):
+        """Откуда итоговые порты: "remote" - удаленные порты серверов, "local" - локальные порты игры."""
+        return "remote" if self.remote_ports else "local"
+
+    def ports(self, gap=DEFAULT_GAP):
+        """Итоговый набор портов: склеенные диапазоны без портов, перехватываемых профилями."""
+        observed = self.remote_ports if self.remote_ports else self.local_ports
+        ports = PortRangeSet((port, port) for port in observed)
+        return (ports - EXCLUDED_PORTS).coalesce(gap) - EXCLUDED_PORTS
+
+    def summary(self):
+        ports = self.ports()
+        return {
+            "samples": self.samples,
+            "duration": time.time() - self.started,
+            "ports": str(ports),
+            "port_count": ports.count(),
+            "source": self.source(),
+            "remote_ports_seen": len(self.remote_ports),
+            "local_ports_seen": len(self.local_ports),
+            "unconnected_sockets": self.unconnected,
+        }
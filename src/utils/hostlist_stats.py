@@ -0,0 +1,194 @@
+"""
+Статистика срабатываний hostlist по отладочному выводу winws (--debug).
+
+winws при проверке хоста пишет строку вида
+    Hostlist check for www.youtube.com : negative
+    Hostlist check for youtube.com : positive
+и проверяет сначала сам домен, затем все родительские. Положительная строка
+называет запись hostlist, которая сработала. Журнал читается потоком с
+сохраненной позиции, поэтому память не зависит от его размера.
+"""
+import os
+import re
+import time
+
+from utils.data_dir import data_path
+from utils.ipset_pipeline import iter_lines
+from utils.list_files import atomic_output
+
+HIT_RE = re.compile(rb'hostlist check for (\S+) : positive', re.IGNORECASE)
+
+DEFAULT_STATS_PATH = data_path("hostlist-stats.tsv")
+MAX_DOMAINS = 100000        # Жесткий предел числа отслеживаемых доменов
+READ_CHUNK = 64 * 1024
+
+# Первая строка файла статистики: позиция в журнале, чтобы продолжать с того же места
+_HEADER_PREFIX = "# log "
+
+
+class HostlistStats:
+    """
+    Счетчики срабатываний по доменам: домен -> [срабатываний, время последнего].
+    Хранится в TSV-файле 'домен<TAB>срабатываний<TAB>последнее (unix time)'.
+    """
+    def __init__(self, path=DEFAULT_STATS_PATH, max_domains=MAX_DOMAINS):
+        self.path = os.path.abspath(path)
+        self.max_domains = max_domains
+        self.counts = {}
+        self.log_path = None
+        self.log_offset = 0
+        self.log_size = 0
+        self.load()
+
+    def load(self):
+        self.counts = {}
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8', errors='ignore') as f:
+            for line in f:
+                line = line.rstrip("\n")
+                if line.startswith(_HEADER_PREFIX):
+                    self._parse_header(line[len(_HEADER_PREFIX):])
+                    continue
+                parts = line.split("\t")
+                if len(parts) != 3:
+                    continue
+                try:
+                    self.counts[parts[0]] = [int(parts[1]), int(parts[2])]
+                except ValueError:
+                    continue
+
+    def _parse_header(self, text):
+        # offset<TAB>size<TAB>путь
+        parts = text.split("\t", 2)
+        if len(parts) == 3:
+            try:
+                self.log_offset, self.log_size = int(parts[0]), int(parts[1])
+                self.log_path = parts[2]
+            except ValueError:
+                pass
+
+    def save(self):
+        """Атомарно записывает статистику, самые частые домены первыми."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with atomic_output(self.path, 'w', encoding='utf-8', newline='\n') as f:
+            if self.log_path:
+                f.write(f"{_HEADER_PREFIX}{self.log_offset}\t{self.log_size}\t{self.log_path}\n")
+            for domain, (hits, last_seen) in self.ranked():
+                f.write(f"{domain}\t{hits}\t{last_seen}\n")
+
+    def add_hit(self, domain, timestamp=None):
+        domain = domain.lower().rstrip(".")
+        entry = self.counts.get(domain)
+        now = int(timestamp if timestamp is not None else time.time())
+        if entry is None:
+            if len(self.counts) >= self.max_domains:
+                self._evict()
+            self.counts[domain] = [1, now]
+        else:
+            entry[0] += 1
+            entry[1] = now
+
+    def _evict(self):
+        # Освобождаем десятую часть места, выбрасывая самые редкие и давние домены
+        victims = sorted(self.counts.items(), key=lambda item: (item[1][0], item[1][1]))
+        for domain, _ in victims[:max(1, self.max_domains // 10)]:
+            del self.counts[domain]
+
+    def feed_lines(self, lines, timestamp=None):
+        """Учитывает строки журнала (bytes). Возвращает число найденных срабатываний."""
+        hits = 0
+        for line in lines:
+            match = HIT_RE.search(line)
+            if match:
+                self.add_hit(match.group(1).decode('ascii', errors='ignore'), timestamp)
+                hits += 1
+        return hits
+
+    def feed_chunks(self, chunks, timestamp=None):
+        """Учитывает поток байтовых кусков (stdout winws или чтение файла)."""
+        return self.feed_lines(iter_lines(chunks), timestamp)
+
+    def collect_from_log(self, log_path):
+        """
+        Читает журнал с места, где остановились в прошлый раз. Если журнал
+        стал меньше (пересоздан), читается с начала. Возвращает число срабатываний.
+        Неполная последняя строка не учитывается и будет прочитана в следующий раз.
+        """
+        log_path = os.path.abspath(log_path)
+        size = os.path.getsize(log_path)
+        offset = self.log_offset if self.log_path == log_path and size >= self.log_offset else 0
+        hits = 0
+        with open(log_path, 'rb') as f:
+            f.seek(offset)
+            tail = b""
+            while True:
+                chunk = f.read(READ_CHUNK)
+                if not chunk:
+                    break
+                lines = (tail + chunk).split(b"\n")
+                tail = lines.pop()
+                hits += self.feed_lines(lines)
+                offset += len(chunk)
+        self.log_path = log_path
+        self.log_offset = offset - len(tail)
+        self.log_size = size
+        return hits
+
+    def ranked(self):
+        """Домены по убыванию числа срабатываний."""
+        return sorted(self.counts.items(), key=lambda item: (-item[1][0], item[0]))
+
+    def total_hits(self):
+        return sum(hits for hits, _ in self.counts.values())
+
+
+def read_hostlist(path):
+    """Записи hostlist в исходном порядке (без пустых строк и комментариев, без дублей)."""
+    entries = []
+    seen = set()
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        for line in f:
+            domain = line.strip().lower()
+            if domain and not domain.startswith("#") and domain not in seen:
+                seen.add(domain)
+                entries.append(domain)
+    return entries
+
+
+def hostlist_match(host, entries):
+    """
+    Проверка хоста по множеству записей hostlist, как в winws: сначала сам домен,
+    затем родительские ('a.b.c' -> 'b.c' -> 'c'). Возвращает сработавшую запись или None.
+    """
+    host = host.lower().rstrip(".")
+    while host:
+        if host in entries:
+            return host
+        dot = host.find(".")
+        if dot == -1:
+            return None
+        host = host[dot + 1:]
+    return None
+
+
+def propose_pruned(entries, stats, min_hits=1, max_age_days=None, now=None):
+    """
+    Делит записи hostlist на используемые (по убыванию срабатываний) и холодные.
+    Запись холодная, если у нее меньше min_hits срабатываний или последнее было
+    раньше max_age_days дней назад.
+    """
+    now = now if now is not None else time.time()
+    hot, cold = [], []
+    for domain in entries:
+        hits, last_seen = stats.counts.get(domain, (0, 0))
+        too_old = max_age_days is not None and now - last_seen > max_age_days * 86400
+        (cold if hits < min_hits or too_old else hot).append((domain, hits))
+    hot.sort(key=lambda item: -item[1])  # sort стабилен: при равенстве сохраняется исходный порядок
+    return [domain for domain, _ in hot], [domain for domain, _ in cold]
+
+
+def write_hostlist(entries, path):
+    with atomic_output(path, 'w', encoding='utf-8', newline='\n') as f:
+        for domain in entries:
+            f.write(domain + "\n")
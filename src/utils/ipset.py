@@ -0,0 +1,279 @@
+import bisect
+import heapq
+import re
+import socket
+from array import array
+
+# Адрес с необязательной маской в начале строки; хвост без букв/цифр (пробелы, '¶') допускается
+_ENTRY_RE = re.compile(r'([0-9A-Fa-f:.]+)(?:/(\d{1,3}))?')
+_TAIL_IS_GARBAGE_RE = re.compile(r'[0-9A-Za-z]')
+
+IPV4_BITS = 32
+IPV6_BITS = 128
+_LOW64 = (1 << 64) - 1
+
+
+def parse_entry(text):
+    """
+    Разбирает строку ipset ('1.2.3.0/24', '1.2.3.4', '2001:db8::/32') в (семейство, start, end),
+    где семейство - 4 или 6. Биты хоста в адресе сети допускаются и обнуляются.
+    Возвращает None для пустых строк, комментариев и некорректных записей.
+    """
+    text = text.strip()
+    if not text or text.startswith("#"):
+        return None
+    match = _ENTRY_RE.match(text)
+    if not match or _TAIL_IS_GARBAGE_RE.search(text, match.end()):
+        return None
+    address, prefix = match.groups()
+    if ":" in address:
+        family, af, bits = 6, socket.AF_INET6, IPV6_BITS
+    else:
+        family, af, bits = 4, socket.AF_INET, IPV4_BITS
+    try:
+        value = int.from_bytes(socket.inet_pton(af, address), "big")
+    except OSError:
+        return None
+    length = bits if prefix is None else int(prefix)
+    if length > bits:
+        return None
+    host_bits = bits - length
+    start = (value >> host_bits) << host_bits
+    return family, start, start + (1 << host_bits) - 1
+
+
+def parse_ipv4_entry(text):
+    """Как parse_entry, но только для IPv4: возвращает (start, end) или None."""
+    parsed = parse_entry(text)
+    if parsed is None or parsed[0] != 4:
+        return None
+    return parsed[1], parsed[2]
+
+
+def merge_ranges(sorted_ranges):
+    """Склеивает отсортированные по началу диапазоны: пересекающиеся и соседние объединяются."""
+    current_start = current_end = None
+    for start, end in sorted_ranges:
+        if current_start is None:
+            current_start, current_end = start, end
+        elif start <= current_end + 1:
+            if end > current_end:
+                current_end = end
+        else:
+            yield current_start, current_end
+            current_start, current_end = start, end
+    if current_start is not None:
+        yield current_start, current_end
+
+
+def merge_tagged_ranges(sorted_ranges):
+    """Как merge_ranges, но для (семейство, start, end): диапазоны разных семейств не склеиваются."""
+    current = None
+    for family, start, end in sorted_ranges:
+        if current is None:
+            current = [family, start, end]
+        elif family == current[0] and start <= current[2] + 1:
+            if end > current[2]:
+                current[2] = end
+        else:
+            yield tuple(current)
+            current = [family, start, end]
+    if current is not None:
+        yield tuple(current)
+
+
+def range_to_cidrs(start, end, bits=IPV4_BITS):
+    """Минимальное покрытие диапазона [start, end] блоками CIDR: [(адрес_сети, длина_маски), ...]."""
+    cidrs = []
+    while start <= end:
+        # Самый большой выровненный блок, начинающийся в start и не выходящий за end
+        size_bits = (start & -start).bit_length() - 1 if start else bits
+        while size_bits > 0 and start + (1 << size_bits) - 1 > end:
+            size_bits -= 1
+        cidrs.append((start, bits - size_bits))
+        start += 1 << size_bits
+    return cidrs
+
+
+def format_ipv4_cidr(network, length):
+    address = socket.inet_ntoa(network.to_bytes(4, "big"))
+    return address if length == IPV4_BITS else f"{address}/{length}"
+
+
+def format_ipv6_cidr(network, length):
+    address = socket.inet_ntop(socket.AF_INET6, network.to_bytes(16, "big"))
+    return address if length == IPV6_BITS else f"{address}/{length}"
+
+
+def format_cidrs(family, start, end):
+    """Строки CIDR для диапазона заданного семейства."""
+    if family == 6:
+        return [format_ipv6_cidr(n, l) for n, l in range_to_cidrs(start, end, IPV6_BITS)]
+    return [format_ipv4_cidr(n, l) for n, l in range_to_cidrs(start, end, IPV4_BITS)]
+
+
+def ip_to_int(ip):
+    """Преобразует строку IPv4 в целое число."""
+    return int.from_bytes(socket.inet_pton(socket.AF_INET, ip), "big")
+
+
+def parse_address(ip):
+    """Преобразует строку IPv4/IPv6 в (семейство, целое число)."""
+    if ":" in ip:
+        return 6, int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), "big")
+    return 4, ip_to_int(ip)
+
+
+class IPSet:
+    """
+    Компактное множество IPv4- и IPv6-адресов из отсортированных непересекающихся диапазонов.
+
+    IPv4: два массива array('I') - начала и концы.
+    IPv6: 128-битные границы разложены на 64-битные половины, четыре массива array('Q')
+    (start_hi, start_lo, end_hi, end_lo). Объекты ipaddress на запись не создаются.
+    Поиск - бинарный поиск по началам, O(log n) для обоих семейств.
+    """
+    def __init__(self, starts=None, ends=None, v6=None):
+        self.starts = starts if starts is not None else array('I')
+        self.ends = ends if ends is not None else array('I')
+        if v6 is None:
+            v6 = (array('Q'), array('Q'), array('Q'), array('Q'))
+        self.v6_start_hi, self.v6_start_lo, self.v6_end_hi, self.v6_end_lo = v6
+
+    @classmethod
+    def from_ranges(cls, ranges, presorted=False):
+        """Строит множество из диапазонов IPv4 (start, end)."""
+        return cls.from_tagged_ranges(((4, s, e) for s, e in ranges), presorted)
+
+    @classmethod
+    def from_tagged_ranges(cls, ranges, presorted=False):
+        """Строит множество из диапазонов (семейство, start, end) обоих семейств."""
+        if not presorted:
+            ranges = sorted(ranges)
+        ipset = cls()
+        for family, start, end in merge_tagged_ranges(ranges):
+            ipset._append(family, start, end)
+        return ipset
+
+    @classmethod
+    def from_lines(cls, lines):
+        """Строит множество из строк ipset, пропуская некорректные."""
+        return cls.from_tagged_ranges(r for r in map(parse_entry, lines) if r is not None)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+            return cls.from_lines(f)
+
+    @classmethod
+    def union_all(cls, ipsets):
+        """Объединяет несколько множеств потоковым слиянием уже отсортированных диапазонов."""
+        return cls.from_tagged_ranges(heapq.merge(*(s.iter_tagged_ranges() for s in ipsets)), presorted=True)
+
+    def __len__(self):
+        """Количество диапазонов (не адресов) обоих семейств."""
+        return len(self.starts) + len(self.v6_start_hi)
+
+    def __contains__(self, ip):
+        if isinstance(ip, str):
+            family, value = parse_address(ip)
+        elif isinstance(ip, tuple):
+            family, value = ip
+        else:
+            family, value = 4, ip
+        if family == 6:
+            return self._contains_v6(value)
+        index = bisect.bisect_right(self.starts, value) - 1
+        return index >= 0 and value <= self.ends[index]
+
+    def _contains_v6(self, value):
+        hi, lo = value >> 64, value & _LOW64
+        start_hi = self.v6_start_hi
+        # Сужаем поиск до диапазонов с той же старшей половиной, затем ищем по младшей
+        upper = bisect.bisect_right(start_hi, hi)
+        lower = bisect.bisect_left(start_hi, hi, 0, upper)
+        index = bisect.bisect_right(self.v6_start_lo, lo, lower, upper) - 1
+        if index < lower:
+            index = lower - 1  # Кандидат - последний диапазон с меньшей старшей половиной
+        if index < 0:
+            return False
+        end_hi = self.v6_end_hi[index]
+        return hi < end_hi or (hi == end_hi and lo <= self.v6_end_lo[index])
+
+    def ipv4_count(self):
+        return len(self.starts)
+
+    def ipv6_count(self):
+        return len(self.v6_start_hi)
+
+    def address_count(self):
+        return sum(end - start + 1 for _, start, end in self.iter_tagged_ranges())
+
+    def iter_ranges(self):
+        """Диапазоны IPv4 (start, end)."""
+        return zip(self.starts, self.ends)
+
+    def iter_ipv6_ranges(self):
+        """Диапазоны IPv6 (start, end) как 128-битные целые."""
+        for s_hi, s_lo, e_hi, e_lo in zip(self.v6_start_hi, self.v6_start_lo, self.v6_end_hi, self.v6_end_lo):
+            yield (s_hi << 64) | s_lo, (e_hi << 64) | e_lo
+
+    def iter_tagged_ranges(self):
+        """Все диапазоны (семейство, start, end): сначала IPv4, затем IPv6, каждые по возрастанию."""
+        for start, end in self.iter_ranges():
+            yield 4, start, end
+        for start, end in self.iter_ipv6_ranges():
+            yield 6, start, end
+
+    def iter_cidrs(self):
+        """Строки CIDR, покрывающие множество минимальным числом блоков."""
+        for family, start, end in self.iter_tagged_ranges():
+            yield from format_cidrs(family, start, end)
+
+    def save(self, path):
+        """Записывает множество в текстовый ipset (по одному CIDR на строку)."""
+        with open(path, 'w', encoding='utf-8', newline='\n') as f:
+            for cidr in self.iter_cidrs():
+                f.write(cidr + "\n")
+
+    def _append(self, family, start, end):
+        if family == 6:
+            self.v6_start_hi.append(start >> 64)
+            self.v6_start_lo.append(start & _LOW64)
+            self.v6_end_hi.append(end >> 64)
+            self.v6_end_lo.append(end & _LOW64)
+        else:
+            self.starts.append(start)
+            self.ends.append(end)
+
+
+class SourcedIPSet:
+    """
+    Объединенный ipset с сохранением происхождения: помимо общего множества
+    хранит множество каждого источника, чтобы отвечать, откуда взялся адрес.
+    merged - уже собранный общий список (например, открытый из кэша); без него
+    объединение строится из источников.
+    """
+    def __init__(self, sources, merged=None):
+        self.sources = dict(sources)  # имя источника -> IPSet
+        self.merged = merged if merged is not None else IPSet.union_all(self.sources.values())
+
+    def __contains__(self, ip):
+        return ip in self.merged
+
+    def __len__(self):
+        return len(self.merged)
+
+    def sources_for(self, ip):
+        """Имена источников, в списках которых есть адрес."""
+        value = parse_address(ip) if isinstance(ip, str) else ip
+        if value not in self.merged:
+            return []
+        return [name for name, ipset in self.sources.items() if value in ipset]
+
+    def close(self):
+        """Закрывает отображенные в память множества (MappedIPSet), чтобы кэш можно было пересобрать."""
+        for ipset in (self.merged, *self.sources.values()):
+            close = getattr(ipset, "close", None)
+            if close:
+                close()
@@ -0,0 +1,243 @@
+"""
+Скомпилированный ipset: двоичный файл рядом с текстовым (ipset-all.txt.cache),
+который открывается через mmap без разбора текста.
+
+Формат (порядок байт - платформенный, отмечен в заголовке):
+    заголовок HEADER_SIZE байт: magic, версия, флаги, размер и mtime исходника,
+        число диапазонов IPv4 и IPv6, SHA-256 исходного текста
+    IPv4: starts[n4] uint32, ends[n4] uint32
+    IPv6: start_hi[n6], start_lo[n6], end_hi[n6], end_lo[n6] uint64
+
+Колонки отсортированы и не пересекаются, поэтому IPSet работает прямо поверх
+memoryview на отображенный файл: бинарный поиск читает только нужные страницы,
+а страницы общие для всех процессов, открывших тот же кэш.
+
+Кэш пересобирается, только если изменился хэш текста. Размер и mtime
+исходника - быстрая проверка: если они совпали, хэш не считается.
+"""
+import hashlib
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from utils.ipset import IPSet
+from utils.ipset_pipeline import iter_lines, iter_ranges
+from utils.list_files import LISTS_LOCK, atomic_output
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MAGIC = b"ZIPS"
+VERSION = 1
+CACHE_SUFFIX = ".cache"
+HEADER_SIZE = 128
+READ_CHUNK = 1024 * 1024
+
+_FLAG_LITTLE_ENDIAN = 1
+# magic, версия, флаги, размер исходника, mtime_ns исходника, n4, n6, sha256
+_HEADER = struct.Struct("<4sHHQqQQ32s")
+_NATIVE_FLAGS = _FLAG_LITTLE_ENDIAN if sys.byteorder == "little" else 0
+
+
+def cache_path_for(text_path):
+    return text_path + CACHE_SUFFIX
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK), b""):
+            digest.update(chunk)
+    return digest.digest()
+
+
+class CacheHeader:
+    def __init__(self, source_size, source_mtime_ns, v4_count, v6_count, digest,
+                 version=VERSION, flags=_NATIVE_FLAGS):
+        self.source_size = source_size
+        self.source_mtime_ns = source_mtime_ns
+        self.v4_count = v4_count
+        self.v6_count = v6_count
+        self.digest = digest
+        self.version = version
+        self.flags = flags
+
+    def pack(self):
+        data = _HEADER.pack(MAGIC, self.version, self.flags, self.source_size, self.source_mtime_ns,
+                            self.v4_count, self.v6_count, self.digest)
+        return data.ljust(HEADER_SIZE, b"\0")
+
+    @classmethod
+    def unpack(cls, data):
+        """Заголовок из байтов или None, если это не кэш текущей версии для этой платформы."""
+        if len(data) < _HEADER.size:
+            return None
+        magic, version, flags, size, mtime_ns, n4, n6, digest = _HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION or flags != _NATIVE_FLAGS:
+            return None
+        return cls(size, mtime_ns, n4, n6, digest, version, flags)
+
+    def data_size(self):
+        return self.v4_count * 8 + self.v6_count * 32
+
+    def matches_stat(self, stat):
+        return self.source_size == stat.st_size and self.source_mtime_ns == stat.st_mtime_ns
+
+
+def read_header(path):
+    try:
+        with open(path, 'rb') as f:
+            return CacheHeader.unpack(f.read(HEADER_SIZE))
+    except OSError:
+        return None
+
+
+def build_cache(text_path, cache_path=None):
+    """
+    Компилирует текстовый ipset в кэш. Текст читается один раз: хэш считается
+    по тем же кускам, что идут в разбор. Возвращает заголовок записанного кэша.
+    """
+    cache_path = cache_path or cache_path_for(text_path)
+    stat = os.stat(text_path)
+    digest = hashlib.sha256()
+    with open(text_path, 'rb') as f:
+        def chunks():
+            for chunk in iter(lambda: f.read(READ_CHUNK), b""):
+                digest.update(chunk)
+                yield chunk
+        ipset = IPSet.from_tagged_ranges(iter_ranges(iter_lines(chunks())))
+
+    header = CacheHeader(stat.st_size, stat.st_mtime_ns, ipset.ipv4_count(), ipset.ipv6_count(), digest.digest())
+    with atomic_output(cache_path) as f:
+        f.write(header.pack())
+        for column in (ipset.starts, ipset.ends, ipset.v6_start_hi, ipset.v6_start_lo,
+                       ipset.v6_end_hi, ipset.v6_end_lo):
+            column.tofile(f)
+    return header
+
+
+def _refresh_stat(cache_path, header, stat):
+    """Текст пересохранен без изменений: обновляем в заголовке только размер и mtime."""
+    header.source_size, header.source_mtime_ns = stat.st_size, stat.st_mtime_ns
+    with open(cache_path, 'r+b') as f:
+        f.write(header.pack())
+
+
+def ensure_cache(text_path, cache_path=None):
+    """
+    Проверяет кэш и при необходимости пересобирает его.
+    Возвращает (путь к кэшу, пересобран ли он).
+    """
+    cache_path = cache_path or cache_path_for(text_path)
+    # Проверка - под блокировкой: IpsetSwitch подменяет список и кэш вместе
+    with LISTS_LOCK:
+        stat = os.stat(text_path)
+        header = read_header(cache_path)
+        if header and os.path.getsize(cache_path) == HEADER_SIZE + header.data_size():
+            if header.matches_stat(stat):
+                return cache_path, False
+            if header.digest == file_digest(text_path):
+                _refresh_stat(cache_path, header, stat)
+                return cache_path, False
+    build_cache(text_path, cache_path)
+    return cache_path, True
+
+
+class MappedIPSet(IPSet):
+    """
+    IPSet поверх отображенного в память кэша. Только для чтения: колонки -
+    memoryview на страницы файла, копий в памяти процесса нет.
+    """
+    def __init__(self, cache_path):
+        self.path = cache_path
+        with open(cache_path, 'rb') as f:
+            header = CacheHeader.unpack(f.read(HEADER_SIZE))
+            if header is None:
+                raise ValueError(f"{cache_path}: не кэш ipset версии {VERSION}")
+            self.header = header
+            size = HEADER_SIZE + header.data_size()
+            if os.fstat(f.fileno()).st_size != size:
+                raise ValueError(f"{cache_path}: неожиданный размер файла")
+            self._mmap = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) if header.data_size() else None
+        self._base = memoryview(self._mmap) if self._mmap is not None else None
+        self._views = []
+        n4, n6 = header.v4_count, header.v6_count
+        offset = HEADER_SIZE
+        columns = []
+        for count, width, fmt in ((n4, 4, 'I'), (n4, 4, 'I'), (n6, 8, 'Q'), (n6, 8, 'Q'), (n6, 8, 'Q'), (n6, 8, 'Q')):
+            columns.append(self._column(offset, count * width, fmt))
+            offset += count * width
+        super().__init__(columns[0], columns[1], tuple(columns[2:]))
+
+    def _column(self, offset, length, fmt):
+        if not length:
+            return array(fmt)
+        view = self._base[offset:offset + length].cast(fmt)
+        self._views.append(view)
+        return view
+
+    def _append(self, family, start, end):
+        raise TypeError("MappedIPSet доступен только для чтения")
+
+    def as_numpy(self):
+        """Колонки как массивы NumPy без копирования (starts, ends) или None без NumPy."""
+        if numpy is None:
+            return None
+        return (numpy.frombuffer(self.starts, dtype=numpy.uint32),
+                numpy.frombuffer(self.ends, dtype=numpy.uint32))
+
+    def contains_many(self, values):
+        """
+        Проверка пачки IPv4-адресов (целых). С NumPy - векторный searchsorted,
+        без нее - бинарный поиск на каждый адрес. Возвращает список bool.
+        """
+        columns = self.as_numpy()
+        if columns is None or not len(columns[0]):
+            return [value in self for value in values]
+        starts, ends = columns
+        queries = numpy.asarray(values, dtype=numpy.uint32)
+        index = numpy.searchsorted(starts, queries, side="right") - 1
+        found = (index >= 0) & (queries <= ends[numpy.maximum(index, 0)])
+        return found.tolist()
+
+    def close(self):
+        """
+        Освобождает отображение. После close множество пусто. Массивы из
+        as_numpy() должны быть удалены раньше, иначе mmap не закроется (BufferError).
+        """
+        self.starts = self.ends = array('I')
+        self.v6_start_hi = self.v6_start_lo = self.v6_end_hi = self.v6_end_lo = array('Q')
+        for view in self._views:
+            view.release()
+        self._views = []
+        if self._base is not None:
+            self._base.release()
+            self._base = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_ipset(text_path, cache_path=None):
+    """
+    Открывает ipset через кэш, пересобирая его при изменении текста.
+    Если кэш нельзя записать (нет прав, файл занят другим процессом на Windows),
+    список разбирается из текста. Возвращает (ipset, warning): warning - текст
+    причины, если кэш не использован, иначе None.
+    """
+    try:
+        cache_path, _ = ensure_cache(text_path, cache_path)
+        return MappedIPSet(cache_path), None
+    except (OSError, ValueError) as e:
+        warning = f"Двоичный кэш {os.path.basename(text_path)} недоступен, список разобран из текста: {e}"
+        return IPSet.load(text_path), warning
@@ -0,0 +1,233 @@
+"""
+Потоковая обработка ipset с ограниченной памятью.
+
+байты из сети -> строки -> проверенные диапазоны -> внешняя сортировка -> склейка -> CIDR на диск
+
+Ни на одном шаге весь текст списка не держится в памяти: строки разбираются
+по мере поступления кусков, а диапазоны копятся в буфере фиксированного размера
+и при переполнении сбрасываются на диск отсортированными прогонами.
+"""
+import heapq
+import os
+import tempfile
+from array import array
+
+from utils.ipset import format_cidrs, merge_ranges, merge_tagged_ranges, parse_entry
+from utils.list_files import atomic_output
+
+_LOW64 = (1 << 64) - 1
+
+DEFAULT_BUFFER_RANGES = 65536   # ~0.5 МБ на буфер IPv4, ~2 МБ на буфер IPv6
+MAX_RUNS = 32                   # при большем числе прогонов они предварительно сливаются
+RUN_READ_PAIRS = 4096           # сколько пар читает за раз каждый прогон при слиянии
+
+
+def iter_lines(chunks):
+    """Собирает строки из потока байтовых кусков; строка может быть разрезана между кусками."""
+    tail = b""
+    for chunk in chunks:
+        lines = (tail + chunk).split(b"\n")
+        tail = lines.pop()
+        yield from lines
+    if tail:
+        yield tail
+
+
+def iter_ranges(lines, stats=None):
+    """
+    Разбирает строки (bytes или str) в диапазоны (семейство, start, end), отбрасывая некорректные.
+    Если передан stats (dict), в нем считаются 'entries' и 'dropped'.
+    """
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', errors='ignore')
+        parsed = parse_entry(line)
+        if parsed is None:
+            if stats is not None and line.strip() and not line.lstrip().startswith("#"):
+                stats["dropped"] = stats.get("dropped", 0) + 1
+            continue
+        if stats is not None:
+            stats["entries"] = stats.get("entries", 0) + 1
+        yield parsed
+
+
+def iter_file_ranges(path):
+    """Диапазоны из текстового ipset-файла, читаемого построчно."""
+    with open(path, 'rb') as f:
+        yield from iter_ranges(f)
+
+
+class _FamilyBuffer:
+    """
+    Буфер диапазонов одного семейства в плоском массиве.
+    IPv4 - пары 32-битных значений ('I'), IPv6 - четверки 64-битных половин ('Q').
+    """
+    def __init__(self, family):
+        self.family = family
+        self.typecode = 'I' if family == 4 else 'Q'
+        self.width = 2 if family == 4 else 4
+        self.values = array(self.typecode)
+
+    def __len__(self):
+        return len(self.values) // self.width
+
+    def add(self, start, end):
+        if self.family == 4:
+            self.values.append(start)
+            self.values.append(end)
+        else:
+            self.values.extend((start >> 64, start & _LOW64, end >> 64, end & _LOW64))
+
+    def clear(self):
+        self.values = array(self.typecode)
+
+    def sorted_ranges(self):
+        """Отсортированные склеенные диапазоны буфера (временный список не больше буфера)."""
+        ranges = list(self.unpack(self.values))
+        ranges.sort()
+        return merge_ranges(ranges)
+
+    def pack(self, ranges):
+        block = array(self.typecode)
+        for start, end in ranges:
+            if self.family == 4:
+                block.append(start)
+                block.append(end)
+            else:
+                block.extend((start >> 64, start & _LOW64, end >> 64, end & _LOW64))
+        return block
+
+    def unpack(self, block):
+        if self.family == 4:
+            for i in range(0, len(block), 2):
+                yield block[i], block[i + 1]
+        else:
+            for i in range(0, len(block), 4):
+                yield (block[i] << 64) | block[i + 1], (block[i + 2] << 64) | block[i + 3]
+
+
+class RangeAggregator:
+    """
+    Инкрементальный агрегатор диапазонов с ограниченной памятью (внешняя сортировка).
+    add() копит диапазоны в буферах по семействам; заполненный буфер сортируется,
+    склеивается и сбрасывается во временный файл. merged() отдает итоговые
+    непересекающиеся диапазоны (семейство, start, end) k-путевым слиянием прогонов:
+    сначала IPv4, затем IPv6.
+    """
+    def __init__(self, buffer_ranges=DEFAULT_BUFFER_RANGES, tmp_dir=None):
+        self.buffer_ranges = buffer_ranges
+        self.tmp_dir = tmp_dir
+        self._buffers = {4: _FamilyBuffer(4), 6: _FamilyBuffer(6)}
+        self._runs = {4: [], 6: []}
+
+    def add(self, family, start, end):
+        buffer = self._buffers[family]
+        buffer.add(start, end)
+        if len(buffer) >= self.buffer_ranges:
+            self._spill(family)
+
+    def extend(self, ranges):
+        for family, start, end in ranges:
+            self.add(family, start, end)
+
+    def merged(self):
+        """Итоговые отсортированные склеенные диапазоны. Временные файлы удаляются по завершении."""
+        try:
+            for family in (4, 6):
+                buffer = self._buffers[family]
+                sources = [self._read_run(family, path) for path in self._runs[family]]
+                sources.append(buffer.sorted_ranges())
+                for start, end in merge_ranges(heapq.merge(*sources)):
+                    yield family, start, end
+        finally:
+            self.close()
+
+    def close(self):
+        for runs in self._runs.values():
+            for path in runs:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            runs.clear()
+        for buffer in self._buffers.values():
+            buffer.clear()
+
+    def _spill(self, family):
+        buffer = self._buffers[family]
+        runs = self._runs[family]
+        runs.append(self._write_run(family, buffer.sorted_ranges()))
+        buffer.clear()
+        if len(runs) >= MAX_RUNS:
+            # Сливаем прогоны в один, чтобы число одновременно открытых файлов оставалось ограниченным
+            old_runs = list(runs)
+            runs.clear()
+            try:
+                merged = merge_ranges(heapq.merge(*(self._read_run(family, path) for path in old_runs)))
+                runs.append(self._write_run(family, merged))
+            finally:
+                for path in old_runs:
+                    os.remove(path)
+
+    def _write_run(self, family, ranges):
+        buffer = self._buffers[family]
+        fd, path = tempfile.mkstemp(prefix=f"ipset-run{family}-", suffix=".bin", dir=self.tmp_dir)
+        with os.fdopen(fd, 'wb') as f:
+            batch = []
+            for item in ranges:
+                batch.append(item)
+                if len(batch) >= RUN_READ_PAIRS:
+                    buffer.pack(batch).tofile(f)
+                    batch = []
+            buffer.pack(batch).tofile(f)
+        return path
+
+    def _read_run(self, family, path):
+        buffer = self._buffers[family]
+        block_bytes = RUN_READ_PAIRS * buffer.width * array(buffer.typecode).itemsize
+        with open(path, 'rb') as f:
+            while True:
+                data = f.read(block_bytes)
+                if not data:
+                    break
+                block = array(buffer.typecode)
+                block.frombytes(data)
+                yield from buffer.unpack(block)
+
+
+def write_cidrs(ranges, path):
+    """
+    Записывает диапазоны (семейство, start, end) в ipset-файл как минимальный набор CIDR.
+    Файл пишется во временный рядом и подменяется атомарно. Возвращает число строк.
+    """
+    lines = 0
+    with atomic_output(path, 'w', encoding='utf-8', newline='\n') as f:
+        for family, start, end in ranges:
+            for cidr in format_cidrs(family, start, end):
+                f.write(cidr + "\n")
+                lines += 1
+    return lines
+
+
+def ingest(chunks, out_path, buffer_ranges=DEFAULT_BUFFER_RANGES):
+    """
+    Полный конвейер: байтовые куски -> компактный ipset в out_path.
+    Возвращает статистику: entries, dropped, ranges (строк CIDR на выходе).
+    """
+    stats = {"entries": 0, "dropped": 0}
+    aggregator = RangeAggregator(buffer_ranges, tmp_dir=os.path.dirname(os.path.abspath(out_path)))
+    try:
+        aggregator.extend(iter_ranges(iter_lines(chunks), stats))
+        stats["ranges"] = write_cidrs(aggregator.merged(), out_path)
+    finally:
+        aggregator.close()
+    return stats
+
+
+def merge_files(paths, out_path):
+    """
+    Объединяет уже компактные ipset-файлы потоковым слиянием.
+    В таких файлах IPv4 идут перед IPv6 и каждые отсортированы, поэтому
+    последовательность (семейство, start, end) в каждом файле упорядочена.
+    """
+    return write_cidrs(merge_tagged_ranges(heapq.merge(*(iter_file_ranges(p) for p in paths))), out_path)
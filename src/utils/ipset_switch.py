@@ -0,0 +1,160 @@
+"""
+Переключение режима ipset без переписывания списков.
+
+winws читает lists/ipset-all.txt. service.bat (:ipset_switch) выключает ipset,
+переименовывая список в ipset-all.txt.backup и записывая вместо него заглушку
+0.0.0.0/32, а включает - переименованием обратно. Здесь тот же формат, но оба
+варианта всегда лежат готовыми:
+
+    ipset-all.txt.backup  - полный список (жесткая ссылка, пока ipset включен)
+    ipset-all.txt.stub    - заглушка 0.0.0.0/32
+
+и активный вариант подставляется на место ipset-all.txt жесткой ссылкой и
+os.replace под общей блокировкой записи в lists/ (list_files.LISTS_LOCK).
+Переключение атомарно и не зависит от размера списка, а полный
+список не теряется: он остается в .backup при любом состоянии. Двоичный кэш
+(ipset-all.txt.cache) переключается так же, поэтому не пересобирается.
+
+Включен ли ipset, определяется по самому файлу (как в :ipset_switch_status),
+а не по отдельному флагу, поэтому переключение из service.bat видно сразу.
+"""
+import os
+import shutil
+
+from utils.ipset_cache import cache_path_for
+from utils.list_files import LISTS_LOCK, atomic_output, remove_quietly, replace, temp_path_for
+
+LIST_NAME = "ipset-all.txt"
+FULL_SUFFIX = ".backup"         # Имя из service.bat
+STUB_SUFFIX = ".stub"
+STUB_CONTENT = b"0.0.0.0/32\n"
+# Файл не больше этого может быть заглушкой; больший читать не нужно
+_STUB_MAX_SIZE = 64
+
+ENABLED = "enabled"
+DISABLED = "disabled"
+MISSING = "missing"             # ipset-all.txt нет совсем
+
+
+class IpsetSwitch:
+    """Режим ipset папки списков. Методы переключения возвращают (success, message)."""
+    def __init__(self, lists_dir="lists"):
+        self.lists_dir = os.path.abspath(lists_dir)
+        self.list_path = os.path.join(self.lists_dir, LIST_NAME)
+        self.full_path = self.list_path + FULL_SUFFIX
+        self.stub_path = self.list_path + STUB_SUFFIX
+
+    # --- Состояние ---
+    def state(self):
+        """ENABLED, DISABLED или MISSING по активному ipset-all.txt: stat и чтение, только если файл крошечный."""
+        try:
+            stat = os.stat(self.list_path)
+        except FileNotFoundError:
+            return MISSING
+        return DISABLED if self._is_stub(self.list_path, stat) else ENABLED
+
+    def is_enabled(self):
+        return self.state() == ENABLED
+
+    def has_full_list(self):
+        """Есть ли полный список: активный или отложенный в .backup."""
+        return self.state() == ENABLED or os.path.exists(self.full_path)
+
+    def write_path(self):
+        """
+        Куда писать обновленный полный список: в активный файл, если ipset включен,
+        иначе в .backup, чтобы обновление не включило ipset само. Чтобы переключение
+        не вклинилось между выбором пути и записью, вызывать под LISTS_LOCK.
+        """
+        return self.list_path if self.state() != DISABLED else self.full_path
+
+    # --- Переключение ---
+    def enable(self):
+        """Делает активным полный список. Возвращает (success, message)."""
+        with LISTS_LOCK:
+            return self._enable()
+
+    def disable(self):
+        """Делает активной заглушку, сохраняя полный список в .backup. Возвращает (success, message)."""
+        with LISTS_LOCK:
+            return self._disable()
+
+    def set_enabled(self, enabled):
+        return self.enable() if enabled else self.disable()
+
+    def _enable(self):
+        state = self.state()
+        if state == ENABLED:
+            return True, "IPset уже включен."
+        if not os.path.exists(self.full_path):
+            return False, "Полного списка ipset нет (ipset-all.txt.backup). Обновите список ipset."
+        try:
+            self._activate(self.full_path, self.stub_path if state == DISABLED else None)
+        except OSError as e:
+            return False, f"Не удалось включить ipset: {e}"
+        return True, "IPset включен."
+
+    def _disable(self):
+        state = self.state()
+        if state == DISABLED:
+            return True, "IPset уже выключен."
+        try:
+            if state == ENABLED:
+                # Список мог обновиться с прошлого выключения: .backup снова ссылается на активный
+                self._place(self.list_path, self.full_path)
+            self._ensure_stub()
+            self._activate(self.stub_path, self.full_path if state == ENABLED else None)
+        except OSError as e:
+            return False, f"Не удалось выключить ipset: {e}"
+        return True, "IPset выключен."
+
+    # --- Вспомогательные ---
+    def _activate(self, variant_path, current_path):
+        """
+        Подставляет вариант на место ipset-all.txt. Двоичный кэш уходящего варианта
+        откладывается рядом с ним, кэш нового (если он есть) становится активным.
+        """
+        list_cache = cache_path_for(self.list_path)
+        if current_path and os.path.exists(list_cache):
+            self._place(list_cache, cache_path_for(current_path))
+        self._place(variant_path, self.list_path)
+        variant_cache = cache_path_for(variant_path)
+        if os.path.exists(variant_cache):
+            self._place(variant_cache, list_cache)
+        elif os.path.exists(list_cache):
+            os.remove(list_cache)   # Кэш другого варианта; соберется заново при открытии
+
+    @staticmethod
+    def _place(source, target):
+        """Атомарно делает target жесткой ссылкой на source; где ссылки не поддерживаются - копией."""
+        if os.path.exists(target) and os.path.samefile(source, target):
+            return      # rename() между ссылками на один файл ничего не делает и оставил бы .tmp
+        tmp_path = temp_path_for(target)
+        try:
+            os.remove(tmp_path)     # Имя уникально; os.link нужен несуществующий путь
+            try:
+                os.link(source, tmp_path)
+            except OSError:
+                shutil.copy2(source, tmp_path)
+            replace(tmp_path, target)
+        except BaseException:
+            remove_quietly(tmp_path)
+            raise
+
+    def _ensure_stub(self):
+        """Заглушку мог переписать редактор, пишущий прямо в ipset-all.txt: проверяем перед подстановкой."""
+        try:
+            if self._is_stub(self.stub_path, os.stat(self.stub_path)):
+                return
+        except FileNotFoundError:
+            pass
+        with atomic_output(self.stub_path) as f:
+            f.write(STUB_CONTENT)
+
+    @staticmethod
+    def _is_stub(path, stat):
+        """Как :ipset_switch_status в service.bat: заглушка - файл со строкой 0.0.0.0/32."""
+        if stat.st_size > _STUB_MAX_SIZE:
+            return False
+        with open(path, 'rb') as f:
+            return b"0.0.0.0/32" in (line.strip() for line in f.read().splitlines())
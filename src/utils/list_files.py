@@ -0,0 +1,54 @@
+"""
+Атомарная запись файлов в папке списков.
+
+Списки пишут несколько потоков сразу: обновление из источников, редактор,
+API, переключение ipset, сборка двоичного кэша. Поэтому временный файл у
+каждой записи свой (tempfile.mkstemp рядом с целевым, имя оканчивается на
+.tmp), а подмена целевого файла и многошаговые переключения (IpsetSwitch)
+идут под одной блокировкой LISTS_LOCK.
+"""
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+TMP_SUFFIX = ".tmp"
+
+# Подмена файлов в lists/; RLock - переключение ipset подменяет несколько файлов подряд
+LISTS_LOCK = threading.RLock()
+
+
+def temp_path_for(path):
+    """Создает пустой временный файл с уникальным именем рядом с path и возвращает его путь."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=TMP_SUFFIX, dir=directory)
+    os.close(fd)
+    return tmp_path
+
+
+@contextmanager
+def atomic_output(path, mode='wb', **kwargs):
+    """
+    Открывает временный файл рядом с path. После успешной записи он подменяет
+    path (os.replace под LISTS_LOCK), при ошибке удаляется.
+    """
+    tmp_path = temp_path_for(path)
+    try:
+        with open(tmp_path, mode, **kwargs) as f:
+            yield f
+        replace(tmp_path, path)
+    except BaseException:
+        remove_quietly(tmp_path)
+        raise
+
+
+def replace(tmp_path, path):
+    with LISTS_LOCK:
+        os.replace(tmp_path, path)
+
+
+def remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,234 @@
+"""
+Индексированное представление большого текстового списка (hostlist, ipset) для редактора.
+
+Файл отображается через mmap, а в памяти хранится только массив смещений строк
+(8 байт на строку). Строка декодируется, только когда ее запрашивают, поэтому
+список на миллион строк открывается за доли секунды и почти не занимает памяти.
+
+Правки не трогают файл: порядок строк хранится в массиве rows, где число >= 0 -
+номер строки файла, а отрицательное - ссылка на новую строку в added
+(-1 -> added[0]). Строки файла в rows никогда не переставляются, поэтому
+вставка и удаление - это сдвиг массива, а не перестроение индекса. save()
+записывает все накопленные правки разом во временный файл и подменяет
+исходный через os.replace.
+"""
+import bisect
+import mmap
+import os
+import re
+from array import array
+
+from utils.list_files import remove_quietly, replace, temp_path_for
+
+from utils.ipset import parse_entry
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+_NEWLINE_RE = re.compile(b"\n")
+_DOMAIN_RE = re.compile(r'^(?=.{1,253}\.?$)(?:[\w*](?:[\w-]{0,61}\w)?\.)*[\w-]{1,63}\.?$')
+
+
+def validate_hostlist_line(text):
+    """Сообщение об ошибке для строки hostlist или None, если строка допустима."""
+    text = text.strip()
+    if not text or text.startswith("#"):
+        return None
+    if not _DOMAIN_RE.match(text):
+        return "Некорректный домен"
+    return None
+
+
+def validate_ipset_line(text):
+    """Сообщение об ошибке для строки ipset или None, если строка допустима."""
+    text = text.strip()
+    if not text or text.startswith("#"):
+        return None
+    if parse_entry(text) is None:
+        return "Некорректный адрес или подсеть"
+    return None
+
+
+def validator_for(path):
+    """ipset-файлы проверяются как адреса, остальные списки - как домены."""
+    return validate_ipset_line if "ipset" in os.path.basename(path).lower() else validate_hostlist_line
+
+
+def build_line_offsets(buffer):
+    """
+    array('Q') начал строк: offsets[i] - начало строки i, последний элемент -
+    размер файла. Пустой хвост после последнего перевода строки строкой не считается.
+    """
+    size = len(buffer)
+    if size == 0:
+        return array('Q', [0])
+    offsets = array('Q', [0])
+    if numpy is not None:
+        newlines = numpy.flatnonzero(numpy.frombuffer(buffer, dtype=numpy.uint8) == 10) + 1
+        offsets.frombytes(newlines.astype(numpy.uint64).tobytes())
+    else:
+        offsets.extend(match.end() for match in _NEWLINE_RE.finditer(buffer))
+    if offsets[-1] != size:
+        offsets.append(size)  # Последняя строка без перевода строки
+    return offsets
+
+
+class ListIndex:
+    def __init__(self, path, encoding='utf-8'):
+        self.path = path
+        self.encoding = encoding
+        self._file = None
+        self._mmap = None
+        self.offsets = array('Q', [0])
+        self.rows = array('q')
+        self.added = []
+        self.modified = False
+        self.open()
+
+    # --- Файл ---
+    def open(self):
+        """(Пере)открывает файл; несохраненные правки отбрасываются."""
+        self._map()
+        self.rows = array('q', range(len(self.offsets) - 1))
+        self.added = []
+        self.modified = False
+
+    def _map(self):
+        self.close()
+        self._file = open(self.path, 'rb')
+        if os.fstat(self._file.fileno()).st_size:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.offsets = build_line_offsets(self._mmap)
+        else:
+            self.offsets = array('Q', [0])  # Пустой файл нельзя отобразить в память
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- Чтение ---
+    def __len__(self):
+        return len(self.rows)
+
+    def raw_line(self, line):
+        """Байты строки файла line без перевода строки."""
+        data = self._mmap[self.offsets[line]:self.offsets[line + 1]]
+        return data.rstrip(b"\r\n")
+
+    def text(self, row):
+        source = self.rows[row]
+        if source < 0:
+            return self.added[-source - 1]
+        return self.raw_line(source).decode(self.encoding, errors='replace')
+
+    def is_edited(self, row):
+        return self.rows[row] < 0
+
+    # --- Правки ---
+    def _add(self, text):
+        self.added.append(text)
+        return -len(self.added)
+
+    def set_text(self, row, text):
+        self.rows[row] = self._add(text)
+        self.modified = True
+
+    def insert(self, row, texts):
+        self.rows[row:row] = array('q', [self._add(text) for text in texts])
+        self.modified = True
+
+    def remove(self, row, count=1):
+        del self.rows[row:row + count]
+        self.modified = True
+
+    # --- Поиск и проверка ---
+    def find(self, query, start=0, backward=False):
+        """
+        Номер первой строки с подстрокой query (без учета регистра), начиная со
+        start; None, если не найдено. Пока правок нет, поиск идет регулярным
+        выражением прямо по отображенному файлу, без декодирования строк.
+        """
+        if not query or not len(self.rows):
+            return None
+        if not self.modified and not backward and self._mmap is not None:
+            pattern = re.compile(re.escape(query.encode(self.encoding)), re.IGNORECASE)
+            if start >= len(self.rows):
+                return None
+            match = pattern.search(self._mmap, self.offsets[start])
+            if match is None:
+                return None
+            return bisect.bisect_right(self.offsets, match.start()) - 1
+        query = query.lower()
+        rows = range(start, -1, -1) if backward else range(start, len(self.rows))
+        for row in rows:
+            if query in self.text(row).lower():
+                return row
+        return None
+
+    def find_invalid(self, validator, start=0):
+        """Номер первой строки, не прошедшей проверку, начиная со start; None, если таких нет."""
+        for row in range(start, len(self.rows)):
+            if validator(self.text(row)):
+                return row
+        return None
+
+    # --- Сохранение ---
+    def iter_lines(self):
+        """Строки в текущем порядке в виде байтов: неизмененные берутся из файла без декодирования."""
+        for source in self.rows:
+            if source < 0:
+                yield self.added[-source - 1].encode(self.encoding)
+            else:
+                yield self.raw_line(source)
+
+    def save(self, path=None, dedupe=True):
+        """
+        Записывает список атомарно: во временный файл рядом, затем os.replace.
+        dedupe - повторные записи (без учета регистра и пробелов) отбрасываются,
+        пустые строки и комментарии сохраняются. Возвращает (success, message).
+        """
+        path = path or self.path
+        seen = set()
+        written = duplicates = 0
+        same_file = os.path.abspath(path) == os.path.abspath(self.path)
+        tmp_path = None
+        try:
+            tmp_path = temp_path_for(path)
+            with open(tmp_path, 'wb') as f:
+                for line in self.iter_lines():
+                    key = line.strip().lower()
+                    if dedupe and key and not key.startswith(b"#"):
+                        if key in seen:
+                            duplicates += 1
+                            continue
+                        seen.add(key)
+                    f.write(line + b"\n")
+                    written += 1
+            # Windows не даст заменить файл, пока он отображен в память
+            if same_file:
+                self.close()
+            replace(tmp_path, path)
+        except OSError as e:
+            if tmp_path:
+                remove_quietly(tmp_path)
+            if self._file is None:
+                self._map()  # Файл не изменился: правки в rows по-прежнему ссылаются на его строки
+            return False, f"Не удалось сохранить {os.path.basename(path)}: {e}"
+        if same_file:
+            self.open()
+        message = f"Сохранено строк: {written}."
+        if duplicates:
+            message += f" Удалено дублей: {duplicates}."
+        return True, message
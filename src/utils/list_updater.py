@@ -0,0 +1,270 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+from utils.ipset import SourcedIPSet, parse_address
+from utils.ipset_cache import ensure_cache, open_ipset
+from utils.ipset_pipeline import ingest, merge_files
+from utils.list_files import LISTS_LOCK, remove_quietly, temp_path_for
+from utils.metrics import DOWNLOAD_BYTES, DOWNLOAD_DURATION, DOWNLOAD_FAILURES, DOWNLOAD_LAST_BYTES
+
+# Источник по умолчанию для ipset-all.txt
+DEFAULT_IPSET_URL = "https://raw.githubusercontent.com/zapret-info/z-i/master/ipset-all.txt"
+
+
+def download_file(url, save_path, progress_callback=None, timeout=15):
+    """
+    Скачивает файл по URL и сохраняет его на диск.
+    progress_callback(percent) вызывается по мере скачивания, если известен размер.
+    Возвращает (success, message).
+    """
+    file_label = os.path.basename(save_path)
+    started = time.perf_counter()
+    try:
+        response = requests.get(url, stream=True, timeout=timeout)
+        response.raise_for_status()
+
+        total_size = int(response.headers.get('content-length', 0))
+        bytes_downloaded = 0
+
+        with open(save_path, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=8192):
+                if chunk:
+                    f.write(chunk)
+                    bytes_downloaded += len(chunk)
+                    if progress_callback and total_size > 0:
+                        progress_callback(int((bytes_downloaded / total_size) * 100))
+
+        if progress_callback:
+            progress_callback(100)
+        DOWNLOAD_DURATION.observe(time.perf_counter() - started, file=file_label)
+        DOWNLOAD_BYTES.inc(bytes_downloaded, file=file_label)
+        DOWNLOAD_LAST_BYTES.set(bytes_downloaded, file=file_label)
+        return True, f"Файл успешно скачан и сохранен в {save_path}"
+
+    except requests.exceptions.RequestException as e:
+        DOWNLOAD_FAILURES.inc(file=file_label)
+        return False, f"Ошибка сети при скачивании: {e}"
+    except Exception as e:
+        DOWNLOAD_FAILURES.inc(file=file_label)
+        return False, f"Произошла ошибка: {e}"
+
+
+# --- Несколько источников ipset ---
+FLOWSEAL_IPSET_URL = "https://raw.githubusercontent.com/Flowseal/zapret-discord-youtube/refs/heads/main/lists/ipset-all.txt"
+
+DEFAULT_IPSET_SOURCES = [
+    {"name": "zapret-info", "url": DEFAULT_IPSET_URL, "timeout": 30},
+    {"name": "flowseal", "url": FLOWSEAL_IPSET_URL, "timeout": 15},
+]
+SOURCES_CACHE_DIRNAME = "ipset-sources"
+
+
+def get_ipset_sources(settings_manager=None):
+    """Источники ipset из настроек ("lists" -> "ipset_sources") или список по умолчанию."""
+    if settings_manager:
+        sources = settings_manager.get_setting("lists", {}).get("ipset_sources")
+        if sources:
+            return sources
+    return DEFAULT_IPSET_SOURCES
+
+
+def validate_ipset_source(source):
+    """Возвращает текст ошибки, если источник из настроек задан неверно, иначе None."""
+    if not isinstance(source, dict):
+        return "источник должен быть объектом с полями name и url"
+    name, url = source.get("name"), source.get("url")
+    if not isinstance(name, str) or not name.strip():
+        return "не задано имя (name)"
+    if not isinstance(url, str) or not url.startswith(("http://", "https://")):
+        return f"{name}: адрес (url) должен начинаться с http:// или https://"
+    timeout = source.get("timeout", 15)
+    if isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or timeout <= 0:
+        return f"{name}: таймаут (timeout) должен быть положительным числом"
+    return None
+
+
+def fetch_ipset_source(source, cache_path, session=None):
+    """
+    Скачивает один источник и по мере поступления байтов разбирает, проверяет
+    и агрегирует записи, записывая компактный результат в cache_path.
+    Память ограничена буфером агрегатора и не зависит от размера списка.
+    timeout источника ограничивает всю загрузку целиком, а не только отдельные операции сокета.
+    Старая копия в cache_path заменяется только при успешной загрузке.
+    Возвращает dict: name, entries, dropped, ranges, bytes, duration, error.
+    """
+    name = source["name"]
+    timeout = source.get("timeout", 15)
+    started = time.perf_counter()
+    deadline = started + timeout
+    result = {"name": name, "entries": 0, "dropped": 0, "ranges": 0, "bytes": 0, "duration": 0.0, "error": None}
+
+    def chunks(response):
+        for chunk in response.iter_content(chunk_size=65536):
+            if time.perf_counter() > deadline:
+                raise TimeoutError(f"источник не уложился в {timeout} с")
+            result["bytes"] += len(chunk)
+            yield chunk
+
+    try:
+        http = session or requests
+        with http.get(source["url"], stream=True, timeout=timeout) as response:
+            response.raise_for_status()
+            result.update(ingest(chunks(response), cache_path))
+    except (requests.exceptions.RequestException, TimeoutError, OSError) as e:
+        result["error"] = str(e)
+        DOWNLOAD_FAILURES.inc(file=name)
+    finally:
+        result["duration"] = time.perf_counter() - started
+
+    if result["error"] is None:
+        DOWNLOAD_DURATION.observe(result["duration"], file=name)
+        DOWNLOAD_BYTES.inc(result["bytes"], file=name)
+        DOWNLOAD_LAST_BYTES.set(result["bytes"], file=name)
+    return result
+
+
+def update_ipset_from_sources(sources, save_path, cache_dir=None, progress_callback=None):
+    """
+    Параллельно скачивает все источники и сохраняет объединенный ipset в save_path.
+    Каждый источник ограничен своим таймаутом, поэтому медленное зеркало не задерживает
+    остальные. Для недоступных источников используется их последняя удачная копия из cache_dir.
+    Копии источников уже отсортированы, поэтому объединение - потоковое слияние файлов.
+    Источники проверяются заранее: неверно заданные и повторяющиеся имена попадают
+    в отчет и не скачиваются. У каждого потока своя сессия requests.
+    progress_callback(done, total) вызывается по завершении каждого источника.
+    save_path может быть функцией (IpsetSwitch.write_path): путь выбирается под
+    LISTS_LOCK в момент подмены, поэтому переключение ipset во время обновления
+    не направит полный список на место заглушки.
+    Возвращает (success, message, список результатов по источникам).
+    """
+    if not sources:
+        return False, "Не задано ни одного источника ipset.", []
+    resolve = save_path if callable(save_path) else (lambda: save_path)
+    cache_dir = cache_dir or os.path.join(os.path.dirname(os.path.abspath(resolve())), SOURCES_CACHE_DIRNAME)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    usable = []
+    report = []
+    results = []
+    valid = []
+    seen = set()
+    for index, source in enumerate(sources, 1):
+        error = validate_ipset_source(source)
+        if error is None and _safe_name(source["name"]) in seen:
+            error = f"{source['name']}: имя повторяется"
+        if error:
+            report.append(f"источник №{index}: {error}")
+            continue
+        seen.add(_safe_name(source["name"]))
+        valid.append(source)
+
+    # requests.Session не потокобезопасна: у каждого потока пула своя
+    local = threading.local()
+    sessions = []
+    sessions_lock = threading.Lock()
+
+    def fetch(source, cache_path):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+            with sessions_lock:
+                sessions.append(session)
+        return fetch_ipset_source(source, cache_path, session)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(len(valid), 1)) as pool:
+            futures = {}
+            for source in valid:
+                cache_path = os.path.join(cache_dir, _safe_name(source["name"]) + ".txt")
+                futures[pool.submit(fetch, source, cache_path)] = (source["name"], cache_path)
+            for done, future in enumerate(as_completed(futures), 1):
+                name, cache_path = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {"name": name, "entries": 0, "dropped": 0, "ranges": 0, "bytes": 0,
+                              "duration": 0.0, "error": f"{type(e).__name__}: {e}"}
+                    DOWNLOAD_FAILURES.inc(file=name)
+                results.append(result)
+                if result["error"] is None:
+                    usable.append(cache_path)
+                    report.append(f"{name}: {result['entries']} записей (отброшено {result['dropped']}), "
+                                  f"{result['bytes'] // 1024} КБ за {result['duration']:.1f} с")
+                elif os.path.exists(cache_path):
+                    usable.append(cache_path)
+                    report.append(f"{name}: ошибка ({result['error']}), использована сохраненная копия")
+                else:
+                    report.append(f"{name}: ошибка ({result['error']})")
+                if progress_callback:
+                    progress_callback(done, len(valid))
+    finally:
+        for session in sessions:
+            session.close()
+
+    if not usable:
+        return False, "Не удалось получить ни один источник:\n" + "\n".join(report), results
+
+    merged_path = temp_path_for(resolve())
+    try:
+        ranges = merge_files(usable, merged_path)
+        with LISTS_LOCK:
+            target_path = resolve()
+            os.replace(merged_path, target_path)
+    except BaseException:
+        remove_quietly(merged_path)
+        raise
+    message = (f"ipset обновлен: {ranges} записей из {len(usable)} источников.\n"
+               + "\n".join(report))
+    try:
+        ensure_cache(target_path)  # Следующее открытие списка - без разбора текста
+    except OSError as e:
+        message += f"\nДвоичный кэш ipset не обновлен: {e}"
+    return True, message, results
+
+
+def load_sourced_ipset(cache_dir, merged=None, warnings=None):
+    """
+    Загружает сохраненные копии источников для поиска происхождения адресов без сети.
+    Копии открываются через двоичный кэш; причины, по которым кэш не использован,
+    добавляются в warnings (если передан список).
+    """
+    sources = {}
+    names = sorted(os.listdir(cache_dir)) if os.path.isdir(cache_dir) else []
+    for name in names:
+        if name.endswith(".txt"):
+            sources[name[:-4]], warning = open_ipset(os.path.join(cache_dir, name))
+            if warning and warnings is not None:
+                warnings.append(warning)
+    return SourcedIPSet(sources, merged)
+
+
+def lookup_address(ip, list_path, cache_dir=None):
+    """
+    Проверяет, входит ли адрес в ipset list_path и в копии каких источников.
+    Списки открываются через двоичный кэш, поэтому проверка не разбирает текст.
+    Возвращает dict: listed, sources, warnings. Неверный адрес - ValueError.
+    """
+    try:
+        value = parse_address(ip.strip())
+    except (ValueError, OSError):
+        raise ValueError(f"Неверный IP-адрес: {ip}")
+    cache_dir = cache_dir or os.path.join(os.path.dirname(os.path.abspath(list_path)), SOURCES_CACHE_DIRNAME)
+    warnings = []
+    merged, warning = open_ipset(list_path)
+    if warning:
+        warnings.append(warning)
+    sourced = load_sourced_ipset(cache_dir, merged, warnings)
+    try:
+        listed = value in sourced
+        sources = sourced.sources_for(value)
+    finally:
+        sourced.close()
+    return {"listed": listed, "sources": sources, "warnings": warnings}
+
+
+def _safe_name(name):
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in name)
@@ -0,0 +1,251 @@
+import bisect
+import os
+import threading
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_value(value):
+    if value is None:
+        return "NaN"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class _Metric:
+    type_name = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: ожидаются метки {self.labelnames}, получены {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [счетчики по корзинам..., сумма, количество]
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def _render_sample(self, key, state):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, state):
+            cumulative += count
+            labels = _format_labels(self.labelnames, key, ("le", _format_value(float(bound))))
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key, ("le", "+Inf"))
+        lines.append(f"{self.name}_bucket{labels} {state[-1]}")
+        plain = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{plain} {_format_value(state[-2])}")
+        lines.append(f"{self.name}_count{plain} {state[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Минимальный реестр метрик в текстовом формате Prometheus.
+    Счетчики и гистограммы обновляются в момент события, а коллекторы
+    вызываются при опросе и лишь читают уже собранное состояние.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._collectors = []
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def add_collector(self, collector):
+        """
+        Регистрирует collector() -> [(name, type, help, labels_dict, value), ...],
+        вызываемый при каждом опросе.
+        """
+        with self._lock:
+            self._collectors.append(collector)
+
+    def remove_collector(self, collector):
+        with self._lock:
+            if collector in self._collectors:
+                self._collectors.remove(collector)
+
+    def render(self):
+        """Возвращает все метрики в текстовом формате экспозиции Prometheus 0.0.4."""
+        with self._lock:
+            metrics = [self._metrics[name] for name in sorted(self._metrics)]
+            collectors = list(self._collectors)
+
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+
+        seen = set()
+        for collector in collectors:
+            try:
+                samples = collector()
+            except Exception as e:
+                print(f"Metrics collector failed: {e}")
+                continue
+            for name, type_name, documentation, labels, value in samples:
+                if name not in seen:
+                    seen.add(name)
+                    lines.append(f"# HELP {name} {documentation}")
+                    lines.append(f"# TYPE {name} {type_name}")
+                names = tuple(sorted(labels))
+                lines.append(f"{name}{_format_labels(names, tuple(labels[n] for n in names))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def _get_or_create(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Метрика {name} уже зарегистрирована как {metric.type_name}")
+            return metric
+
+
+class ListEntriesCollector:
+    """
+    Считает записи в файлах списков (lists/*.txt).
+    Результат кэшируется по (размер, mtime), поэтому опрос не перечитывает неизменные файлы.
+    """
+    def __init__(self, lists_dir="lists"):
+        self.lists_dir = os.path.abspath(lists_dir)
+        self._cache = {}
+
+    def count_entries(self, path):
+        stat = os.stat(path)
+        signature = (stat.st_size, stat.st_mtime_ns)
+        cached = self._cache.get(path)
+        if cached and cached[0] == signature:
+            return cached[1]
+        count = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith(b"#"):
+                    count += 1
+        self._cache[path] = (signature, count)
+        return count
+
+    def __call__(self):
+        samples = []
+        try:
+            names = sorted(n for n in os.listdir(self.lists_dir) if n.endswith(".txt"))
+        except OSError:
+            return samples
+        for name in names:
+            try:
+                count = self.count_entries(os.path.join(self.lists_dir, name))
+            except OSError:
+                continue
+            samples.append(("zapret_list_entries", "gauge", "Количество записей в файле списка.",
+                            {"list": name}, count))
+        return samples
+
+
+# Общий реестр приложения
+REGISTRY = MetricsRegistry()
+
+COMMAND_LATENCY = REGISTRY.histogram(
+    "zapret_service_command_seconds", "Длительность консольных команд ServiceManager.", ("command",))
+DOWNLOAD_DURATION = REGISTRY.histogram(
+    "zapret_list_download_seconds", "Длительность скачивания списков.", ("file",))
+DOWNLOAD_BYTES = REGISTRY.counter(
+    "zapret_list_download_bytes_total", "Скачано байт списков.", ("file",))
+DOWNLOAD_LAST_BYTES = REGISTRY.gauge(
+    "zapret_list_download_last_bytes", "Размер последнего скачанного списка.", ("file",))
+DOWNLOAD_FAILURES = REGISTRY.counter(
+    "zapret_list_download_failures_total", "Неудачные скачивания списков.", ("file",))
+DIAGNOSTICS_LATENCY = REGISTRY.histogram(
+    "zapret_diagnostics_check_seconds", "Длительность проверок диагностики.", ("check",))
+DIAGNOSTICS_LAST = REGISTRY.gauge(
+    "zapret_diagnostics_check_last_seconds", "Длительность последнего выполнения проверки.", ("check",))
+OPERATION_QUEUE_DEPTH = REGISTRY.gauge(
+    "zapret_operation_queue_depth", "Операций со службой в очереди планировщика.")
+OPERATION_WAIT = REGISTRY.histogram(
+    "zapret_operation_wait_seconds", "Время ожидания операции в очереди.", ("action",))
+OPERATION_LATENCY = REGISTRY.histogram(
+    "zapret_operation_seconds", "Длительность выполнения операции со службой.", ("action",))
+OPERATION_RESULTS = REGISTRY.counter(
+    "zapret_operations_total", "Завершенные операции по исходу.", ("action", "outcome"))
+SERVICE_STEP_LATENCY = REGISTRY.histogram(
+    "zapret_service_step_seconds", "Длительность шагов установки/удаления службы.", ("step",))
+SUPERVISOR_RESTARTS = REGISTRY.counter(
+    "zapret_supervisor_restarts_total", "Перезапуски winws.exe супервизором по причине.", ("reason",))
+SUPERVISOR_DOWNTIME = REGISTRY.counter(
+    "zapret_supervisor_downtime_seconds_total", "Время без winws.exe между падением и перезапуском.")
+SUPERVISOR_MTBF = REGISTRY.gauge(
+    "zapret_supervisor_mtbf_seconds", "Среднее время работы winws.exe между падениями.")
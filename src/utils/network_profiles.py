@@ -0,0 +1,406 @@
+"""
+Лучший профиль для каждой сети.
+
+Какой general*.bat работает, зависит от провайдера. Сеть опознается по отпечатку:
+IP и MAC шлюза по умолчанию, DNS-серверы и (если включено) номер AS внешнего
+адреса. Для каждого отпечатка хранится последний проверенный рабочий профиль
+и счетчики проверок. При смене сети сохраненный профиль устанавливается сразу,
+без перебора всех профилей; в незнакомой сети, но у знакомого провайдера (тот же
+AS) берется профиль, который работал у этого провайдера.
+
+Смена сети замечается без запуска процессов: сравнивается набор адресов
+интерфейсов (psutil), а в Windows поток еще и ждет NotifyAddrChange. Процесс
+`arp` для MAC шлюза запускается только при смене сети.
+"""
+import hashlib
+import json
+import os
+import re
+import socket
+import threading
+import time
+
+import psutil
+import requests
+
+from utils.conflict_scanner import snapshot_dns_servers
+from utils.data_dir import data_path
+from utils.supervisor import tls_probe
+
+DEFAULT_STORE_PATH = data_path("network-profiles.json")
+DEFAULT_SETTINGS = {
+    "enabled": False,
+    "auto_apply": True,
+    "asn_lookup": False,          # Запрос внешнего адреса и AS к ASN_LOOKUP_URL
+    "poll_interval": 10.0,        # Запасной опрос адресов интерфейсов, сек
+    "verify_delay": 3.0,          # Пауза после смены профиля перед проверкой, сек
+    "max_failures": 2,            # Столько неудачных проверок подряд - и профиль сети забывается
+    "probe_host": "discord.com",
+}
+ASN_LOOKUP_URL = "https://ipinfo.io/json"
+ASN_LOOKUP_TIMEOUT = 3
+
+_MAC_RE = re.compile(r'([0-9a-fA-F]{2}[-:]){5}[0-9a-fA-F]{2}')
+_ASN_RE = re.compile(r'^AS(\d+)\s*(.*)$')
+
+
+class NetworkFingerprint:
+    def __init__(self, gateway_ip=None, gateway_mac=None, dns_servers=(), asn=None, isp=None):
+        self.gateway_ip = gateway_ip
+        self.gateway_mac = gateway_mac.lower().replace("-", ":") if gateway_mac else None
+        self.dns_servers = tuple(sorted(dns_servers))
+        self.asn = asn
+        self.isp = isp
+
+    @property
+    def key(self):
+        """
+        Ключ сети. MAC шлюза отличает сети с одинаковыми адресами (192.168.1.1 есть
+        почти везде), а AS в ключ не входит: запрос к внешнему сервису может не пройти.
+        """
+        parts = [self.gateway_ip or "", self.gateway_mac or "", ",".join(self.dns_servers)]
+        return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()[:16]
+
+    @property
+    def label(self):
+        parts = []
+        if self.isp or self.asn:
+            parts.append(" ".join(part for part in (f"AS{self.asn}" if self.asn else None, self.isp) if part))
+        parts.append(f"шлюз {self.gateway_ip or '?'}")
+        return ", ".join(parts)
+
+    def to_dict(self):
+        return {"gateway_ip": self.gateway_ip, "gateway_mac": self.gateway_mac,
+                "dns_servers": list(self.dns_servers), "asn": self.asn, "isp": self.isp}
+
+
+# --- Сбор отпечатка ---
+def interface_signature():
+    """Адреса всех поднятых интерфейсов, кроме loopback. Меняется при переходе в другую сеть."""
+    stats = psutil.net_if_stats()
+    signature = []
+    for name, addresses in psutil.net_if_addrs().items():
+        if name in stats and not stats[name].isup:
+            continue
+        for address in addresses:
+            if address.family in (socket.AF_INET, socket.AF_INET6) and not address.address.startswith(("127.", "::1")):
+                signature.append((name, address.address))
+    return tuple(sorted(signature))
+
+
+def default_gateway():
+    """IP шлюза по умолчанию: в Windows из реестра интерфейсов, в Linux из /proc/net/route."""
+    try:
+        import winreg
+    except ImportError:
+        return _linux_default_gateway()
+    root = r"SYSTEM\CurrentControlSet\Services\Tcpip\Parameters\Interfaces"
+    try:
+        with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, root) as interfaces:
+            index = 0
+            while True:
+                try:
+                    name = winreg.EnumKey(interfaces, index)
+                except OSError:
+                    return None
+                index += 1
+                with winreg.OpenKey(interfaces, name) as key:
+                    for value_name in ("DefaultGateway", "DhcpDefaultGateway"):
+                        try:
+                            value, _ = winreg.QueryValueEx(key, value_name)
+                        except OSError:
+                            continue
+                        gateways = value if isinstance(value, list) else [value]
+                        for gateway in gateways:
+                            if gateway and gateway != "0.0.0.0":
+                                return gateway
+    except OSError:
+        return None
+
+
+def _linux_default_gateway():
+    try:
+        with open("/proc/net/route") as f:
+            next(f)
+            for line in f:
+                fields = line.split()
+                if len(fields) > 2 and fields[1] == "00000000":
+                    return ".".join(str(b) for b in int(fields[2], 16).to_bytes(4, "little"))
+    except (OSError, StopIteration, ValueError):
+        pass
+    return None
+
+
+def gateway_mac(ip, service_manager=None):
+    """MAC шлюза из ARP-таблицы (`arp -a <ip>` в Windows, /proc/net/arp в Linux)."""
+    if not ip:
+        return None
+    if os.name == "nt" and service_manager is not None:
+        stdout, _ = service_manager._run_command(f"arp -a {ip}")
+        for line in (stdout or "").splitlines():
+            if ip in line.split():
+                match = _MAC_RE.search(line)
+                if match:
+                    return match.group(0)
+        return None
+    try:
+        with open("/proc/net/arp") as f:
+            for line in f:
+                fields = line.split()
+                if fields and fields[0] == ip and len(fields) > 3:
+                    return fields[3]
+    except OSError:
+        pass
+    return None
+
+
+def dns_servers():
+    servers = snapshot_dns_servers()
+    if servers or os.name == "nt":
+        return servers
+    try:
+        with open("/etc/resolv.conf") as f:
+            return [line.split()[1] for line in f if line.startswith("nameserver") and len(line.split()) > 1]
+    except OSError:
+        return []
+
+
+def lookup_asn(timeout=ASN_LOOKUP_TIMEOUT):
+    """(номер AS, название) внешнего адреса или (None, None), если сервис недоступен."""
+    try:
+        response = requests.get(ASN_LOOKUP_URL, timeout=timeout)
+        response.raise_for_status()
+        match = _ASN_RE.match(response.json().get("org", ""))
+    except (requests.exceptions.RequestException, ValueError):
+        return None, None
+    if not match:
+        return None, None
+    return int(match.group(1)), match.group(2) or None
+
+
+def take_fingerprint(service_manager=None, asn_lookup=False):
+    gateway = default_gateway()
+    asn, isp = lookup_asn() if asn_lookup else (None, None)
+    return NetworkFingerprint(gateway, gateway_mac(gateway, service_manager), dns_servers(), asn, isp)
+
+
+def wait_address_change():
+    """
+    Блокируется до изменения таблицы IP-адресов (Windows, NotifyAddrChange).
+    Возвращает False, если так ждать нельзя.
+    """
+    try:
+        import ctypes
+        return ctypes.windll.iphlpapi.NotifyAddrChange(None, None) == 0
+    except (ImportError, AttributeError, OSError):
+        return False
+
+
+# --- Хранилище ---
+class NetworkProfileStore:
+    """
+    JSON-файл {ключ сети: запись}. Запись: отпечаток, профиль, счетчики
+    успешных и неудачных проверок, время последней успешной проверки.
+    """
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = os.path.abspath(path)
+        self._lock = threading.Lock()
+        self.networks = {}
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.networks = json.load(f)
+        except (OSError, ValueError):
+            self.networks = {}
+
+    def save(self):
+        with self._lock:
+            data = json.dumps(self.networks, indent=1, ensure_ascii=False)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+
+    def get(self, fingerprint):
+        with self._lock:
+            entry = self.networks.get(fingerprint.key)
+            return dict(entry) if entry else None
+
+    def best_profile(self, fingerprint):
+        """
+        (профиль, откуда) для сети: "network" - проверен в этой сети, "asn" - у
+        того же провайдера в другой сети, (None, None) - сведений нет.
+        """
+        with self._lock:
+            entry = self.networks.get(fingerprint.key)
+            if entry and entry.get("profile"):
+                return entry["profile"], "network"
+            if fingerprint.asn is None:
+                return None, None
+            same_isp = [item for item in self.networks.values()
+                        if item.get("profile") and item["fingerprint"].get("asn") == fingerprint.asn]
+        if not same_isp:
+            return None, None
+        return max(same_isp, key=lambda item: item.get("last_ok", 0))["profile"], "asn"
+
+    def record(self, fingerprint, profile, ok, max_failures=DEFAULT_SETTINGS["max_failures"], switch_seconds=None):
+        """Результат проверки profile в сети fingerprint. Возвращает обновленную запись."""
+        now = time.time()
+        with self._lock:
+            entry = self.networks.setdefault(fingerprint.key, {"profile": None, "successes": 0, "failures": 0,
+                                                               "streak": 0, "last_ok": None})
+            entry["fingerprint"] = fingerprint.to_dict()
+            entry["last_seen"] = now
+            if ok:
+                entry["profile"] = profile
+                entry["successes"] += 1
+                entry["streak"] = 0
+                entry["last_ok"] = now
+                if switch_seconds is not None:
+                    entry["switch_seconds"] = round(switch_seconds, 2)
+            else:
+                entry["failures"] += 1
+                if profile == entry.get("profile"):
+                    entry["streak"] += 1
+                    if entry["streak"] >= max_failures:
+                        entry["profile"] = None  # Профиль перестал работать в этой сети
+            result = dict(entry)
+        self.save()
+        return result
+
+
+# --- Автоприменение ---
+class NetworkProfileManager:
+    """
+    Следит за сменой сети и применяет сохраненный для нее профиль через
+    OperationScheduler. После установки профиля (или при первом появлении сети)
+    проверяет обход и запоминает результат. on_change(state) вызывается из
+    рабочего потока при смене сети и после каждой проверки.
+    """
+    def __init__(self, service_manager, scheduler, settings_manager, store=None, settings=None,
+                 profiles_dir=".", probe=None, fingerprint_func=None, signature_func=interface_signature,
+                 on_change=None):
+        self.service_manager = service_manager
+        self.scheduler = scheduler
+        self.settings_manager = settings_manager
+        self.store = store or NetworkProfileStore()
+        self.settings = dict(DEFAULT_SETTINGS)
+        self.settings.update(settings or {})
+        self.profiles_dir = profiles_dir
+        self.probe = probe or (lambda: tls_probe(self.settings["probe_host"]))
+        self.fingerprint_func = fingerprint_func or (
+            lambda: take_fingerprint(service_manager, self.settings["asn_lookup"]))
+        self.signature_func = signature_func
+        self.on_change = on_change
+        self.fingerprint = None
+        self.state = {}
+        self._signature = None
+        self._pending_verify = None     # (отпечаток, профиль, начало) - проверка после установки профиля
+        self._changed = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="network-watcher", daemon=True)
+        self._thread.start()
+        if os.name == "nt":
+            threading.Thread(target=self._watch_addresses, name="network-notify", daemon=True).start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._changed.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def installed_profile(self):
+        """Профиль, установленный в службу (его запоминает ServiceManager), а не выбранный в настройках."""
+        return self.service_manager.installed_profile
+
+    def _watch_addresses(self):
+        # NotifyAddrChange не прерывается, поэтому поток только будит основной
+        while not self._stop.is_set() and wait_address_change():
+            self._changed.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            pending, self._pending_verify = self._pending_verify, None
+            if pending:
+                self._verify(*pending)
+            signature = self.signature_func()
+            if signature != self._signature:
+                self._signature = signature
+                if signature:
+                    self.check_network()
+            self._changed.wait(self.settings["poll_interval"])
+            self._changed.clear()
+
+    def check_network(self):
+        """Снимает отпечаток сети и, если сеть сменилась, применяет или проверяет профиль."""
+        started = time.monotonic()
+        fingerprint = self.fingerprint_func()
+        if self.fingerprint is not None and fingerprint.key == self.fingerprint.key:
+            return
+        self.fingerprint = fingerprint
+        profile, source = self.store.best_profile(fingerprint)
+        if self.service_manager.is_manual_process_running():
+            # Ручной запуск (под супервизором) не подменяем установкой службы и не приписываем ей
+            self._publish(profile=os.path.basename(self.service_manager.manual_bat_path or "") or None,
+                          source=source, action="manual")
+            return
+        current = self.installed_profile()
+        self._publish(profile=current, source=source, action="detected")
+        if profile and profile != current and self.settings["auto_apply"]:
+            path = os.path.join(self.profiles_dir, profile)
+            if os.path.exists(path):
+                self.scheduler.submit("install", path,
+                                      callback=lambda operation: self._on_applied(operation, fingerprint, profile,
+                                                                                  started))
+                self._publish(profile=profile, source=source, action="applying")
+                return
+        if current and self.service_manager.get_service_status() == "RUNNING":
+            # Незнакомая сеть или профиль уже установлен: проверяем его и запоминаем результат
+            self._verify(fingerprint, current, started)
+
+    def _on_applied(self, operation, fingerprint, profile, started):
+        success, message = operation.result
+        if not success:
+            self._publish(profile=profile, action="failed", message=message)
+            return
+        filter_config = self.settings_manager.get_setting("filter", {})
+        filter_config.setdefault("settings", {})["selected_profile"] = profile
+        self.settings_manager.set_setting("filter", filter_config)
+        # Callback выполняется в потоке планировщика: проверку (с паузой) отдаем потоку наблюдения
+        self._pending_verify = (fingerprint, profile, started)
+        self._changed.set()
+
+    def _verify(self, fingerprint, profile, started):
+        if self._stop.wait(self.settings["verify_delay"]):
+            return
+        if self.fingerprint is None or fingerprint.key != self.fingerprint.key:
+            return  # Пока ждали, сеть снова сменилась
+        if self.service_manager.is_manual_process_running() or self.installed_profile() != profile:
+            return  # Работает уже не этот профиль: результат проверки ему не принадлежит
+        ok = self.probe()
+        entry = self.store.record(fingerprint, profile, ok, self.settings["max_failures"],
+                                  time.monotonic() - started if ok else None)
+        self._publish(profile=profile, action="verified" if ok else "not_working",
+                      successes=entry["successes"], failures=entry["failures"])
+
+    def _publish(self, **state):
+        fingerprint = self.fingerprint
+        self.state = dict(state, network=fingerprint.label if fingerprint else None,
+                          key=fingerprint.key if fingerprint else None, updated_at=time.time())
+        if self.on_change:
+            try:
+                self.on_change(dict(self.state))
+            except Exception as e:
+                print(f"Network listener failed: {e}")
@@ -0,0 +1,249 @@
+"""
+Единый планировщик операций со службой.
+
+Все изменения (установка, запуск, остановка, ручной запуск и т.д.) выполняются
+одним рабочим потоком строго по очереди, поэтому `sc` никогда не запускается
+параллельно. Повторный запрос, пришедший подряд, склеивается с последней
+операцией в очереди, только если совпадают и действие, и данные: три
+"перезапуска" выполняются как один, а "установить" с другим профилем
+выполняется отдельно.
+"""
+import itertools
+import threading
+import time
+from collections import deque
+
+from utils.metrics import OPERATION_LATENCY, OPERATION_QUEUE_DEPTH, OPERATION_RESULTS, OPERATION_WAIT
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+CANCELLED = "cancelled"
+EXPIRED = "expired"
+
+# Действия ServiceManager, доступные через планировщик
+ACTIONS = {
+    "install": lambda sm, data: sm.install_service(data),
+    "uninstall": lambda sm, data: sm.uninstall_service(),
+    "start": lambda sm, data: sm.start_service(),
+    "stop": lambda sm, data: sm.stop_service(),
+    "restart": lambda sm, data: sm.restart_service(),
+    "set_auto": lambda sm, data: sm.set_service_start_type("auto"),
+    "set_demand": lambda sm, data: sm.set_service_start_type("demand"),
+    "start_manual": lambda sm, data: sm.start_manual_process(data),
+    "stop_manual": lambda sm, data: sm.stop_manual_process(),
+    "reload_lists": lambda sm, data: sm.reload_lists(),
+    "apply_update": lambda sm, data: data.apply(sm),   # data - BundleUpdater со скачанным обновлением
+}
+
+class Operation:
+    """Операция в очереди. Если ее склеили с другими запросами, ее ждут все их отправители."""
+    _ids = itertools.count(1)
+
+    def __init__(self, scheduler, action, data=None, deadline=None):
+        self.id = next(self._ids)
+        self.scheduler = scheduler
+        self.action = action
+        self.data = data
+        self.deadline = deadline        # Абсолютное время (time.monotonic), до которого операция должна начаться
+        self.state = QUEUED
+        self.result = None              # (success, message)
+        self.requests = 1               # Сколько запросов склеено в эту операцию
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self._callbacks = []
+        self._done = threading.Event()
+
+    def add_callback(self, callback):
+        """callback(operation) вызывается из рабочего потока по завершении (сразу, если уже завершена)."""
+        with self.scheduler._lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def wait(self, timeout=None):
+        """Ждет завершения. Возвращает (success, message) или None по таймауту."""
+        if not self._done.wait(timeout):
+            return None
+        return self.result
+
+    def cancel(self):
+        return self.scheduler.cancel(self)
+
+    def is_finished(self):
+        return self._done.is_set()
+
+
+class OperationScheduler:
+    """
+    Очередь операций над одним общим ServiceManager. После каждой операции
+    обновляется StatusCache, если он передан.
+    """
+    def __init__(self, service_manager, status_cache=None):
+        self.service_manager = service_manager
+        self.status_cache = status_cache
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._queue = deque()
+        self._current = None
+        self._thread = None
+        self._stopping = False
+        self._history = deque(maxlen=100)   # (action, outcome, wait, duration)
+
+    # --- Жизненный цикл ---
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="operation-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5):
+        """Отменяет ожидающие операции и дожидается текущей."""
+        with self._lock:
+            self._stopping = True
+            pending = list(self._queue)
+            self._queue.clear()
+            self._wakeup.notify_all()
+        for operation in pending:
+            self._finish(operation, CANCELLED, (False, "Операция отменена: планировщик остановлен."))
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    # --- API ---
+    def submit(self, action, data=None, deadline=None, callback=None):
+        """
+        Ставит операцию в очередь. deadline - сколько секунд операция может ждать начала.
+        Возвращает Operation (возможно, уже стоящую в очереди, если запрос склеен).
+        """
+        if action not in ACTIONS:
+            raise ValueError(f"Неизвестная операция: {action}")
+        expires = time.monotonic() + deadline if deadline is not None else None
+        with self._lock:
+            if self._stopping:
+                raise RuntimeError("Планировщик остановлен.")
+            operation = self._coalesce_locked(action, data, expires)
+            if operation is None:
+                operation = Operation(self, action, data, expires)
+                self._queue.append(operation)
+                self._wakeup.notify()
+            OPERATION_QUEUE_DEPTH.set(len(self._queue))
+        if callback:
+            operation.add_callback(callback)
+        return operation
+
+    def run(self, action, data=None, deadline=None, timeout=None):
+        """Синхронный вариант submit: ждет результата. Для API и скриптов."""
+        operation = self.submit(action, data, deadline)
+        result = operation.wait(timeout)
+        if result is None:
+            return False, "Операция не завершилась вовремя."
+        return result
+
+    def cancel(self, operation):
+        """Отменяет операцию, которая еще не началась. Выполняющуюся отменить нельзя."""
+        with self._lock:
+            if operation.state != QUEUED or operation not in self._queue:
+                return False
+            self._queue.remove(operation)
+            OPERATION_QUEUE_DEPTH.set(len(self._queue))
+        self._finish(operation, CANCELLED, (False, "Операция отменена."))
+        return True
+
+    def queue_depth(self):
+        with self._lock:
+            return len(self._queue)
+
+    def is_busy(self):
+        with self._lock:
+            return self._current is not None or bool(self._queue)
+
+    def stats(self):
+        """Состояние очереди и задержки последних операций."""
+        with self._lock:
+            history = list(self._history)
+            current = self._current.action if self._current else None
+            depth = len(self._queue)
+        durations = [item[3] for item in history if item[1] == DONE]
+        return {
+            "queue_depth": depth,
+            "running": current,
+            "completed": len(history),
+            "last": [{"action": a, "outcome": o, "wait": round(w, 3), "duration": round(d, 3)}
+                     for a, o, w, d in history[-10:]],
+            "avg_duration": sum(durations) / len(durations) if durations else 0.0,
+        }
+
+    # --- Внутреннее ---
+    def _coalesce_locked(self, action, data, expires):
+        # Склеиваем только с последней операцией очереди: иначе поменялся бы порядок с операциями между ними
+        if not self._queue:
+            return None
+        tail = self._queue[-1]
+        if tail.action != action or tail.data != data:
+            return None
+        tail.requests += 1
+        if tail.deadline is not None:
+            tail.deadline = None if expires is None else max(tail.deadline, expires)
+        return tail
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._queue and not self._stopping:
+                    self._wakeup.wait()
+                if self._stopping:
+                    return
+                operation = self._queue.popleft()
+                OPERATION_QUEUE_DEPTH.set(len(self._queue))
+                if operation.deadline is not None and time.monotonic() > operation.deadline:
+                    expired = True
+                else:
+                    expired = False
+                    operation.state = RUNNING
+                    operation.started_at = time.monotonic()
+                    self._current = operation
+            if expired:
+                self._finish(operation, EXPIRED, (False, "Операция не была выполнена: истек срок ожидания."))
+                continue
+            if self.status_cache:
+                self.status_cache.begin_operation()   # Запуск службы по команде - не перезапуск
+            try:
+                result = ACTIONS[operation.action](self.service_manager, operation.data)
+            except Exception as e:
+                result = (False, f"Произошла ошибка: {e}")
+            if self.status_cache:
+                try:
+                    self.status_cache.refresh()
+                except Exception:
+                    pass
+                self.status_cache.end_operation()
+            with self._lock:
+                self._current = None
+            self._finish(operation, DONE, result)
+
+    def _finish(self, operation, state, result):
+        now = time.monotonic()
+        with self._lock:
+            operation.state = state
+            operation.result = result
+            operation.finished_at = now
+            callbacks, operation._callbacks = operation._callbacks, []
+            started = operation.started_at or now
+            wait, duration = started - operation.submitted_at, now - started
+            self._history.append((operation.action, state, wait, duration))
+            operation._done.set()
+        outcome = state if state != DONE else ("ok" if result and result[0] else "error")
+        OPERATION_RESULTS.inc(action=operation.action, outcome=outcome)
+        OPERATION_WAIT.observe(wait, action=operation.action)
+        if state == DONE:
+            OPERATION_LATENCY.observe(duration, action=operation.action)
+        for callback in callbacks:
+            try:
+                callback(operation)
+            except Exception as e:
+                print(f"Operation callback failed: {e}")
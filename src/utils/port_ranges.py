@@ -0,0 +1,115 @@
+from utils.ipset import merge_ranges
+
+MIN_PORT = 0
+MAX_PORT = 65535
+
+
+class PortRangeSet:
+    """
+    Множество портов в виде отсортированных непересекающихся диапазонов.
+    Поддерживает разбор/запись в формате winws ('80,443,50000-50100')
+    и операции объединения, пересечения и разности.
+    """
+    def __init__(self, ranges=()):
+        self.ranges = tuple(merge_ranges(sorted((int(lo), int(hi)) for lo, hi in ranges if lo <= hi)))
+
+    @classmethod
+    def parse(cls, spec):
+        """Разбирает '80,443,1024-65535'. Некорректные элементы вызывают ValueError."""
+        ranges = []
+        for part in str(spec).split(","):
+            part = part.strip()
+            if not part:
+                continue
+            if "-" in part:
+                lo, hi = part.split("-", 1)
+                lo, hi = int(lo), int(hi)
+            else:
+                lo = hi = int(part)
+            if not (MIN_PORT <= lo <= hi <= MAX_PORT):
+                raise ValueError(f"Некорректный диапазон портов: {part}")
+            ranges.append((lo, hi))
+        return cls(ranges)
+
+    @classmethod
+    def full(cls):
+        return cls([(MIN_PORT, MAX_PORT)])
+
+    def union(self, other):
+        return PortRangeSet(self.ranges + other.ranges)
+
+    def intersection(self, other):
+        result = []
+        i = j = 0
+        while i < len(self.ranges) and j < len(other.ranges):
+            lo = max(self.ranges[i][0], other.ranges[j][0])
+            hi = min(self.ranges[i][1], other.ranges[j][1])
+            if lo <= hi:
+                result.append((lo, hi))
+            if self.ranges[i][1] < other.ranges[j][1]:
+                i += 1
+            else:
+                j += 1
+        return PortRangeSet(result)
+
+    def difference(self, other):
+        result = []
+        for lo, hi in self.ranges:
+            for o_lo, o_hi in other.ranges:
+                if o_hi < lo or o_lo > hi:
+                    continue
+                if o_lo > lo:
+                    result.append((lo, o_lo - 1))
+                lo = o_hi + 1
+                if lo > hi:
+                    break
+            if lo <= hi:
+                result.append((lo, hi))
+        return PortRangeSet(result)
+
+    def coalesce(self, gap):
+        """Склеивает диапазоны, между которыми не больше gap свободных портов."""
+        result = []
+        for lo, hi in self.ranges:
+            if result and lo - result[-1][1] - 1 <= gap:
+                result[-1] = (result[-1][0], hi)
+            else:
+                result.append((lo, hi))
+        return PortRangeSet(result)
+
+    def issubset(self, other):
+        return not self.difference(other)
+
+    def count(self):
+        """Количество портов в множестве."""
+        return sum(hi - lo + 1 for lo, hi in self.ranges)
+
+    def __contains__(self, port):
+        return any(lo <= port <= hi for lo, hi in self.ranges)
+
+    def __bool__(self):
+        return bool(self.ranges)
+
+    def __eq__(self, other):
+        return isinstance(other, PortRangeSet) and self.ranges == other.ranges
+
+    def __hash__(self):
+        return hash(self.ranges)
+
+    def __or__(self, other):
+        return self.union(other)
+
+    def __and__(self, other):
+        return self.intersection(other)
+
+    def __sub__(self, other):
+        return self.difference(other)
+
+    def __le__(self, other):
+        return self.issubset(other)
+
+    def __str__(self):
+        return ",".join(str(lo) if lo == hi else f"{lo}-{hi}" for lo, hi in self.ranges)
+
+    def __repr__(self):
+        return f"PortRangeSet('{self}')"
@@ -1,15 +1,36 @@
 import ctypes
+import json
 import os
 import subprocess
 import sys
 import re
+import time
+
+from utils.capture_filter import analyze_capture
+from utils.config_manager import ConfigManager
+from utils.data_dir import data_path
+from utils.metrics import COMMAND_LATENCY
+from utils.profile_parser import parse_profile, profile_variables
+from utils.service_pipeline import NOT_FOUND, STOPPED, ServicePipeline
+from utils.supervisor import WinwsSupervisor
+
+# Какой профиль установлен в службу: из binPath имя .bat уже не восстановить
+DEFAULT_STATE_PATH = data_path("service-state.json")
+
 
 class ServiceManager:
-    def __init__(self, service_name="zapret", winsw_path="bin/winws.exe"):
+    def __init__(self, service_name="zapret", winsw_path="bin/winws.exe", state_path=DEFAULT_STATE_PATH):
         self.service_name = service_name
         self.winsw_path = os.path.abspath(winsw_path)
         self.winsw_dir = os.path.dirname(self.winsw_path)
         self.manual_process_pid = None
+        self.manual_bat_path = None       # Профиль ручного запуска, чтобы его можно было перезапустить
+        self.last_pipeline_report = None  # Шаги и длительности последней установки/удаления
+        self.supervisor = None            # WinwsSupervisor ручного запуска
+        self.supervisor_settings = {}     # Настройки "supervisor" из config.json
+        self.supervisor_listeners = []    # callback(event, stats) на события супервизора
+        self.state_path = state_path      # None - не сохранять установленный профиль
+        self.installed_profile = self._load_installed_profile()
 
     def is_admin(self):
         """Проверяет, запущены ли скрипты с правами администратора."""
@@ -38,6 +59,7 @@ class ServiceManager:
             print("Admin rights required.")
             return None, "Admin rights required."
 
+        started = time.perf_counter()
         try:
             startupinfo = subprocess.STARTUPINFO()
             startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
@@ -57,6 +79,18 @@ class ServiceManager:
             return stdout.decode('utf-8', errors='ignore'), stderr.decode('utf-8', errors='ignore')
         except Exception as e:
             return None, str(e)
+        finally:
+            COMMAND_LATENCY.observe(time.perf_counter() - started, command=self._command_label(command))
+
+    @staticmethod
+    def _command_label(command):
+        """Метка команды для метрик: 'sc query', 'sc stop', 'tasklist' и т.п. (без аргументов)."""
+        parts = command.split() if isinstance(command, str) else list(command)
+        if not parts:
+            return ""
+        if parts[0].lower() in ("sc", "net") and len(parts) > 1:
+            return f"{parts[0].lower()} {parts[1].lower()}"
+        return parts[0].lower()
 
     def get_service_status(self):
         """Получает статус службы: 'RUNNING', 'STOPPED', 'NOT_FOUND'."""
@@ -76,55 +110,54 @@ class ServiceManager:
         if args is None: # Проверяем на None, т.к. пустая строка аргументов может быть валидной
             return False, "Failed to parse .bat file or winws.exe not found in it."
             
-        # Commands to install the service
-        self.uninstall_service() # Ensure it's not installed first
-        
         # Правильное формирование binPath для sc create.
         # Весь путь + аргументы должны быть одной строкой в кавычках,
-        # а все внутренние кавычки должны быть экранированы.
+        # а внутренние кавычки экранирует ServicePipeline.
         full_bin_path = f'"{self.winsw_path}" {args}'
-        escaped_bin_path = full_bin_path.replace('"', '\\"')
-
-        install_cmd = (
-            f'sc create "{self.service_name}" binPath= "{escaped_bin_path}" '
-            f'DisplayName= "{self.service_name}" start= auto'
-        )
-        
-        stdout, stderr = self._run_command(install_cmd, as_admin=True)
-        if not stdout or "SUCCESS" not in stdout:
-            return False, f"Failed to create service: {stderr or 'Unknown error'}. Command: {install_cmd}"
-
-        desc_cmd = f'sc description "{self.service_name}" "Zapret DPI bypass software"'
-        self._run_command(desc_cmd, as_admin=True)
-        
-        return self.start_service()
+        self.last_pipeline_report = ServicePipeline(self).install(full_bin_path)
+        if self.last_pipeline_report.success:
+            self._save_installed_profile(os.path.basename(bat_file_path))
+        return self.last_pipeline_report.as_tuple()
 
     def uninstall_service(self):
         """
         Удаляет службу 'zapret', а также связанные службы 'WinDivert'.
         """
-        services_to_remove = [self.service_name, "WinDivert", "WinDivert14"]
-        all_successful = True
-        error_messages = []
+        self.last_pipeline_report = ServicePipeline(self).uninstall()
+        if self.last_pipeline_report.success:
+            self._save_installed_profile(None)
+        return self.last_pipeline_report.as_tuple()
 
-        for service in services_to_remove:
-            # Сначала останавливаем службу
-            self._run_command(f'sc stop "{service}"', as_admin=True)
-            
-            # Затем удаляем
-            stdout, stderr = self._run_command(f'sc delete "{service}"', as_admin=True)
-            
-            # Успехом считаем либо сообщение SUCCESS, либо ошибку 1060 (служба не найдена)
-            if (stdout and "SUCCESS" in stdout) or (stderr and "1060" in stderr):
-                continue
-            else:
-                all_successful = False
-                error_messages.append(f"Failed to uninstall service '{service}': {stderr}")
-        
-        if all_successful:
-            return True, "Все службы (zapret, WinDivert) успешно удалены."
-        else:
-            return False, "\n".join(error_messages)
+    def active_profile(self, service_status, manual_running):
+        """
+        Профиль, с которым сейчас работает обход: ручного запуска, если он активен,
+        иначе установленный в службу, если она запущена; None - обход не работает.
+        """
+        if manual_running:
+            return os.path.basename(self.manual_bat_path) if self.manual_bat_path else None
+        return self.installed_profile if service_status == "RUNNING" else None
+
+    def _load_installed_profile(self):
+        if not self.state_path:
+            return None
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                return json.load(f).get("installed_profile")
+        except (OSError, ValueError):
+            return None
+
+    def _save_installed_profile(self, profile):
+        self.installed_profile = profile
+        if not self.state_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.state_path)), exist_ok=True)
+            tmp_path = self.state_path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"installed_profile": profile, "installed_at": time.time() if profile else None}, f)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            print(f"Не удалось сохранить установленный профиль: {e}")
 
     def start_service(self):
         """Запускает службу."""
@@ -151,58 +184,60 @@ class ServiceManager:
         """Перезапускает службу."""
         stop_ok, stop_msg = self.stop_service()
         if stop_ok:
-            import time
-            time.sleep(1) # Give it a moment to stop
+            ServicePipeline(self).wait_for(self.service_name, (STOPPED, NOT_FOUND))
             return self.start_service()
         return False, f"Failed to stop service for restart: {stop_msg}"
+
+    def reload_lists(self):
+        """
+        Перезапускает работающий winws, чтобы он перечитал списки: ручной запуск -
+        с тем же профилем, службу - без переустановки. Драйвер WinDivert не трогается.
+        """
+        if self.manual_bat_path and self.is_manual_process_running():
+            return self.start_manual_process(self.manual_bat_path)
+        if self.get_service_status() == "RUNNING":
+            return self.restart_service()
+        return True, "winws не запущен: списки будут прочитаны при следующем запуске."
         
-    def _parse_bat_file(self, bat_path):
+    def bat_variables(self, bat_path):
+        """Переменные, которые .bat профиль и service.bat задают перед запуском winws.exe."""
+        base_dir = os.path.dirname(os.path.abspath(self.winsw_path))
+        bat_dir = os.path.dirname(os.path.abspath(bat_path))
+        variables = {
+            "BIN": base_dir + os.sep,
+            "LISTS": os.path.join(os.path.dirname(base_dir), "lists") + os.sep,
+            "~dp0": bat_dir + os.sep,
+        }
+        variables.update(profile_variables(ConfigManager(base_dir)))
+        return variables
+
+    def _parse_bat_file(self, bat_path, tighten_capture=True):
         """
         Парсит .bat файл, чтобы извлечь ЧИСТУЮ строку аргументов для winws.exe,
-        в точности повторяя логику из service.bat.
+        в точности повторяя логику из service.bat: строки-продолжения '^' склеиваются,
+        %BIN%, %LISTS%, %~dp0 и %GameFilter% подставляются.
+        С tighten_capture=True --wf-tcp/--wf-udp сужаются до портов, которые
+        действительно используют секции профиля.
         Возвращает строку аргументов без экранирования.
         """
+        variables = self.bat_variables(bat_path)
         try:
-            with open(bat_path, 'r', encoding='utf-8', errors='ignore') as f:
-                lines = f.readlines()
+            profile = parse_profile(bat_path, variables)
         except Exception as e:
             print(f"Error reading bat file: {e}")
             return None
-
-        raw_args_line = ""
-        winsw_executable_name = "winws.exe"
-
-        for line in lines:
-            lower_line = line.lower()
-            if winsw_executable_name in lower_line:
-                raw_args_line = line[lower_line.find(winsw_executable_name) + len(winsw_executable_name):]
-                break
-        
-        if not raw_args_line:
+        if profile is None:
             return None # winws.exe не найден
 
-        raw_args_line = raw_args_line.strip()
-        if not raw_args_line:
-            return "" # winws.exe найден, но аргументов нет
-
-        # Замена переменных окружения .bat на их Python-эквиваленты
-        base_dir = os.path.dirname(os.path.abspath(self.winsw_path))
-        bat_dir = os.path.dirname(os.path.abspath(bat_path))
-        
-        # Создаем словарь замен
-        replacements = {
-            "%~dp0": f'"{bat_dir}\\"',
-            "%%BIN%%": f'"{base_dir}\\"',
-            "%BIN%": f'"{base_dir}\\"',
-            "%%LISTS%%": f'"{os.path.join(base_dir, "..", "lists")}\\"',
-            "%LISTS%": f'"{os.path.join(base_dir, "..", "lists")}\\"',
-        }
+        global_options = None
+        if tighten_capture:
+            try:
+                global_options = analyze_capture(profile).tight_options()
+            except ValueError as e:
+                print(f"Cannot compute capture filter: {e}")
 
-        for var, value in replacements.items():
-            raw_args_line = raw_args_line.replace(var, value)
-            
-        # Просто возвращаем обработанную строку. Экранированием займется install_service.
-        return raw_args_line.strip() 
+        # Экранированием займется install_service.
+        return profile.to_args(global_options=global_options, resolve_variables=True).strip()
 
     def get_service_start_type(self):
         """Получает тип запуска службы: 'AUTO', 'DEMAND', 'DISABLED', 'NOT_FOUND'."""
@@ -231,17 +266,37 @@ class ServiceManager:
         return False, f"Не удалось изменить тип запуска: {stderr}"
 
     def start_manual_process(self, bat_path):
-        """Запускает .bat файл в новой консоли и сохраняет его PID."""
-        try:
-            # CREATE_NEW_CONSOLE ensures it runs in its own window
-            process = subprocess.Popen(['cmd.exe', '/c', bat_path], creationflags=subprocess.CREATE_NEW_CONSOLE)
-            self.manual_process_pid = process.pid
-            return True, f"Процесс запущен с PID: {self.manual_process_pid}"
-        except Exception as e:
-            return False, f"Не удалось запустить процесс: {e}"
+        """
+        Запускает winws.exe с аргументами из .bat под наблюдением супервизора:
+        при падении или зависании процесс перезапускается.
+        """
+        args = self._parse_bat_file(bat_path)
+        if args is None:
+            return False, "Failed to parse .bat file or winws.exe not found in it."
+        if self.supervisor:
+            self.supervisor.stop()
+        self.manual_bat_path = bat_path
+        self.supervisor = WinwsSupervisor(f'"{self.winsw_path}" {args}', cwd=self.winsw_dir,
+                                          settings=self.supervisor_settings,
+                                          on_event=self._on_supervisor_event)
+        success, message = self.supervisor.start()
+        if not success:
+            return False, f"Не удалось запустить процесс: {message}"
+        self.manual_process_pid = self.supervisor.pid
+        return True, f"Процесс запущен с PID: {self.manual_process_pid}"
+
+    def _on_supervisor_event(self, event, stats):
+        self.manual_process_pid = stats["pid"] if stats["state"] != "crash_loop" else None
+        for callback in list(self.supervisor_listeners):
+            callback(event, stats)
 
     def stop_manual_process(self):
         """Останавливает процесс, запущенный вручную."""
+        if self.supervisor:
+            self.supervisor.stop()
+            self.supervisor = None
+            self.manual_process_pid = None
+            return True, "Процесс успешно остановлен."
         if not self.manual_process_pid:
             return False, "Нет информации о запущенном вручную процессе."
         
@@ -258,8 +313,19 @@ class ServiceManager:
         
         return False, f"Не удалось остановить процесс: {stderr}"
 
+    def shutdown(self):
+        """
+        Останавливает ручной запуск при выходе из программы: winws.exe запущен без
+        окна, и после выхода его уже никто не увидит и не остановит.
+        """
+        if self.supervisor:
+            self.stop_manual_process()
+
     def is_manual_process_running(self):
         """Проверяет, активен ли еще процесс, запущенный вручную."""
+        if self.supervisor:
+            # Падение супервизор видит сразу по дескриптору процесса, tasklist не нужен
+            return self.supervisor.is_supervising()
         if not self.manual_process_pid:
             return False
         
@@ -0,0 +1,232 @@
+import os
+
+from utils.port_ranges import PortRangeSet
+
+WINWS_EXECUTABLE = "winws.exe"
+
+# Опции winws, действующие на весь процесс, а не на отдельный профиль (--new секцию)
+GLOBAL_OPTIONS = ("--wf-", "--debug", "--daemon", "--ipcache-", "--ctrack-")
+
+
+def resolve(value, variables):
+    """
+    Подставляет переменные .bat из словаря variables: %NAME% или
+    параметры вида %~dp0 (имя начинается с '~', закрывающего '%' нет).
+    """
+    if value and variables:
+        for name, replacement in variables.items():
+            pattern = f"%{name}" if name.startswith("~") else f"%{name}%"
+            value = value.replace(pattern, replacement)
+    return value
+
+
+def tokenize(text):
+    """
+    Разбивает командную строку .bat на аргументы. Кавычки группируют пробелы
+    и удаляются; '^' в конце строки (перенос) игнорируется.
+    """
+    tokens = []
+    current = []
+    in_quotes = False
+    has_token = False
+    for char in text:
+        if char == '"':
+            in_quotes = not in_quotes
+            has_token = True
+        elif char.isspace() and not in_quotes:
+            if has_token:
+                tokens.append("".join(current))
+                current = []
+                has_token = False
+        else:
+            current.append(char)
+            has_token = True
+    if has_token:
+        tokens.append("".join(current))
+    return [t for t in tokens if t != "^"]
+
+
+def extract_winws_command(lines):
+    """Находит строку запуска winws.exe (с продолжениями через '^') и возвращает текст аргументов или None."""
+    collected = None
+    for line in lines:
+        stripped = line.rstrip("\r\n")
+        if collected is None:
+            lower = stripped.lower()
+            position = lower.find(WINWS_EXECUTABLE)
+            if position == -1:
+                continue
+            rest = stripped[position + len(WINWS_EXECUTABLE):]
+            if rest.startswith('"'):
+                rest = rest[1:]
+            collected = []
+        else:
+            rest = stripped
+        continued = rest.rstrip().endswith("^")
+        collected.append(rest.rstrip()[:-1] if continued else rest)
+        if not continued:
+            break
+    if collected is None:
+        return None
+    return " ".join(collected)
+
+
+class ProfileSection:
+    """Одна секция (профиль) winws между разделителями --new."""
+    def __init__(self, index, options, variables=None):
+        self.index = index
+        self.options = options  # [(опция, значение или None), ...] в исходном порядке
+        self.variables = variables or {}
+
+    def get(self, name, default=None):
+        for option, value in self.options:
+            if option == name:
+                return value
+        return default
+
+    def get_all(self, name):
+        return [value for option, value in self.options if option == name]
+
+    def has(self, name):
+        return any(option == name for option, _ in self.options)
+
+    def ports(self, protocol):
+        """
+        Порты протокола ('tcp'/'udp'), на которые секция может сработать.
+        Без --filter-tcp и --filter-udp секция применяется ко всем портам обоих протоколов.
+        """
+        tcp, udp = self.get_all("--filter-tcp"), self.get_all("--filter-udp")
+        if not tcp and not udp:
+            return PortRangeSet.full()
+        specs = tcp if protocol == "tcp" else udp
+        result = PortRangeSet()
+        for spec in specs:
+            result = result | PortRangeSet.parse(resolve(spec, self.variables))
+        return result
+
+    def l7(self):
+        """Множество протоколов --filter-l7 или None, если фильтра нет (подходит любой)."""
+        values = self.get_all("--filter-l7")
+        if not values:
+            return None
+        return frozenset(p.strip().lower() for v in values for p in v.split(",") if p.strip())
+
+    def hostlists(self):
+        return frozenset(self.get_all("--hostlist") + self.get_all("--hostlist-domains"))
+
+    def ipsets(self):
+        return frozenset(self.get_all("--ipset") + self.get_all("--ipset-ip"))
+
+    def match_options(self):
+        """Опции условий срабатывания секции."""
+        return [(o, v) for o, v in self.options if o.startswith("--filter-") or o.startswith("--hostlist")
+                or o.startswith("--ipset")]
+
+    def action_options(self):
+        """Опции действия (все, кроме условий срабатывания)."""
+        conditions = set(self.match_options())
+        return [(o, v) for o, v in self.options if (o, v) not in conditions]
+
+    def to_args(self, resolve_variables=False):
+        return format_options(self.options, self.variables if resolve_variables else None)
+
+
+class WinwsProfile:
+    """Разобранный .bat профиль: глобальные опции winws и цепочка секций."""
+    def __init__(self, path, global_options, sections, variables=None):
+        self.path = path
+        self.name = os.path.basename(path) if path else ""
+        self.global_options = global_options
+        self.sections = sections
+        self.variables = variables or {}
+
+    def get_global(self, name, default=None):
+        """Значение глобальной опции с подставленными переменными."""
+        for option, value in self.global_options:
+            if option == name:
+                return resolve(value, self.variables)
+        return default
+
+    def to_args(self, sections=None, global_options=None, resolve_variables=False):
+        """
+        Строка аргументов winws. По умолчанию - в исходной нотации .bat с %BIN%/%LISTS%,
+        с resolve_variables=True - с подставленными переменными, как для установки службы.
+        """
+        sections = self.sections if sections is None else sections
+        global_options = self.global_options if global_options is None else global_options
+        variables = self.variables if resolve_variables else None
+        parts = [format_options(global_options, variables)] if global_options else []
+        chain = " --new ".join(section.to_args(resolve_variables) for section in sections)
+        if chain:
+            parts.append(chain)
+        return " ".join(parts)
+
+
+def parse_options(tokens):
+    """Превращает токены в [(опция, значение)]: '--a=b' -> ('--a', 'b'), '--flag' -> ('--flag', None)."""
+    options = []
+    for token in tokens:
+        if token.startswith("--"):
+            if "=" in token:
+                name, value = token.split("=", 1)
+                options.append((name, value))
+            else:
+                options.append((token, None))
+        elif options and options[-1][1] is None:
+            # Значение, переданное отдельным токеном ('--opt value')
+            options[-1] = (options[-1][0], token)
+        else:
+            options.append((token, None))
+    return options
+
+
+def parse_args(args_text, path=None, variables=None):
+    """
+    Разбирает строку аргументов winws в WinwsProfile. Опции хранятся в исходной
+    нотации .bat, а variables (например, GameFilter) подставляются при вычислении портов.
+    """
+    global_options = []
+    sections = []
+    current = []
+    for option, value in parse_options(tokenize(args_text)):
+        if option == "--new":
+            sections.append(ProfileSection(len(sections) + 1, current, variables))
+            current = []
+        elif option.startswith(GLOBAL_OPTIONS):
+            global_options.append((option, value))
+        else:
+            current.append((option, value))
+    if current or not sections:
+        sections.append(ProfileSection(len(sections) + 1, current, variables))
+    return WinwsProfile(path, global_options, sections, variables)
+
+
+def parse_profile(path, variables=None):
+    """
+    Читает .bat профиль и разбирает строку запуска winws.exe.
+    Возвращает WinwsProfile или None, если winws.exe в файле не найден.
+    """
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        args_text = extract_winws_command(f)
+    if args_text is None:
+        return None
+    return parse_args(args_text, path, variables)
+
+
+def profile_variables(config_manager):
+    """Переменные, которые service.bat задает перед запуском профиля."""
+    return {"GameFilter": config_manager.get_game_filter_ports()}
+
+
+def format_options(options, variables=None):
+    parts = []
+    for option, value in options:
+        value = resolve(value, variables)
+        if value is None:
+            parts.append(option)
+        elif any(c in value for c in ' \\/:') or (value.startswith('%') and not value.endswith('%')):
+            # Пути вида "%LISTS%list.txt" в профилях всегда в кавычках
+            parts.append(f'{option}="{value}"')
+        else:
+            parts.append(f"{option}={value}")
+    return " ".join(parts)
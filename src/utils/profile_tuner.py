@@ -0,0 +1,384 @@
+"""
+Автоподбор параметров стратегии winws (--dpi-desync*) для секций профиля.
+
+Кандидаты - сочетания значений из пространства параметров (DEFAULT_SPACE).
+Все кандидаты проверяются сначала малым числом попыток, затем лучшая треть
+(eta = 3) получает в eta раз больше попыток, и так далее до одного кандидата
+(successive halving). Большинство кандидатов отсеивается после первого дешевого
+раунда, поэтому полная проверка достается только немногим.
+
+Результаты накапливаются в кэше по ключу кандидата: следующий раунд и
+повторный запуск догоняют только недостающие попытки. Кэш привязан к базовому
+профилю, проверяемым хостам и способу проверки; старые записи не используются.
+
+Способ проверки подключаемый (Evaluator). WinwsEvaluator запускает winws.exe с
+профилем кандидата и проверяет TLS-рукопожатия с хостами; для него parallelism = 1,
+потому что два winws перехватывали бы одни и те же пакеты. Заглушки без winws
+(например, в бенчмарках) могут проверять кандидатов параллельно.
+"""
+import hashlib
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.data_dir import data_path
+from utils.filter_analyzer import format_chain
+from utils.profile_parser import ProfileSection, WinwsProfile, WINWS_EXECUTABLE, extract_winws_command
+from utils.supervisor import launch_winws, tls_probe
+
+DEFAULT_SPACE = {
+    "--dpi-desync": ["fake", "fake,split", "fake,split2", "fake,disorder2", "split2"],
+    "--dpi-desync-repeats": ["2", "6", "11"],
+    "--dpi-desync-split-pos": [None, "1", "2", "midsld"],   # None - опция не задается
+    "--dpi-desync-fooling": ["badseq", "md5sig", "ts"],
+    "--dpi-desync-autottl": [None, "2", "5"],
+}
+TUNED_OPTIONS = tuple(DEFAULT_SPACE)
+
+DEFAULT_HOSTS = ("discord.com", "gateway.discord.gg", "www.youtube.com", "i.ytimg.com")
+DEFAULT_CACHE_PATH = data_path("tuner-cache.json")
+CACHE_MAX_AGE = 24 * 3600     # Сеть и DPI провайдера меняются: старые результаты не доверяем
+DEFAULT_ETA = 3
+DEFAULT_MIN_BUDGET = 1        # Раундов проверки у каждого кандидата в первом отборе
+DEFAULT_MAX_BUDGET = 9
+TUNED_PROFILE_NAME = "general (TUNED).bat"
+
+
+class Candidate:
+    """Набор значений подбираемых опций. Опция со значением None не задается."""
+    def __init__(self, options):
+        self.options = tuple((option, value) for option, value in options if value is not None)
+        self.key = " ".join(f"{option}={value}" for option, value in self.options)
+
+    def apply(self, section):
+        """Копия секции с подбираемыми опциями кандидата на месте прежних (остальные опции не меняются)."""
+        options = []
+        inserted = False
+        for option, value in section.options:
+            if option in TUNED_OPTIONS:
+                if not inserted:
+                    options.extend(self.options)
+                    inserted = True
+                continue
+            options.append((option, value))
+        if not inserted:
+            options.extend(self.options)
+        return ProfileSection(section.index, options, section.variables)
+
+    def __repr__(self):
+        return f"Candidate({self.key})"
+
+
+def _is_sensible(values):
+    # Позиция разреза имеет смысл только для split/disorder
+    desync = values.get("--dpi-desync") or ""
+    if values.get("--dpi-desync-split-pos") and not any(mode in desync for mode in ("split", "disorder")):
+        return False
+    return True
+
+
+def generate_candidates(space=DEFAULT_SPACE, limit=None, seed=0):
+    """Все осмысленные сочетания значений space; при limit - случайная выборка из них."""
+    names = list(space)
+    candidates = []
+    for combination in itertools.product(*(space[name] for name in names)):
+        values = dict(zip(names, combination))
+        if _is_sensible(values):
+            candidates.append(Candidate(values.items()))
+    if limit and len(candidates) > limit:
+        candidates = random.Random(seed).sample(candidates, limit)
+    return candidates
+
+
+def target_sections(profile, protocol="tcp", port=443):
+    """Номера (index) секций со стратегией --dpi-desync, срабатывающих на protocol/port."""
+    return [section.index for section in profile.sections
+            if section.has("--dpi-desync") and port in section.ports(protocol)]
+
+
+def build_profile(profile, candidate, targets):
+    sections = [candidate.apply(section) if section.index in targets else section
+                for section in profile.sections]
+    return WinwsProfile(profile.path, profile.global_options, sections, profile.variables)
+
+
+class Evaluation:
+    """Накопленный результат кандидата: rounds раундов, attempts отдельных проверок."""
+    def __init__(self, rounds=0, attempts=0, successes=0, latency_total=0.0, evaluated_at=None):
+        self.rounds = rounds
+        self.attempts = attempts
+        self.successes = successes
+        self.latency_total = latency_total
+        self.evaluated_at = evaluated_at if evaluated_at is not None else time.time()
+
+    @property
+    def success_rate(self):
+        return self.successes / self.attempts if self.attempts else 0.0
+
+    @property
+    def mean_latency(self):
+        return self.latency_total / self.successes if self.successes else None
+
+    def score(self):
+        """Больше - лучше: сначала доля успешных проверок, затем скорость."""
+        latency = self.mean_latency
+        return self.success_rate, -(latency if latency is not None else float("inf"))
+
+    def merge(self, other):
+        return Evaluation(self.rounds + other.rounds, self.attempts + other.attempts,
+                          self.successes + other.successes, self.latency_total + other.latency_total,
+                          max(self.evaluated_at, other.evaluated_at))
+
+    def to_dict(self):
+        return {"rounds": self.rounds, "attempts": self.attempts, "successes": self.successes,
+                "latency_total": self.latency_total, "evaluated_at": self.evaluated_at}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["rounds"], data["attempts"], data["successes"], data["latency_total"],
+                   data["evaluated_at"])
+
+
+class ResultCache:
+    """Результаты кандидатов в JSON-файле: {контекст: {ключ кандидата: результат}}."""
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_age=CACHE_MAX_AGE):
+        self.path = os.path.abspath(path) if path else None
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self.entries = {}
+        self.load()
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def get(self, context, key):
+        with self._lock:
+            data = self.entries.get(context, {}).get(key)
+        if data is None or time.time() - data["evaluated_at"] > self.max_age:
+            return None
+        return Evaluation.from_dict(data)
+
+    def put(self, context, key, evaluation):
+        with self._lock:
+            self.entries.setdefault(context, {})[key] = evaluation.to_dict()
+
+    def save(self):
+        if not self.path:
+            return
+        now = time.time()
+        with self._lock:
+            entries = {context: {key: data for key, data in results.items()
+                                 if now - data["evaluated_at"] <= self.max_age}
+                       for context, results in self.entries.items()}
+        entries = {context: results for context, results in entries.items() if results}
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+
+class Evaluator:
+    """
+    Способ проверки кандидата. evaluate(args, rounds) проверяет профиль со строкой
+    аргументов winws args в rounds раундах и возвращает Evaluation.
+    """
+    name = "base"
+    parallelism = 1
+
+    def evaluate(self, args, rounds):
+        raise NotImplementedError
+
+
+class WinwsEvaluator(Evaluator):
+    """Запускает winws.exe с профилем кандидата и проверяет TLS-рукопожатия с hosts."""
+    name = "winws"
+    parallelism = 1     # Два winws одновременно перехватывали бы одни и те же пакеты
+
+    def __init__(self, winws_path, hosts=DEFAULT_HOSTS, timeout=3.0, settle=0.5, launcher=launch_winws):
+        self.winws_path = winws_path
+        self.hosts = tuple(hosts)
+        self.timeout = timeout
+        self.settle = settle     # Пауза после запуска: winws должен открыть WinDivert
+        self.launcher = launcher
+
+    def _probe(self, host):
+        started = time.perf_counter()
+        ok = tls_probe(host, 443, self.timeout)
+        return ok, time.perf_counter() - started
+
+    def evaluate(self, args, rounds):
+        process = self.launcher(f'"{self.winws_path}" {args}', cwd=os.path.dirname(self.winws_path))
+        result = Evaluation()
+        try:
+            time.sleep(self.settle)
+            if process.poll() is not None:
+                # winws не принял аргументы: кандидат негоден
+                return Evaluation(rounds, rounds * len(self.hosts), 0, 0.0)
+            with ThreadPoolExecutor(max_workers=len(self.hosts)) as pool:
+                for _ in range(rounds):
+                    for ok, latency in pool.map(self._probe, self.hosts):
+                        result = result.merge(Evaluation(0, 1, int(ok), latency if ok else 0.0))
+                    result.rounds += 1
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+        return result
+
+
+class TuningReport:
+    def __init__(self, base_profile, targets):
+        self.base_profile = base_profile
+        self.targets = targets
+        self.rounds = []            # (раунд, раундов проверки у кандидата, кандидатов, лучший ключ, лучший результат)
+        self.ranking = []           # [(Candidate, Evaluation)] последнего раунда, лучшие первыми
+        self.evaluations = 0        # Сколько раз вызывался evaluator (без попаданий в кэш)
+        self.cache_hits = 0
+        self.cancelled = False
+
+    @property
+    def best(self):
+        return self.ranking[0] if self.ranking else (None, None)
+
+    def best_profile(self):
+        candidate, _ = self.best
+        return build_profile(self.base_profile, candidate, self.targets) if candidate else None
+
+    def summary(self):
+        candidate, evaluation = self.best
+        if candidate is None:
+            return "Подбор не дал результатов."
+        lines = [f"Раунд {number}: кандидатов {count}, проверок у каждого {budget}, "
+                 f"лучший {evaluation.success_rate:.0%}"
+                 for number, budget, count, _, evaluation in self.rounds]
+        latency = f", {evaluation.mean_latency * 1000:.0f} мс" if evaluation.mean_latency is not None else ""
+        lines.append(f"Лучший: {candidate.key} ({evaluation.success_rate:.0%}{latency})")
+        lines.append(f"Запусков проверки: {self.evaluations}, взято из кэша: {self.cache_hits}")
+        if self.cancelled:
+            lines.append("Подбор прерван.")
+        return "\n".join(lines)
+
+
+class ProfileTuner:
+    def __init__(self, profile, evaluator, candidates=None, targets=None, cache=None,
+                 eta=DEFAULT_ETA, min_budget=DEFAULT_MIN_BUDGET, max_budget=DEFAULT_MAX_BUDGET,
+                 progress_callback=None):
+        self.profile = profile
+        self.evaluator = evaluator
+        self.candidates = candidates if candidates is not None else generate_candidates()
+        self.targets = targets if targets is not None else target_sections(profile)
+        self.cache = cache
+        self.eta = eta
+        self.min_budget = min_budget
+        self.max_budget = max_budget
+        self.progress_callback = progress_callback
+        self.results = {}           # Ключ кандидата -> накопленный Evaluation этого запуска
+        self._cancel = threading.Event()
+        base = profile.to_args(resolve_variables=True)
+        hosts = ",".join(getattr(evaluator, "hosts", ()))
+        self.context = hashlib.sha256(f"{evaluator.name}|{hosts}|{base}".encode("utf-8")).hexdigest()[:16]
+
+    def cancel(self):
+        self._cancel.set()
+
+    def run(self):
+        report = TuningReport(self.profile, self.targets)
+        if not self.targets:
+            return report
+        survivors = list(self.candidates)
+        budget = self.min_budget
+        number = 0
+        while survivors and not self._cancel.is_set():
+            number += 1
+            results = self._evaluate_round(survivors, budget, report)
+            ranked = sorted(zip(survivors, results), key=lambda item: item[1].score(), reverse=True)
+            report.ranking = ranked
+            report.rounds.append((number, budget, len(survivors), ranked[0][0].key, ranked[0][1]))
+            if len(ranked) == 1 or budget >= self.max_budget:
+                break
+            survivors = [candidate for candidate, _ in ranked[:max(1, len(ranked) // self.eta)]]
+            budget = min(budget * self.eta, self.max_budget)
+        report.cancelled = self._cancel.is_set()
+        if self.cache:
+            self.cache.save()
+        return report
+
+    def _evaluate_round(self, candidates, budget, report):
+        done = [0]
+        lock = threading.Lock()
+
+        def evaluate(candidate):
+            result = self.results.get(candidate.key)
+            if result is None and self.cache:
+                result = self.cache.get(self.context, candidate.key)
+            result = result or Evaluation()
+            missing = budget - result.rounds
+            if missing > 0 and not self._cancel.is_set():
+                args = build_profile(self.profile, candidate, self.targets).to_args(resolve_variables=True)
+                result = result.merge(self.evaluator.evaluate(args, missing))
+                self.results[candidate.key] = result
+                if self.cache:
+                    self.cache.put(self.context, candidate.key, result)
+            with lock:
+                if missing > 0:
+                    report.evaluations += 1
+                else:
+                    report.cache_hits += 1
+                done[0] += 1
+                if self.progress_callback:
+                    self.progress_callback(done[0], len(candidates))
+            return result
+
+        with ThreadPoolExecutor(max_workers=max(1, self.evaluator.parallelism)) as pool:
+            return list(pool.map(evaluate, candidates))
+
+
+def write_tuned_profile(base_path, profile, candidate=None, out_path=None):
+    """
+    Пишет профиль как копию base_path, в которой строка запуска winws.exe заменена
+    цепочкой секций profile. Возвращает (success, message).
+    """
+    out_path = out_path or os.path.join(os.path.dirname(base_path), TUNED_PROFILE_NAME)
+    try:
+        with open(base_path, 'r', encoding='utf-8', newline='') as f:
+            lines = f.readlines()
+    except OSError as e:
+        return False, f"Не удалось прочитать {os.path.basename(base_path)}: {e}"
+    if extract_winws_command(lines) is None:
+        return False, f"В файле {os.path.basename(base_path)} не найден запуск winws.exe."
+
+    newline = "\r\n" if lines and lines[0].endswith("\r\n") else "\n"
+    start = next(i for i, line in enumerate(lines) if WINWS_EXECUTABLE in line.lower())
+    end = start
+    while lines[end].rstrip().endswith("^") and end + 1 < len(lines):
+        end += 1
+    line = lines[start]
+    position = line.lower().find(WINWS_EXECUTABLE) + len(WINWS_EXECUTABLE)
+    if line[position:position + 1] == '"':
+        position += 1
+    chain = format_chain(profile, profile.sections).replace("\n", newline)
+    replacement = []
+    if candidate is not None:
+        replacement.append(f":: Параметры подобраны автоматически: {candidate.key}{newline}")
+    replacement.append(f"{line[:position]} {chain}{newline}")
+    lines[start:end + 1] = replacement
+
+    tmp_path = out_path + ".tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+            f.writelines(lines)
+        os.replace(tmp_path, out_path)
+    except OSError as e:
+        return False, f"Не удалось записать профиль: {e}"
+    return True, f"Профиль сохранен: {os.path.basename(out_path)}"
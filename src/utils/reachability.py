@@ -0,0 +1,277 @@
+"""
+История проверок доступности доменов в SQLite.
+
+Каждая проверка - строка checks: домен, профиль (None - без обхода), сеть
+(ключ отпечатка из network_profiles), время DNS / TCP / TLS и исход.
+Таблица latest хранит последнюю проверку каждой тройки (домен, профиль, сеть),
+поэтому повторная проверка выбирает только устаревшие записи без просмотра истории.
+
+Сырые проверки хранятся RETENTION_DAYS дней, после чего сворачиваются в
+суточные агрегаты daily (число проверок, успешных, p50/p95 TLS), которые
+хранятся DAILY_RETENTION_DAYS дней.
+"""
+import math
+import os
+import socket
+import ssl
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.data_dir import data_path
+
+DEFAULT_DB_PATH = data_path("reachability.sqlite3")
+RETENTION_DAYS = 30
+DAILY_RETENTION_DAYS = 365
+DEFAULT_MAX_AGE = 15 * 60       # Результат моложе этого (сек) считается свежим
+DEFAULT_TIMEOUT = 5.0
+DEFAULT_PARALLELISM = 8
+DAY = 86400
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS checks (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    domain TEXT NOT NULL,
+    port INTEGER NOT NULL DEFAULT 443,
+    profile TEXT,
+    network TEXT,
+    ok INTEGER NOT NULL,
+    dns_ms REAL,
+    connect_ms REAL,
+    tls_ms REAL,
+    error TEXT
+);
+-- Покрывающий индекс для трендов по домену: таблицу читать не нужно
+CREATE INDEX IF NOT EXISTS checks_domain_ts ON checks (domain, ts, profile, ok, tls_ms);
+CREATE INDEX IF NOT EXISTS checks_ts ON checks (ts);
+CREATE TABLE IF NOT EXISTS latest (
+    domain TEXT NOT NULL,
+    profile TEXT NOT NULL,          -- '' - без обхода (NULL в ключе не сравнивается)
+    network TEXT NOT NULL,
+    ts REAL NOT NULL,
+    ok INTEGER NOT NULL,
+    tls_ms REAL,
+    PRIMARY KEY (profile, network, domain)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS daily (
+    day INTEGER NOT NULL,           -- начало суток, unix time
+    domain TEXT NOT NULL,
+    profile TEXT NOT NULL,
+    network TEXT NOT NULL,
+    checks INTEGER NOT NULL,
+    successes INTEGER NOT NULL,
+    tls_p50 REAL,
+    tls_p95 REAL,
+    PRIMARY KEY (domain, day, profile, network)
+) WITHOUT ROWID;
+"""
+
+
+def percentile(sorted_values, fraction):
+    """Перцентиль методом ближайшего ранга по отсортированному списку."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def probe_domain(domain, port=443, timeout=DEFAULT_TIMEOUT):
+    """
+    DNS, TCP и TLS до domain с замером каждой фазы. Возвращает dict с полями
+    ok, dns_ms, connect_ms, tls_ms, error (фазы, до которых не дошло, - None).
+    """
+    result = {"domain": domain, "port": port, "ok": False, "dns_ms": None, "connect_ms": None, "tls_ms": None,
+              "error": None}
+    started = time.perf_counter()
+    try:
+        address = socket.getaddrinfo(domain, port, type=socket.SOCK_STREAM)[0]
+        result["dns_ms"] = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        with socket.socket(address[0], address[1], address[2]) as sock:
+            sock.settimeout(timeout)
+            sock.connect(address[4])
+            result["connect_ms"] = (time.perf_counter() - started) * 1000
+            started = time.perf_counter()
+            with ssl.create_default_context().wrap_socket(sock, server_hostname=domain):
+                result["tls_ms"] = (time.perf_counter() - started) * 1000
+        result["ok"] = True
+    except socket.gaierror as e:
+        result["error"] = f"DNS: {e}"
+    except (OSError, ssl.SSLError) as e:
+        phase = "TLS" if result["connect_ms"] is not None else "TCP"
+        result["error"] = f"{phase}: {e}"
+    return result
+
+
+class ReachabilityHistory:
+    """
+    Хранилище проверок. Одно соединение на процесс (WAL), запись под блокировкой,
+    поэтому объект можно использовать из рабочих потоков.
+    """
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA auto_vacuum=INCREMENTAL")  # Действует только для новой базы
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    # --- Запись ---
+    def record(self, results, profile=None, network=None, ts=None):
+        """Сохраняет результаты probe_domain одной транзакцией."""
+        ts = time.time() if ts is None else ts
+        rows = [(ts, r["domain"], r.get("port", 443), profile, network, int(r["ok"]),
+                 r.get("dns_ms"), r.get("connect_ms"), r.get("tls_ms"), r.get("error")) for r in results]
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT INTO checks (ts, domain, port, profile, network, ok, dns_ms, connect_ms, tls_ms, error) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._db.executemany(
+                "INSERT INTO latest (domain, profile, network, ts, ok, tls_ms) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (profile, network, domain) DO UPDATE SET ts=excluded.ts, ok=excluded.ok, "
+                "tls_ms=excluded.tls_ms WHERE excluded.ts >= latest.ts",
+                [(row[1], profile or "", network or "", ts, row[5], row[8]) for row in rows])
+
+    # --- Запросы ---
+    def stale_domains(self, domains, profile=None, network=None, max_age=DEFAULT_MAX_AGE, now=None):
+        """Домены из domains, для которых нет результата моложе max_age в этом профиле и сети."""
+        cutoff = (time.time() if now is None else now) - max_age
+        with self._lock:
+            fresh = {row[0] for row in self._db.execute(
+                "SELECT domain FROM latest WHERE profile = ? AND network = ? AND ts >= ?",
+                (profile or "", network or "", cutoff))}
+        return [domain for domain in domains if domain not in fresh]
+
+    def latest(self, profile=None, network=None):
+        """{домен: (время, ok, tls_ms)} последних проверок в этом профиле и сети."""
+        with self._lock:
+            rows = self._db.execute("SELECT domain, ts, ok, tls_ms FROM latest WHERE profile = ? AND network = ?",
+                                    (profile or "", network or "")).fetchall()
+        return {domain: (ts, bool(ok), tls_ms) for domain, ts, ok, tls_ms in rows}
+
+    def tls_percentiles(self, domain, days=7, fraction=0.95, now=None):
+        """
+        Перцентиль времени TLS-рукопожатия domain по профилям за days суток:
+        {профиль: {"p": мс, "checks": n, "successes": k}}. Профиль None - без обхода.
+        Для суток, уже свернутых compact(), каждая успешная проверка учитывается как p95 этих суток.
+        """
+        now = time.time() if now is None else now
+        since = now - days * DAY
+        first_day = since - since % DAY
+        stats = {}
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT profile, ok, tls_ms FROM checks WHERE domain = ? AND ts >= ?", (domain, since)).fetchall()
+            raw_since = self._db.execute("SELECT MIN(ts) FROM checks WHERE domain = ?", (domain,)).fetchone()[0]
+            daily = self._db.execute(
+                "SELECT profile, checks, successes, tls_p95 FROM daily WHERE domain = ? AND day >= ? AND day < ?",
+                (domain, first_day, raw_since if raw_since is not None else now)).fetchall()
+        samples = {}
+        for profile, ok, tls_ms in rows:
+            entry = stats.setdefault(profile, {"checks": 0, "successes": 0})
+            entry["checks"] += 1
+            if ok:
+                entry["successes"] += 1
+                samples.setdefault(profile, []).append(tls_ms)
+        for profile, checks, successes, tls_p95 in daily:
+            profile = profile or None
+            entry = stats.setdefault(profile, {"checks": 0, "successes": 0})
+            entry["checks"] += checks
+            entry["successes"] += successes
+            if tls_p95 is not None:
+                samples.setdefault(profile, []).extend([tls_p95] * successes)
+        for profile, entry in stats.items():
+            entry["p"] = percentile(sorted(samples.get(profile, [])), fraction)
+        return stats
+
+    def domains(self):
+        with self._lock:
+            return [row[0] for row in self._db.execute("SELECT DISTINCT domain FROM latest ORDER BY domain")]
+
+    def count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM checks").fetchone()[0]
+
+    # --- Обслуживание ---
+    def compact(self, retention_days=RETENTION_DAYS, daily_retention_days=DAILY_RETENTION_DAYS, now=None):
+        """
+        Сворачивает проверки старше retention_days в суточные агрегаты и удаляет их,
+        удаляет агрегаты старше daily_retention_days и возвращает место в файле.
+        Возвращает число удаленных проверок.
+        """
+        now = time.time() if now is None else now
+        cutoff = now - retention_days * DAY
+        cutoff -= cutoff % DAY   # Сворачиваем только целые сутки
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT CAST(ts / ? AS INTEGER) * ?, domain, IFNULL(profile, ''), IFNULL(network, ''), ok, tls_ms "
+                "FROM checks WHERE ts < ? ORDER BY 1, 2, 3, 4", (DAY, DAY, cutoff)).fetchall()
+            groups = {}
+            for day, domain, profile, network, ok, tls_ms in rows:
+                group = groups.setdefault((day, domain, profile, network), [0, 0, []])
+                group[0] += 1
+                if ok:
+                    group[1] += 1
+                    if tls_ms is not None:
+                        group[2].append(tls_ms)
+            with self._db:
+                self._db.executemany(
+                    "INSERT INTO daily (day, domain, profile, network, checks, successes, tls_p50, tls_p95) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (domain, day, profile, network) DO UPDATE SET "
+                    "checks = checks + excluded.checks, successes = successes + excluded.successes, "
+                    "tls_p50 = IFNULL(excluded.tls_p50, tls_p50), tls_p95 = IFNULL(excluded.tls_p95, tls_p95)",
+                    [(day, domain, profile, network, checks, successes,
+                      percentile(sorted(samples), 0.5), percentile(sorted(samples), 0.95))
+                     for (day, domain, profile, network), (checks, successes, samples) in groups.items()])
+                deleted = self._db.execute("DELETE FROM checks WHERE ts < ?", (cutoff,)).rowcount
+                self._db.execute("DELETE FROM daily WHERE day < ?", (now - daily_retention_days * DAY,))
+                self._db.execute("DELETE FROM latest WHERE ts < ?", (now - daily_retention_days * DAY,))
+            if deleted:
+                self._db.executescript("PRAGMA incremental_vacuum;")  # execute() освобождает только одну страницу
+        return deleted
+
+
+class ReachabilityChecker:
+    """
+    Проверяет домены параллельно и пишет результаты в историю. context() возвращает
+    (профиль, сеть) на момент проверки: профиль None, если обход не активен.
+    """
+    def __init__(self, history, context=lambda: (None, None), parallelism=DEFAULT_PARALLELISM,
+                 timeout=DEFAULT_TIMEOUT, probe=probe_domain):
+        self.history = history
+        self.context = context
+        self.parallelism = parallelism
+        self.timeout = timeout
+        self.probe = probe
+
+    def check(self, domains, only_stale=True, max_age=DEFAULT_MAX_AGE):
+        """Возвращает результаты проверенных доменов; при only_stale свежие пропускаются."""
+        profile, network = self.context()
+        if only_stale:
+            domains = self.history.stale_domains(domains, profile, network, max_age)
+        if not domains:
+            return []
+        with ThreadPoolExecutor(max_workers=max(1, min(self.parallelism, len(domains)))) as pool:
+            results = list(pool.map(lambda domain: self.probe(domain, timeout=self.timeout), domains))
+        self.history.record(results, profile, network)
+        return results
+
+
+def check_context(status_cache=None):
+    """
+    (профиль, сеть) для записи в историю: профиль - тот, с которым сейчас работает
+    обход (ручной запуск или установленный в запущенную службу), иначе None;
+    сеть - ключ от NetworkProfileManager, если он включен.
+    """
+    snapshot = status_cache.snapshot() if status_cache else {}
+    network = (snapshot.get("network") or {}).get("key")
+    return snapshot.get("profile"), network
@@ -0,0 +1,387 @@
+"""
+Транзакционная установка и удаление служб zapret / WinDivert.
+
+Вместо фиксированной последовательности `sc stop` + `sc delete` для всех трех
+служб сначала (параллельно) опрашивается текущее состояние, затем строится
+минимальный план шагов с зависимостями. Независимые шаги выполняются
+одновременно, переходы состояний дожидаются опросом `sc query`, а не паузой.
+Если шаг не удался, выполненные шаги откатываются в обратном порядке.
+"""
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from utils.metrics import SERVICE_STEP_LATENCY
+
+DRIVER_SERVICES = ("WinDivert", "WinDivert14")
+
+NOT_FOUND = "NOT_FOUND"
+STOPPED = "STOPPED"
+RUNNING = "RUNNING"
+START_PENDING = "START_PENDING"
+STOP_PENDING = "STOP_PENDING"
+UNKNOWN = "UNKNOWN"
+
+POLL_INTERVAL = 0.1
+STATE_TIMEOUT = 15.0
+DELETE_TIMEOUT = 2.0
+MAX_WORKERS = 4
+
+_STATE_RE = re.compile(r'STATE\s*:\s*\d+\s+(\w+)')
+_BIN_PATH_RE = re.compile(r'BINARY_PATH_NAME\s*:\s*(.*)')
+_START_TYPE_RE = re.compile(r'START_TYPE\s*:\s*\d+\s+(\w+)')
+
+
+def parse_state(stdout, stderr=""):
+    """Состояние службы по выводу `sc query`."""
+    text = (stdout or "") + (stderr or "")
+    if "1060" in text:
+        return NOT_FOUND
+    match = _STATE_RE.search(stdout or "")
+    return match.group(1) if match else UNKNOWN
+
+
+def parse_config(stdout):
+    """(binPath, тип запуска) по выводу `sc qc`; (None, None), если разобрать не удалось."""
+    if not stdout:
+        return None, None
+    bin_path = _BIN_PATH_RE.search(stdout)
+    start_type = _START_TYPE_RE.search(stdout)
+    return (bin_path.group(1).strip() if bin_path else None,
+            start_type.group(1).replace("_START", "") if start_type else None)
+
+
+def _same_command_line(left, right):
+    return " ".join((left or "").split()) == " ".join((right or "").split())
+
+
+class ServiceState:
+    """Снимок одной службы: состояние, binPath и тип запуска."""
+    def __init__(self, name, state, bin_path=None, start_type=None):
+        self.name = name
+        self.state = state
+        self.bin_path = bin_path
+        self.start_type = start_type
+
+    @property
+    def exists(self):
+        return self.state not in (NOT_FOUND, UNKNOWN)
+
+    @property
+    def active(self):
+        return self.state in (RUNNING, START_PENDING)
+
+
+class Step:
+    """
+    Шаг плана. run() и undo() возвращают (success, message). Шаг запускается,
+    когда выполнены все шаги из after.
+    """
+    def __init__(self, name, run, after=(), undo=None):
+        self.name = name
+        self.run = run
+        self.after = tuple(after)
+        self.undo = undo
+
+
+class StepResult:
+    def __init__(self, name, outcome, message="", duration=0.0):
+        self.name = name
+        self.outcome = outcome      # "ok", "failed", "skipped", "rolled back", "rollback failed"
+        self.message = message
+        self.duration = duration
+
+
+class PipelineReport:
+    """Итог выполнения плана: успех, результаты шагов и общая длительность."""
+    def __init__(self, title):
+        self.title = title
+        self.success = True
+        self.message = ""
+        self.steps = []
+        self.duration = 0.0
+
+    def add(self, result):
+        self.steps.append(result)
+
+    def summary(self):
+        lines = [self.message] if self.message else []
+        for step in self.steps:
+            line = f"  {step.name}: {step.outcome}, {step.duration:.2f} с"
+            if step.outcome != "ok" and step.message:
+                line += f" ({step.message})"
+            lines.append(line)
+        lines.append(f"Всего: {self.duration:.2f} с")
+        return "\n".join(lines)
+
+    def as_tuple(self):
+        return self.success, self.summary()
+
+
+class ServicePipeline:
+    """Планирует и выполняет установку/удаление через команды ServiceManager._run_command."""
+    def __init__(self, service_manager, poll_interval=POLL_INTERVAL, state_timeout=STATE_TIMEOUT,
+                 max_workers=MAX_WORKERS):
+        self.service_manager = service_manager
+        self.poll_interval = poll_interval
+        self.state_timeout = state_timeout
+        self.max_workers = max_workers
+
+    # --- Состояние ---
+    def _sc(self, command):
+        stdout, stderr = self.service_manager._run_command(command, as_admin=True)
+        return stdout or "", stderr or ""
+
+    def query(self, name):
+        return parse_state(*self._sc(f'sc query "{name}"'))
+
+    def snapshot(self, names, with_config=()):
+        """Опрашивает службы параллельно. Возвращает {имя: ServiceState}."""
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            states = {name: executor.submit(self.query, name) for name in names}
+            configs = {name: executor.submit(self._sc, f'sc qc "{name}"') for name in with_config}
+            result = {}
+            for name, future in states.items():
+                bin_path, start_type = parse_config(configs[name].result()[0]) if name in configs else (None, None)
+                result[name] = ServiceState(name, future.result(), bin_path, start_type)
+        return result
+
+    def wait_for(self, name, targets, timeout=None):
+        """Опрашивает `sc query`, пока состояние не попадет в targets. Возвращает последнее состояние."""
+        deadline = time.monotonic() + (self.state_timeout if timeout is None else timeout)
+        while True:
+            state = self.query(name)
+            if state in targets or time.monotonic() >= deadline:
+                return state
+            time.sleep(self.poll_interval)
+
+    def stop_services(self, names):
+        """
+        Параллельно останавливает активные службы из names.
+        Возвращает (success, message, остановленные службы), чтобы потом запустить их снова.
+        """
+        active = [name for name, state in self.snapshot(names).items() if state.active]
+        if not active:
+            return True, "", []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = dict(zip(active, executor.map(self._stop, active)))
+        errors = [f"{name}: {message}" for name, (success, message) in results.items() if not success]
+        return not errors, "; ".join(errors), active
+
+    # --- Элементарные шаги ---
+    def _start(self, name):
+        stdout, stderr = self._sc(f'sc start "{name}"')
+        if "1056" not in stdout + stderr and "START_PENDING" not in stdout and "RUNNING" not in stdout:
+            return False, f"sc start: {(stderr or stdout).strip()}"
+        state = self.wait_for(name, (RUNNING, STOPPED))
+        if state != RUNNING:
+            return False, f"служба не запустилась (состояние {state})"
+        return True, ""
+
+    def _stop(self, name):
+        stdout, stderr = self._sc(f'sc stop "{name}"')
+        text = stdout + stderr
+        if "1062" not in text and "1060" not in text and "STOP_PENDING" not in stdout and "SUCCESS" not in stdout \
+                and "STOPPED" not in stdout:
+            return False, f"sc stop: {(stderr or stdout).strip()}"
+        state = self.wait_for(name, (STOPPED, NOT_FOUND))
+        if state not in (STOPPED, NOT_FOUND):
+            return False, f"служба не остановилась (состояние {state})"
+        return True, ""
+
+    def _delete(self, name):
+        stdout, stderr = self._sc(f'sc delete "{name}"')
+        if "SUCCESS" not in stdout and "1060" not in stdout + stderr:
+            return False, f"sc delete: {(stderr or stdout).strip()}"
+        # Служба с открытыми дескрипторами только помечается на удаление (1072)
+        if self.wait_for(name, (NOT_FOUND,), timeout=min(DELETE_TIMEOUT, self.state_timeout)) != NOT_FOUND:
+            return True, "будет удалена после закрытия дескрипторов"
+        return True, ""
+
+    def _create(self, name, bin_path):
+        escaped = bin_path.replace('"', '\\"')
+        stdout, stderr = self._sc(
+            f'sc create "{name}" binPath= "{escaped}" DisplayName= "{name}" start= auto')
+        if "SUCCESS" not in stdout:
+            return False, f"sc create: {(stderr or stdout).strip()}"
+        return True, ""
+
+    def _configure(self, name, bin_path, start_type="auto"):
+        escaped = bin_path.replace('"', '\\"')
+        stdout, stderr = self._sc(f'sc config "{name}" binPath= "{escaped}" start= {start_type}')
+        if "SUCCESS" not in stdout:
+            return False, f"sc config: {(stderr or stdout).strip()}"
+        return True, ""
+
+    def _restart_if_present(self, name):
+        if self.query(name) == NOT_FOUND:
+            return True, "служба уже удалена"
+        return self._start(name)
+
+    def _describe(self, name):
+        stdout, stderr = self._sc(f'sc description "{name}" "Zapret DPI bypass software"')
+        return ("SUCCESS" in stdout), (stderr or stdout).strip()
+
+    # --- Планы ---
+    def plan_install(self, bin_path, current):
+        """Минимальный набор шагов, чтобы служба работала с заданным binPath."""
+        name = self.service_manager.service_name
+        steps = []
+        if not current.exists:
+            steps.append(Step(f"create {name}", lambda: self._create(name, bin_path),
+                              undo=lambda: self._delete(name)))
+            steps.append(Step(f"description {name}", lambda: self._describe(name), after=[f"create {name}"]))
+            steps.append(Step(f"start {name}", lambda: self._start(name), after=[f"create {name}"],
+                              undo=lambda: self._stop(name)))
+            return steps
+
+        same_path = _same_command_line(current.bin_path, bin_path)
+        old_start = (current.start_type or "AUTO").lower()
+        start_after = []
+        if not same_path or old_start != "auto":
+            old_path = current.bin_path
+            steps.append(Step(f"config {name}", lambda: self._configure(name, bin_path),
+                              undo=(lambda: self._configure(name, old_path, old_start)) if old_path else None))
+            start_after.append(f"config {name}")
+        if current.active and not same_path:
+            # Новый binPath вступит в силу только после перезапуска; sc config не ждет остановки.
+            # Шаг стоит перед config в плане, чтобы при откате сначала вернуть старый binPath
+            steps.insert(0, Step(f"stop {name}", lambda: self._stop(name), undo=lambda: self._start(name)))
+            start_after.append(f"stop {name}")
+        if not current.active or not same_path:
+            steps.append(Step(f"start {name}", lambda: self._start(name), after=start_after,
+                              undo=lambda: self._stop(name)))
+        return steps
+
+    def plan_uninstall(self, current):
+        """Остановка и удаление существующих служб; драйвер WinDivert - после остановки winws."""
+        name = self.service_manager.service_name
+        steps = []
+        service = current.get(name)
+        driver_after = []
+        if service and service.exists:
+            if service.state != STOPPED:
+                steps.append(Step(f"stop {name}", lambda: self._stop(name),
+                                  undo=(lambda: self._restart_if_present(name)) if service.active else None))
+                driver_after.append(f"stop {name}")
+            steps.append(Step(f"delete {name}", lambda: self._delete(name), after=list(driver_after)))
+        for driver in DRIVER_SERVICES:
+            state = current.get(driver)
+            if not state or not state.exists:
+                continue
+            after = list(driver_after)
+            if state.state != STOPPED:
+                steps.append(Step(f"stop {driver}", lambda d=driver: self._stop(d), after=driver_after))
+                after.append(f"stop {driver}")
+            steps.append(Step(f"delete {driver}", lambda d=driver: self._delete(d), after=after))
+        return steps
+
+    # --- Выполнение ---
+    def execute(self, steps, report):
+        """
+        Выполняет шаги с учетом зависимостей. При первой ошибке новые шаги не
+        запускаются, уже выполненные откатываются в обратном порядке.
+        """
+        pending = list(steps)
+        done = []
+        finished = set()
+        failed = False
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                if not failed:
+                    for step in [s for s in pending if all(dep in finished for dep in s.after)]:
+                        pending.remove(step)
+                        running[executor.submit(self._timed, step.run)] = step
+                if not running:
+                    break
+                completed, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    step = running.pop(future)
+                    (success, message), duration = future.result()
+                    SERVICE_STEP_LATENCY.observe(duration, step=step.name.split()[0])
+                    report.add(StepResult(step.name, "ok" if success else "failed", message, duration))
+                    if success:
+                        done.append(step)
+                        finished.add(step.name)
+                    else:
+                        failed = True
+        for step in pending:
+            report.add(StepResult(step.name, "skipped"))
+        if failed:
+            report.success = False
+            # Откат в порядке, обратном плану (не порядку завершения параллельных шагов)
+            for step in reversed([s for s in steps if s in done]):
+                if step.undo is None:
+                    continue
+                (success, message), duration = self._timed(step.undo)
+                report.add(StepResult(f"undo {step.name}", "rolled back" if success else "rollback failed",
+                                      message, duration))
+        return report.success
+
+    @staticmethod
+    def _timed(func):
+        started = time.perf_counter()
+        try:
+            result = func()
+        except Exception as e:
+            result = (False, str(e))
+        return result, time.perf_counter() - started
+
+    def _query(self, report, snapshot):
+        """
+        Опрос состояния перед планированием. Возвращает {имя: ServiceState} или None,
+        если опрос не удался или состояние какой-то службы не распознано: по UNKNOWN
+        нельзя понять, есть ли служба, а план для отсутствующей начнется с sc create.
+        """
+        current, duration = self._timed(snapshot)
+        if isinstance(current, tuple):
+            report.add(StepResult("query", "failed", current[1], duration))
+        else:
+            unknown = [name for name, state in current.items() if state.state == UNKNOWN]
+            if not unknown:
+                report.add(StepResult("query", "ok", "", duration))
+                return current
+            report.add(StepResult("query", "failed", f"состояние не распознано: {', '.join(unknown)}", duration))
+        report.success = False
+        return None
+
+    def install(self, bin_path):
+        """Приводит службу к работе с binPath. Возвращает PipelineReport."""
+        started = time.perf_counter()
+        name = self.service_manager.service_name
+        report = PipelineReport("install")
+        current = self._query(report, lambda: self.snapshot([name], with_config=[name]))
+        if current is None:
+            report.message = "Не удалось определить состояние службы, установка отменена."
+            report.duration = time.perf_counter() - started
+            return report
+        steps = self.plan_install(bin_path, current[name])
+        if not steps:
+            report.message = "Служба уже установлена с этим профилем и запущена."
+        elif self.execute(steps, report):
+            report.message = "Служба установлена и запущена."
+        else:
+            report.message = "Не удалось установить службу, изменения отменены."
+        report.duration = time.perf_counter() - started
+        return report
+
+    def uninstall(self):
+        """Останавливает и удаляет zapret и драйверы WinDivert. Возвращает PipelineReport."""
+        started = time.perf_counter()
+        names = [self.service_manager.service_name, *DRIVER_SERVICES]
+        report = PipelineReport("uninstall")
+        current = self._query(report, lambda: self.snapshot(names))
+        if current is None:
+            report.message = "Не удалось определить состояние служб, удаление отменено."
+            report.duration = time.perf_counter() - started
+            return report
+        steps = self.plan_uninstall(current)
+        if not steps:
+            report.message = "Службы zapret и WinDivert не установлены."
+        elif self.execute(steps, report):
+            report.message = "Все службы (zapret, WinDivert) успешно удалены."
+        else:
+            report.message = "Не удалось удалить службы."
+        report.duration = time.perf_counter() - started
+        return report
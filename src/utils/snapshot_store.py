@@ -0,0 +1,347 @@
+import glob
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import zlib
+
+from utils.list_files import LISTS_LOCK
+
+CHUNK_SIZE = 1024 * 1024
+
+# Что входит в снимок (пути относительно корня программы)
+DEFAULT_PATTERNS = ("lists/**/*", "bin/*.enabled", "config.json", "general*.bat")
+# Файлы, которые программа создает сама, в снимок не входят: восстановление не должно
+# подменять кэши и варианты ipset (IpsetSwitch) или удалять открытые базы
+# Сколько автоматических снимков (перед обновлением, заменой и правкой списков) хранить
+DEFAULT_KEEP_AUTO = 30
+EXCLUDED_SUFFIXES = (".cache", ".backup", ".stub", ".tmp", ".restore-tmp", ".restore-bak",
+                     ".sqlite3", ".sqlite3-wal", ".sqlite3-shm")
+
+
+class SnapshotStore:
+    """
+    Контентно-адресуемое хранилище снимков конфигурации.
+
+    backups/objects/ab/<sha256>  - сжатое zlib содержимое файла, хранится один раз
+    backups/snapshots/<id>.json  - манифест: относительный путь -> [sha256, размер]
+    backups/index.json           - кэш хэшей по (размер, mtime), чтобы не перечитывать неизменные файлы
+
+    Автоматические снимки (auto=True) после создания прореживаются до keep_auto
+    последних; снимки, созданные вручную, не удаляются.
+
+    Снимки создаются, восстанавливаются и удаляются из разных потоков (вкладка,
+    API, автоснимок перед изменениями), поэтому эти операции и общий индекс
+    защищены одной блокировкой.
+    """
+    def __init__(self, root_dir=".", store_dir="backups", patterns=DEFAULT_PATTERNS, keep_auto=DEFAULT_KEEP_AUTO):
+        self.root_dir = os.path.abspath(root_dir)
+        self.store_dir = os.path.join(self.root_dir, store_dir)
+        self.objects_dir = os.path.join(self.store_dir, "objects")
+        self.snapshots_dir = os.path.join(self.store_dir, "snapshots")
+        self.index_path = os.path.join(self.store_dir, "index.json")
+        self.patterns = patterns
+        self.keep_auto = keep_auto
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.snapshots_dir, exist_ok=True)
+        self._index = self._load_index()
+        # RLock: prune и delete_snapshot вызывают collect_garbage под той же блокировкой
+        self._lock = threading.RLock()
+
+    # --- Снимки ---
+    def create_snapshot(self, label="", auto=False):
+        """
+        Создает снимок текущих файлов. auto - снимок сделан программой перед
+        изменением; старые автоматические снимки сверх keep_auto удаляются.
+        Возвращает (success, message).
+        """
+        with self._lock:
+            success, message = self._create_snapshot(label, auto)
+            if success and auto and self.keep_auto:
+                self.prune(self.keep_auto, auto_only=True)
+            return success, message
+
+    def _create_snapshot(self, label, auto):
+        try:
+            files = {}
+            new_blobs = 0
+            for rel_path in self.collect_files():
+                digest, size, stored = self._store_file(rel_path)
+                files[rel_path] = [digest, size]
+                new_blobs += stored
+
+            snapshot_id = self._new_snapshot_id()
+            manifest = {"id": snapshot_id, "created": time.time(), "label": label, "auto": auto, "files": files}
+            self._write_atomic(os.path.join(self.snapshots_dir, f"{snapshot_id}.json"),
+                               json.dumps(manifest, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+            self._save_index()
+            return True, f"Снимок {snapshot_id} создан: файлов {len(files)}, новых объектов {new_blobs}."
+        except OSError as e:
+            return False, f"Не удалось создать снимок: {e}"
+
+    def list_snapshots(self):
+        """Возвращает манифесты (без списка файлов) от новых к старым."""
+        snapshots = []
+        for path in glob.glob(os.path.join(self.snapshots_dir, "*.json")):
+            manifest = self._read_manifest(path)
+            if manifest is None:
+                continue
+            files = manifest.get("files", {})
+            snapshots.append({
+                "id": manifest["id"],
+                "created": manifest.get("created", 0),
+                "label": manifest.get("label", ""),
+                "auto": manifest.get("auto", False),
+                "file_count": len(files),
+                "total_size": sum(size for _, size in files.values()),
+            })
+        snapshots.sort(key=lambda s: s["created"], reverse=True)
+        return snapshots
+
+    def restore_snapshot(self, snapshot_id):
+        """
+        Атомарно восстанавливает снимок: сначала все измененные файлы распаковываются
+        во временные рядом с целевыми, и только потом подменяются через os.replace.
+        Если подмена прервется, уже замененные файлы возвращаются обратно.
+        Возвращает (success, message).
+        """
+        with self._lock:
+            return self._restore_snapshot(snapshot_id)
+
+    def _restore_snapshot(self, snapshot_id):
+        manifest = self._read_manifest(os.path.join(self.snapshots_dir, f"{snapshot_id}.json"))
+        if manifest is None:
+            return False, f"Снимок {snapshot_id} не найден."
+        # Снимки старых версий могли захватить созданные программой файлы: их не восстанавливаем
+        target = {rel: entry for rel, entry in manifest["files"].items() if not self.is_excluded(rel)}
+
+        staged = []   # (временный файл, целевой путь, sha256)
+        removals = [rel for rel in self.collect_files() if rel not in target]
+        try:
+            for rel_path, (digest, _) in target.items():
+                full_path = self._full_path(rel_path)
+                if os.path.exists(full_path) and self._hash_cached(rel_path) == digest:
+                    continue  # Файл не изменился - не трогаем
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                tmp_path = full_path + ".restore-tmp"
+                self._extract_blob(digest, tmp_path)
+                staged.append((tmp_path, full_path, digest))
+        except (OSError, ValueError, zlib.error) as e:
+            for tmp_path, _, _ in staged:
+                self._remove_quietly(tmp_path)
+            return False, f"Не удалось подготовить восстановление: {e}"
+
+        committed = []  # (целевой путь, путь резервной копии или None)
+        # Подмена идет под LISTS_LOCK, чтобы не смешаться с записью списков в других потоках
+        with LISTS_LOCK:
+            try:
+                for tmp_path, full_path, _ in staged:
+                    backup = self._move_aside(full_path)
+                    committed.append((full_path, backup))
+                    os.replace(tmp_path, full_path)
+                for rel_path in removals:
+                    full_path = self._full_path(rel_path)
+                    committed.append((full_path, self._move_aside(full_path)))
+            except OSError as e:
+                for full_path, backup in reversed(committed):
+                    if backup:
+                        os.replace(backup, full_path)
+                    else:
+                        self._remove_quietly(full_path)
+                for tmp_path, _, _ in staged:
+                    self._remove_quietly(tmp_path)
+                return False, f"Восстановление отменено, файлы возвращены: {e}"
+
+        for _, backup in committed:
+            if backup:
+                self._remove_quietly(backup)
+        for _, full_path, digest in staged:
+            self._remember(os.path.relpath(full_path, self.root_dir).replace(os.sep, "/"), digest)
+        for rel_path in removals:
+            self._index.pop(rel_path, None)
+        self._save_index()
+        return True, (f"Снимок {snapshot_id} восстановлен: изменено {len(staged)}, "
+                      f"удалено {len(removals)}, без изменений {len(target) - len(staged)}.")
+
+    def delete_snapshot(self, snapshot_id):
+        """Удаляет манифест снимка и объекты, на которые больше никто не ссылается."""
+        path = os.path.join(self.snapshots_dir, f"{snapshot_id}.json")
+        with self._lock:
+            if not os.path.exists(path):
+                return False, f"Снимок {snapshot_id} не найден."
+            os.remove(path)
+            removed = self.collect_garbage()
+        return True, f"Снимок {snapshot_id} удален, освобождено объектов: {removed}."
+
+    def prune(self, keep, auto_only=False):
+        """Оставляет только keep последних снимков (auto_only - только среди автоматических)."""
+        with self._lock:
+            snapshots = [s for s in self.list_snapshots() if s["auto"] or not auto_only]
+            for snapshot in snapshots[keep:]:
+                self._remove_quietly(os.path.join(self.snapshots_dir, f"{snapshot['id']}.json"))
+            return self.collect_garbage()
+
+    def collect_garbage(self):
+        """Удаляет объекты, не упомянутые ни в одном манифесте. Возвращает их количество."""
+        with self._lock:
+            referenced = set()
+            for path in glob.glob(os.path.join(self.snapshots_dir, "*.json")):
+                manifest = self._read_manifest(path)
+                if manifest:
+                    referenced.update(digest for digest, _ in manifest["files"].values())
+            removed = 0
+            for path in glob.glob(os.path.join(self.objects_dir, "*", "*")):
+                if os.path.basename(path) not in referenced:
+                    self._remove_quietly(path)
+                    removed += 1
+            return removed
+
+    def collect_files(self):
+        """Список относительных путей (через '/') файлов, попадающих в снимок."""
+        found = set()
+        for pattern in self.patterns:
+            for path in glob.glob(os.path.join(self.root_dir, pattern), recursive=True):
+                if os.path.isfile(path) and not self.is_excluded(path):
+                    found.add(os.path.relpath(path, self.root_dir).replace(os.sep, "/"))
+        return sorted(found)
+
+    @staticmethod
+    def is_excluded(path):
+        return path.endswith(EXCLUDED_SUFFIXES)
+
+    # --- Объекты ---
+    def _store_file(self, rel_path):
+        """
+        Сохраняет файл в хранилище, если его содержимого там еще нет. Возвращает (sha256, размер, записан_ли).
+        Хэш считается по тем же байтам, что сжимаются в объект: если файл подменят
+        во время чтения, объект все равно будет назван по своему содержимому.
+        """
+        full_path = self._full_path(rel_path)
+        stat = os.stat(full_path)
+        cached = self._index.get(rel_path)
+        if (cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns
+                and os.path.exists(self._blob_path(cached[2]))):
+            return cached[2], cached[0], False
+
+        compressor = zlib.compressobj(6)
+        hasher = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=self.objects_dir)
+        try:
+            with open(full_path, 'rb') as src, os.fdopen(fd, 'wb') as dst:
+                for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+                    hasher.update(chunk)
+                    size += len(chunk)
+                    dst.write(compressor.compress(chunk))
+                dst.write(compressor.flush())
+            digest = hasher.hexdigest()
+            blob_path = self._blob_path(digest)
+            stored = not os.path.exists(blob_path)
+            if stored:
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                os.replace(tmp_path, blob_path)
+            else:
+                self._remove_quietly(tmp_path)
+        except BaseException:
+            self._remove_quietly(tmp_path)
+            raise
+        # В кэш хэшей - только если файл не менялся, пока его читали
+        after = os.stat(full_path)
+        if after.st_size == stat.st_size == size and after.st_mtime_ns == stat.st_mtime_ns:
+            self._index[rel_path] = [size, stat.st_mtime_ns, digest]
+        return digest, size, stored
+
+    def _extract_blob(self, digest, dest_path):
+        decompressor = zlib.decompressobj()
+        hasher = hashlib.sha256()
+        with open(self._blob_path(digest), 'rb') as src, open(dest_path, 'wb') as dst:
+            for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+                data = decompressor.decompress(chunk)
+                hasher.update(data)
+                dst.write(data)
+            tail = decompressor.flush()
+            hasher.update(tail)
+            dst.write(tail)
+        if hasher.hexdigest() != digest:
+            raise ValueError(f"Объект {digest} поврежден.")
+
+    def _blob_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    # --- Кэш хэшей ---
+    def _hash_cached(self, rel_path):
+        """sha256 файла; пересчитывается только если изменились размер или mtime."""
+        stat = os.stat(self._full_path(rel_path))
+        cached = self._index.get(rel_path)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+        hasher = hashlib.sha256()
+        with open(self._full_path(rel_path), 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                hasher.update(chunk)
+        digest = hasher.hexdigest()
+        self._index[rel_path] = [stat.st_size, stat.st_mtime_ns, digest]
+        return digest
+
+    def _remember(self, rel_path, digest):
+        stat = os.stat(self._full_path(rel_path))
+        self._index[rel_path] = [stat.st_size, stat.st_mtime_ns, digest]
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def _save_index(self):
+        self._write_atomic(self.index_path,
+                           json.dumps(self._index, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+    # --- Вспомогательные ---
+    def _full_path(self, rel_path):
+        return os.path.join(self.root_dir, *rel_path.split("/"))
+
+    def _read_manifest(self, path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def _move_aside(self, full_path):
+        if not os.path.exists(full_path):
+            return None
+        backup = full_path + ".restore-bak"
+        os.replace(full_path, backup)
+        return backup
+
+    def _new_snapshot_id(self):
+        """Время с миллисекундами; если такой снимок уже есть, добавляется номер."""
+        now = time.time()
+        base = time.strftime("%Y%m%d-%H%M%S", time.localtime(now)) + f"-{int(now * 1000) % 1000:03d}"
+        snapshot_id = base
+        n = 1
+        while os.path.exists(os.path.join(self.snapshots_dir, f"{snapshot_id}.json")):
+            n += 1
+            snapshot_id = f"{base}-{n}"
+        return snapshot_id
+
+    def _write_atomic(self, path, data):
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp",
+                                        dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            self._remove_quietly(tmp_path)
+            raise
+
+    def _remove_quietly(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,202 @@
+import threading
+import time
+
+import psutil
+
+WINWS_PROCESS_NAME = "winws.exe"
+# Если winws.exe не найден, полный обход процессов повторяется не чаще раза в столько секунд
+WINWS_RESCAN_INTERVAL = 2.0
+# Сколько секунд после операции со службой ее запуск считается запрошенным:
+# `sc start` возвращается в START_PENDING, и RUNNING опрос может увидеть позже
+EXPECTED_START_GRACE = 15.0
+
+
+class StatusCache:
+    """
+    Хранит последний снимок состояния службы, процесса и флагов.
+    Обновляется одним опросчиком (задача "status" в TimerScheduler или headless-цикл),
+    все остальные читатели получают готовый снимок без запуска `sc`.
+    """
+    def __init__(self, service_manager, config_manager, settings_manager=None):
+        self.service_manager = service_manager
+        self.config_manager = config_manager
+        self.settings_manager = settings_manager
+        self._lock = threading.Lock()
+        # refresh() зовут и планировщик операций, и таймер GUI: счетчики переходов общие
+        self._refresh_lock = threading.Lock()
+        self._snapshot = {}
+        self._listeners = []
+
+        # Учет аптайма и перезапусков по переходам состояния между опросами.
+        # Перезапуск - только неожиданный переход "остановлен -> запущен": запуски,
+        # пришедшие во время операции планировщика или сразу после нее, не считаются
+        self._running_since = None
+        self._was_running = None        # None - опросов еще не было
+        self._restarts = 0
+        self._operations = 0
+        self._expected_until = 0.0
+        self._winws_process = None
+        self._winws_missed_at = None
+        # Падение и перезапуск winws в ручном режиме отражаются в снимке сразу, без ожидания опроса
+        service_manager.supervisor_listeners.append(self._on_supervisor_event)
+
+    def refresh(self, full=True):
+        """
+        Опрашивает службу и флаги, сохраняет и возвращает новый снимок.
+        full=False - облегченный фоновый опрос: тип запуска службы меняется
+        только нашими же операциями, поэтому `sc qc` не запускается и берется
+        из прошлого снимка.
+        """
+        with self._refresh_lock:
+            previous = self.snapshot()
+            service_status = self.service_manager.get_service_status()
+            manual_running = self.service_manager.is_manual_process_running()
+            now = time.time()
+
+            running = service_status == "RUNNING" or manual_running
+            if running and not self._was_running:
+                self._running_since = now
+                if self._was_running is not None and not self._start_expected():
+                    self._restarts += 1
+            elif not running:
+                self._running_since = None
+            self._was_running = running
+
+            snapshot = {
+                "service_status": service_status,
+                "start_type": (self.service_manager.get_service_start_type() if full or "start_type" not in previous
+                               else previous["start_type"]),
+                "manual_running": manual_running,
+                "manual_pid": self.service_manager.manual_process_pid,
+                "supervisor": self.service_manager.supervisor.stats() if self.service_manager.supervisor else None,
+                "is_admin": bool(self.service_manager.is_admin()),
+                "game_filter_enabled": self.config_manager.is_game_filter_enabled(),
+                "ipset_enabled": self.config_manager.is_ipset_enabled(),
+                "profile": self.service_manager.active_profile(service_status, manual_running),
+                "installed_profile": self.service_manager.installed_profile,
+                "selected_profile": self.get_selected_profile(),
+                "uptime": (now - self._running_since) if self._running_since else 0.0,
+                "restarts": self._restarts,
+                "network": previous.get("network"),     # Задается NetworkProfileManager через update()
+                "updated_at": now,
+            }
+            snapshot.update(self._collect_winws_stats(running))
+            with self._lock:
+                self._snapshot = snapshot
+            self._notify(snapshot)
+            return dict(snapshot)
+
+    def begin_operation(self):
+        """Вызывается планировщиком перед операцией со службой."""
+        with self._lock:
+            self._operations += 1
+
+    def end_operation(self):
+        """Вызывается после операции и опроса: запуск в ближайшие EXPECTED_START_GRACE с - ожидаемый."""
+        with self._lock:
+            self._operations = max(self._operations - 1, 0)
+            self._expected_until = time.monotonic() + EXPECTED_START_GRACE
+
+    def _start_expected(self):
+        with self._lock:
+            return self._operations > 0 or time.monotonic() < self._expected_until
+
+    def update(self, **changes):
+        """Точечно обновляет снимок (например, после переключения флага) без полного опроса."""
+        with self._lock:
+            snapshot = dict(self._snapshot)
+            snapshot.update(changes)
+            snapshot["updated_at"] = time.time()
+            self._snapshot = snapshot
+        self._notify(snapshot)
+        return dict(snapshot)
+
+    def _on_supervisor_event(self, event, stats):
+        if self.snapshot():
+            self.update(manual_running=stats["state"] in ("running", "backoff"),
+                        manual_pid=stats["pid"] if stats["state"] == "running" else None, supervisor=stats)
+
+    def snapshot(self):
+        """Возвращает копию последнего снимка. Пустой словарь, если опроса еще не было."""
+        with self._lock:
+            return dict(self._snapshot)
+
+    def add_listener(self, callback):
+        """Подписывает callback(snapshot) на каждое обновление снимка."""
+        self._listeners.append(callback)
+
+    def get_selected_profile(self):
+        """Возвращает имя выбранного .bat профиля из настроек."""
+        if not self.settings_manager:
+            return None
+        filter_settings = self.settings_manager.get_setting("filter", {}).get("settings", {})
+        return filter_settings.get("selected_profile")
+
+    def collect_metrics(self):
+        """Коллектор для MetricsRegistry: метрики из последнего снимка, без новых опросов."""
+        snapshot = self.snapshot()
+        if not snapshot:
+            return []
+        samples = [
+            ("zapret_service_up", "gauge", "Служба zapret запущена (1) или нет (0).", {},
+             snapshot["service_status"] == "RUNNING"),
+            ("zapret_manual_process_up", "gauge", "Ручной запуск активен (1) или нет (0).", {},
+             snapshot["manual_running"]),
+            ("zapret_uptime_seconds", "gauge", "Время работы обхода с последнего запуска.", {},
+             snapshot["uptime"]),
+            ("zapret_restarts_total", "counter", "Неожиданные перезапуски обхода (не по команде), замеченные опросом.", {},
+             snapshot["restarts"]),
+            ("zapret_game_filter_enabled", "gauge", "Игровой фильтр включен.", {},
+             snapshot["game_filter_enabled"]),
+            ("zapret_ipset_enabled", "gauge", "IPset включен.", {}, snapshot["ipset_enabled"]),
+            ("zapret_status_updated_timestamp_seconds", "gauge", "Время последнего опроса состояния.", {},
+             snapshot["updated_at"]),
+        ]
+        if snapshot.get("winws_pid"):
+            samples.extend([
+                ("zapret_winws_cpu_percent", "gauge", "Загрузка CPU процессом winws.exe.", {},
+                 snapshot["winws_cpu_percent"]),
+                ("zapret_winws_rss_bytes", "gauge", "Резидентная память процесса winws.exe.", {},
+                 snapshot["winws_rss"]),
+            ])
+        return samples
+
+    def _collect_winws_stats(self, running):
+        """CPU и RSS процесса winws.exe. Объект psutil.Process переиспользуется между опросами."""
+        empty = {"winws_pid": None, "winws_cpu_percent": None, "winws_rss": None}
+        if not running:
+            self._winws_process = None
+            return empty
+        try:
+            process = self._winws_process
+            if process is None or not process.is_running():
+                # Пока служба запускается, процесса еще нет: не обходим все процессы на каждом снимке
+                if self._winws_missed_at and time.monotonic() - self._winws_missed_at < WINWS_RESCAN_INTERVAL:
+                    return empty
+                process = self._find_winws_process()
+                self._winws_process = process
+                self._winws_missed_at = None if process else time.monotonic()
+            if process is None:
+                return empty
+            with process.oneshot():
+                return {
+                    "winws_pid": process.pid,
+                    "winws_cpu_percent": process.cpu_percent(interval=None),
+                    "winws_rss": process.memory_info().rss,
+                }
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            self._winws_process = None
+            return empty
+
+    def _find_winws_process(self):
+        for process in psutil.process_iter(['name']):
+            if (process.info.get('name') or "").lower() == WINWS_PROCESS_NAME:
+                return process
+        return None
+
+    def _notify(self, snapshot):
+        for callback in list(self._listeners):
+            try:
+                callback(dict(snapshot))
+            except Exception as e:
+                print(f"Status listener failed: {e}")
@@ -0,0 +1,287 @@
+"""
+Супервизор winws.exe для ручного режима.
+
+winws.exe запускается напрямую (аргументы берутся из .bat, как при установке
+службы), и поток супервизора блокируется на дескрипторе процесса - падение
+замечается сразу, без опроса `tasklist`. После падения процесс перезапускается
+с экспоненциальной задержкой; если падения идут подряд (crash loop),
+супервизор сдается, чтобы не крутить драйвер WinDivert впустую.
+
+Отдельный поток раз в probe_interval выполняет дешевую проверку трафика
+(TLS-рукопожатие с probe_host). Если процесс жив, а проверка несколько раз
+подряд не проходит при работающей сети, процесс считается зависшим и
+перезапускается.
+"""
+import socket
+import ssl
+import subprocess
+import threading
+import time
+from collections import deque
+
+from utils.metrics import SUPERVISOR_DOWNTIME, SUPERVISOR_MTBF, SUPERVISOR_RESTARTS
+
+STOPPED = "stopped"
+RUNNING = "running"
+BACKOFF = "backoff"
+CRASH_LOOP = "crash_loop"
+
+DEFAULT_SETTINGS = {
+    "backoff_initial": 1.0,      # Первая задержка перед перезапуском, сек
+    "backoff_max": 30.0,
+    "stable_after": 60.0,        # Столько секунд работы сбрасывают серию падений
+    "crash_loop_limit": 5,       # Столько падений за crash_loop_window - и супервизор сдается
+    "crash_loop_window": 120.0,
+    "probe_interval": 30.0,      # 0 - проверка трафика выключена
+    "probe_failures": 3,         # Подряд неудачных проверок до признания зависания
+    "probe_host": "discord.com",
+    "probe_port": 443,
+    "probe_timeout": 3.0,
+    "control_host": "1.1.1.1",   # Контроль сети: если недоступен и он, зависанием это не считается
+    "control_port": 53,
+}
+
+
+def tls_probe(host, port=443, timeout=3.0):
+    """TLS-рукопожатие с host. DPI обычно рвет именно его, поэтому это дешевый признак работы обхода."""
+    context = ssl.create_default_context()
+    try:
+        with socket.create_connection((host, port), timeout=timeout) as sock:
+            with context.wrap_socket(sock, server_hostname=host):
+                return True
+    except (OSError, ssl.SSLError):
+        return False
+
+
+def tcp_probe(host, port, timeout=3.0):
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+def launch_winws(command, cwd=None):
+    """Запускает winws.exe без окна консоли. command - полная командная строка."""
+    kwargs = {}
+    if hasattr(subprocess, "CREATE_NO_WINDOW"):
+        kwargs["creationflags"] = subprocess.CREATE_NO_WINDOW
+    return subprocess.Popen(command, cwd=cwd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL, **kwargs)
+
+
+class WinwsSupervisor:
+    """
+    Держит один процесс winws.exe запущенным. launcher(command) должен вернуть
+    объект с pid, wait(), poll() и kill() (subprocess.Popen). probe() - проверка
+    трафика, control_probe() - проверка сети без обхода; обе возвращают bool.
+    on_event(event, stats) вызывается из потока супервизора при запуске,
+    падении, зависании и отказе.
+    """
+    def __init__(self, command, cwd=None, settings=None, launcher=launch_winws,
+                 probe=None, control_probe=None, on_event=None):
+        self.command = command
+        self.cwd = cwd
+        self.settings = dict(DEFAULT_SETTINGS)
+        self.settings.update(settings or {})
+        self.launcher = launcher
+        self.probe = probe or (lambda: tls_probe(self.settings["probe_host"], self.settings["probe_port"],
+                                                 self.settings["probe_timeout"]))
+        self.control_probe = control_probe or (lambda: tcp_probe(
+            self.settings["control_host"], self.settings["control_port"], self.settings["probe_timeout"]))
+        self.on_event = on_event
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._process = None
+        self._thread = None
+        self._probe_thread = None
+        self._stall_killed = False
+        self.state = STOPPED
+        self.started_at = None          # Запуск текущего экземпляра (time.monotonic)
+        self.restarts = 0
+        self.failures = []              # (время, причина, код выхода, сколько проработал)
+        self.recent_failures = deque()  # Время падений в окне crash_loop_window
+        self.total_uptime = 0.0
+        self.total_downtime = 0.0
+        self.last_error = None
+
+    # --- Жизненный цикл ---
+    def start(self):
+        """Запускает процесс и поток наблюдения. Возвращает (success, message)."""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return True, "Супервизор уже запущен."
+            self._stop.clear()
+            self.recent_failures.clear()
+        success, message = self._launch()
+        if not success:
+            return False, message
+        self._thread = threading.Thread(target=self._watch, name="winws-supervisor", daemon=True)
+        self._thread.start()
+        if self.settings["probe_interval"] > 0:
+            self._probe_thread = threading.Thread(target=self._probe_loop, name="winws-probe", daemon=True)
+            self._probe_thread.start()
+        return True, f"winws.exe запущен под наблюдением (PID: {self.pid})"
+
+    def stop(self, timeout=10):
+        """Останавливает процесс без перезапуска."""
+        self._stop.set()
+        with self._lock:
+            process = self._process
+        if process is not None and process.poll() is None:
+            process.kill()
+        for thread in (self._thread, self._probe_thread):
+            if thread and thread is not threading.current_thread():
+                thread.join(timeout)
+        self._thread = self._probe_thread = None
+        return True, "Процесс winws.exe остановлен."
+
+    @property
+    def pid(self):
+        with self._lock:
+            return self._process.pid if self._process is not None else None
+
+    def is_running(self):
+        with self._lock:
+            return self._process is not None and self._process.poll() is None
+
+    def is_supervising(self):
+        """Процесс работает или ждет перезапуска."""
+        return self.state in (RUNNING, BACKOFF)
+
+    # --- Статистика ---
+    def mtbf(self):
+        """Среднее время работы между падениями, сек; None, если падений не было."""
+        if not self.failures:
+            return None
+        return self._uptime_now() / len(self.failures)
+
+    def _uptime_now(self):
+        uptime = self.total_uptime
+        if self.started_at is not None and self.state == RUNNING:
+            uptime += time.monotonic() - self.started_at
+        return uptime
+
+    def stats(self):
+        last = self.failures[-1] if self.failures else None
+        return {
+            "state": self.state,
+            "pid": self.pid,
+            "restarts": self.restarts,
+            "failures": len(self.failures),
+            "last_failure": {"reason": last[1], "exit_code": last[2], "uptime": round(last[3], 1)} if last else None,
+            "uptime_total": self._uptime_now(),
+            "downtime_total": self.total_downtime,
+            "mtbf": self.mtbf(),
+            "error": self.last_error,
+        }
+
+    # --- Внутреннее ---
+    def _launch(self):
+        # Запуск под блокировкой: stop() выставляет флаг до захвата блокировки, поэтому
+        # либо здесь виден флаг, либо stop() увидит новый процесс и завершит его
+        with self._lock:
+            if self._stop.is_set():
+                self.state = STOPPED
+                return False, "Супервизор остановлен."
+            try:
+                process = self.launcher(self.command, cwd=self.cwd)
+            except OSError as e:
+                self.last_error = f"Не удалось запустить winws.exe: {e}"
+                self.state = STOPPED
+                return False, self.last_error
+            self._process = process
+            self._stall_killed = False
+        self.started_at = time.monotonic()
+        self.state = RUNNING
+        self.last_error = None
+        self._emit("started")
+        return True, ""
+
+    def _watch(self):
+        while True:
+            with self._lock:
+                process = self._process
+            exit_code = process.wait()          # Блокируется на дескрипторе процесса
+            uptime = time.monotonic() - self.started_at
+            self.started_at = None
+            self.total_uptime += uptime
+            if self._stop.is_set():
+                self.state = STOPPED
+                self._emit("stopped")
+                return
+            crashed_at = time.monotonic()
+            reason = "stall" if self._stall_killed else "exit"
+            self._record_failure(reason, exit_code, uptime)
+            delay = self._next_delay(uptime)
+            if delay is None:
+                self.state = CRASH_LOOP
+                self.last_error = (f"winws.exe падал {len(self.recent_failures)} раз за "
+                                   f"{self.settings['crash_loop_window']:.0f} с, перезапуск остановлен")
+                self._emit("crash_loop")
+                return
+            self.state = BACKOFF
+            self._emit("crashed")
+            if self._stop.wait(delay):
+                self.state = STOPPED
+                self._emit("stopped")
+                return
+            success, _ = self._launch()
+            self.total_downtime += time.monotonic() - crashed_at
+            SUPERVISOR_DOWNTIME.inc(time.monotonic() - crashed_at)
+            if not success:
+                self._emit("stopped" if self._stop.is_set() else "failed")
+                return
+            self.restarts += 1
+            SUPERVISOR_RESTARTS.inc(reason=reason)
+
+    def _record_failure(self, reason, exit_code, uptime):
+        now = time.monotonic()
+        self.failures.append((time.time(), reason, exit_code, uptime))
+        if uptime >= self.settings["stable_after"]:
+            self.recent_failures.clear()  # Процесс долго работал: это не серия падений
+        self.recent_failures.append(now)
+        while self.recent_failures and now - self.recent_failures[0] > self.settings["crash_loop_window"]:
+            self.recent_failures.popleft()
+        SUPERVISOR_MTBF.set(self.mtbf())
+
+    def _next_delay(self, uptime):
+        """Задержка перед перезапуском или None, если достигнут предел падений."""
+        streak = len(self.recent_failures)
+        if streak >= self.settings["crash_loop_limit"]:
+            return None
+        return min(self.settings["backoff_initial"] * (2 ** (streak - 1)), self.settings["backoff_max"])
+
+    def _probe_loop(self):
+        failures = 0
+        while not self._stop.wait(self.settings["probe_interval"]):
+            if self.state != RUNNING:
+                failures = 0
+                continue
+            if self.probe():
+                failures = 0
+                continue
+            if not self.control_probe():
+                failures = 0  # Сети нет вообще: перезапуск winws не поможет
+                continue
+            failures += 1
+            if failures >= self.settings["probe_failures"]:
+                failures = 0
+                self._kill_stalled()
+
+    def _kill_stalled(self):
+        with self._lock:
+            process = self._process
+            if process is None or process.poll() is not None:
+                return
+            self._stall_killed = True
+        self._emit("stalled")
+        process.kill()  # Поток наблюдения увидит выход и перезапустит процесс
+
+    def _emit(self, event):
+        if self.on_event:
+            try:
+                self.on_event(event, self.stats())
+            except Exception as e:
+                print(f"Supervisor listener failed: {e}")
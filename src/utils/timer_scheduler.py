@@ -0,0 +1,93 @@
+"""
+Общий планировщик периодических задач GUI с учетом видимости окна.
+
+Задачи двух видов:
+    ui         - нужны только для отображения; пока окно скрыто (в трее или
+                 свернуто), их таймеры остановлены;
+    background - нужны и в фоне (опрос состояния для API и значка в трее);
+                 пока окно скрыто, их интервал растягивается.
+При показе окна все задачи один раз выполняются сразу, чтобы картинка была
+свежей. wake() выполняет задачу вне расписания - для реальных событий.
+"""
+from PySide6.QtCore import QObject, QTimer, Qt
+
+DEFAULT_HIDDEN_STRETCH = 20    # Во сколько раз реже фоновые задачи выполняются при скрытом окне
+
+
+class TimerJob:
+    def __init__(self, name, callback, interval, background, hidden_interval, timer):
+        self.name = name
+        self.callback = callback
+        self.interval = interval
+        self.background = background
+        self.hidden_interval = hidden_interval
+        self.timer = timer
+        self.runs = 0
+
+
+class TimerScheduler(QObject):
+    def __init__(self, parent=None, hidden_stretch=DEFAULT_HIDDEN_STRETCH):
+        super().__init__(parent)
+        self.hidden_stretch = hidden_stretch
+        self.visible = True
+        self._jobs = {}
+
+    def add(self, name, callback, interval, background=False, hidden_interval=None):
+        """
+        Регистрирует задачу callback() с интервалом interval мс. Для фоновых задач
+        hidden_interval - интервал при скрытом окне (по умолчанию interval * hidden_stretch).
+        """
+        self.remove(name)
+        timer = QTimer(self)
+        # Грубые таймеры ОС может объединять с другими пробуждениями
+        timer.setTimerType(Qt.TimerType.VeryCoarseTimer if background else Qt.TimerType.CoarseTimer)
+        job = TimerJob(name, callback, interval, background, hidden_interval, timer)
+        timer.timeout.connect(lambda: self._run(job))
+        self._jobs[name] = job
+        self._apply(job)
+        return job
+
+    def remove(self, name):
+        job = self._jobs.pop(name, None)
+        if job:
+            job.timer.stop()
+            job.timer.deleteLater()
+
+    def set_visible(self, visible):
+        """Вызывается окном при показе/скрытии."""
+        if visible == self.visible:
+            return
+        self.visible = visible
+        for job in self._jobs.values():
+            self._apply(job)
+            if visible:
+                self.wake(job.name)
+
+    def wake(self, name):
+        """Выполняет задачу в ближайшем цикле событий (для ui-задач - только при видимом окне)."""
+        job = self._jobs.get(name)
+        if job and (self.visible or job.background):
+            QTimer.singleShot(0, lambda: self._run(job))
+
+    def current_interval(self, name):
+        """Действующий интервал задачи в мс или None, если она приостановлена."""
+        job = self._jobs.get(name)
+        return job.timer.interval() if job and job.timer.isActive() else None
+
+    def stats(self):
+        return {name: {"background": job.background, "interval": self.current_interval(name), "runs": job.runs}
+                for name, job in self._jobs.items()}
+
+    def _apply(self, job):
+        if self.visible:
+            job.timer.start(job.interval)
+        elif job.background:
+            job.timer.start(job.hidden_interval or job.interval * self.hidden_stretch)
+        else:
+            job.timer.stop()
+
+    def _run(self, job):
+        if job.name not in self._jobs:
+            return
+        job.runs += 1
+        job.callback()
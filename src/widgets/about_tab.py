@@ -1,10 +1,11 @@
 import webbrowser
 from PySide6.QtWidgets import (QWidget, QVBoxLayout, QLabel, QPushButton, 
-                               QGroupBox, QHBoxLayout)
+                               QGroupBox, QHBoxLayout, QProgressBar, QMessageBox)
 from PySide6.QtCore import QThread, Signal, Qt
 from PySide6.QtGui import QFont
 
 from utils.update_checker import UpdateChecker
+from utils.bundle_updater import BundleUpdater, DEFAULT_PARALLELISM
 
 # Определяем текущую версию здесь, чтобы она была в одном месте
 APP_VERSION = "1.8.0" 
@@ -27,11 +28,39 @@ class UpdateWorker(QThread):
                 self.result_ready.emit(False, message, None)
 
 
+class BundleUpdateWorker(QThread):
+    """Проверяет манифест и скачивает измененные файлы zapret в staging."""
+    progress = Signal(int)
+    finished = Signal(bool, str)
+
+    def __init__(self, updater):
+        super().__init__()
+        self.updater = updater
+
+    def run(self):
+        success, message, plan = self.updater.check()
+        if not success or plan.is_empty():
+            self.finished.emit(success, message)
+            return
+        self.progress.emit(0)
+        success, download_message = self.updater.download(
+            plan, progress_callback=lambda done, total: self.progress.emit(int(done * 100 / total)))
+        self.finished.emit(success, message + "\n" + download_message)
+
+
 class AboutTab(QWidget):
-    def __init__(self, parent=None):
+    # Результат операции планировщика приходит из его потока
+    bundle_update_applied = Signal(object)
+
+    def __init__(self, settings_manager=None, scheduler=None, parent=None):
         super().__init__(parent)
+        self.settings_manager = settings_manager
+        self.scheduler = scheduler
         self.worker = None
+        self.bundle_worker = None
+        self.bundle_updater = None
         self.release_url = None
+        self.bundle_update_applied.connect(self.on_bundle_update_applied)
         self.setup_ui()
 
     def setup_ui(self):
@@ -75,6 +104,22 @@ class AboutTab(QWidget):
         update_layout.addWidget(self.check_button)
         update_layout.addWidget(self.download_button)
         main_layout.addWidget(update_group)
+
+        # --- Bundle Update Group ---
+        bundle_group = QGroupBox("Файлы zapret")
+        bundle_layout = QVBoxLayout(bundle_group)
+        self.bundle_status_label = QLabel(
+            "Скачиваются только изменившиеся файлы bin/ и профилей; служба останавливается только на время замены.")
+        self.bundle_status_label.setWordWrap(True)
+        self.bundle_progress = QProgressBar()
+        self.bundle_progress.setVisible(False)
+        self.bundle_button = QPushButton("Обновить файлы zapret")
+        self.bundle_button.clicked.connect(self.update_bundle)
+        self.bundle_button.setEnabled(self.scheduler is not None)
+        bundle_layout.addWidget(self.bundle_status_label)
+        bundle_layout.addWidget(self.bundle_progress)
+        bundle_layout.addWidget(self.bundle_button)
+        main_layout.addWidget(bundle_group)
         
         main_layout.addStretch()
 
@@ -104,4 +149,45 @@ class AboutTab(QWidget):
 
     def open_release_page(self):
         if self.release_url:
-            webbrowser.open(self.release_url) 
\ No newline at end of file
+            webbrowser.open(self.release_url)
+
+    def update_bundle(self):
+        updater_settings = self.settings_manager.get_setting("updater", {}) if self.settings_manager else {}
+        manifest_url = updater_settings.get("manifest_url")
+        if not manifest_url:
+            self.bundle_status_label.setText('Адрес манифеста не задан: "updater" -> "manifest_url" в config.json.')
+            return
+        self.bundle_updater = BundleUpdater(manifest_url, public_key=updater_settings.get("public_key"),
+                                            parallelism=updater_settings.get("parallelism", DEFAULT_PARALLELISM))
+        self.bundle_button.setEnabled(False)
+        self.bundle_status_label.setText("Проверка манифеста...")
+        self.bundle_worker = BundleUpdateWorker(self.bundle_updater)
+        self.bundle_worker.progress.connect(self.on_bundle_progress)
+        self.bundle_worker.finished.connect(self.on_bundle_downloaded)
+        self.bundle_worker.start()
+
+    def on_bundle_progress(self, value):
+        self.bundle_progress.setVisible(True)
+        self.bundle_progress.setValue(value)
+
+    def on_bundle_downloaded(self, success, message):
+        self.bundle_progress.setVisible(False)
+        self.bundle_status_label.setText(message)
+        if not success or self.bundle_updater.staged is None:
+            self.bundle_button.setEnabled(True)
+            return
+        reply = QMessageBox.question(self, "Обновление", message + "\n\nЗаменить файлы сейчас? "
+                                     "Служба и ручной запуск будут ненадолго остановлены.")
+        if reply != QMessageBox.StandardButton.Yes:
+            self.bundle_button.setEnabled(True)
+            return
+        self.bundle_status_label.setText("Замена файлов...")
+        self.scheduler.submit("apply_update", self.bundle_updater,
+                              callback=lambda operation: self.bundle_update_applied.emit(operation.result))
+
+    def on_bundle_update_applied(self, result):
+        success, message = result
+        self.bundle_button.setEnabled(True)
+        self.bundle_status_label.setText(message)
+        if not success:
+            QMessageBox.critical(self, "Обновление", message)
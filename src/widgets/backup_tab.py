@@ -1,9 +1,135 @@
-from PySide6.QtWidgets import QWidget, QVBoxLayout, QLabel
+from datetime import datetime
+
+from PySide6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel,
+                               QGroupBox, QTableWidget, QTableWidgetItem, QHeaderView,
+                               QAbstractItemView, QInputDialog, QMessageBox)
+from PySide6.QtCore import Qt, QThread, Signal
+
+from utils.snapshot_store import SnapshotStore
+
+
+class SnapshotWorker(QThread):
+    """Создает, восстанавливает или удаляет снимок в фоновом потоке."""
+    finished = Signal(bool, str)
+
+    def __init__(self, action, store, data=None):
+        super().__init__()
+        self.action = action
+        self.store = store
+        self.data = data  # Метка нового снимка или id существующего
+
+    def run(self):
+        actions = {
+            "create": lambda: self.store.create_snapshot(self.data or ""),
+            "restore": lambda: self.store.restore_snapshot(self.data),
+            "delete": lambda: self.store.delete_snapshot(self.data),
+        }
+        try:
+            result, message = actions[self.action]()
+        except Exception as e:
+            result, message = False, f"Произошла ошибка: {e}"
+        self.finished.emit(result, message)
+
 
 class BackupTab(QWidget):
-    def __init__(self, parent=None):
+    def __init__(self, snapshot_store=None, parent=None):
         super().__init__(parent)
-        layout = QVBoxLayout(self)
-        label = QLabel("This is the Backup Tab. Content will be added here.")
-        layout.addWidget(label)
-        self.setLayout(layout) 
\ No newline at end of file
+        self.store = snapshot_store or SnapshotStore()
+        self.worker = None
+
+        self.setup_ui()
+        self.refresh_list()
+
+    def setup_ui(self):
+        main_layout = QVBoxLayout(self)
+        main_layout.setContentsMargins(20, 20, 20, 20)
+        main_layout.setSpacing(15)
+
+        description = QLabel(
+            "Снимки сохраняют списки, флаги из bin/, config.json и все профили general*.bat. "
+            "Одинаковые файлы хранятся один раз, поэтому снимки почти не занимают места."
+        )
+        description.setWordWrap(True)
+        description.setStyleSheet("color: #888;")
+        main_layout.addWidget(description)
+
+        snapshots_group = QGroupBox("Снимки")
+        snapshots_layout = QVBoxLayout(snapshots_group)
+
+        self.table = QTableWidget(0, 4)
+        self.table.setHorizontalHeaderLabels(["Дата", "Описание", "Файлов", "Размер"])
+        self.table.horizontalHeader().setSectionResizeMode(1, QHeaderView.ResizeMode.Stretch)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
+        self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table.verticalHeader().setVisible(False)
+        snapshots_layout.addWidget(self.table)
+
+        buttons_layout = QHBoxLayout()
+        self.create_button = QPushButton("Создать снимок")
+        self.restore_button = QPushButton("Восстановить")
+        self.delete_button = QPushButton("Удалить")
+        self.create_button.clicked.connect(self.create_snapshot)
+        self.restore_button.clicked.connect(self.restore_snapshot)
+        self.delete_button.clicked.connect(self.delete_snapshot)
+        buttons_layout.addWidget(self.create_button)
+        buttons_layout.addStretch()
+        buttons_layout.addWidget(self.restore_button)
+        buttons_layout.addWidget(self.delete_button)
+        snapshots_layout.addLayout(buttons_layout)
+
+        main_layout.addWidget(snapshots_group)
+
+    def refresh_list(self):
+        snapshots = self.store.list_snapshots()
+        self.table.setRowCount(len(snapshots))
+        for row, snapshot in enumerate(snapshots):
+            created = datetime.fromtimestamp(snapshot["created"]).strftime("%d.%m.%Y %H:%M:%S")
+            date_item = QTableWidgetItem(created)
+            date_item.setData(Qt.ItemDataRole.UserRole, snapshot["id"])
+            self.table.setItem(row, 0, date_item)
+            self.table.setItem(row, 1, QTableWidgetItem(snapshot["label"]))
+            self.table.setItem(row, 2, QTableWidgetItem(str(snapshot["file_count"])))
+            self.table.setItem(row, 3, QTableWidgetItem(f"{snapshot['total_size'] / 1024:.1f} КБ"))
+
+    def selected_snapshot_id(self):
+        row = self.table.currentRow()
+        if row < 0:
+            QMessageBox.information(self, "Снимки", "Выберите снимок в списке.")
+            return None
+        return self.table.item(row, 0).data(Qt.ItemDataRole.UserRole)
+
+    def create_snapshot(self):
+        label, ok = QInputDialog.getText(self, "Новый снимок", "Описание (необязательно):")
+        if ok:
+            self.run_operation("create", label)
+
+    def restore_snapshot(self):
+        snapshot_id = self.selected_snapshot_id()
+        if not snapshot_id:
+            return
+        reply = QMessageBox.question(self, "Восстановление",
+                                     "Текущие списки, флаги и профили будут заменены содержимым снимка. Продолжить?")
+        if reply == QMessageBox.StandardButton.Yes:
+            self.run_operation("restore", snapshot_id)
+
+    def delete_snapshot(self):
+        snapshot_id = self.selected_snapshot_id()
+        if snapshot_id:
+            self.run_operation("delete", snapshot_id)
+
+    def run_operation(self, action, data=None):
+        for button in (self.create_button, self.restore_button, self.delete_button):
+            button.setEnabled(False)
+        self.worker = SnapshotWorker(action, self.store, data)
+        self.worker.finished.connect(self.on_operation_finished)
+        self.worker.start()
+
+    def on_operation_finished(self, success, message):
+        for button in (self.create_button, self.restore_button, self.delete_button):
+            button.setEnabled(True)
+        if success:
+            QMessageBox.information(self, "Успех", message)
+        else:
+            QMessageBox.critical(self, "Ошибка", message)
+        self.refresh_list()
@@ -1,34 +1,43 @@
 import socket
-import subprocess
-from PySide6.QtWidgets import (QWidget, QVBoxLayout, QPushButton, QTextEdit, 
-                               QGroupBox, QSizePolicy)
+import time
+from PySide6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QTextEdit,
+                               QGroupBox, QSizePolicy, QMessageBox)
 from PySide6.QtCore import QThread, Signal, Qt
 from PySide6.QtGui import QFont, QColor
 
+from utils.conflict_scanner import ConflictScanner, clear_discord_cache, take_snapshot
 from utils.process_manager import ServiceManager
+from utils.metrics import DIAGNOSTICS_LAST, DIAGNOSTICS_LATENCY
+from utils.reachability import check_context
 
 class DiagnosticsWorker(QThread):
     """Выполняет диагностику в фоновом потоке."""
     progress = Signal(str)
     finished = Signal()
 
-    def __init__(self, service_manager):
+    def __init__(self, service_manager, scanner=None, history=None, context=None):
         super().__init__()
         self.service_manager = service_manager
+        self.scanner = scanner
+        self.history = history      # ReachabilityHistory для проверки доступа к сети
+        self.context = context      # () -> (профиль, сеть)
 
     def run(self):
         self.progress.emit("--- Начало диагностики ---")
 
         # 1. Проверка прав администратора
-        self.progress.emit("\n[1/4] Проверка прав доступа...")
-        if self.service_manager.is_admin():
+        self.progress.emit("\n[1/5] Проверка прав доступа...")
+        if self.timed("admin", self.service_manager.is_admin):
             self.progress.emit("    <font color='green'>OK:</font> Приложение запущено с правами администратора.")
         else:
             self.progress.emit("    <font color='orange'>ВНИМАНИЕ:</font> Приложение запущено без прав администратора. Некоторые проверки могут быть недоступны.")
 
+        # Один снимок процессов и служб на все проверки ниже
+        snapshot = self.timed("snapshot", take_snapshot, self.service_manager)
+
         # 2. Проверка статуса служб и процесса
-        self.progress.emit("\n[2/4] Проверка статуса служб и процесса...")
-        zapret_status = self.service_manager.get_service_status()
+        self.progress.emit("\n[2/5] Проверка статуса служб и процесса...")
+        zapret_status = self.timed("zapret_service", self.service_manager.get_service_status)
         if zapret_status == 'RUNNING':
             self.progress.emit("    <font color='green'>OK:</font> Служба 'zapret' запущена.")
         elif zapret_status == 'STOPPED':
@@ -38,60 +47,77 @@ class DiagnosticsWorker(QThread):
         
         # Проверка WinDivert (аналогично)
         windivert_manager = ServiceManager(service_name="WinDivert")
-        windivert_status = windivert_manager.get_service_status()
+        windivert_status = self.timed("windivert_service", windivert_manager.get_service_status)
         if windivert_status == 'RUNNING':
             self.progress.emit("    <font color='green'>OK:</font> Служба 'WinDivert' запущена.")
         else:
             self.progress.emit("    <font color='orange'>ВНИМАНИЕ:</font> Служба 'WinDivert' не найдена или не запущена.")
 
         # Проверка процесса winws.exe
-        if self.is_process_running("winws.exe"):
+        if snapshot.has_process("winws.exe"):
             self.progress.emit("    <font color='green'>OK:</font> Процесс 'winws.exe' активен.")
         else:
             self.progress.emit("    <font color='red'>ОШИБКА:</font> Процесс 'winws.exe' не найден в диспетчере задач.")
 
         # 3. Проверка сетевых портов
-        self.progress.emit("\n[3/4] Проверка сетевых портов...")
+        self.progress.emit("\n[3/5] Проверка сетевых портов...")
         ports_to_check = [53, 12345] # Пример портов (DNS, baddr)
         for port in ports_to_check:
-            if self.is_port_in_use(port):
+            if self.timed(f"port_{port}", self.is_port_in_use, port):
                 self.progress.emit(f"    <font color='orange'>ВНИМАНИЕ:</font> Порт {port} уже используется. Возможны конфликты.")
             else:
                 self.progress.emit(f"    <font color='green'>OK:</font> Порт {port} свободен.")
 
         # 4. Проверка доступа к сети
-        self.progress.emit("\n[4/4] Проверка доступа к сети...")
-        if self.check_internet_connection():
+        self.progress.emit("\n[4/5] Проверка доступа к сети...")
+        started = time.perf_counter()
+        online = self.timed("internet", self.check_internet_connection)
+        if self.history:
+            profile, network = self.context() if self.context else (None, None)
+            self.history.record([{"domain": "8.8.8.8", "port": 53, "ok": online,
+                                  "connect_ms": (time.perf_counter() - started) * 1000 if online else None,
+                                  "error": None if online else "TCP: нет ответа"}], profile, network)
+        if online:
             self.progress.emit("    <font color='green'>OK:</font> Доступ в Интернет есть.")
         else:
              self.progress.emit("    <font color='red'>ОШИБКА:</font> Нет доступа в Интернет.")
 
+        # 5. Конфликтующие программы
+        self.progress.emit("\n[5/5] Проверка конфликтующих программ...")
+        if self.scanner is None:
+            try:
+                self.scanner = ConflictScanner()
+            except (OSError, ValueError) as e:
+                self.progress.emit(f"    <font color='red'>ОШИБКА:</font> Не удалось загрузить правила: {e}")
+        if self.scanner is not None:
+            for finding in self.timed("conflicts", self.scanner.scan, snapshot):
+                self.emit_finding(finding)
+
         self.progress.emit("\n--- Диагностика завершена ---")
         self.finished.emit()
 
-    def is_process_running(self, process_name: str) -> bool:
-        """Проверяет, запущен ли процесс с заданным именем."""
+    def timed(self, check, func, *args):
+        """Выполняет проверку и записывает ее длительность в метрики."""
+        started = time.perf_counter()
         try:
-            # Используем tasklist, как в оригинальном скрипте
-            startupinfo = subprocess.STARTUPINFO()
-            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-            startupinfo.wShowWindow = subprocess.SW_HIDE
-
-            process = subprocess.Popen(
-                ['tasklist', '/FI', f'IMAGENAME eq {process_name}'],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                stdin=subprocess.PIPE,
-                startupinfo=startupinfo,
-                creationflags=subprocess.CREATE_NO_WINDOW
-            )
-            stdout, stderr = process.communicate()
-            return process_name.lower() in stdout.decode('utf-8', errors='ignore').lower()
-        except FileNotFoundError:
-            # Если tasklist не найден, можно попробовать psutil, если он есть
-            # Для соответствия service.bat, ограничимся tasklist
-            self.progress.emit("    <font color='orange'>INFO:</font> Команда 'tasklist' не найдена.")
-            return False
+            return func(*args)
+        finally:
+            elapsed = time.perf_counter() - started
+            DIAGNOSTICS_LATENCY.observe(elapsed, check=check)
+            DIAGNOSTICS_LAST.set(elapsed, check=check)
+
+    def emit_finding(self, finding):
+        rule = finding.rule
+        if finding.passed:
+            self.progress.emit(f"    <font color='green'>OK:</font> {rule.title}: проверка пройдена.")
+            return
+        label = {"error": "<font color='red'>[X]</font>", "warning": "<font color='orange'>[?]</font>",
+                 "info": "<font color='blue'>INFO:</font>"}[rule.severity]
+        self.progress.emit(f"    {label} {rule.message} ({', '.join(finding.evidence)})")
+        if rule.hint:
+            self.progress.emit(f"        {rule.hint}")
+        if rule.link:
+            self.progress.emit(f"        <a href='{rule.link}'>{rule.link}</a>")
 
     def is_port_in_use(self, port: int) -> bool:
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
@@ -107,9 +133,12 @@ class DiagnosticsWorker(QThread):
 
 
 class DiagnosticsTab(QWidget):
-    def __init__(self, parent=None):
+    def __init__(self, service_manager=None, settings_manager=None, history=None, status_cache=None, parent=None):
         super().__init__(parent)
-        self.service_manager = ServiceManager()
+        self.service_manager = service_manager or ServiceManager()
+        self.settings_manager = settings_manager
+        self.history = history
+        self.status_cache = status_cache
         self.worker = None
 
         self.setup_ui()
@@ -129,6 +158,14 @@ class DiagnosticsTab(QWidget):
         self.run_button.clicked.connect(self.run_diagnostics)
         control_layout.addWidget(self.run_button)
 
+        actions_layout = QHBoxLayout()
+        self.clear_discord_button = QPushButton("Очистить кэш Discord")
+        self.clear_discord_button.setToolTip("Закрывает Discord и удаляет папки Cache, Code Cache и GPUCache")
+        self.clear_discord_button.clicked.connect(self.clear_discord_cache)
+        actions_layout.addWidget(self.clear_discord_button)
+        actions_layout.addStretch()
+        control_layout.addLayout(actions_layout)
+
         main_layout.addWidget(control_group)
 
         # --- Output Group ---
@@ -146,7 +183,13 @@ class DiagnosticsTab(QWidget):
         self.run_button.setText("Диагностика выполняется...")
         self.output_text.clear()
 
-        self.worker = DiagnosticsWorker(self.service_manager)
+        try:
+            scanner = ConflictScanner.from_settings(self.settings_manager)
+        except (OSError, ValueError) as e:
+            self.output_text.append(f"<font color='red'>ОШИБКА:</font> Не удалось загрузить правила конфликтов: {e}")
+            scanner = None
+        self.worker = DiagnosticsWorker(self.service_manager, scanner, self.history,
+                                        lambda: check_context(self.status_cache))
         self.worker.progress.connect(self.output_text.append)
         self.worker.finished.connect(self.on_diagnostics_finished)
         self.worker.start()
@@ -154,4 +197,16 @@ class DiagnosticsTab(QWidget):
     def on_diagnostics_finished(self):
         self.run_button.setEnabled(True)
         self.run_button.setText("Начать полную диагностику")
-        self.worker = None 
\ No newline at end of file
+        self.worker = None
+
+    def clear_discord_cache(self):
+        reply = QMessageBox.question(self, "Кэш Discord",
+                                     "Discord будет закрыт, а его кэш удален. Продолжить?",
+                                     QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+        if reply != QMessageBox.StandardButton.Yes:
+            return
+        success, message = clear_discord_cache()
+        if success:
+            QMessageBox.information(self, "Кэш Discord", message)
+        else:
+            QMessageBox.warning(self, "Кэш Discord", message)
@@ -1,9 +1,197 @@
-from PySide6.QtWidgets import QWidget, QVBoxLayout, QLabel
+import time
+
+from PySide6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, QGroupBox, QPushButton,
+                               QPlainTextEdit, QTableWidget, QTableWidgetItem, QHeaderView, QCheckBox,
+                               QAbstractItemView)
+from PySide6.QtCore import QThread, Signal, Qt
+from PySide6.QtGui import QColor
+
+from utils.reachability import (ReachabilityChecker, ReachabilityHistory, check_context, DEFAULT_MAX_AGE,
+                                DEFAULT_PARALLELISM)
+
+DEFAULT_DOMAINS = ["discord.com", "gateway.discord.gg", "cdn.discordapp.com", "youtube.com", "i.ytimg.com",
+                   "www.google.com"]
+DEFAULT_INTERVAL = 15 * 60      # Повторная проверка, сек
+TREND_DAYS = 7
+
+
+class ReachabilityWorker(QThread):
+    """Проверяет домены (только устаревшие, если only_stale) и сворачивает старую историю."""
+    finished = Signal(object)   # список результатов probe_domain
+
+    def __init__(self, checker, domains, only_stale, max_age):
+        super().__init__()
+        self.checker = checker
+        self.domains = domains
+        self.only_stale = only_stale
+        self.max_age = max_age
+
+    def run(self):
+        results = self.checker.check(self.domains, self.only_stale, self.max_age)
+        self.checker.history.compact()
+        self.finished.emit(results)
+
 
 class DomainCheckerTab(QWidget):
-    def __init__(self, parent=None):
+    """
+    Проверка доступности доменов (DNS, TCP, TLS) с историей в SQLite: для каждого
+    домена видно последний результат и p95 TLS-рукопожатия по профилям за неделю.
+    """
+    COLUMNS = ("Домен", "Статус", "DNS, мс", "TCP, мс", "TLS, мс", f"p95 TLS за {TREND_DAYS} дн.", "Проверен")
+
+    def __init__(self, history=None, settings_manager=None, status_cache=None, timers=None, parent=None):
         super().__init__(parent)
-        layout = QVBoxLayout(self)
-        label = QLabel("This is the Domain Checker Tab. Content will be added here.")
-        layout.addWidget(label)
-        self.setLayout(layout) 
\ No newline at end of file
+        self.history = history or ReachabilityHistory()
+        self.settings_manager = settings_manager
+        self.status_cache = status_cache
+        self.timers = timers
+        self.settings = settings_manager.get_setting("reachability", {}) if settings_manager else {}
+        self.worker = None
+        self.last_results = {}
+
+        self.setup_ui()
+        self.render_table()
+        if self.settings.get("recurring", False):
+            self.recurring_checkbox.setChecked(True)
+
+    def setup_ui(self):
+        main_layout = QVBoxLayout(self)
+        main_layout.setContentsMargins(20, 20, 20, 20)
+        main_layout.setSpacing(15)
+
+        description = QLabel(
+            "Каждая проверка сохраняется в data/reachability.sqlite3 вместе с профилем и сетью. "
+            "Повторно проверяются только домены, результат которых старше "
+            f"{self.settings.get('max_age', DEFAULT_MAX_AGE) // 60} мин. для текущего профиля и сети."
+        )
+        description.setWordWrap(True)
+        description.setStyleSheet("color: #888;")
+        main_layout.addWidget(description)
+
+        domains_group = QGroupBox("Домены")
+        domains_layout = QVBoxLayout(domains_group)
+        self.domains_edit = QPlainTextEdit("\n".join(self.settings.get("domains", DEFAULT_DOMAINS)))
+        self.domains_edit.setMaximumHeight(110)
+        domains_layout.addWidget(self.domains_edit)
+        buttons_layout = QHBoxLayout()
+        self.check_stale_button = QPushButton("Проверить устаревшие")
+        self.check_stale_button.clicked.connect(lambda: self.run_check(only_stale=True))
+        self.check_all_button = QPushButton("Проверить все")
+        self.check_all_button.clicked.connect(lambda: self.run_check(only_stale=False))
+        self.recurring_checkbox = QCheckBox(
+            f"Повторять каждые {self.settings.get('interval', DEFAULT_INTERVAL) // 60} мин.")
+        self.recurring_checkbox.toggled.connect(self.set_recurring)
+        buttons_layout.addWidget(self.check_stale_button)
+        buttons_layout.addWidget(self.check_all_button)
+        buttons_layout.addWidget(self.recurring_checkbox)
+        buttons_layout.addStretch()
+        domains_layout.addLayout(buttons_layout)
+        main_layout.addWidget(domains_group)
+
+        results_group = QGroupBox("Результаты")
+        results_layout = QVBoxLayout(results_group)
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.itemSelectionChanged.connect(self.show_trend)
+        results_layout.addWidget(self.table)
+        self.trend_label = QLabel("Выберите домен, чтобы увидеть p95 TLS по профилям.")
+        self.trend_label.setWordWrap(True)
+        results_layout.addWidget(self.trend_label)
+        main_layout.addWidget(results_group)
+
+    def domains(self):
+        seen = []
+        for line in self.domains_edit.toPlainText().splitlines():
+            domain = line.strip().lower()
+            if domain and not domain.startswith("#") and domain not in seen:
+                seen.append(domain)
+        return seen
+
+    def save_settings(self, **changes):
+        if not self.settings_manager:
+            return
+        self.settings.update(changes)
+        self.settings_manager.set_setting("reachability", self.settings)
+
+    def run_check(self, only_stale=True):
+        if self.worker and self.worker.isRunning():
+            return
+        domains = self.domains()
+        if domains != self.settings.get("domains", DEFAULT_DOMAINS):
+            self.save_settings(domains=domains)
+        checker = ReachabilityChecker(self.history, lambda: check_context(self.status_cache),
+                                      parallelism=self.settings.get("parallelism", DEFAULT_PARALLELISM))
+        self.check_stale_button.setEnabled(False)
+        self.check_all_button.setEnabled(False)
+        self.worker = ReachabilityWorker(checker, domains, only_stale, self.settings.get("max_age", DEFAULT_MAX_AGE))
+        self.worker.finished.connect(self.on_check_finished)
+        self.worker.start()
+
+    def on_check_finished(self, results):
+        self.check_stale_button.setEnabled(True)
+        self.check_all_button.setEnabled(True)
+        for result in results:
+            self.last_results[result["domain"]] = result
+        self.render_table()
+
+    def set_recurring(self, enabled):
+        if enabled != self.settings.get("recurring", False):
+            self.save_settings(recurring=enabled)
+        if not self.timers:
+            return
+        if enabled:
+            interval = self.settings.get("interval", DEFAULT_INTERVAL) * 1000
+            # Проверка нужна и при свернутом окне: история копится в фоне
+            self.timers.add("reachability", lambda: self.run_check(only_stale=True), interval,
+                            background=True, hidden_interval=interval)
+        else:
+            self.timers.remove("reachability")
+
+    def render_table(self):
+        profile, network = check_context(self.status_cache)
+        latest = self.history.latest(profile, network)
+        domains = self.domains()
+        self.table.setRowCount(len(domains))
+        for row, domain in enumerate(domains):
+            result = self.last_results.get(domain)
+            checked = latest.get(domain)
+            if checked:
+                checked_at, ok, tls_ms = checked
+                status, when = ("Доступен" if ok else "Недоступен"), time.strftime("%d.%m %H:%M",
+                                                                                   time.localtime(checked_at))
+            else:
+                ok, tls_ms, status, when = None, None, "Не проверялся", ""
+            if result and not result["ok"]:
+                status = result["error"] or status
+            trend = self.history.tls_percentiles(domain, TREND_DAYS).get(profile)
+            values = (domain, status, self.format_ms(result and result["dns_ms"]),
+                      self.format_ms(result and result["connect_ms"]), self.format_ms(tls_ms),
+                      self.format_ms(trend and trend["p"]), when)
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if column == 1 and ok is not None:
+                    item.setForeground(QColor("green") if ok else QColor("red"))
+                self.table.setItem(row, column, item)
+
+    def show_trend(self):
+        rows = self.table.selectionModel().selectedRows()
+        if not rows:
+            return
+        domain = self.table.item(rows[0].row(), 0).text()
+        stats = self.history.tls_percentiles(domain, TREND_DAYS)
+        if not stats:
+            self.trend_label.setText(f"{domain}: проверок за {TREND_DAYS} дн. нет.")
+            return
+        lines = [f"{domain}, за {TREND_DAYS} дн.:"]
+        for profile, entry in sorted(stats.items(), key=lambda item: (item[1]["p"] is None, item[1]["p"] or 0)):
+            lines.append(f"  {profile or 'без обхода'}: p95 TLS {self.format_ms(entry['p']) or '-'} мс, "
+                         f"успешно {entry['successes']} из {entry['checks']}")
+        self.trend_label.setText("\n".join(lines))
+
+    @staticmethod
+    def format_ms(value):
+        return f"{value:.0f}" if value is not None else ""
@@ -1,9 +1,185 @@
-from PySide6.QtWidgets import QWidget, QVBoxLayout, QLabel
+import glob
+import os
+
+from PySide6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, QGroupBox,
+                               QComboBox, QPushButton, QTextEdit, QApplication, QMessageBox,
+                               QProgressBar)
+from PySide6.QtCore import QThread, Signal
+from PySide6.QtGui import QFont
+
+from utils.config_manager import ConfigManager
+from utils.process_manager import ServiceManager
+from utils.profile_parser import parse_profile, profile_variables
+from utils.filter_analyzer import analyze_profile, format_report, format_chain
+from utils.capture_filter import analyze_capture, format_capture_report
+from utils.profile_tuner import ProfileTuner, ResultCache, WinwsEvaluator, write_tuned_profile
+
+
+class TunerWorker(QThread):
+    """Подбирает параметры стратегии для профиля и сохраняет лучший вариант новым .bat."""
+    progress = Signal(int)
+    finished = Signal(bool, str)
+
+    def __init__(self, path, service_manager):
+        super().__init__()
+        self.path = path
+        self.service_manager = service_manager
+        self.tuner = None
+
+    def run(self):
+        try:
+            profile = parse_profile(self.path, self.service_manager.bat_variables(self.path))
+            if profile is None:
+                self.finished.emit(False, "В профиле не найден запуск winws.exe.")
+                return
+            self.tuner = ProfileTuner(profile, WinwsEvaluator(self.service_manager.winsw_path), cache=ResultCache(),
+                                      progress_callback=lambda done, total: self.progress.emit(int(done * 100 / total)))
+            report = self.tuner.run()
+        except (OSError, ValueError) as e:
+            self.finished.emit(False, f"Ошибка подбора: {e}")
+            return
+        candidate, _ = report.best
+        if candidate is None:
+            self.finished.emit(False, "В профиле нет секций TCP 443 со стратегией --dpi-desync.")
+            return
+        success, message = write_tuned_profile(self.path, report.best_profile(), candidate)
+        self.finished.emit(success, report.summary() + "\n" + message)
+
+    def cancel(self):
+        if self.tuner:
+            self.tuner.cancel()
+
 
 class FilterTab(QWidget):
-    def __init__(self, parent=None):
+    """Анализ цепочки фильтров профиля winws: недостижимые и пересекающиеся секции, стоимость, порядок."""
+    def __init__(self, config_manager=None, profiles_dir=".", service_manager=None, parent=None):
         super().__init__(parent)
-        layout = QVBoxLayout(self)
-        label = QLabel("This is the Filter Tab. Content will be added here.")
-        layout.addWidget(label)
-        self.setLayout(layout) 
\ No newline at end of file
+        self.config_manager = config_manager or ConfigManager()
+        self.service_manager = service_manager or ServiceManager()
+        self.profiles_dir = profiles_dir
+        self.report = None
+        self.tuner_worker = None
+
+        self.setup_ui()
+        self.load_profiles()
+
+    def setup_ui(self):
+        main_layout = QVBoxLayout(self)
+        main_layout.setContentsMargins(20, 20, 20, 20)
+        main_layout.setSpacing(15)
+
+        description = QLabel(
+            "winws проверяет секции профиля (разделенные --new) по порядку и применяет первую подходящую. "
+            "Анализ находит секции, которые никогда не срабатывают, пересечения, для которых важен порядок, "
+            "и предлагает порядок с меньшим числом проверок на пакет."
+        )
+        description.setWordWrap(True)
+        description.setStyleSheet("color: #888;")
+        main_layout.addWidget(description)
+
+        control_group = QGroupBox("Профиль")
+        control_layout = QHBoxLayout(control_group)
+        self.profile_combo = QComboBox()
+        self.analyze_button = QPushButton("Анализировать")
+        self.analyze_button.clicked.connect(self.analyze)
+        self.copy_button = QPushButton("Копировать цепочку")
+        self.copy_button.setEnabled(False)
+        self.copy_button.clicked.connect(self.copy_chain)
+        control_layout.addWidget(self.profile_combo, 1)
+        control_layout.addWidget(self.analyze_button)
+        control_layout.addWidget(self.copy_button)
+        main_layout.addWidget(control_group)
+
+        tuner_group = QGroupBox("Автоподбор параметров")
+        tuner_layout = QVBoxLayout(tuner_group)
+        tuner_description = QLabel(
+            "Перебирает сочетания --dpi-desync, -repeats, -split-pos, -fooling и -autottl для секций TCP 443 "
+            "выбранного профиля, запуская winws.exe и проверяя доступность Discord и YouTube. Слабые варианты "
+            "отсеиваются после первых проверок. Лучший сохраняется как general (TUNED).bat. "
+            "Служба и ручной запуск на время подбора должны быть остановлены."
+        )
+        tuner_description.setWordWrap(True)
+        tuner_description.setStyleSheet("color: #888;")
+        tuner_layout.addWidget(tuner_description)
+        tuner_controls = QHBoxLayout()
+        self.tune_button = QPushButton("Подобрать")
+        self.tune_button.clicked.connect(self.start_tuning)
+        self.cancel_tune_button = QPushButton("Прервать")
+        self.cancel_tune_button.setEnabled(False)
+        self.cancel_tune_button.clicked.connect(self.cancel_tuning)
+        self.tune_progress = QProgressBar()
+        self.tune_progress.setVisible(False)
+        tuner_controls.addWidget(self.tune_progress, 1)
+        tuner_controls.addWidget(self.tune_button)
+        tuner_controls.addWidget(self.cancel_tune_button)
+        tuner_layout.addLayout(tuner_controls)
+        main_layout.addWidget(tuner_group)
+
+        output_group = QGroupBox("Результаты анализа")
+        output_layout = QVBoxLayout(output_group)
+        self.output_text = QTextEdit()
+        self.output_text.setReadOnly(True)
+        self.output_text.setLineWrapMode(QTextEdit.LineWrapMode.NoWrap)
+        self.output_text.setFont(QFont("Consolas", 10))
+        self.output_text.setStyleSheet("background-color: #f0f0f0;")
+        output_layout.addWidget(self.output_text)
+        main_layout.addWidget(output_group)
+
+    def load_profiles(self):
+        self.profile_combo.clear()
+        for path in sorted(glob.glob(os.path.join(self.profiles_dir, "general*.bat"))):
+            self.profile_combo.addItem(os.path.basename(path), path)
+
+    def analyze(self):
+        path = self.profile_combo.currentData()
+        self.report = None
+        self.copy_button.setEnabled(False)
+        if not path:
+            QMessageBox.information(self, "Анализ", "Профили general*.bat не найдены.")
+            return
+        try:
+            profile = parse_profile(path, profile_variables(self.config_manager))
+            if profile is None:
+                self.output_text.setPlainText(f"В файле {os.path.basename(path)} не найден запуск winws.exe.")
+                return
+            self.report = analyze_profile(profile)
+            capture = analyze_capture(profile)
+        except (OSError, ValueError) as e:
+            self.output_text.setPlainText(f"Не удалось разобрать профиль: {e}")
+            return
+        self.output_text.setPlainText(format_report(self.report) + "\n\n" + format_capture_report(capture))
+        self.copy_button.setEnabled(self.report.has_changes())
+
+    def copy_chain(self):
+        if self.report:
+            QApplication.clipboard().setText(format_chain(self.report.profile, self.report.suggested_sections))
+
+    def start_tuning(self):
+        path = self.profile_combo.currentData()
+        if not path:
+            return
+        if self.service_manager.get_service_status() == "RUNNING" or self.service_manager.is_manual_process_running():
+            QMessageBox.warning(self, "Автоподбор", "Остановите службу и ручной запуск: подбор запускает свой winws.exe.")
+            return
+        self.tune_button.setEnabled(False)
+        self.cancel_tune_button.setEnabled(True)
+        self.tune_progress.setValue(0)
+        self.tune_progress.setVisible(True)
+        self.tuner_worker = TunerWorker(path, self.service_manager)
+        self.tuner_worker.progress.connect(self.tune_progress.setValue)
+        self.tuner_worker.finished.connect(self.on_tuning_finished)
+        self.tuner_worker.start()
+
+    def cancel_tuning(self):
+        if self.tuner_worker:
+            self.tuner_worker.cancel()
+
+    def on_tuning_finished(self, success, message):
+        self.tune_button.setEnabled(True)
+        self.cancel_tune_button.setEnabled(False)
+        self.tune_progress.setVisible(False)
+        self.output_text.setPlainText(message)
+        if success:
+            self.load_profiles()
+        else:
+            QMessageBox.critical(self, "Автоподбор", message)
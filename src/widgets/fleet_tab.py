@@ -0,0 +1,188 @@
+import glob
+import os
+from collections import Counter
+
+from PySide6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, QGroupBox, QPushButton, QComboBox,
+                               QTableWidget, QTableWidgetItem, QHeaderView, QAbstractItemView, QTextEdit)
+from PySide6.QtCore import Signal
+from PySide6.QtGui import QColor
+
+from utils.fleet import FleetAggregator, OK, DEGRADED, OFFLINE
+
+
+class FleetTab(QWidget):
+    """
+    Сводка по машинам парка (настройка "fleet") и рассылка профиля или списка
+    выбранным узлам. Опрос идет в потоке агрегатора; при скрытой вкладке
+    таблица не перерисовывается.
+    """
+    COLUMNS = ("Узел", "Адрес", "Состояние", "Служба", "Профиль", "Списки", "Задержка, мс", "Ошибка")
+    HEALTH = {OK: ("В норме", "green"), DEGRADED: ("Обход не работает", "orange"), OFFLINE: ("Нет связи", "red")}
+
+    view_changed = Signal(object)
+    push_finished = Signal(str, object)
+
+    def __init__(self, settings, lists_dir="lists", parent=None):
+        super().__init__(parent)
+        self.lists_dir = lists_dir
+        self.view = []
+        self.stale = False
+        self.aggregator = FleetAggregator.from_settings(settings, on_change=self.view_changed.emit)
+        self.view_changed.connect(self.on_view_changed)
+        self.push_finished.connect(self.on_push_finished)
+
+        self.setup_ui()
+        self.aggregator.start()
+
+    def setup_ui(self):
+        main_layout = QVBoxLayout(self)
+        main_layout.setContentsMargins(20, 20, 20, 20)
+        main_layout.setSpacing(15)
+
+        self.summary_label = QLabel(f"Узлов: {len(self.aggregator.nodes)}, ожидание первого опроса...")
+        main_layout.addWidget(self.summary_label)
+
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.horizontalHeader().setSectionResizeMode(len(self.COLUMNS) - 1, QHeaderView.ResizeMode.Stretch)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+        main_layout.addWidget(self.table, 1)
+
+        push_group = QGroupBox("Рассылка выбранным узлам")
+        push_layout = QVBoxLayout(push_group)
+        profile_layout = QHBoxLayout()
+        self.profile_combo = QComboBox()
+        self.push_profile_button = QPushButton("Применить профиль")
+        self.push_profile_button.clicked.connect(self.push_profile)
+        profile_layout.addWidget(self.profile_combo, 1)
+        profile_layout.addWidget(self.push_profile_button)
+        push_layout.addLayout(profile_layout)
+        list_layout = QHBoxLayout()
+        self.list_combo = QComboBox()
+        for path in sorted(glob.glob(os.path.join(self.lists_dir, "*.txt"))):
+            self.list_combo.addItem(os.path.basename(path), path)
+        self.push_list_button = QPushButton("Отправить список")
+        self.push_list_button.clicked.connect(self.push_list)
+        list_layout.addWidget(self.list_combo, 1)
+        list_layout.addWidget(self.push_list_button)
+        push_layout.addLayout(list_layout)
+        self.push_output = QTextEdit()
+        self.push_output.setReadOnly(True)
+        self.push_output.setMaximumHeight(120)
+        push_layout.addWidget(self.push_output)
+        main_layout.addWidget(push_group)
+
+    def stop(self):
+        self.aggregator.stop()
+
+    # --- Сводка ---
+    def on_view_changed(self, view):
+        self.view = view
+        if not self.isVisible():
+            self.stale = True
+            return
+        self.render()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if self.stale:
+            self.stale = False
+            self.render()
+
+    def render(self):
+        view = self.view
+        health = Counter(node["health"] for node in view)
+        majority = self.majority_lists(view)
+        cycle = self.aggregator.last_cycle
+        self.summary_label.setText(
+            f"Узлов: {len(view)}, в норме {health[OK]}, без обхода {health[DEGRADED]}, нет связи {health[OFFLINE]}"
+            + (f"; опрос всех узлов {cycle * 1000:.0f} мс" if cycle is not None else ""))
+
+        # Порядок узлов постоянный, поэтому выделение строк переживает перерисовку
+        self.table.setRowCount(len(view))
+        for row, node in enumerate(view):
+            differs = sorted(name for name, digest in node["lists"].items() if majority.get(name) != digest)
+            lists = ("отличаются: " + ", ".join(differs)) if differs else ("совпадают" if node["lists"] else "")
+            service = "ручной запуск" if node["manual_running"] else (node["service_status"] or "")
+            values = (node["name"], node["address"], self.HEALTH[node["health"]][0], service,
+                      node["profile"] or "", lists,
+                      f"{node['latency'] * 1000:.0f}" if node["latency"] is not None else "", node["error"] or "")
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if column == 2:
+                    item.setForeground(QColor(self.HEALTH[node["health"]][1]))
+                elif column == 5 and differs:
+                    item.setForeground(QColor("orange"))
+                self.table.setItem(row, column, item)
+
+        profiles = sorted({profile for node in view for profile in node["profiles"]})
+        if profiles != [self.profile_combo.itemText(i) for i in range(self.profile_combo.count())]:
+            current = self.profile_combo.currentText()
+            self.profile_combo.clear()
+            self.profile_combo.addItems(profiles)
+            if current in profiles:
+                self.profile_combo.setCurrentText(current)
+
+    @staticmethod
+    def majority_lists(view):
+        """Самая частая версия каждого списка среди узлов в сети."""
+        counters = {}
+        for node in view:
+            for name, digest in node["lists"].items():
+                counters.setdefault(name, Counter())[digest] += 1
+        return {name: counter.most_common(1)[0][0] for name, counter in counters.items()}
+
+    def selected_nodes(self):
+        names = set()
+        for index in self.table.selectionModel().selectedRows():
+            item = self.table.item(index.row(), 0)
+            if item:
+                names.add(item.text())
+        return names
+
+    # --- Рассылка ---
+    def push_profile(self):
+        profile = self.profile_combo.currentText()
+        names = self.selected_nodes()
+        if not profile or not names:
+            self.push_output.setPlainText("Выберите узлы в таблице и профиль.")
+            return
+        self.start_push(f"Профиль {profile}", self.aggregator.push_profile(sorted(names), profile))
+
+    def push_list(self):
+        path = self.list_combo.currentData()
+        names = self.selected_nodes()
+        if not path or not names:
+            self.push_output.setPlainText("Выберите узлы в таблице и список.")
+            return
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                content = f.read()
+        except OSError as e:
+            self.push_output.setPlainText(f"Не удалось прочитать список: {e}")
+            return
+        name = os.path.basename(path)
+        self.start_push(f"Список {name}", self.aggregator.push_list(sorted(names), name, content))
+
+    def start_push(self, title, future):
+        self.push_profile_button.setEnabled(False)
+        self.push_list_button.setEnabled(False)
+        self.push_output.setPlainText(f"{title}: рассылка...")
+        future.add_done_callback(lambda done: self.push_finished.emit(title, done))
+
+    def on_push_finished(self, title, future):
+        self.push_profile_button.setEnabled(True)
+        self.push_list_button.setEnabled(True)
+        try:
+            results = future.result()
+        except Exception as e:
+            self.push_output.setPlainText(f"{title}: ошибка рассылки: {e}")
+            return
+        failed = sum(1 for success, _ in results.values() if not success)
+        lines = [f"{title}: успешно {len(results) - failed} из {len(results)}"]
+        for name, (success, message) in sorted(results.items()):
+            lines.append(f"  {name}: {'OK' if success else 'ошибка'} - {message.splitlines()[0] if message else ''}")
+        self.push_output.setPlainText("\n".join(lines))
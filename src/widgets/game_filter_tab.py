@@ -1,17 +1,51 @@
 from PySide6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, 
-                               QGroupBox, QCheckBox, QFrame, QSizePolicy)
-from PySide6.QtCore import Qt
+                               QGroupBox, QCheckBox, QFrame, QSizePolicy, QListWidget,
+                               QListWidgetItem, QPushButton, QMessageBox)
+from PySide6.QtCore import Qt, QThread, Signal
 from PySide6.QtGui import QFont
 
 from utils.config_manager import ConfigManager
+from utils.game_ports import GamePortDetector, UdpFlowSniffer, list_udp_processes
+
+class GamePortWorker(QThread):
+    """Периодически снимает UDP-сокеты и потоки выбранных игр, пока не будет остановлен."""
+    updated = Signal(dict)
+
+    def __init__(self, process_names, interval_ms=2000):
+        super().__init__()
+        self.sniffer = UdpFlowSniffer()
+        self.detector = GamePortDetector(process_names, self.sniffer)
+        self.interval_ms = interval_ms
+
+    def run(self):
+        sniffing, message = self.sniffer.start()
+        if not sniffing:
+            print(message)
+            self.detector.sniffer = None
+        try:
+            while not self.isInterruptionRequested():
+                self.detector.sample()
+                self.updated.emit(self.detector.summary())
+                # Короткие паузы, чтобы остановка не ждала весь интервал
+                for _ in range(self.interval_ms // 100):
+                    if self.isInterruptionRequested():
+                        break
+                    self.msleep(100)
+        finally:
+            self.sniffer.stop()
+
 
 class GameFilterTab(QWidget):
-    def __init__(self, parent=None):
+    def __init__(self, config_manager=None, settings_manager=None, parent=None):
         super().__init__(parent)
-        self.config_manager = ConfigManager()
+        self.config_manager = config_manager or ConfigManager()
+        self.settings_manager = settings_manager
+        self.port_worker = None
+        self.detected_ports = ""
 
         self.setup_ui()
         self.update_status()
+        self.refresh_processes()
 
     def setup_ui(self):
         main_layout = QVBoxLayout(self)
@@ -75,6 +109,46 @@ class GameFilterTab(QWidget):
 
         main_layout.addWidget(control_group)
 
+        # --- Port detection Group ---
+        detect_group = QGroupBox("Подбор портов по играм")
+        detect_layout = QVBoxLayout(detect_group)
+
+        detect_description = QLabel(
+            "Отметьте игры и запустите подбор во время игровой сессии. Будут собраны порты серверов, "
+            "с которыми игра обменивается UDP-пакетами, и вместо диапазона 1024-65535 перехватываться "
+            "будут только они."
+        )
+        detect_description.setWordWrap(True)
+        detect_description.setStyleSheet("color: #888;")
+        detect_layout.addWidget(detect_description)
+
+        self.process_list = QListWidget()
+        self.process_list.setMaximumHeight(160)
+        detect_layout.addWidget(self.process_list)
+
+        buttons_layout = QHBoxLayout()
+        self.refresh_processes_button = QPushButton("Обновить список")
+        self.refresh_processes_button.clicked.connect(self.refresh_processes)
+        self.detect_button = QPushButton("Начать подбор")
+        self.detect_button.clicked.connect(self.toggle_detection)
+        self.apply_ports_button = QPushButton("Использовать найденные порты")
+        self.apply_ports_button.setEnabled(False)
+        self.apply_ports_button.clicked.connect(self.apply_detected_ports)
+        self.reset_ports_button = QPushButton("Весь диапазон")
+        self.reset_ports_button.clicked.connect(self.reset_ports)
+        buttons_layout.addWidget(self.refresh_processes_button)
+        buttons_layout.addWidget(self.detect_button)
+        buttons_layout.addStretch()
+        buttons_layout.addWidget(self.apply_ports_button)
+        buttons_layout.addWidget(self.reset_ports_button)
+        detect_layout.addLayout(buttons_layout)
+
+        self.detect_status_label = QLabel("Подбор не запущен.")
+        self.detect_status_label.setWordWrap(True)
+        detect_layout.addWidget(self.detect_status_label)
+
+        main_layout.addWidget(detect_group)
+
     def update_status(self):
         """Обновляет UI в соответствии с состоянием фильтра."""
         is_enabled = self.config_manager.is_game_filter_enabled()
@@ -85,7 +159,7 @@ class GameFilterTab(QWidget):
         self.toggle_switch.blockSignals(False)
 
         if is_enabled:
-            self.status_label.setText("ВКЛЮЧЕН")
+            self.status_label.setText(f"ВКЛЮЧЕН (порты {self.config_manager.get_game_filter_ports()})")
             self.status_label.setStyleSheet("color: green;")
         else:
             self.status_label.setText("ВЫКЛЮЧЕН")
@@ -97,4 +171,84 @@ class GameFilterTab(QWidget):
             self.config_manager.enable_game_filter()
         else:
             self.config_manager.disable_game_filter()
-        self.update_status() 
\ No newline at end of file
+        self.update_status()
+
+    def saved_processes(self):
+        if not self.settings_manager:
+            return []
+        return self.settings_manager.get_setting("game_filter", {}).get("processes", [])
+
+    def selected_processes(self):
+        return [self.process_list.item(i).data(Qt.ItemDataRole.UserRole)
+                for i in range(self.process_list.count())
+                if self.process_list.item(i).checkState() == Qt.CheckState.Checked]
+
+    def refresh_processes(self):
+        """Показывает процессы с UDP-сокетами; ранее выбранные игры отмечены, даже если не запущены."""
+        selected = set(self.selected_processes()) | set(self.saved_processes())
+        counts = list_udp_processes()
+        names = sorted(set(counts) | selected, key=str.lower)
+        self.process_list.clear()
+        for name in names:
+            item = QListWidgetItem(f"{name} (UDP-сокетов: {counts.get(name, 0)})")
+            item.setData(Qt.ItemDataRole.UserRole, name)
+            item.setFlags(item.flags() | Qt.ItemFlag.ItemIsUserCheckable)
+            item.setCheckState(Qt.CheckState.Checked if name in selected else Qt.CheckState.Unchecked)
+            self.process_list.addItem(item)
+
+    def toggle_detection(self):
+        if self.port_worker:
+            self.stop_detection()
+            return
+        processes = self.selected_processes()
+        if not processes:
+            QMessageBox.information(self, "Подбор портов", "Отметьте хотя бы один процесс игры.")
+            return
+        if self.settings_manager:
+            settings = self.settings_manager.get_setting("game_filter", {})
+            settings["processes"] = processes
+            self.settings_manager.set_setting("game_filter", settings)
+        self.detected_ports = ""
+        self.apply_ports_button.setEnabled(False)
+        self.port_worker = GamePortWorker(processes)
+        self.port_worker.updated.connect(self.on_ports_updated)
+        self.port_worker.start()
+        self.detect_button.setText("Остановить подбор")
+        self.detect_status_label.setText("Подбор запущен, играйте как обычно...")
+
+    def stop_detection(self):
+        if self.port_worker:
+            self.port_worker.requestInterruption()
+            self.port_worker.wait()
+            self.port_worker = None
+        self.detect_button.setText("Начать подбор")
+        self.apply_ports_button.setEnabled(bool(self.detected_ports))
+
+    def on_ports_updated(self, summary):
+        self.detected_ports = summary["ports"]
+        minutes = int(summary["duration"] // 60)
+        text = (f"Снимков: {summary['samples']} за {minutes} мин. "
+                f"Порты: {summary['ports'] or 'пока не найдены'} ({summary['port_count']} шт.)")
+        if summary["ports"] and summary["source"] == "local":
+            text += ("\nПорты серверов определить не удалось (WinDivert недоступен, сокеты игры "
+                     "не привязаны к серверу), в набор взяты локальные порты игры.")
+        self.detect_status_label.setText(text)
+
+    def apply_detected_ports(self):
+        success, message = self.config_manager.set_game_filter_ports(self.detected_ports)
+        self.update_status()
+        if success:
+            QMessageBox.information(self, "Игровой фильтр",
+                                    message + "\nПереустановите службу, чтобы применить изменения.")
+        else:
+            QMessageBox.critical(self, "Ошибка", message)
+
+    def reset_ports(self):
+        success, message = self.config_manager.set_game_filter_ports("")
+        self.update_status()
+        if not success:
+            QMessageBox.critical(self, "Ошибка", message)
+
+    def stop(self):
+        """Останавливает подбор при выходе: closeEvent у страницы QStackedWidget не вызывается."""
+        self.stop_detection()
@@ -0,0 +1,229 @@
+import os
+
+from PySide6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QTableView, QHeaderView, QLineEdit, QPushButton,
+                               QLabel, QCheckBox, QMessageBox, QInputDialog, QAbstractItemView)
+from PySide6.QtCore import Qt, QAbstractListModel, QModelIndex, QTimer
+from PySide6.QtGui import QColor, QKeySequence, QShortcut
+
+from utils.list_index import ListIndex, validator_for
+
+SEARCH_DELAY = 200  # Пауза после ввода перед поиском, мс
+
+INVALID_COLOR = QColor("#e57373")
+EDITED_COLOR = QColor("#3a3a1e")
+
+
+class ListModel(QAbstractListModel):
+    """Модель поверх ListIndex: строки декодируются и проверяются только при отрисовке."""
+    def __init__(self, index, validator, parent=None):
+        super().__init__(parent)
+        self.index_view = index
+        self.validator = validator
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.index_view)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        row = index.row()
+        if role in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.EditRole):
+            return self.index_view.text(row)
+        if role == Qt.ItemDataRole.ForegroundRole:
+            return INVALID_COLOR if self.validator(self.index_view.text(row)) else None
+        if role == Qt.ItemDataRole.BackgroundRole:
+            return EDITED_COLOR if self.index_view.is_edited(row) else None
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return self.validator(self.index_view.text(row))
+        return None
+
+    def flags(self, index):
+        return super().flags(index) | Qt.ItemFlag.ItemIsEditable
+
+    def setData(self, index, value, role=Qt.ItemDataRole.EditRole):
+        if role != Qt.ItemDataRole.EditRole or not index.isValid():
+            return False
+        if value == self.index_view.text(index.row()):
+            return False
+        self.index_view.set_text(index.row(), value)
+        self.dataChanged.emit(index, index)
+        return True
+
+    def insert_lines(self, row, texts):
+        if not texts:
+            return
+        self.beginInsertRows(QModelIndex(), row, row + len(texts) - 1)
+        self.index_view.insert(row, texts)
+        self.endInsertRows()
+
+    def remove_rows(self, rows):
+        """Удаляет строки одним пакетом: соседние строки - одним диапазоном, с конца списка."""
+        ranges = []
+        for row in sorted(set(rows), reverse=True):
+            if ranges and ranges[-1][0] == row + 1:
+                ranges[-1][0] = row
+            else:
+                ranges.append([row, row])
+        for first, last in ranges:
+            self.beginRemoveRows(QModelIndex(), first, last)
+            self.index_view.remove(first, last - first + 1)
+            self.endRemoveRows()
+
+
+class ListEditorDialog(QDialog):
+    """
+    Редактор hostlist/ipset любого размера. Правки копятся в памяти и
+    записываются одним атомарным сохранением.
+    """
+    def __init__(self, path, snapshot_store=None, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.snapshot_store = snapshot_store
+        self.index_view = ListIndex(path)
+        self.model = ListModel(self.index_view, validator_for(path), self)
+
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.timeout.connect(lambda: self.find_next(from_current=True))
+
+        self.setWindowTitle(f"Редактор: {os.path.basename(path)}")
+        self.resize(700, 600)
+        self.setup_ui()
+        self.update_status()
+
+    def setup_ui(self):
+        layout = QVBoxLayout(self)
+
+        search_layout = QHBoxLayout()
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText("Поиск...")
+        self.search_edit.textChanged.connect(lambda: self.search_timer.start(SEARCH_DELAY))
+        self.search_edit.returnPressed.connect(self.find_next)
+        find_button = QPushButton("Далее")
+        find_button.clicked.connect(self.find_next)
+        invalid_button = QPushButton("Следующая ошибка")
+        invalid_button.clicked.connect(self.find_invalid)
+        search_layout.addWidget(self.search_edit)
+        search_layout.addWidget(find_button)
+        search_layout.addWidget(invalid_button)
+        layout.addLayout(search_layout)
+
+        # QTableView с фиксированной высотой строк хранит геометрию строк сжато, а QListView
+        # при показе раскладывает каждую строку: на миллионе строк это секунды
+        self.view = QTableView()
+        self.view.setModel(self.model)
+        self.view.setShowGrid(False)
+        self.view.setWordWrap(False)
+        self.view.horizontalHeader().hide()
+        self.view.horizontalHeader().setStretchLastSection(True)
+        rows_header = self.view.verticalHeader()  # Номера строк
+        rows_header.setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        rows_header.setDefaultSectionSize(self.fontMetrics().height() + 4)
+        self.view.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.view.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+        self.view.setEditTriggers(QAbstractItemView.EditTrigger.DoubleClicked |
+                                  QAbstractItemView.EditTrigger.EditKeyPressed)
+        layout.addWidget(self.view)
+        QShortcut(QKeySequence.StandardKey.Delete, self.view, self.remove_selected)
+        self.model.dataChanged.connect(self.update_status)
+        self.model.rowsInserted.connect(self.update_status)
+        self.model.rowsRemoved.connect(self.update_status)
+
+        self.status_label = QLabel()
+        layout.addWidget(self.status_label)
+
+        buttons_layout = QHBoxLayout()
+        add_button = QPushButton("Добавить...")
+        add_button.clicked.connect(self.add_lines)
+        remove_button = QPushButton("Удалить выбранные")
+        remove_button.clicked.connect(self.remove_selected)
+        self.dedupe_check = QCheckBox("Удалять дубли при сохранении")
+        self.dedupe_check.setChecked(True)
+        self.dedupe_check.toggled.connect(self.update_status)
+        self.save_button = QPushButton("Сохранить")
+        self.save_button.clicked.connect(self.save)
+        buttons_layout.addWidget(add_button)
+        buttons_layout.addWidget(remove_button)
+        buttons_layout.addStretch()
+        buttons_layout.addWidget(self.dedupe_check)
+        buttons_layout.addWidget(self.save_button)
+        layout.addLayout(buttons_layout)
+
+    def update_status(self):
+        text = f"Строк: {len(self.index_view)}"
+        if self.index_view.modified:
+            text += " (есть несохраненные изменения)"
+        self.status_label.setText(text)
+        self.save_button.setEnabled(self.index_view.modified or self.dedupe_check.isChecked())
+
+    def current_row(self):
+        index = self.view.currentIndex()
+        return index.row() if index.isValid() else -1
+
+    def select_row(self, row):
+        index = self.model.index(row)
+        self.view.setCurrentIndex(index)
+        self.view.scrollTo(index, QAbstractItemView.ScrollHint.PositionAtCenter)
+
+    def find_next(self, from_current=False):
+        """Ищет со следующей строки (по Enter) или с текущей (при вводе), затем с начала списка."""
+        query = self.search_edit.text().strip()
+        if not query:
+            return
+        start = max(self.current_row(), 0) if from_current else self.current_row() + 1
+        row = self.index_view.find(query, start)
+        if row is None and start > 0:
+            row = self.index_view.find(query, 0)
+        if row is None:
+            self.status_label.setText(f"'{query}' не найдено")
+            return
+        self.select_row(row)
+
+    def find_invalid(self):
+        row = self.index_view.find_invalid(self.model.validator, self.current_row() + 1)
+        if row is None:
+            self.status_label.setText("Некорректных строк ниже нет")
+            return
+        self.select_row(row)
+
+    def add_lines(self):
+        text, ok = QInputDialog.getMultiLineText(self, "Добавить строки", "По одной записи в строке:")
+        if not ok:
+            return
+        lines = [line.strip() for line in text.splitlines() if line.strip()]
+        row = self.current_row() + 1 if self.current_row() >= 0 else len(self.index_view)
+        self.model.insert_lines(row, lines)
+        if lines:
+            self.select_row(row)
+
+    def remove_selected(self):
+        rows = [index.row() for index in self.view.selectionModel().selectedIndexes()]
+        if rows:
+            self.model.remove_rows(rows)
+
+    def save(self):
+        if self.snapshot_store:
+            self.snapshot_store.create_snapshot(f"Перед правкой {os.path.basename(self.path)}", auto=True)
+        self.model.beginResetModel()
+        success, message = self.index_view.save(dedupe=self.dedupe_check.isChecked())
+        self.model.endResetModel()
+        self.update_status()
+        if success:
+            QMessageBox.information(self, "Успех", message)
+        else:
+            QMessageBox.critical(self, "Ошибка", message)
+
+    def done(self, result):
+        if self.index_view.modified:
+            reply = QMessageBox.question(
+                self, "Несохраненные изменения", "Сохранить изменения перед закрытием?",
+                QMessageBox.StandardButton.Save | QMessageBox.StandardButton.Discard |
+                QMessageBox.StandardButton.Cancel)
+            if reply == QMessageBox.StandardButton.Cancel:
+                return
+            if reply == QMessageBox.StandardButton.Save:
+                self.save()
+                if self.index_view.modified:
+                    return  # Сохранить не удалось: не теряем правки
+        self.index_view.close()
+        super().done(result)
@@ -1,59 +1,83 @@
 import os
-import requests
 from PySide6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, 
                                QGroupBox, QCheckBox, QSizePolicy, QPushButton,
-                               QProgressBar, QMessageBox)
+                               QProgressBar, QMessageBox, QFileDialog, QComboBox)
 from PySide6.QtCore import Qt, QThread, Signal
 from PySide6.QtGui import QFont
 
 from utils.config_manager import ConfigManager
+from utils.ipset_switch import ENABLED, DISABLED
+from utils.list_updater import get_ipset_sources, update_ipset_from_sources
+from utils.hostlist_stats import HostlistStats, read_hostlist, propose_pruned, write_hostlist
+from widgets.list_editor import ListEditorDialog
 
-class DownloadWorker(QThread):
-    """Скачивает файл в фоновом потоке."""
+class IpsetUpdateWorker(QThread):
+    """Параллельно скачивает все источники ipset и собирает из них один список."""
     progress = Signal(int)
     finished = Signal(bool, str) # success, message
 
-    def __init__(self, url, save_path):
+    def __init__(self, sources, save_path, snapshot_store=None):
         super().__init__()
-        self.url = url
+        self.sources = sources
         self.save_path = save_path
+        self.snapshot_store = snapshot_store
+
+    def run(self):
+        if self.snapshot_store:
+            # Снимок перед обновлением дешев: неизменные файлы не перечитываются
+            self.snapshot_store.create_snapshot("Перед обновлением ipset", auto=True)
+        success, message, _ = update_ipset_from_sources(
+            self.sources, self.save_path,
+            progress_callback=lambda done, total: self.progress.emit(int(done * 100 / total)))
+        self.finished.emit(success, message)
+
+
+class HostlistStatsWorker(QThread):
+    """Дочитывает журнал winws --debug и сохраняет статистику срабатываний."""
+    finished = Signal(bool, str)
+
+    def __init__(self, stats, log_path):
+        super().__init__()
+        self.stats = stats
+        self.log_path = log_path
 
     def run(self):
         try:
-            response = requests.get(self.url, stream=True, timeout=15)
-            response.raise_for_status()
-            
-            total_size = int(response.headers.get('content-length', 0))
-            bytes_downloaded = 0
-            
-            with open(self.save_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-                        bytes_downloaded += len(chunk)
-                        if total_size > 0:
-                            progress_percent = int((bytes_downloaded / total_size) * 100)
-                            self.progress.emit(progress_percent)
-            
-            self.progress.emit(100)
-            self.finished.emit(True, f"Файл успешно скачан и сохранен в {self.save_path}")
-
-        except requests.exceptions.RequestException as e:
-            self.finished.emit(False, f"Ошибка сети при скачивании: {e}")
-        except Exception as e:
-            self.finished.emit(False, f"Произошла ошибка: {e}")
+            hits = self.stats.collect_from_log(self.log_path)
+            self.stats.save()
+            self.finished.emit(True, f"Новых срабатываний: {hits}.")
+        except OSError as e:
+            self.finished.emit(False, f"Не удалось прочитать журнал: {e}")
 
 
 class ListsTab(QWidget):
-    def __init__(self, parent=None):
+    # Состояние может поменяться из любого потока (API, планировщик)
+    snapshot_changed = Signal(object)
+    reload_finished = Signal(object)
+
+    def __init__(self, snapshot_store=None, settings_manager=None, config_manager=None, status_cache=None,
+                 scheduler=None, parent=None):
         super().__init__(parent)
-        self.config_manager = ConfigManager()
+        self.config_manager = config_manager or ConfigManager()
+        self.snapshot_store = snapshot_store
+        self.settings_manager = settings_manager
+        self.status_cache = status_cache
+        self.scheduler = scheduler
+        self.reload_operation = None    # Перезапуск winws после переключения ipset
+        self.reload_error = None
         self.download_worker = None
-        self.ipset_url = "https://raw.githubusercontent.com/zapret-info/z-i/master/ipset-all.txt"
-        self.save_path = os.path.abspath("lists/ipset-all.txt")
+        self.stats_worker = None
+        self.lists_dir = os.path.abspath("lists")
+        self.hostlist_path = os.path.abspath("lists/list-general.txt")
+        self.hostlist_stats = HostlistStats()
 
         self.setup_ui()
         self.update_ipset_status()
+        self.reload_finished.connect(self.on_reload_finished)
+        if self.status_cache:
+            # Переключение через API или service.bat тоже должно быть видно здесь
+            self.snapshot_changed.connect(self.on_snapshot_changed)
+            self.status_cache.add_listener(self.snapshot_changed.emit)
 
     def setup_ui(self):
         main_layout = QVBoxLayout(self)
@@ -67,7 +91,8 @@ class ListsTab(QWidget):
         
         description = QLabel(
             "Включение этого режима активирует использование списков IP-адресов (ipset) для более эффективной фильтрации. "
-            "Это может улучшить производительность, но требует соответствующей настройки в конфигурационном файле службы."
+            "Выключенный ipset - заглушка 0.0.0.0/32 вместо ipset-all.txt, полный список хранится в ipset-all.txt.backup. "
+            "Переключение мгновенное, работающий winws перезапускается, чтобы перечитать список."
         )
         description.setWordWrap(True)
         description.setStyleSheet("color: #888; padding-bottom: 10px;")
@@ -100,15 +125,20 @@ class ListsTab(QWidget):
         control_layout.addStretch()
         control_layout.addWidget(self.ipset_toggle_switch)
         
+        self.ipset_hint_label = QLabel()
+        self.ipset_hint_label.setWordWrap(True)
+        self.ipset_hint_label.setStyleSheet("color: #888;")
+
         ipset_layout.addWidget(description)
         ipset_layout.addLayout(control_layout)
+        ipset_layout.addWidget(self.ipset_hint_label)
         main_layout.addWidget(ipset_group)
 
         # --- IPset Update Group ---
         update_group = QGroupBox("Обновление списков IPset")
         update_layout = QVBoxLayout(update_group)
 
-        self.update_button = QPushButton("Обновить ipset-all.txt с GitHub")
+        self.update_button = QPushButton("Обновить ipset-all.txt из всех источников")
         self.update_button.clicked.connect(self.update_ipset_list)
         
         self.progress_bar = QProgressBar()
@@ -118,35 +148,118 @@ class ListsTab(QWidget):
         update_layout.addWidget(self.progress_bar)
         main_layout.addWidget(update_group)
 
+        # --- Hostlist Stats Group ---
+        stats_group = QGroupBox("Статистика hostlist")
+        stats_layout = QVBoxLayout(stats_group)
+
+        stats_description = QLabel(
+            "Считает, какие домены list-general.txt действительно срабатывают, по журналу winws, "
+            "запущенного с --debug=@файл. Журнал дочитывается с места прошлого сбора."
+        )
+        stats_description.setWordWrap(True)
+        stats_description.setStyleSheet("color: #888;")
+        stats_layout.addWidget(stats_description)
+
+        self.stats_label = QLabel()
+        self.stats_label.setWordWrap(True)
+        stats_layout.addWidget(self.stats_label)
+
+        stats_buttons = QHBoxLayout()
+        self.collect_stats_button = QPushButton("Собрать из журнала...")
+        self.collect_stats_button.clicked.connect(self.collect_hostlist_stats)
+        self.prune_button = QPushButton("Создать сокращенный список")
+        self.prune_button.clicked.connect(self.create_pruned_hostlist)
+        stats_buttons.addWidget(self.collect_stats_button)
+        stats_buttons.addStretch()
+        stats_buttons.addWidget(self.prune_button)
+        stats_layout.addLayout(stats_buttons)
+        main_layout.addWidget(stats_group)
+        self.update_stats_label()
+
+        # --- List Editor Group ---
+        editor_group = QGroupBox("Редактор списков")
+        editor_layout = QHBoxLayout(editor_group)
+        self.list_combo = QComboBox()
+        self.list_combo.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Fixed)
+        self.open_editor_button = QPushButton("Открыть")
+        self.open_editor_button.clicked.connect(self.open_list_editor)
+        editor_layout.addWidget(self.list_combo)
+        editor_layout.addWidget(self.open_editor_button)
+        main_layout.addWidget(editor_group)
+        self.update_list_combo()
+
         main_layout.addStretch()
 
     def update_ipset_status(self):
-        is_enabled = self.config_manager.is_ipset_enabled()
-        
+        """Показывает действующий режим: по самому ipset-all.txt и по ходу перезапуска winws."""
+        ipset = self.config_manager.ipset
+        state = ipset.state()
+        is_enabled = state == ENABLED
+
         self.ipset_toggle_switch.blockSignals(True)
         self.ipset_toggle_switch.setChecked(is_enabled)
         self.ipset_toggle_switch.blockSignals(False)
 
         if is_enabled:
-            self.ipset_status_label.setText("ВКЛЮЧЕН")
-            self.ipset_status_label.setStyleSheet("color: green;")
+            text, color = "ВКЛЮЧЕН", "green"
+        elif state == DISABLED:
+            text, color = "ВЫКЛЮЧЕН", "red"
         else:
-            self.ipset_status_label.setText("ВЫКЛЮЧЕН")
-            self.ipset_status_label.setStyleSheet("color: red;")
+            text, color = "НЕТ СПИСКА", "red"
+        if self.reload_operation is not None:
+            text += " (применяется...)"
+        elif self.reload_error:
+            text, color = text + " (не применен)", "orange"
+        self.ipset_status_label.setText(text)
+        self.ipset_status_label.setStyleSheet(f"color: {color};")
+
+        if self.reload_error:
+            hint = f"winws не перезапущен: {self.reload_error}"
+        elif not ipset.has_full_list():
+            hint = "Полного списка ipset нет: обновите его ниже, чтобы включить режим."
+        else:
+            hint = ""
+        self.ipset_hint_label.setText(hint)
+        self.ipset_hint_label.setVisible(bool(hint))
 
     def toggle_ipset(self, checked):
         if checked:
-            self.config_manager.enable_ipset()
+            success, message = self.config_manager.enable_ipset()
         else:
-            self.config_manager.disable_ipset()
+            success, message = self.config_manager.disable_ipset()
+        if not success:
+            self.update_ipset_status()
+            QMessageBox.critical(self, "Ошибка", message)
+            return
+        if self.status_cache:
+            self.status_cache.update(ipset_enabled=self.config_manager.is_ipset_enabled())
+        if self.scheduler:
+            # Частые переключения склеиваются в один перезапуск
+            self.reload_error = None
+            self.reload_operation = self.scheduler.submit("reload_lists")
+            self.reload_operation.add_callback(self.reload_finished.emit)
         self.update_ipset_status()
-        
+
+    def on_reload_finished(self, operation):
+        if operation is not self.reload_operation:
+            return
+        self.reload_operation = None
+        success, message = operation.result or (False, "операция отменена")
+        self.reload_error = None if success else message
+        self.update_ipset_status()
+
+    def on_snapshot_changed(self, snapshot):
+        if snapshot.get("ipset_enabled") != self.ipset_toggle_switch.isChecked():
+            self.update_ipset_status()
+
     def update_ipset_list(self):
         self.update_button.setEnabled(False)
         self.progress_bar.setVisible(True)
         self.progress_bar.setValue(0)
         
-        self.download_worker = DownloadWorker(self.ipset_url, self.save_path)
+        # При выключенном ipset обновляется отложенный полный список, а не заглушка
+        self.download_worker = IpsetUpdateWorker(get_ipset_sources(self.settings_manager),
+                                                 self.config_manager.ipset.write_path, self.snapshot_store)
         self.download_worker.progress.connect(self.progress_bar.setValue)
         self.download_worker.finished.connect(self.on_download_finished)
         self.download_worker.start()
@@ -155,7 +268,68 @@ class ListsTab(QWidget):
         self.update_button.setEnabled(True)
         self.progress_bar.setVisible(False)
         
+        self.update_ipset_status()
         if success:
             QMessageBox.information(self, "Успех", message)
         else:
-            QMessageBox.critical(self, "Ошибка", message) 
\ No newline at end of file
+            QMessageBox.critical(self, "Ошибка", message)
+
+    def update_stats_label(self):
+        stats = self.hostlist_stats
+        if not stats.counts:
+            self.stats_label.setText("Статистика еще не собрана.")
+            self.prune_button.setEnabled(False)
+            return
+        top = ", ".join(f"{domain} ({hits})" for domain, (hits, _) in stats.ranked()[:5])
+        text = f"Срабатываний: {stats.total_hits()}, доменов: {len(stats.counts)}. Чаще всего: {top}"
+        if os.path.exists(self.hostlist_path):
+            hot, cold = propose_pruned(read_hostlist(self.hostlist_path), stats)
+            text += f"\nВ list-general.txt используется {len(hot)} записей, ни разу не сработало: {len(cold)}."
+        self.stats_label.setText(text)
+        self.prune_button.setEnabled(True)
+
+    def collect_hostlist_stats(self):
+        log_path = self.hostlist_stats.log_path
+        if not log_path or not os.path.exists(log_path):
+            log_path, _ = QFileDialog.getOpenFileName(self, "Журнал winws", "", "Журналы (*.log *.txt);;Все файлы (*)")
+            if not log_path:
+                return
+        self.collect_stats_button.setEnabled(False)
+        self.stats_worker = HostlistStatsWorker(self.hostlist_stats, log_path)
+        self.stats_worker.finished.connect(self.on_stats_collected)
+        self.stats_worker.start()
+
+    def on_stats_collected(self, success, message):
+        self.collect_stats_button.setEnabled(True)
+        self.update_stats_label()
+        if not success:
+            QMessageBox.critical(self, "Ошибка", message)
+
+    def create_pruned_hostlist(self):
+        """Пишет рядом list-general.pruned.txt: только сработавшие записи, самые частые первыми."""
+        try:
+            hot, cold = propose_pruned(read_hostlist(self.hostlist_path), self.hostlist_stats)
+            pruned_path = os.path.splitext(self.hostlist_path)[0] + ".pruned.txt"
+            write_hostlist(hot, pruned_path)
+        except OSError as e:
+            QMessageBox.critical(self, "Ошибка", f"Не удалось создать список: {e}")
+            return
+        QMessageBox.information(self, "Готово",
+                                f"Сохранено {len(hot)} записей в {os.path.basename(pruned_path)}, "
+                                f"исключено {len(cold)}. Исходный список не изменен.")
+
+    def update_list_combo(self):
+        self.list_combo.clear()
+        if os.path.isdir(self.lists_dir):
+            self.list_combo.addItems(sorted(name for name in os.listdir(self.lists_dir) if name.endswith(".txt")))
+        self.open_editor_button.setEnabled(self.list_combo.count() > 0)
+
+    def open_list_editor(self):
+        path = os.path.join(self.lists_dir, self.list_combo.currentText())
+        try:
+            dialog = ListEditorDialog(path, self.snapshot_store, self)
+        except OSError as e:
+            QMessageBox.critical(self, "Ошибка", f"Не удалось открыть список: {e}")
+            return
+        dialog.exec()
+        self.update_stats_label()
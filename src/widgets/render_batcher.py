@@ -0,0 +1,48 @@
+import time
+
+from PySide6.QtCore import QObject, QTimer
+
+# Не чаще одной перерисовки за столько мс; промежуточные снимки пропускаются
+RENDER_BATCH_MS = 16
+
+
+class RenderBatcher(QObject):
+    """
+    Склеивает частые обновления снимка в одну перерисовку. Первое обновление после
+    паузы рисуется сразу (в следующей итерации цикла событий), последующие в
+    пределах batch_ms - одним вызовом render с последним снимком.
+    submitted/rendered - сколько снимков пришло и сколько было отрисовано.
+    """
+    def __init__(self, render, batch_ms=RENDER_BATCH_MS, parent=None):
+        super().__init__(parent)
+        self.render = render
+        self.batch_ms = batch_ms
+        self.submitted = 0
+        self.rendered = 0
+        self._pending = None
+        self._scheduled = False     # Свой флаг вместо QTimer.isActive(): submit вызывается очень часто
+        self._last_render = 0.0
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.flush)
+
+    def submit(self, snapshot):
+        self.submitted += 1
+        self._pending = snapshot
+        if self._scheduled:
+            return
+        self._scheduled = True
+        wait_ms = self.batch_ms - (time.monotonic() - self._last_render) * 1000
+        # Даже без ожидания - через таймер: очередь сигналов успеет свернуться в один снимок
+        self._timer.start(max(0, int(wait_ms)))
+
+    def flush(self):
+        """Рисует ожидающий снимок сейчас (например, при показе вкладки)."""
+        self._timer.stop()
+        self._scheduled = False
+        if self._pending is None:
+            return
+        snapshot, self._pending = self._pending, None
+        self._last_render = time.monotonic()
+        self.rendered += 1
+        self.render(snapshot)
@@ -2,44 +2,43 @@ import os
 from PySide6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel,
                                QMessageBox, QGroupBox, QFileDialog, QSizePolicy,
                                QGridLayout)
-from PySide6.QtCore import QThread, Signal, QTimer, Qt
+from PySide6.QtCore import Signal, Qt
 from PySide6.QtGui import QFont
 
+from utils.config_manager import ConfigManager
 from utils.process_manager import ServiceManager
+from utils.status_cache import StatusCache
+from utils.operation_scheduler import OperationScheduler
+from utils.timer_scheduler import TimerScheduler
+from widgets.render_batcher import RenderBatcher
 
-# Worker thread for service operations
-class ServiceWorker(QThread):
-    finished = Signal(bool, str)
-
-    def __init__(self, action, service_manager, data=None):
-        super().__init__()
-        self.action = action
-        self.service_manager = service_manager
-        self.data = data # Может быть bat_file или start_type
-
-    def run(self):
-        result, message = False, "Unknown action"
-        actions = {
-            "install": lambda: self.service_manager.install_service(self.data),
-            "uninstall": lambda: self.service_manager.uninstall_service(),
-            "start": lambda: self.service_manager.start_service(),
-            "stop": lambda: self.service_manager.stop_service(),
-            "restart": lambda: self.service_manager.restart_service(),
-            "set_auto": lambda: self.service_manager.set_service_start_type("auto"),
-            "set_demand": lambda: self.service_manager.set_service_start_type("demand"),
-            "start_manual": lambda: self.service_manager.start_manual_process(self.data),
-            "stop_manual": lambda: self.service_manager.stop_manual_process()
-        }
-        if self.action in actions:
-            result, message = actions[self.action]()
-        self.finished.emit(result, message)
-
+# Сколько секунд операция может ждать в очереди, прежде чем потеряет смысл
+OPERATION_DEADLINE = 120
+# Опрос состояния службы: при открытом окне и в фоне (окно в трее или свернуто), мс
+STATUS_INTERVAL = 3000
+HIDDEN_STATUS_INTERVAL = 60000
 
 class ServiceTab(QWidget):
-    def __init__(self, parent=None):
+    # Завершение операции приходит из потока планировщика и доставляется в GUI-поток сигналом
+    operation_finished = Signal(object)
+    # Снимок состояния может обновиться из любого потока (планировщик, супервизор)
+    snapshot_changed = Signal(object)
+
+    def __init__(self, service_manager=None, status_cache=None, scheduler=None, timers=None, parent=None):
         super().__init__(parent)
-        self.service_manager = ServiceManager()
-        self.worker = None
+        self.service_manager = service_manager or ServiceManager()
+        self.status_cache = status_cache or StatusCache(self.service_manager, ConfigManager())
+        self.scheduler = scheduler
+        if self.scheduler is None:
+            self.scheduler = OperationScheduler(self.service_manager, self.status_cache)
+            self.scheduler.start()
+        self.timers = timers or TimerScheduler(self)
+        self.pending_operations = []
+        self.stale = False  # Снимок менялся, пока вкладка была скрыта
+        # Частые смены состояния (супервизор, API) рисуются не чаще раза за кадр
+        self.render_batcher = RenderBatcher(self.render_state, parent=self)
+        self.operation_finished.connect(self.on_operation_finished)
+        self.snapshot_changed.connect(self.on_snapshot_changed)
 
         # Check for admin rights
         if not self.service_manager.is_admin():
@@ -49,11 +48,12 @@ class ServiceTab(QWidget):
         self.setup_ui()
         self.setup_connections()
 
-        # Timer to update status
-        self.status_timer = QTimer(self)
-        self.status_timer.timeout.connect(self.update_ui_states)
-        self.status_timer.start(3000)  # Check every 3 seconds
-        self.update_ui_states()
+        # Опрос состояния - фоновая задача: снимок нужен и API, и значку в трее.
+        # Перерисовка идет только по изменению снимка и только когда вкладку видно.
+        self.status_cache.add_listener(self.snapshot_changed.emit)
+        self.timers.add("status", self.poll_status, STATUS_INTERVAL, background=True,
+                        hidden_interval=HIDDEN_STATUS_INTERVAL)
+        self.poll_status()
 
     def setup_ui(self):
         main_layout = QVBoxLayout(self)
@@ -67,6 +67,10 @@ class ServiceTab(QWidget):
         font = self.overall_status_label.font(); font.setPointSize(14); font.setBold(True)
         self.overall_status_label.setFont(font)
         status_layout.addWidget(self.overall_status_label)
+        status_layout.addStretch()
+        self.network_label = QLabel()
+        self.network_label.setStyleSheet("color: #888;")
+        status_layout.addWidget(self.network_label)
         main_layout.addWidget(status_box)
 
         # --- УПРАВЛЕНИЕ СЛУЖБОЙ ---
@@ -106,6 +110,16 @@ class ServiceTab(QWidget):
         manual_layout.addWidget(self.manual_stop_button)
         main_layout.addWidget(manual_box)
 
+        # --- ОЧЕРЕДЬ ОПЕРАЦИЙ ---
+        queue_layout = QHBoxLayout()
+        self.queue_label = QLabel()
+        self.cancel_button = QPushButton("Отменить ожидающие")
+        self.cancel_button.clicked.connect(self.cancel_pending)
+        queue_layout.addWidget(self.queue_label)
+        queue_layout.addStretch()
+        queue_layout.addWidget(self.cancel_button)
+        main_layout.addLayout(queue_layout)
+
         main_layout.addStretch()
 
     def setup_connections(self):
@@ -122,30 +136,58 @@ class ServiceTab(QWidget):
         self.manual_start_button.clicked.connect(self.start_manual)
         self.manual_stop_button.clicked.connect(lambda: self.run_operation("stop_manual"))
 
-    def update_ui_states(self):
-        # Получаем все статусы
-        service_status = self.service_manager.get_service_status()
-        start_type = self.service_manager.get_service_start_type()
-        is_manual_running = self.service_manager.is_manual_process_running()
-        is_admin = self.service_manager.is_admin()
+    def poll_status(self):
+        # Один опрос на тик; снимок затем читают и другие потребители (например, локальный API).
+        # Пока планировщик занят, `sc` не запускаем: он сам обновит снимок после операции.
+        if self.scheduler.is_busy() and self.status_cache.snapshot():
+            return
+        # В фоне тип запуска не перечитываем: лишний `sc qc` на каждый тик
+        self.status_cache.refresh(full=self.timers.visible)
+
+    def on_snapshot_changed(self, snapshot):
+        if not self.isVisible():
+            self.stale = True
+            return
+        self.render_batcher.submit(snapshot)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if self.stale and self.status_cache.snapshot():
+            self.stale = False
+            self.render_state(self.status_cache.snapshot())
+
+    def render_state(self, snapshot):
+        service_status = snapshot["service_status"]
+        start_type = snapshot["start_type"]
+        is_manual_running = snapshot["manual_running"]
+        is_admin = snapshot["is_admin"]
 
         # По умолчанию все выключаем
         all_buttons = self.findChildren(QPushButton)
         for btn in all_buttons: btn.setEnabled(False)
+        self.render_queue()
+        self.network_label.setText(self.format_network(snapshot.get("network")))
 
         if not is_admin:
             self.overall_status_label.setText("НЕТ ПРАВ АДМИНИСТРАТОРА"); self.overall_status_label.setStyleSheet("color: red;")
             return
 
         # Логика состояний
+        supervisor = snapshot.get("supervisor")
         if is_manual_running:
             self.overall_status_label.setText("РУЧНОЙ ЗАПУСК АКТИВЕН"); self.overall_status_label.setStyleSheet("color: blue;")
-            self.manual_status_label.setText(f"Активен (PID: {self.service_manager.manual_process_pid})")
+            if supervisor and supervisor["state"] == "backoff":
+                self.manual_status_label.setText("winws.exe упал, ожидание перезапуска...")
+            else:
+                self.manual_status_label.setText(f"Активен (PID: {snapshot['manual_pid']})" + self.format_supervisor(supervisor))
             self.manual_stop_button.setEnabled(True)
             # Все остальное блокируется
             return
 
-        self.manual_status_label.setText("Статус: неактивен")
+        if supervisor and supervisor["state"] == "crash_loop":
+            self.manual_status_label.setText(f"Остановлен: {supervisor['error']}")
+        else:
+            self.manual_status_label.setText("Статус: неактивен")
         self.manual_start_button.setEnabled(True)
 
         # Управление службой
@@ -177,6 +219,35 @@ class ServiceTab(QWidget):
         else:
             self.autostart_status_label.setText("Тип запуска: -")
 
+    @staticmethod
+    def format_network(state):
+        """Сеть и профиль, выбранный для нее NetworkProfileManager."""
+        if not state or not state.get("network"):
+            return ""
+        actions = {
+            "applying": "применяется",
+            "verified": "работает",
+            "not_working": "не работает",
+            "failed": "не удалось применить",
+            "manual": "ручной запуск, автоприменение отложено",
+        }
+        text = f"Сеть: {state['network']}"
+        if state.get("profile"):
+            text += f" | {state['profile']}"
+            if state.get("action") in actions:
+                text += f" ({actions[state['action']]})"
+        return text
+
+    @staticmethod
+    def format_supervisor(stats):
+        """Перезапуски и MTBF супервизора для строки статуса ручного запуска."""
+        if not stats or not stats["restarts"]:
+            return ""
+        text = f", перезапусков: {stats['restarts']}"
+        if stats["mtbf"] is not None:
+            text += f", MTBF: {stats['mtbf'] / 60:.1f} мин"
+        return text
+
     def install_service(self):
         path, _ = QFileDialog.getOpenFileName(self, "Выберите .bat файл", "", "Batch Files (*.bat)")
         if path: self.run_operation("install", data=path)
@@ -186,13 +257,32 @@ class ServiceTab(QWidget):
         if path: self.run_operation("start_manual", data=path)
 
     def run_operation(self, action, data=None):
-        self.worker = ServiceWorker(action, self.service_manager, data)
-        self.worker.finished.connect(self.on_operation_finished)
-        self.status_timer.stop() # Останавливаем таймер на время операции
-        self.worker.start()
+        operation = self.scheduler.submit(action, data, deadline=OPERATION_DEADLINE)
+        # Повторный клик мог склеиться с уже ожидающей операцией: результат покажем один раз
+        if operation not in self.pending_operations:
+            self.pending_operations.append(operation)
+            operation.add_callback(self.operation_finished.emit)
+        self.render_queue()
+
+    def cancel_pending(self):
+        for operation in list(self.pending_operations):
+            operation.cancel()
+
+    def render_queue(self):
+        stats = self.scheduler.stats()
+        if stats["running"] or stats["queue_depth"]:
+            running = f"выполняется: {stats['running']}, " if stats["running"] else ""
+            self.queue_label.setText(f"Операции: {running}в очереди: {stats['queue_depth']}")
+        else:
+            self.queue_label.setText("Операции: нет")
+        self.cancel_button.setEnabled(stats["queue_depth"] > 0)
 
-    def on_operation_finished(self, success, message):
+    def on_operation_finished(self, operation):
+        if operation in self.pending_operations:
+            self.pending_operations.remove(operation)
+        success, message = operation.result
+        if operation.requests > 1:
+            message += f"\n(объединено запросов: {operation.requests})"
         if success: QMessageBox.information(self, "Успех", message)
         else: QMessageBox.critical(self, "Ошибка", message)
-        self.update_ui_states()
-        self.status_timer.start() # Запускаем таймер снова 
\ No newline at end of file
+        self.render_queue()
@@ -1,9 +1,144 @@
-from PySide6.QtWidgets import QWidget, QVBoxLayout, QLabel
+import time
+
+from PySide6.QtWidgets import QWidget, QVBoxLayout, QLabel, QGroupBox, QGridLayout
+from PySide6.QtCore import Signal, Qt
+
+from widgets.render_batcher import RenderBatcher
+
+STATUS_TEXT = {"RUNNING": "служба запущена", "STOPPED": "служба остановлена", "NOT_FOUND": "служба не установлена"}
+
 
 class StatsTab(QWidget):
-    def __init__(self, parent=None):
+    """
+    Статистика работы обхода по снимкам StatusCache: время работы и перезапуски,
+    ресурсы winws.exe, супервизор ручного запуска, очередь операций со службой
+    и смены состояния за сессию. Новых опросов вкладка не делает.
+    """
+    # Снимок может обновиться из любого потока (планировщик, супервизор)
+    snapshot_changed = Signal(object)
+
+    def __init__(self, status_cache=None, scheduler=None, parent=None):
         super().__init__(parent)
-        layout = QVBoxLayout(self)
-        label = QLabel("This is the Stats Tab. Content will be added here.")
-        layout.addWidget(label)
-        self.setLayout(layout) 
\ No newline at end of file
+        self.status_cache = status_cache
+        self.scheduler = scheduler
+        self.stale = False
+        self.last_state = None
+        self.state_changes = 0
+        self.last_change_at = None
+        self.render_batcher = RenderBatcher(self.render_stats, parent=self)
+
+        self.setup_ui()
+        self.snapshot_changed.connect(self.on_snapshot_changed)
+        if self.status_cache:
+            self.status_cache.add_listener(self.snapshot_changed.emit)
+            if self.status_cache.snapshot():
+                self.on_snapshot_changed(self.status_cache.snapshot())
+
+    def setup_ui(self):
+        main_layout = QVBoxLayout(self)
+        main_layout.setContentsMargins(20, 20, 20, 20)
+        main_layout.setSpacing(15)
+        main_layout.setAlignment(Qt.AlignmentFlag.AlignTop)
+
+        self.values = {}
+        groups = (
+            ("Обход", (("state", "Состояние"), ("uptime", "Время работы"), ("restarts", "Перезапусков"),
+                       ("changes", "Смен состояния за сессию"), ("last_change", "Последняя смена"))),
+            ("winws.exe", (("pid", "PID"), ("cpu", "CPU"), ("rss", "Память"))),
+            ("Супервизор ручного запуска", (("supervisor", "Состояние"), ("supervisor_restarts", "Перезапусков"),
+                                            ("mtbf", "MTBF"), ("last_failure", "Последний сбой"))),
+            ("Операции со службой", (("queue", "Очередь"), ("completed", "Выполнено"),
+                                     ("avg_duration", "Средняя длительность"), ("last_operation", "Последняя"))),
+        )
+        for title, rows in groups:
+            group = QGroupBox(title)
+            grid = QGridLayout(group)
+            grid.setColumnStretch(1, 1)
+            for row, (key, label) in enumerate(rows):
+                grid.addWidget(QLabel(label + ":"), row, 0)
+                value = QLabel("-")
+                value.setTextInteractionFlags(Qt.TextInteractionFlag.TextSelectableByMouse)
+                grid.addWidget(value, row, 1)
+                self.values[key] = value
+            main_layout.addWidget(group)
+
+        self.updated_label = QLabel()
+        self.updated_label.setStyleSheet("color: #888;")
+        main_layout.addWidget(self.updated_label)
+
+    def on_snapshot_changed(self, snapshot):
+        # Смены считаем по каждому снимку, даже если отрисовка их склеит
+        state = (snapshot.get("service_status"), bool(snapshot.get("manual_running")))
+        if self.last_state is not None and state != self.last_state:
+            self.state_changes += 1
+            self.last_change_at = snapshot.get("updated_at")
+        self.last_state = state
+        if not self.isVisible():
+            self.stale = True
+            return
+        self.render_batcher.submit(snapshot)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if self.stale and self.status_cache and self.status_cache.snapshot():
+            self.stale = False
+            self.render_stats(self.status_cache.snapshot())
+
+    def render_stats(self, snapshot):
+        if snapshot.get("manual_running"):
+            state = "ручной запуск активен"
+        else:
+            state = STATUS_TEXT.get(snapshot.get("service_status"), "состояние неизвестно")
+        self.set_value("state", state)
+        self.set_value("uptime", self.format_duration(snapshot.get("uptime")) if snapshot.get("uptime") else "-")
+        self.set_value("restarts", str(snapshot.get("restarts", 0)))
+        self.set_value("changes", str(self.state_changes))
+        self.set_value("last_change", self.format_time(self.last_change_at))
+
+        self.set_value("pid", str(snapshot["winws_pid"]) if snapshot.get("winws_pid") else "-")
+        cpu = snapshot.get("winws_cpu_percent")
+        self.set_value("cpu", f"{cpu:.1f}%" if cpu is not None else "-")
+        rss = snapshot.get("winws_rss")
+        self.set_value("rss", f"{rss / 1024 / 1024:.1f} МБ" if rss else "-")
+
+        supervisor = snapshot.get("supervisor")
+        if supervisor:
+            self.set_value("supervisor", supervisor["state"])
+            self.set_value("supervisor_restarts", str(supervisor["restarts"]))
+            self.set_value("mtbf", self.format_duration(supervisor["mtbf"]) if supervisor["mtbf"] is not None else "-")
+            failure = supervisor["last_failure"]
+            self.set_value("last_failure", f"{failure['reason']} (код {failure['exit_code']}, "
+                                           f"проработал {self.format_duration(failure['uptime'])})" if failure else "-")
+        else:
+            for key in ("supervisor", "supervisor_restarts", "mtbf", "last_failure"):
+                self.set_value(key, "-")
+
+        if self.scheduler:
+            stats = self.scheduler.stats()
+            running = f"выполняется {stats['running']}, " if stats["running"] else ""
+            self.set_value("queue", f"{running}ожидает {stats['queue_depth']}")
+            self.set_value("completed", str(stats["completed"]))
+            self.set_value("avg_duration", f"{stats['avg_duration']:.2f} с" if stats["completed"] else "-")
+            last = stats["last"][-1] if stats["last"] else None
+            self.set_value("last_operation", f"{last['action']}: {last['outcome']}, {last['duration']:.2f} с"
+                           if last else "-")
+
+        self.updated_label.setText(f"Снимок от {self.format_time(snapshot.get('updated_at'))}")
+
+    def set_value(self, key, text):
+        # Неизменившиеся поля не трогаем: перерисовывается только то, что поменялось
+        if self.values[key].text() != text:
+            self.values[key].setText(text)
+
+    @staticmethod
+    def format_duration(seconds):
+        seconds = int(seconds)
+        if seconds < 60:
+            return f"{seconds} с"
+        if seconds < 3600:
+            return f"{seconds // 60} мин {seconds % 60} с"
+        return f"{seconds // 3600} ч {seconds % 3600 // 60} мин"
+
+    @staticmethod
+    def format_time(timestamp):
+        return time.strftime("%H:%M:%S", time.localtime(timestamp)) if timestamp else "-"